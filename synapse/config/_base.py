@@ -137,7 +137,7 @@ class Config:
     def parse_size(value):
         if isinstance(value, int):
             return value
-        sizes = {"K": 1024, "M": 1024 * 1024}
+        sizes = {"K": 1024, "M": 1024 * 1024, "G": 1024 * 1024 * 1024}
         size = 1
         suffix = value[-1]
         if suffix in sizes:
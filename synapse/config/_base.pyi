@@ -28,6 +28,7 @@ from synapse.config import (
     repository,
     room_directory,
     saml2,
+    search,
     server,
     server_notices,
     spam_checker,
@@ -81,6 +82,7 @@ class RootConfig:
     spamchecker: spam_checker.SpamCheckerConfig
     groups: groups.GroupsConfig
     userdirectory: user_directory.UserDirectoryConfig
+    search: search.SearchConfig
     consent: consent.ConsentConfig
     stats: stats.StatsConfig
     servernotices: server_notices.ServerNoticesConfig
@@ -15,7 +15,7 @@
 import os
 import re
 import threading
-from typing import Callable, Dict
+from typing import Callable, Dict, Optional
 
 from synapse.python_dependencies import DependencyException, check_requirements
 
@@ -41,6 +41,9 @@ class CacheProperties:
             os.environ.get(_CACHE_PREFIX, _DEFAULT_FACTOR_SIZE)
         )
         self.resize_all_caches_func = None
+        # Map from canonicalised cache name to the maximum estimated size in
+        # bytes of the cache's contents.
+        self.cache_max_memory: Dict[str, int] = {}
 
 
 properties = CacheProperties()
@@ -60,6 +63,19 @@ def _canonicalise_cache_name(cache_name: str) -> str:
     return cache_name.lower()
 
 
+def get_cache_max_memory(cache_name: str) -> Optional[int]:
+    """Gets the configured upper bound on the estimated memory usage of a cache
+
+    Args:
+        cache_name: The name of the cache
+
+    Returns:
+        The maximum number of bytes the cache should hold, or None if the cache
+        is not bounded by memory usage.
+    """
+    return properties.cache_max_memory.get(_canonicalise_cache_name(cache_name))
+
+
 def add_resizable_cache(
     cache_name: str, cache_resize_callback: Callable[[float], None]
 ):
@@ -97,6 +113,7 @@ class CacheConfig(Config):
             os.environ.get(_CACHE_PREFIX, _DEFAULT_FACTOR_SIZE)
         )
         properties.resize_all_caches_func = None
+        properties.cache_max_memory = {}
         with _CACHES_LOCK:
             _CACHES.clear()
 
@@ -146,6 +163,20 @@ class CacheConfig(Config):
           per_cache_factors:
             #get_users_who_share_room_with_user: 2.0
 
+          # A dictionary of cache name to the maximum amount of memory that
+          # cache may use. Once the estimated size of a cache's contents
+          # exceeds this limit the least recently used entries are evicted,
+          # regardless of how many entries the cache holds. This is useful
+          # for caches whose entries vary wildly in size, such as the event
+          # cache (`*getEvent*`).
+          #
+          # Cache names are matched in the same way as for
+          # `per_cache_factors`. Sizes are estimated using the optional
+          # `pympler` dependency, which must be installed to use this option.
+          #
+          per_cache_max_memory:
+            #getEvent: 512M
+
           # Controls how long an entry can be in a cache without having been
           # accessed before being evicted. Defaults to None, which means
           # entries are never evicted based on time.
@@ -206,6 +237,33 @@ class CacheConfig(Config):
                 )
             self.cache_factors[cache] = factor
 
+        max_memory = cache_config.get("per_cache_max_memory") or {}
+        if not isinstance(max_memory, dict):
+            raise ConfigError("caches.per_cache_max_memory must be a dictionary")
+
+        self.cache_max_memory: Dict[str, int] = {}
+        for cache, size in max_memory.items():
+            try:
+                self.cache_max_memory[
+                    _canonicalise_cache_name(cache)
+                ] = self.parse_size(size)
+            except (TypeError, ValueError):
+                raise ConfigError(
+                    "caches.per_cache_max_memory.%s must be a size, e.g. '512M'"
+                    % (cache,)
+                )
+
+        if self.cache_max_memory:
+            try:
+                check_requirements("cache_memory")
+            except DependencyException as e:
+                raise ConfigError(
+                    e.message  # noqa: B306, DependencyException.message is a property
+                )
+
+        # Set the global mapping so that it's applied to new caches
+        properties.cache_max_memory = self.cache_max_memory
+
         self.track_memory_usage = cache_config.get("track_memory_usage", False)
         if self.track_memory_usage:
             try:
@@ -14,6 +14,7 @@
 # limitations under the License.
 import logging
 import os
+from typing import List
 
 from synapse.config._base import Config, ConfigError
 
@@ -36,6 +37,21 @@ DEFAULT_CONFIG = """\
 # 'txn_limit' gives the maximum number of transactions to run per connection
 # before reconnecting. Defaults to 0, which means no limit.
 #
+# 'upsert_flush_interval_ms' gives how long to buffer frequently updated
+# bookkeeping rows for before writing them out in a single batch. Defaults to
+# 500. Set to 0 to write them out immediately.
+#
+# 'max_concurrent_background_updates' gives the maximum number of background
+# updates which don't depend on each other to run at once. More than one is
+# only run while the database has connections to spare. Defaults to 1.
+#
+# 'replicas' gives a list of PostgreSQL hot standby replicas of the database,
+# which some read-only queries are sent to in order to take load off the
+# primary. Each entry may give 'args' to connect to the replica with, which
+# are merged with those of the primary. Queries only go to a replica once it
+# has caught up with the primary, so they never see stale data. If a replica
+# fails, its queries go to the primary for a while.
+#
 # 'args' gives options which are passed through to the database engine,
 # except for options starting 'cp_', which are used to configure the Twisted
 # connection pool. For a reference to valid arguments, see:
@@ -65,6 +81,9 @@ DEFAULT_CONFIG = """\
 #    port: 5432
 #    cp_min: 5
 #    cp_max: 10
+#  replicas:
+#    - args:
+#        host: replica1.example.com
 #
 # For more information on using Synapse with Postgres,
 # see https://matrix-org.github.io/synapse/latest/postgres.html.
@@ -76,6 +95,18 @@ database:
 """
 
 
+def _parse_int_option(db_config: dict, name: str, default: int, minimum: int) -> int:
+    """Read an integer option from a database config, checking that it is at
+    least `minimum`.
+    """
+    value = db_config.get(name, default)
+    if not isinstance(value, int) or isinstance(value, bool) or value < minimum:
+        raise ConfigError(
+            "'%s' must be an integer of at least %d" % (name, minimum), (name,)
+        )
+    return value
+
+
 class DatabaseConnectionConfig:
     """Contains the connection config for a particular database.
 
@@ -106,10 +137,42 @@ class DatabaseConnectionConfig:
         self.name = name
         self.config = db_config
 
+        self.upsert_flush_interval_ms = _parse_int_option(
+            db_config, "upsert_flush_interval_ms", 500, minimum=0
+        )
+        self.max_concurrent_background_updates = _parse_int_option(
+            db_config, "max_concurrent_background_updates", 1, minimum=1
+        )
+
         # The `data_stores` config is actually talking about `databases` (we
         # changed the name).
         self.databases = data_stores
 
+        replicas = db_config.get("replicas") or []
+        if not isinstance(replicas, list):
+            raise ConfigError("'replicas' must be a list", ("replicas",))
+        if replicas and db_engine != "psycopg2":
+            raise ConfigError("Read replicas are only supported with PostgreSQL")
+
+        self.replicas: List[DatabaseConnectionConfig] = []
+        for i, replica in enumerate(replicas):
+            if not isinstance(replica, dict):
+                raise ConfigError("Replica config must be a dict", ("replicas", str(i)))
+
+            replica_args = dict(db_config.get("args", {}))
+            replica_args.update(replica.get("args") or {})
+            self.replicas.append(
+                DatabaseConnectionConfig(
+                    "%s_replica%d" % (name, i),
+                    {
+                        "name": db_engine,
+                        "args": replica_args,
+                        "txn_limit": db_config.get("txn_limit", 0),
+                        "data_stores": data_stores,
+                    },
+                )
+            )
+
 
 class DatabaseConfig(Config):
     section = "database"
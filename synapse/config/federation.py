@@ -13,7 +13,7 @@
 # limitations under the License.
 from typing import Optional
 
-from synapse.config._base import Config
+from synapse.config._base import Config, ConfigError
 from synapse.config._util import validate_config
 
 
@@ -48,6 +48,28 @@ class FederationConfig(Config):
             "allow_device_name_lookup_over_federation", True
         )
 
+        self.federation_inbound_concurrency = config.get(
+            "federation_inbound_concurrency", 10
+        )
+        if (
+            not isinstance(self.federation_inbound_concurrency, int)
+            or self.federation_inbound_concurrency < 1
+        ):
+            raise ConfigError(
+                "'federation_inbound_concurrency' must be a positive integer"
+            )
+
+        self.federation_backfill_concurrency = config.get(
+            "federation_backfill_concurrency", 1
+        )
+        if (
+            not isinstance(self.federation_backfill_concurrency, int)
+            or self.federation_backfill_concurrency < 1
+        ):
+            raise ConfigError(
+                "'federation_backfill_concurrency' must be a positive integer"
+            )
+
     def generate_config_section(self, config_dir_path, server_name, **kwargs):
         return """\
         ## Federation ##
@@ -85,6 +107,21 @@ class FederationConfig(Config):
         # on this homeserver. Defaults to 'true'.
         #
         #allow_device_name_lookup_over_federation: false
+
+        # The maximum number of events received over federation which each
+        # instance processes at once. Events in different rooms are processed
+        # in parallel, taking turns so that a room with a lot of events queued
+        # up does not delay the others. Defaults to 10.
+        #
+        #federation_inbound_concurrency: 20
+
+        # The number of servers to request history from at once when
+        # backfilling a room. The first response with events we don't have is
+        # used, so a higher value avoids waiting for servers which are down to
+        # time out, at the cost of making more requests. Defaults to 1, which
+        # tries the servers one at a time.
+        #
+        #federation_backfill_concurrency: 3
         """
 
 
@@ -40,6 +40,7 @@ from .repository import ContentRepositoryConfig
 from .room import RoomConfig
 from .room_directory import RoomDirectoryConfig
 from .saml2 import SAML2Config
+from .search import SearchConfig
 from .server import ServerConfig
 from .server_notices import ServerNoticesConfig
 from .spam_checker import SpamCheckerConfig
@@ -86,6 +87,7 @@ class HomeServerConfig(RootConfig):
         RoomConfig,
         GroupsConfig,
         UserDirectoryConfig,
+        SearchConfig,
         ConsentConfig,
         StatsConfig,
         ServerNoticesConfig,
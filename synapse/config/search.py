@@ -0,0 +1,86 @@
+# Copyright 2021 The Matrix.org Foundation C.I.C.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+
+from synapse.util.module_loader import load_module
+
+from ._base import Config, ConfigError
+
+# The modules implementing the built in search backends.
+BUILTIN_SEARCH_BACKENDS = {
+    "database": "synapse.search.DatabaseSearchBackend",
+    "inverted_index": "synapse.search.inverted_index.InvertedIndexSearchBackend",
+}
+
+
+class SearchConfig(Config):
+    """Search Configuration
+    Configuration for the backend used by the /search API
+    """
+
+    section = "search"
+
+    def read_config(self, config, **kwargs):
+        search_config = config.get("search") or {}
+
+        backend = search_config.get("backend", "database")
+        if isinstance(backend, str):
+            if backend not in BUILTIN_SEARCH_BACKENDS:
+                raise ConfigError(
+                    "Unknown search backend %r" % (backend,), ("search", "backend")
+                )
+
+            # The built in backends take their options from the search section.
+            backend = {
+                "module": BUILTIN_SEARCH_BACKENDS[backend],
+                "config": search_config,
+            }
+        elif not isinstance(backend, dict):
+            raise ConfigError("expected a string or a dict", ("search", "backend"))
+
+        self.search_backend = load_module(backend, ("search", "backend"))
+
+    def generate_config_section(self, data_dir_path, **kwargs):
+        index_directory = os.path.join(data_dir_path, "search_index")
+        return (
+            """\
+        # Search configuration
+        #
+        search:
+            # The backend used to search the contents of rooms. One of:
+            #
+            #  * 'database': use the full text search support of the database.
+            #
+            #  * 'inverted_index': use an index stored in files on disk, which
+            #    is kept up to date with new events by a single instance (see
+            #    'indexer_instance'). Other workers read the same files, so
+            #    they must all have access to 'index_directory'.
+            #
+            # Alternatively a custom backend can be given as a dict with
+            # 'module' and 'config' keys. Defaults to 'database'.
+            #
+            #backend: inverted_index
+
+            # The directory to store the 'inverted_index' search index in.
+            #
+            #index_directory: "%(index_directory)s"
+
+            # The name of the worker which keeps the 'inverted_index' search
+            # index up to date. Defaults to the main process.
+            #
+            #indexer_instance: worker1
+        """
+            % locals()
+        )
@@ -31,6 +31,9 @@ class UserDirectoryConfig(Config):
         self.user_directory_search_prefer_local_users = user_directory_config.get(
             "prefer_local_users", False
         )
+        self.user_directory_in_memory_index = user_directory_config.get(
+            "in_memory_index", False
+        )
 
     def generate_config_section(self, config_dir_path, server_name, **kwargs):
         return """
@@ -65,4 +68,15 @@ class UserDirectoryConfig(Config):
             # results.
             #
             #prefer_local_users: true
+
+            # Defines whether to keep a copy of the user directory in memory on
+            # the instance which updates it (the main process, or the user_dir
+            # worker if there is one), and answer searches from that rather than
+            # querying the database. Searches fall back to the database if the
+            # copy is still being loaded or has no matching users.
+            #
+            # This uses memory in proportion to the number of users in the
+            # directory and the rooms they share. Defaults to false.
+            #
+            #in_memory_index: true
         """
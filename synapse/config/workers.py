@@ -133,6 +133,11 @@ class WorkerConfig(Config):
         # The shared secret used for authentication when connecting to the main synapse.
         self.worker_replication_secret = config.get("worker_replication_secret", None)
 
+        # Whether to send stream updates which share a stream token as a single
+        # RDATA_BATCH replication command. This must only be enabled once all
+        # instances understand the command.
+        self.replication_batch_rdata = config.get("replication_batch_rdata", False)
+
         self.worker_name = config.get("worker_name", self.worker_app)
         self.instance_name = self.worker_name or "master"
 
@@ -189,6 +194,14 @@ class WorkerConfig(Config):
             federation_sender_instances
         )
 
+        # The instances which process the events received over federation, which
+        # are sharded between them by room. If empty, events are processed by
+        # whichever instance received them.
+        federation_inbound_instances = config.get("federation_inbound_instances") or []
+        self.federation_inbound_shard_config = ShardedWorkerHandlingConfig(
+            federation_inbound_instances
+        )
+
         # A map from instance name to host/port of their HTTP replication endpoint.
         instance_map = config.get("instance_map") or {}
         self.instance_map = {
@@ -302,6 +315,18 @@ class WorkerConfig(Config):
         #federation_sender_instances:
         #  - federation_sender1
 
+        # The workers which process events received over federation. Rooms are
+        # sharded between these instances, so that the events in different rooms
+        # are processed in parallel. Each of them must be able to receive
+        # federation traffic (e.g. a federation reader), and the configuration
+        # must be shared between all of them.
+        #
+        # By default events are processed by the instance which received them.
+        #
+        #federation_inbound_instances:
+        #  - federation_reader1
+        #  - federation_reader2
+
         # When using workers this should be a map from `worker_name` to the
         # HTTP replication listener of the worker, if configured.
         #
@@ -20,6 +20,7 @@ from typing import TYPE_CHECKING, Callable, Dict, Iterable, List, Optional, Tupl
 
 import attr
 from signedjson.key import (
+    VerifyKey,
     decode_verify_key_bytes,
     encode_verify_key_base64,
     is_signing_algorithm_supported,
@@ -40,15 +41,21 @@ from synapse.api.errors import (
     RequestSendFailed,
     SynapseError,
 )
+from synapse.api.room_versions import EventFormatVersions
 from synapse.config.key import TrustedKeyServer
 from synapse.events import EventBase
 from synapse.events.utils import prune_event_dict
-from synapse.logging.context import make_deferred_yieldable, run_in_background
+from synapse.logging.context import (
+    defer_to_thread,
+    make_deferred_yieldable,
+    run_in_background,
+)
 from synapse.storage.keys import FetchKeyResult
 from synapse.types import JsonDict
 from synapse.util import unwrapFirstError
 from synapse.util.async_helpers import yieldable_gather_results
 from synapse.util.batching_queue import BatchingQueue
+from synapse.util.caches.lrucache import LruCache
 from synapse.util.retryutils import NotRetryingDestination
 
 if TYPE_CHECKING:
@@ -56,6 +63,13 @@ if TYPE_CHECKING:
 
 logger = logging.getLogger(__name__)
 
+# Batches of signatures at least this large get verified on a thread, rather
+# than blocking the reactor.
+_MIN_SIGNATURES_TO_VERIFY_IN_THREAD = 10
+
+# The number of events we remember having verified the signatures of.
+_VERIFIED_EVENTS_CACHE_SIZE = 100000
+
 
 @attr.s(slots=True, cmp=False)
 class VerifyJsonRequest:
@@ -75,12 +89,17 @@ class VerifyJsonRequest:
             be valid. (0 implies we don't care)
 
         key_ids: The set of key_ids to that could be used to verify the JSON object
+
+        event_id: The ID of the event being verified, if the event ID is a hash
+            of the signed content of the event (and so can be used to remember
+            that it has been verified).
     """
 
     server_name = attr.ib(type=str)
     get_json_object = attr.ib(type=Callable[[], JsonDict])
     minimum_valid_until_ts = attr.ib(type=int)
     key_ids = attr.ib(type=List[str])
+    event_id = attr.ib(type=Optional[str], default=None)
 
     @staticmethod
     def from_json_object(
@@ -109,6 +128,13 @@ class VerifyJsonRequest:
         object for the given server.
         """
         key_ids = list(event.signatures.get(server_name, []))
+
+        # Event IDs in the original event format are chosen by the sending
+        # server, rather than being a hash of the event.
+        event_id = None
+        if event.room_version.event_format != EventFormatVersions.V1:
+            event_id = event.event_id
+
         return VerifyJsonRequest(
             server_name,
             # We defer creating the redacted json object, as it uses a lot more
@@ -116,6 +142,7 @@ class VerifyJsonRequest:
             lambda: prune_event_dict(event.room_version, event.get_pdu_json()),
             minimum_valid_until_ms,
             key_ids=key_ids,
+            event_id=event_id,
         )
 
     def to_fetch_key_request(self) -> "_FetchKeyRequest":
@@ -161,6 +188,7 @@ class Keyring:
         self, hs: "HomeServer", key_fetchers: "Optional[Iterable[KeyFetcher]]" = None
     ):
         self.clock = hs.get_clock()
+        self._reactor = hs.get_reactor()
 
         if key_fetchers is None:
             key_fetchers = (
@@ -178,6 +206,22 @@ class Keyring:
             process_batch_callback=self._inner_fetch_key_requests,
         )
 
+        # Signatures for each server are queued up and checked in batches.
+        self._verify_queue: BatchingQueue[
+            Tuple[VerifyJsonRequest, List[VerifyKey]],
+            Dict[VerifyJsonRequest, Optional[SynapseError]],
+        ] = BatchingQueue(
+            "keyring_verify",
+            clock=hs.get_clock(),
+            process_batch_callback=self._verify_signatures,
+        )
+
+        # A map from (server name, event ID) to the time until which the key
+        # which verified the event's signature from that server is valid.
+        self._verified_events: LruCache[Tuple[str, str], int] = LruCache(
+            _VERIFIED_EVENTS_CACHE_SIZE, "verified_event_signatures"
+        )
+
     async def verify_json_for_server(
         self,
         server_name: str,
@@ -262,6 +306,16 @@ class Keyring:
                 Codes.UNAUTHORIZED,
             )
 
+        cache_key = None
+        if verify_request.event_id is not None:
+            cache_key = (verify_request.server_name, verify_request.event_id)
+            verified_until_ts = self._verified_events.get(cache_key)
+            if (
+                verified_until_ts is not None
+                and verified_until_ts >= verify_request.minimum_valid_until_ts
+            ):
+                return
+
         # Add the keys we need to verify to the queue for retrieval. We queue
         # up requests for the same server so we don't end up with many in flight
         # requests for the same keys.
@@ -274,9 +328,8 @@ class Keyring:
         # from other servers, so we pull out only the ones we care about.s
         found_keys = found_keys_by_server.get(verify_request.server_name, {})
 
-        # Verify each signature we got valid keys for, raising if we can't
-        # verify any of them.
-        verified = False
+        # We need to verify each signature we got valid keys for.
+        key_results = []
         for key_id in verify_request.key_ids:
             key_result = found_keys.get(key_id)
             if not key_result:
@@ -285,43 +338,49 @@ class Keyring:
             if key_result.valid_until_ts < verify_request.minimum_valid_until_ts:
                 continue
 
-            verify_key = key_result.verify_key
-            json_object = verify_request.get_json_object()
-            try:
-                verify_signed_json(
-                    json_object,
-                    verify_request.server_name,
-                    verify_key,
-                )
-                verified = True
-            except SignatureVerifyException as e:
-                logger.debug(
-                    "Error verifying signature for %s:%s:%s with key %s: %s",
-                    verify_request.server_name,
-                    verify_key.alg,
-                    verify_key.version,
-                    encode_verify_key_base64(verify_key),
-                    str(e),
-                )
-                raise SynapseError(
-                    401,
-                    "Invalid signature for server %s with key %s:%s: %s"
-                    % (
-                        verify_request.server_name,
-                        verify_key.alg,
-                        verify_key.version,
-                        str(e),
-                    ),
-                    Codes.UNAUTHORIZED,
-                )
+            key_results.append(key_result)
 
-        if not verified:
+        if not key_results:
             raise SynapseError(
                 401,
                 f"Failed to find any key to satisfy: {key_request}",
                 Codes.UNAUTHORIZED,
             )
 
+        # Queue up the signatures to be checked along with any others for the
+        # same server.
+        errors = await self._verify_queue.add_to_queue(
+            (verify_request, [key_result.verify_key for key_result in key_results]),
+            key=verify_request.server_name,
+        )
+        error = errors[verify_request]
+        if error is not None:
+            raise error
+
+        if cache_key is not None:
+            self._verified_events.set(
+                cache_key,
+                min(key_result.valid_until_ts for key_result in key_results),
+            )
+
+    async def _verify_signatures(
+        self, requests: List[Tuple[VerifyJsonRequest, List[VerifyKey]]]
+    ) -> Dict[VerifyJsonRequest, Optional[SynapseError]]:
+        """Processing function for the queue of signatures to verify.
+
+        Returns:
+            A map from each request to the error to raise for it, or None if
+            its signatures are valid.
+        """
+        num_signatures = sum(len(verify_keys) for _, verify_keys in requests)
+        if num_signatures < _MIN_SIGNATURES_TO_VERIFY_IN_THREAD:
+            return _verify_signatures(requests)
+
+        # Building the canonical JSON of each object and checking the signatures
+        # is CPU intensive, so we do it on a thread to avoid blocking the
+        # reactor.
+        return await defer_to_thread(self._reactor, _verify_signatures, requests)
+
     async def _inner_fetch_key_requests(
         self, requests: List[_FetchKeyRequest]
     ) -> Dict[str, Dict[str, FetchKeyResult]]:
@@ -416,6 +475,53 @@ class Keyring:
         return found_keys
 
 
+def _verify_signatures(
+    requests: List[Tuple[VerifyJsonRequest, List[VerifyKey]]]
+) -> Dict[VerifyJsonRequest, Optional[SynapseError]]:
+    """Checks the signatures on each of the requested JSON objects against the
+    given keys.
+
+    Returns:
+        A map from each request to the error to raise for it, or None if all its
+        signatures are valid.
+    """
+    results: Dict[VerifyJsonRequest, Optional[SynapseError]] = {}
+    for verify_request, verify_keys in requests:
+        results[verify_request] = None
+
+        json_object = verify_request.get_json_object()
+        for verify_key in verify_keys:
+            try:
+                verify_signed_json(
+                    json_object,
+                    verify_request.server_name,
+                    verify_key,
+                )
+            except SignatureVerifyException as e:
+                logger.debug(
+                    "Error verifying signature for %s:%s:%s with key %s: %s",
+                    verify_request.server_name,
+                    verify_key.alg,
+                    verify_key.version,
+                    encode_verify_key_base64(verify_key),
+                    str(e),
+                )
+                results[verify_request] = SynapseError(
+                    401,
+                    "Invalid signature for server %s with key %s:%s: %s"
+                    % (
+                        verify_request.server_name,
+                        verify_key.alg,
+                        verify_key.version,
+                        str(e),
+                    ),
+                    Codes.UNAUTHORIZED,
+                )
+                break
+
+    return results
+
+
 class KeyFetcher(metaclass=abc.ABCMeta):
     def __init__(self, hs: "HomeServer"):
         self._queue = BatchingQueue(
@@ -14,8 +14,6 @@
 # limitations under the License.
 
 
-import copy
-import itertools
 import logging
 from typing import (
     TYPE_CHECKING,
@@ -56,7 +54,7 @@ from synapse.events import EventBase, builder
 from synapse.federation.federation_base import FederationBase, event_from_pdu_json
 from synapse.federation.transport.client import SendJoinResponse
 from synapse.logging.utils import log_function
-from synapse.types import JsonDict, get_domain_from_id
+from synapse.types import JsonDict, StateMap, get_domain_from_id
 from synapse.util.async_helpers import concurrently_execute
 from synapse.util.caches.expiringcache import ExpiringCache
 from synapse.util.retryutils import NotRetryingDestination
@@ -71,6 +69,10 @@ sent_queries_counter = Counter("synapse_federation_client_sent_queries", "", ["t
 
 PDU_RETRY_TIME_MS = 1 * 60 * 1000
 
+# The number of events from the state and auth chain of a /send_join response to
+# parse and check at a time.
+SEND_JOIN_CHUNK_SIZE = 1000
+
 T = TypeVar("T")
 
 
@@ -86,8 +88,9 @@ class SendJoinResult:
     event: EventBase
     # A string giving the server the event was sent to.
     origin: str
-    state: List[EventBase]
-    auth_chain: List[EventBase]
+    # The state before the event, as a map to the IDs of the events. The events
+    # themselves are passed to the caller of `send_join` as they are processed.
+    state: StateMap[str]
 
 
 class FederationClient(FederationBase):
@@ -709,19 +712,32 @@ class FederationClient(FederationBase):
         )
 
     async def send_join(
-        self, destinations: Iterable[str], pdu: EventBase, room_version: RoomVersion
+        self,
+        destinations: Iterable[str],
+        pdu: EventBase,
+        room_version: RoomVersion,
+        on_events: Callable[[str, List[EventBase]], Awaitable[None]],
     ) -> SendJoinResult:
         """Sends a join event to one of a list of homeservers.
 
         Doing so will cause the remote server to add the event to the graph,
         and send the event out to the rest of the federation.
 
+        The state and auth chain in the response can be huge, so rather than
+        being returned they are parsed and checked a chunk at a time, and passed
+        to `on_events`.
+
         Args:
             destinations: Candidate homeservers which are probably
                 participating in the room.
             pdu: event to be sent
             room_version: the version of the room (according to the server that
                 did the make_join)
+            on_events: Called with the server which responded and a chunk of the
+                events in its response which have valid signatures and hashes.
+                The auth chain is passed before the state, and each event is only
+                passed once. If a server's response turns out to be invalid, we
+                may go on to pass the events from another server's response.
 
         Returns:
             The result of the send join request.
@@ -733,116 +749,12 @@ class FederationClient(FederationBase):
 
         async def send_request(destination) -> SendJoinResult:
             response = await self._do_send_join(room_version, destination, pdu)
-
-            # If an event was returned (and expected to be returned):
-            #
-            # * Ensure it has the same event ID (note that the event ID is a hash
-            #   of the event fields for versions which support MSC3083).
-            # * Ensure the signatures are good.
-            #
-            # Otherwise, fallback to the provided event.
-            if room_version.msc3083_join_rules and response.event:
-                event = response.event
-
-                valid_pdu = await self._check_sigs_and_hash_and_fetch_one(
-                    pdu=event,
-                    origin=destination,
-                    outlier=True,
-                    room_version=room_version,
-                )
-
-                if valid_pdu is None or event.event_id != pdu.event_id:
-                    raise InvalidResponseError("Returned an invalid join event")
-            else:
-                event = pdu
-
-            state = response.state
-            auth_chain = response.auth_events
-
-            create_event = None
-            for e in state:
-                if (e.type, e.state_key) == (EventTypes.Create, ""):
-                    create_event = e
-                    break
-
-            if create_event is None:
-                # If the state doesn't have a create event then the room is
-                # invalid, and it would fail auth checks anyway.
-                raise InvalidResponseError("No create event in state")
-
-            # the room version should be sane.
-            create_room_version = create_event.content.get(
-                "room_version", RoomVersions.V1.identifier
-            )
-            if create_room_version != room_version.identifier:
-                # either the server that fulfilled the make_join, or the server that is
-                # handling the send_join, is lying.
-                raise InvalidResponseError(
-                    "Unexpected room version %s in create event"
-                    % (create_room_version,)
-                )
-
-            logger.info(
-                "Processing from send_join %d events", len(state) + len(auth_chain)
-            )
-
-            # We now go and check the signatures and hashes for the event. Note
-            # that we limit how many events we process at a time to keep the
-            # memory overhead from exploding.
-            valid_pdus_map: Dict[str, EventBase] = {}
-
-            async def _execute(pdu: EventBase) -> None:
-                valid_pdu = await self._check_sigs_and_hash_and_fetch_one(
-                    pdu=pdu,
-                    origin=destination,
-                    outlier=True,
-                    room_version=room_version,
-                )
-
-                if valid_pdu:
-                    valid_pdus_map[valid_pdu.event_id] = valid_pdu
-
-            await concurrently_execute(
-                _execute, itertools.chain(state, auth_chain), 10000
-            )
-
-            # NB: We *need* to copy to ensure that we don't have multiple
-            # references being passed on, as that causes... issues.
-            signed_state = [
-                copy.copy(valid_pdus_map[p.event_id])
-                for p in state
-                if p.event_id in valid_pdus_map
-            ]
-
-            signed_auth = [
-                valid_pdus_map[p.event_id]
-                for p in auth_chain
-                if p.event_id in valid_pdus_map
-            ]
-
-            # NB: We *need* to copy to ensure that we don't have multiple
-            # references being passed on, as that causes... issues.
-            for s in signed_state:
-                s.internal_metadata = copy.deepcopy(s.internal_metadata)
-
-            # double-check that the same create event has ended up in the auth chain
-            auth_chain_create_events = [
-                e.event_id
-                for e in signed_auth
-                if (e.type, e.state_key) == (EventTypes.Create, "")
-            ]
-            if auth_chain_create_events != [create_event.event_id]:
-                raise InvalidResponseError(
-                    "Unexpected create event(s) in auth chain: %s"
-                    % (auth_chain_create_events,)
+            try:
+                return await self._process_send_join_response(
+                    destination, pdu, room_version, response, on_events
                 )
-
-            return SendJoinResult(
-                event=event,
-                state=signed_state,
-                auth_chain=signed_auth,
-                origin=destination,
-            )
+            finally:
+                response.close()
 
         # MSC3083 defines additional error codes for room joins.
         failover_errcodes = None
@@ -864,6 +776,127 @@ class FederationClient(FederationBase):
             "send_join", destinations, send_request, failover_errcodes=failover_errcodes
         )
 
+    async def _process_send_join_response(
+        self,
+        destination: str,
+        pdu: EventBase,
+        room_version: RoomVersion,
+        response: SendJoinResponse,
+        on_events: Callable[[str, List[EventBase]], Awaitable[None]],
+    ) -> SendJoinResult:
+        """Checks the response to a /send_join request, passing the events in
+        its state and auth chain to `on_events` a chunk at a time.
+
+        Args:
+            destination: The server which sent the response.
+            pdu: The join event which we sent.
+            room_version: The version of the room.
+            response: The response to check.
+            on_events: As for `send_join`.
+
+        Returns:
+            The result of the send join request.
+
+        Raises:
+            InvalidResponseError: if the response was invalid.
+        """
+        # If an event was returned (and expected to be returned):
+        #
+        # * Ensure it has the same event ID (note that the event ID is a hash
+        #   of the event fields for versions which support MSC3083).
+        # * Ensure the signatures are good.
+        #
+        # Otherwise, fallback to the provided event.
+        if room_version.msc3083_join_rules and response.event:
+            event = response.event
+
+            valid_pdu = await self._check_sigs_and_hash_and_fetch_one(
+                pdu=event,
+                origin=destination,
+                outlier=True,
+                room_version=room_version,
+            )
+
+            if valid_pdu is None or event.event_id != pdu.event_id:
+                raise InvalidResponseError("Returned an invalid join event")
+        else:
+            event = pdu
+
+        # Whether each of the events that we've checked so far was valid. The
+        # state and auth chain mostly contain the same events, so we make sure
+        # to only check each event once.
+        checked_events: Dict[str, bool] = {}
+
+        async def check_events(events: List[EventBase]) -> List[EventBase]:
+            events_to_check = {
+                e.event_id: e for e in events if e.event_id not in checked_events
+            }
+            for event_id in events_to_check:
+                checked_events[event_id] = False
+
+            # We now go and check the signatures and hashes for the events. We
+            # only check a chunk of the events at a time, to keep the memory
+            # overhead from exploding.
+            valid_pdus = await self._check_sigs_and_hash_and_fetch(
+                destination,
+                list(events_to_check.values()),
+                outlier=True,
+                room_version=room_version,
+            )
+
+            for valid_pdu in valid_pdus:
+                checked_events[valid_pdu.event_id] = True
+
+                if (valid_pdu.type, valid_pdu.state_key) == (EventTypes.Create, ""):
+                    # the room version should be sane.
+                    create_room_version = valid_pdu.content.get(
+                        "room_version", RoomVersions.V1.identifier
+                    )
+                    if create_room_version != room_version.identifier:
+                        # either the server that fulfilled the make_join, or the
+                        # server that is handling the send_join, is lying.
+                        raise InvalidResponseError(
+                            "Unexpected room version %s in create event"
+                            % (create_room_version,)
+                        )
+
+            if valid_pdus:
+                await on_events(destination, valid_pdus)
+
+            return valid_pdus
+
+        # We process the auth chain first, so that the auth events of the state
+        # have already been passed on by the time we get to it.
+        auth_chain_create_events = []
+        for chunk in response.iter_auth_events(SEND_JOIN_CHUNK_SIZE):
+            for e in await check_events(chunk):
+                if (e.type, e.state_key) == (EventTypes.Create, ""):
+                    auth_chain_create_events.append(e.event_id)
+
+        state: StateMap[str] = {}
+        for chunk in response.iter_state(SEND_JOIN_CHUNK_SIZE):
+            await check_events(chunk)
+            for e in chunk:
+                if checked_events[e.event_id]:
+                    state[(e.type, e.state_key)] = e.event_id
+
+        logger.info("Processed %d events from send_join", len(checked_events))
+
+        create_event_id = state.get((EventTypes.Create, ""))
+        if create_event_id is None:
+            # If the state doesn't have a create event then the room is
+            # invalid, and it would fail auth checks anyway.
+            raise InvalidResponseError("No create event in state")
+
+        # double-check that the same create event has ended up in the auth chain
+        if auth_chain_create_events != [create_event_id]:
+            raise InvalidResponseError(
+                "Unexpected create event(s) in auth chain: %s"
+                % (auth_chain_create_events,)
+            )
+
+        return SendJoinResult(event=event, origin=destination, state=state)
+
     async def _do_send_join(
         self, room_version: RoomVersion, destination: str, pdu: EventBase
     ) -> SendJoinResponse:
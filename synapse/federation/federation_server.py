@@ -13,6 +13,7 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import heapq
 import logging
 import random
 from typing import (
@@ -24,6 +25,7 @@ from typing import (
     Iterable,
     List,
     Optional,
+    Set,
     Tuple,
     Union,
 )
@@ -99,11 +101,42 @@ last_pdu_ts_metric = Gauge(
     labelnames=("server_name",),
 )
 
+staged_rooms_processing_gauge = Gauge(
+    "synapse_federation_server_staged_rooms_processing",
+    "The number of rooms whose staged inbound events this instance is processing",
+)
+
+staged_rooms_backlog_gauge = Gauge(
+    "synapse_federation_server_staged_rooms_backlog",
+    "The number of rooms with staged inbound events which this instance is responsible for",
+)
+
+room_backlog_gauge = Gauge(
+    "synapse_federation_server_room_inbound_pdu_backlog",
+    "The number of staged inbound events in the rooms with the largest backlogs",
+    labelnames=("room_id",),
+)
+
 
 # The name of the lock to use when process events in a room received over
 # federation.
 _INBOUND_EVENT_HANDLING_LOCK_NAME = "federation_inbound_pdu"
 
+# How often we check the staging area for rooms which need processing. When
+# rooms are sharded between instances this is how long it takes an instance to
+# notice events received by another instance, otherwise it is only needed to
+# pick up rooms whose processing was interrupted.
+_STAGED_EVENTS_SHARDED_POLL_INTERVAL_MS = 1000
+_STAGED_EVENTS_POLL_INTERVAL_MS = 60 * 1000
+
+# The maximum number of staged events we look at each time we check the
+# staging area. If there are more than this we carry on from where we got to
+# the next time.
+_MAX_STAGED_EVENTS_PER_POLL = 10000
+
+# The number of rooms we report the backlog of staged events for.
+_MAX_ROOMS_IN_BACKLOG_METRIC = 10
+
 
 class FederationServer(FederationBase):
     def __init__(self, hs: "HomeServer"):
@@ -149,17 +182,99 @@ class FederationServer(FederationBase):
 
         self._room_prejoin_state_types = hs.config.api.room_prejoin_state
 
-        # Whether we have started handling old events in the staging area.
-        self._started_handling_of_staged_events = False
+        self._instance_name = hs.get_instance_name()
+        self._inbound_shard_config = hs.config.worker.federation_inbound_shard_config
+
+        # Limits how many staged events we process at once, across all rooms.
+        # The linearizer queues are FIFO, so rooms with lots of events take
+        # turns with the other rooms.
+        self._inbound_pdu_limiter = Linearizer(
+            "fed_inbound_pdu",
+            max_count=hs.config.federation.federation_inbound_concurrency,
+            clock=self._clock,
+        )
+
+        # The rooms we are currently processing staged events for.
+        self._rooms_processing_staged_events: Set[str] = set()
+
+        # The rooms currently reported in `room_backlog_gauge`.
+        self._rooms_in_backlog_metric: Set[str] = set()
+
+        self._dispatching_staged_events = False
+
+        # The room ID we have got up to in the current pass over the staging
+        # area, and the backlogs of the rooms we have seen so far in that pass.
+        self._staged_events_from_room_id = ""
+        self._staged_event_counts: Dict[str, int] = {}
+
+        # Start handling any events left in the staging area for the rooms we
+        # are responsible for, and keep an eye out for new ones. This needs to
+        # happen even if we never receive a transaction ourselves, as the
+        # events may have been received by another instance.
+        if (
+            not self._inbound_shard_config.instances
+            or self._instance_name in self._inbound_shard_config.instances
+        ):
+            self._clock.call_later(0, self._start_dispatching_staged_events)
+
+    def _should_process_staged_events_in_room(self, room_id: str) -> bool:
+        """Whether this instance is responsible for processing the staged
+        events in the given room.
+        """
+        if not self._inbound_shard_config.instances:
+            # We're not sharding, so whichever instance gets there first.
+            return True
+
+        return self._inbound_shard_config.should_handle(self._instance_name, room_id)
+
+    def _start_dispatching_staged_events(self) -> None:
+        self._dispatch_staged_events()
 
-    @wrap_as_background_process("_handle_old_staged_events")
-    async def _handle_old_staged_events(self) -> None:
-        """Handle old staged events by fetching all rooms that have staged
-        events and start the processing of each of those rooms.
+        if self._inbound_shard_config.instances:
+            interval = _STAGED_EVENTS_SHARDED_POLL_INTERVAL_MS
+        else:
+            interval = _STAGED_EVENTS_POLL_INTERVAL_MS
+        self._clock.looping_call(self._dispatch_staged_events, interval)
+
+    @wrap_as_background_process("_dispatch_staged_events")
+    async def _dispatch_staged_events(self) -> None:
+        """Fetch all rooms that have staged events, and start processing each
+        of those this instance is responsible for that nobody is processing.
         """
+        if self._dispatching_staged_events:
+            return
+
+        self._dispatching_staged_events = True
+        try:
+            await self._dispatch_staged_events_inner()
+        finally:
+            self._dispatching_staged_events = False
 
-        # Get all the rooms IDs with staged events.
-        room_ids = await self.store.get_all_rooms_with_staged_incoming_events()
+    async def _dispatch_staged_events_inner(self) -> None:
+        counts, next_room_id = await self.store.get_staged_event_counts_by_room(
+            self._staged_events_from_room_id, _MAX_STAGED_EVENTS_PER_POLL
+        )
+        counts = {
+            room_id: count
+            for room_id, count in counts.items()
+            if self._should_process_staged_events_in_room(room_id)
+        }
+
+        # We only update the metrics once we have been through all of the
+        # staging area.
+        self._staged_event_counts.update(counts)
+        if next_room_id is None:
+            self._update_staged_events_metrics(self._staged_event_counts)
+            self._staged_events_from_room_id = ""
+            self._staged_event_counts = {}
+        else:
+            self._staged_events_from_room_id = next_room_id
+
+        room_ids = [
+            room_id
+            for room_id in counts
+            if room_id not in self._rooms_processing_staged_events
+        ]
 
         # We then shuffle them so that if there are multiple instances doing
         # this work they're less likely to collide.
@@ -181,8 +296,30 @@ class FederationServer(FederationBase):
                     lock,
                 )
 
-            # We pause a bit so that we don't start handling all rooms at once.
-            await self._clock.sleep(random.uniform(0, 0.1))
+            if not self._inbound_shard_config.instances:
+                # We pause a bit so that we don't start handling all rooms at
+                # once, and other instances get a chance to pick some up.
+                await self._clock.sleep(random.uniform(0, 0.1))
+
+    def _update_staged_events_metrics(self, counts: Dict[str, int]) -> None:
+        """Update the metrics for the backlog of staged events.
+
+        Args:
+            counts: The number of staged events in each room this instance is
+                responsible for.
+        """
+        staged_rooms_backlog_gauge.set(len(counts))
+
+        largest = heapq.nlargest(
+            _MAX_ROOMS_IN_BACKLOG_METRIC, counts.items(), key=lambda c: c[1]
+        )
+        for room_id in self._rooms_in_backlog_metric - {r for r, _ in largest}:
+            room_backlog_gauge.remove(room_id)
+
+        self._rooms_in_backlog_metric = set()
+        for room_id, count in largest:
+            room_backlog_gauge.labels(room_id).set(count)
+            self._rooms_in_backlog_metric.add(room_id)
 
     async def on_backfill_request(
         self, origin: str, room_id: str, versions: List[str], limit: int
@@ -202,12 +339,6 @@ class FederationServer(FederationBase):
     async def on_incoming_transaction(
         self, origin: str, transaction_data: JsonDict
     ) -> Tuple[int, Dict[str, Any]]:
-        # If we receive a transaction we should make sure that kick off handling
-        # any old events in the staging area.
-        if not self._started_handling_of_staged_events:
-            self._started_handling_of_staged_events = True
-            self._handle_old_staged_events()
-
         # keep this as early as possible to make the calculated origin ts as
         # accurate as possible.
         request_time = self._clock.time_msec()
@@ -406,14 +537,25 @@ class FederationServer(FederationBase):
                         pdu_results[event_id] = e.error_dict()
                     return
 
-                for pdu in pdus_by_room[room_id]:
-                    pdu_results[pdu.event_id] = await process_pdu(pdu)
-
-        async def process_pdu(pdu: EventBase) -> JsonDict:
+                # We start checking the signatures and hashes of all of the
+                # room's events at once, so that they get verified together.
+                room_version = await self.store.get_room_version(room_id)
+                pdus = pdus_by_room[room_id]
+                checked_pdus = [
+                    run_in_background(self._check_sigs_and_hash, room_version, pdu)
+                    for pdu in pdus
+                ]
+
+                for pdu, checked_pdu in zip(pdus, checked_pdus):
+                    pdu_results[pdu.event_id] = await process_pdu(pdu, checked_pdu)
+
+        async def process_pdu(
+            pdu: EventBase, checked_pdu: "defer.Deferred[EventBase]"
+        ) -> JsonDict:
             event_id = pdu.event_id
             with nested_logging_context(event_id):
                 try:
-                    await self._handle_received_pdu(origin, pdu)
+                    await self._handle_received_pdu(origin, pdu, checked_pdu)
                     return {}
                 except FederationError as e:
                     logger.warning("Error handling PDU %s: %s", event_id, e)
@@ -892,7 +1034,9 @@ class FederationServer(FederationBase):
             destination=None,
         )
 
-    async def _handle_received_pdu(self, origin: str, pdu: EventBase) -> None:
+    async def _handle_received_pdu(
+        self, origin: str, pdu: EventBase, checked_pdu: "defer.Deferred[EventBase]"
+    ) -> None:
         """Process a PDU received in a federation /send/ transaction.
 
         If the event is invalid, then this method throws a FederationError.
@@ -915,24 +1059,32 @@ class FederationServer(FederationBase):
         Args:
             origin: server which sent the pdu
             pdu: received pdu
+            checked_pdu: the result of calling `_check_sigs_and_hash` on the pdu,
+                which the caller starts so that the pdus in a transaction can be
+                checked together.
 
         Raises: FederationError if the signatures / hash do not match, or
             if the event was unacceptable for any other reason (eg, too large,
             too many prev_events, couldn't find the prev_events)
         """
 
-        # We've already checked that we know the room version by this point
-        room_version = await self.store.get_room_version(pdu.room_id)
-
         # Check signature.
         try:
-            pdu = await self._check_sigs_and_hash(room_version, pdu)
+            pdu = await make_deferred_yieldable(checked_pdu)
         except SynapseError as e:
             raise FederationError("ERROR", e.code, e.msg, affected=pdu.event_id)
 
+        # We've already checked that we know the room version by this point
+        room_version = await self.store.get_room_version(pdu.room_id)
+
         # Add the event to our staging area
         await self.store.insert_received_event_to_staging(origin, pdu)
 
+        # If another instance is responsible for the room it'll pick the event
+        # up from the staging area.
+        if not self._should_process_staged_events_in_room(pdu.room_id):
+            return
+
         # Try and acquire the processing lock for the room, if we get it start a
         # background process for handling the events in the room.
         lock = await self.store.try_acquire_lock(
@@ -957,7 +1109,24 @@ class FederationServer(FederationBase):
         The latest_origin and latest_event args are the latest origin and event
         received (or None to simply pull the next event from the database).
         """
+        self._rooms_processing_staged_events.add(room_id)
+        staged_rooms_processing_gauge.set(len(self._rooms_processing_staged_events))
+        try:
+            await self._process_staged_events_in_room(
+                room_id, room_version, lock, latest_origin, latest_event
+            )
+        finally:
+            self._rooms_processing_staged_events.discard(room_id)
+            staged_rooms_processing_gauge.set(len(self._rooms_processing_staged_events))
 
+    async def _process_staged_events_in_room(
+        self,
+        room_id: str,
+        room_version: RoomVersion,
+        lock: Lock,
+        latest_origin: Optional[str],
+        latest_event: Optional[EventBase],
+    ) -> None:
         # The common path is for the event we just received be the only event in
         # the room, so instead of pulling the event out of the DB and parsing
         # the event we just pull out the next event ID and check if that matches.
@@ -988,30 +1157,32 @@ class FederationServer(FederationBase):
         # has started processing).
         while True:
             async with lock:
-                try:
-                    await self.handler.on_receive_pdu(
-                        origin, event, sent_to_us_directly=True
-                    )
-                except FederationError as e:
-                    # XXX: Ideally we'd inform the remote we failed to process
-                    # the event, but we can't return an error in the transaction
-                    # response (as we've already responded).
-                    logger.warning("Error handling PDU %s: %s", event.event_id, e)
-                except Exception:
-                    f = failure.Failure()
-                    logger.error(
-                        "Failed to handle PDU %s",
-                        event.event_id,
-                        exc_info=(f.type, f.value, f.getTracebackObject()),  # type: ignore
-                    )
-
-                received_ts = await self.store.remove_received_event_from_staging(
-                    origin, event.event_id
-                )
-                if received_ts is not None:
-                    pdu_process_time.observe(
-                        (self._clock.time_msec() - received_ts) / 1000
+                # Wait for our turn to process an event.
+                with (await self._inbound_pdu_limiter.queue(None)):
+                    try:
+                        await self.handler.on_receive_pdu(
+                            origin, event, sent_to_us_directly=True
+                        )
+                    except FederationError as e:
+                        # XXX: Ideally we'd inform the remote we failed to process
+                        # the event, but we can't return an error in the transaction
+                        # response (as we've already responded).
+                        logger.warning("Error handling PDU %s: %s", event.event_id, e)
+                    except Exception:
+                        f = failure.Failure()
+                        logger.error(
+                            "Failed to handle PDU %s",
+                            event.event_id,
+                            exc_info=(f.type, f.value, f.getTracebackObject()),  # type: ignore
+                        )
+
+                    received_ts = await self.store.remove_received_event_from_staging(
+                        origin, event.event_id
                     )
+                    if received_ts is not None:
+                        pdu_process_time.observe(
+                            (self._clock.time_msec() - received_ts) / 1000
+                        )
 
             # We need to do this check outside the lock to avoid a race between
             # a new event being inserted by another instance and it attempting
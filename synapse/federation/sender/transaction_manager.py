@@ -12,9 +12,10 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 import logging
-from typing import TYPE_CHECKING, List
+from typing import TYPE_CHECKING, List, Tuple
 
-from prometheus_client import Gauge
+from canonicaljson import encode_canonical_json
+from prometheus_client import Counter, Gauge
 
 from synapse.api.errors import HttpResponseException
 from synapse.events import EventBase
@@ -28,6 +29,7 @@ from synapse.logging.opentracing import (
     whitelisted_homeserver,
 )
 from synapse.util import json_decoder
+from synapse.util.caches.lrucache import LruCache
 from synapse.util.metrics import measure_func
 
 if TYPE_CHECKING:
@@ -41,6 +43,17 @@ last_pdu_ts_metric = Gauge(
     labelnames=("server_name",),
 )
 
+pdu_json_encoded_bytes = Counter(
+    "synapse_federation_pdu_json_encoded_bytes",
+    "Number of bytes of PDU JSON encoded for outgoing transactions",
+)
+
+pdu_json_reused_bytes = Counter(
+    "synapse_federation_pdu_json_reused_bytes",
+    "Number of bytes of PDU JSON reused from a previous encoding for outgoing "
+    "transactions",
+)
+
 
 class TransactionManager:
     """Helper class which handles building and sending transactions
@@ -62,6 +75,14 @@ class TransactionManager:
         # HACK to get unique tx id
         self._next_txn_id = int(self.clock.time_msec())
 
+        # The canonical JSON encoding of recently sent PDUs, shared between all
+        # destinations so that an event sent to many servers is only encoded
+        # once. We store the event alongside its encoding so that we notice if
+        # we're handed a different (e.g. redacted) copy of the event.
+        self._pdu_json_cache: LruCache[str, Tuple[EventBase, bytes]] = LruCache(
+            max_size=1000, cache_name="federation_pdu_json_cache"
+        )
+
     @measure_func("_send_new_transaction")
     async def send_new_transaction(
         self,
@@ -142,9 +163,12 @@ class TransactionManager:
                             del p["age_ts"]
                 return data
 
+            def json_bytes_cb() -> bytes:
+                return self._encode_transaction(transaction, pdus)
+
             try:
                 response = await self._transport_layer.send_transaction(
-                    transaction, json_data_cb
+                    transaction, json_data_cb, json_bytes_callback=json_bytes_cb
                 )
             except HttpResponseException as e:
                 code = e.code
@@ -172,3 +196,41 @@ class TransactionManager:
                 last_pdu_ts_metric.labels(server_name=destination).set(
                     last_pdu.origin_server_ts / 1000
                 )
+
+    def _encode_transaction(
+        self, transaction: Transaction, pdus: List[EventBase]
+    ) -> bytes:
+        """Builds the canonical JSON encoding of the given transaction, reusing
+        the cached encodings of its PDUs where possible.
+        """
+        data = transaction.get_dict()
+        del data["pdus"]
+
+        # "pdus" sorts after all the other keys of a transaction, so we can
+        # append the list of PDUs to the encoding of everything else.
+        if not data or max(data) >= "pdus":
+            data["pdus"] = [p.get_pdu_json() for p in pdus]
+            return encode_canonical_json(data)
+
+        return b"".join(
+            (
+                encode_canonical_json(data)[:-1],
+                b',"pdus":[',
+                b",".join(self._encode_pdu(pdu) for pdu in pdus),
+                b"]}",
+            )
+        )
+
+    def _encode_pdu(self, pdu: EventBase) -> bytes:
+        """Returns the canonical JSON encoding of the given PDU, as sent in
+        transactions.
+        """
+        cached = self._pdu_json_cache.get(pdu.event_id)
+        if cached is not None and cached[0] is pdu:
+            pdu_json_reused_bytes.inc(len(cached[1]))
+            return cached[1]
+
+        pdu_bytes = encode_canonical_json(pdu.get_pdu_json())
+        pdu_json_encoded_bytes.inc(len(pdu_bytes))
+        self._pdu_json_cache[pdu.event_id] = (pdu, pdu_bytes)
+        return pdu_bytes
@@ -14,8 +14,21 @@
 # limitations under the License.
 
 import logging
+import tempfile
 import urllib
-from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Tuple, Union
+from typing import (
+    IO,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Tuple,
+    Union,
+)
 
 import attr
 import ijson
@@ -33,6 +46,7 @@ from synapse.federation.units import Transaction
 from synapse.http.matrixfederationclient import ByteParser
 from synapse.logging.utils import log_function
 from synapse.types import JsonDict
+from synapse.util.iterutils import batch_iter
 
 logger = logging.getLogger(__name__)
 
@@ -41,6 +55,10 @@ logger = logging.getLogger(__name__)
 # usage a bit.
 MAX_RESPONSE_SIZE_SEND_JOIN = 500 * 1024 * 1024
 
+# How much of a send join response to hold in memory, before spooling the rest
+# to disk.
+SEND_JOIN_SPOOL_SIZE = 10 * 1024 * 1024
+
 
 class TransportLayerClient:
     """Sends federation HTTP requests to other servers"""
@@ -139,11 +157,16 @@ class TransportLayerClient:
         self,
         transaction: Transaction,
         json_data_callback: Optional[Callable[[], JsonDict]] = None,
+        json_bytes_callback: Optional[Callable[[], bytes]] = None,
     ) -> JsonDict:
         """Sends the given Transaction to its destination
 
         Args:
             transaction (Transaction)
+            json_data_callback: A callable returning the body of the transaction.
+            json_bytes_callback: A callable returning the canonical JSON
+                encoding of the body of the transaction. Takes precedence over
+                `json_data_callback` if given.
 
         Returns:
             Succeeds when we get a 2xx HTTP response. The result
@@ -178,6 +201,7 @@ class TransportLayerClient:
             path=path,
             data=json_data,
             json_data_callback=json_data_callback,
+            json_bytes_callback=json_bytes_callback,
             long_retries=True,
             backoff_on_404=True,  # If we get a 404 the other side has gone
             try_trailing_slash_on_400=True,
@@ -1217,18 +1241,58 @@ def _create_v2_path(path: str, *args: str) -> str:
 
 @attr.s(slots=True, auto_attribs=True)
 class SendJoinResponse:
-    """The parsed response of a `/send_join` request."""
+    """The parsed response of a `/send_join` request.
+
+    The state and auth chain can be huge for large rooms, so they aren't parsed
+    up front. Instead the body of the response is kept, and the events are
+    parsed from it a chunk at a time by `iter_auth_events` and `iter_state`.
+    `close` should be called once the response has been processed.
+    """
 
-    # The list of auth events from the /send_join response.
-    auth_events: List[EventBase]
-    # The list of state from the /send_join response.
-    state: List[EventBase]
+    # The version of the room.
+    room_version: RoomVersion
+    # The raw body of the /send_join response, which is spooled to disk if it's
+    # large.
+    body: IO[bytes]
+    # The prefix of the path to the fields of the response.
+    prefix: str
     # The raw join event from the /send_join response.
     event_dict: JsonDict
     # The parsed join event from the /send_join response. This will be None if
     # "event" is not included in the response.
     event: Optional[EventBase] = None
 
+    def iter_auth_events(self, chunk_size: int) -> Iterator[List[EventBase]]:
+        """Parses the auth chain from the /send_join response.
+
+        Args:
+            chunk_size: The maximum number of events to parse at a time.
+
+        Returns:
+            The events in the auth chain, in chunks of up to `chunk_size`.
+        """
+        return self._iter_events(self.prefix + "auth_chain.item", chunk_size)
+
+    def iter_state(self, chunk_size: int) -> Iterator[List[EventBase]]:
+        """Parses the state from the /send_join response.
+
+        Args:
+            chunk_size: The maximum number of events to parse at a time.
+
+        Returns:
+            The state events, in chunks of up to `chunk_size`.
+        """
+        return self._iter_events(self.prefix + "state.item", chunk_size)
+
+    def _iter_events(self, prefix: str, chunk_size: int) -> Iterator[List[EventBase]]:
+        self.body.seek(0)
+        for chunk in batch_iter(ijson.items(self.body, prefix), chunk_size):
+            yield [make_event_from_dict(obj, self.room_version) for obj in chunk]
+
+    def close(self) -> None:
+        """Discards the body of the response."""
+        self.body.close()
+
 
 @ijson.coroutine
 def _event_parser(event_dict: JsonDict):
@@ -1241,21 +1305,12 @@ def _event_parser(event_dict: JsonDict):
         event_dict[key] = value
 
 
-@ijson.coroutine
-def _event_list_parser(room_version: RoomVersion, events: List[EventBase]):
-    """Helper function for use with `ijson.items_coro` to parse an array of
-    events and add them to the given list.
-    """
-
-    while True:
-        obj = yield
-        event = make_event_from_dict(obj, room_version)
-        events.append(event)
-
-
 class SendJoinParser(ByteParser[SendJoinResponse]):
     """A parser for the response to `/send_join` requests.
 
+    Only the join event is parsed as the response is received. The rest of the
+    response is spooled, for the state and auth chain to be parsed from later.
+
     Args:
         room_version: The version of the room.
         v1_api: Whether the response is in the v1 format.
@@ -1264,29 +1319,27 @@ class SendJoinParser(ByteParser[SendJoinResponse]):
     CONTENT_TYPE = "application/json"
 
     def __init__(self, room_version: RoomVersion, v1_api: bool):
-        self._response = SendJoinResponse([], [], {})
-        self._room_version = room_version
-
         # The V1 API has the shape of `[200, {...}]`, which we handle by
         # prefixing with `item.*`.
         prefix = "item." if v1_api else ""
 
-        self._coro_state = ijson.items_coro(
-            _event_list_parser(room_version, self._response.state),
-            prefix + "state.item",
-        )
-        self._coro_auth = ijson.items_coro(
-            _event_list_parser(room_version, self._response.auth_events),
-            prefix + "auth_chain.item",
+        self._response = SendJoinResponse(
+            room_version,
+            tempfile.SpooledTemporaryFile(max_size=SEND_JOIN_SPOOL_SIZE),
+            prefix,
+            {},
         )
+        self._room_version = room_version
+
+        # We still parse the whole of the response as it comes in, which also
+        # makes sure that it is valid JSON.
         self._coro_event = ijson.kvitems_coro(
             _event_parser(self._response.event_dict),
             prefix + "org.matrix.msc3083.v2.event",
         )
 
     def write(self, data: bytes) -> int:
-        self._coro_state.send(data)
-        self._coro_auth.send(data)
+        self._response.body.write(data)
         self._coro_event.send(data)
 
         return len(data)
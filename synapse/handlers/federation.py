@@ -59,7 +59,7 @@ from synapse.api.errors import (
     RequestSendFailed,
     SynapseError,
 )
-from synapse.api.room_versions import KNOWN_ROOM_VERSIONS, RoomVersion, RoomVersions
+from synapse.api.room_versions import KNOWN_ROOM_VERSIONS, RoomVersion
 from synapse.crypto.event_signing import compute_event_signature
 from synapse.event_auth import auth_types_for_event
 from synapse.events import EventBase
@@ -68,6 +68,7 @@ from synapse.events.validator import EventValidator
 from synapse.handlers._base import BaseHandler
 from synapse.http.servlet import assert_params_in_dict
 from synapse.logging.context import (
+    PreserveLoggingContext,
     make_deferred_yieldable,
     nested_logging_context,
     preserve_fn,
@@ -93,7 +94,8 @@ from synapse.types import (
     get_domain_from_id,
 )
 from synapse.util.async_helpers import Linearizer, concurrently_execute
-from synapse.util.iterutils import batch_iter
+from synapse.util.caches.lrucache import LruCache
+from synapse.util.iterutils import batch_iter, sorted_topologically
 from synapse.util.retryutils import NotRetryingDestination
 from synapse.util.stringutils import shortstr
 from synapse.visibility import filter_events_for_server
@@ -103,6 +105,22 @@ if TYPE_CHECKING:
 
 logger = logging.getLogger(__name__)
 
+# The number of events from the auth chain and state of a room we've joined
+# which we persist at a time.
+_PERSIST_AUTH_TREE_BATCH_SIZE = 1000
+
+# How long, in seconds, we assume backfill requests to a server we haven't
+# backfilled from before will take, when choosing which servers to try first.
+_UNKNOWN_BACKFILL_LATENCY = 10.0
+
+# The latency, in seconds, recorded for a server when a backfill request to it
+# fails.
+_FAILED_BACKFILL_LATENCY = 60.0
+
+# How much weight the latest backfill request to a server has in its average
+# latency.
+_BACKFILL_LATENCY_WEIGHT = 0.3
+
 soft_failed_event_counter = Counter(
     "synapse_federation_soft_failed_events_total",
     "Events received over federation that we marked as soft_failed",
@@ -126,6 +144,250 @@ class _NewEventInfo:
     auth_events = attr.ib(type=Optional[MutableStateMap[EventBase]], default=None)
 
 
+class _SendJoinPersister:
+    """Persists the events in the auth chain and state of a /send_join
+    response as outliers, a batch at a time as they are received.
+
+    Each event is auth checked against its auth events, so is only persisted
+    once they have been. Until then it is held on to.
+
+    Args:
+        handler: The handler, used to persist the events.
+        room_id: The room being joined.
+        room_version: The version of the room, which has been checked against
+            the version in the create event.
+    """
+
+    def __init__(
+        self, handler: "FederationHandler", room_id: str, room_version: RoomVersion
+    ):
+        self._handler = handler
+        self._store = handler.store
+        self._room_id = room_id
+        self._room_version = room_version
+
+        self._create_event: Optional[EventBase] = None
+        self._upserted_room = False
+
+        # The IDs of the events we've been given, and of those which have been
+        # persisted.
+        self._seen_event_ids: Set[str] = set()
+        self._persisted_event_ids: Set[str] = set()
+
+        # The events which are waiting for some of their auth events to be
+        # persisted, along with the IDs of those auth events.
+        self._waiting_events: Dict[str, Tuple[EventBase, Set[str]]] = {}
+        # Map from event ID to the IDs of the waiting events which need it.
+        self._waiting_on: Dict[str, List[str]] = {}
+
+        # The events which are ready to be persisted, in the order to persist
+        # them in.
+        self._ready_events: List[EventBase] = []
+
+    async def add_events(self, events: Iterable[EventBase]) -> None:
+        """Persists those of the given events, and of the events we're holding
+        on to, which are ready to be.
+
+        Args:
+            events: Events from the auth chain or state, which have valid
+                signatures and hashes.
+        """
+        for e in events:
+            if e.event_id in self._seen_event_ids:
+                continue
+            self._seen_event_ids.add(e.event_id)
+
+            e.internal_metadata.outlier = True
+            if (e.type, e.state_key) == (EventTypes.Create, ""):
+                self._create_event = e
+
+            missing_auth_event_ids = {
+                e_id
+                for e_id in e.auth_event_ids()
+                if e_id not in self._persisted_event_ids
+            }
+            if missing_auth_event_ids:
+                self._waiting_events[e.event_id] = (e, missing_auth_event_ids)
+                for e_id in missing_auth_event_ids:
+                    self._waiting_on.setdefault(e_id, []).append(e.event_id)
+            else:
+                self._ready_events.append(e)
+
+        # We don't persist anything until we've got the create event, which
+        # every event is auth checked against.
+        if self._create_event is not None:
+            await self._persist_ready_events({})
+
+    async def finish(self, origin: str, state: StateMap[str], event: EventBase) -> int:
+        """Persists the rest of the events we've been given, followed by the
+        join event.
+
+        Will attempt to fetch any auth events which we weren't given.
+
+        Args:
+            origin: The server which sent the /send_join response.
+            state: The state before the join event.
+            event: The join event.
+
+        Returns:
+            The stream ID after which all the events have been persisted.
+        """
+        missing_auth_event_ids = {
+            e_id
+            for e_id in itertools.chain(self._waiting_on, event.auth_event_ids())
+            if e_id not in self._seen_event_ids
+        }
+
+        fetched_events: Dict[str, EventBase] = {}
+        for e_id in missing_auth_event_ids:
+            m_ev = await self._handler.federation_client.get_pdu(
+                [origin],
+                e_id,
+                room_version=self._room_version,
+                outlier=True,
+                timeout=10000,
+            )
+            if m_ev and m_ev.event_id == e_id:
+                fetched_events[e_id] = m_ev
+            else:
+                logger.info("Failed to find auth event %r", e_id)
+
+        # Persist the events which are still waiting for auth events which we
+        # haven't got, each after any of its auth events which we have.
+        waiting_events = {e_id: e for e_id, (e, _) in self._waiting_events.items()}
+        self._waiting_events.clear()
+        self._waiting_on.clear()
+
+        sorted_event_ids = sorted_topologically(
+            waiting_events,
+            {e.event_id: e.auth_event_ids() for e in waiting_events.values()},
+        )
+        self._ready_events.extend(waiting_events[e_id] for e_id in sorted_event_ids)
+        await self._persist_ready_events(fetched_events)
+
+        auth_events = await self._get_auth_events([event], fetched_events)
+        try:
+            self._check_auth(event, auth_events)
+        except SynapseError as err:
+            logger.warning("Rejecting %s because %s", event.event_id, err.msg)
+            raise
+
+        await self._maybe_upsert_room()
+
+        new_event_context = await self._handler.state_handler.compute_event_context(
+            event, old_state_ids=state
+        )
+
+        return await self._handler.persist_events_and_notify(
+            self._room_id, [(event, new_event_context)]
+        )
+
+    async def _persist_ready_events(self, fetched_events: Dict[str, EventBase]) -> None:
+        """Persists the events which are ready to be, and any events which are
+        then ready because their auth events have been persisted.
+
+        Args:
+            fetched_events: Auth events which weren't in the response, and had
+                to be fetched.
+        """
+        # We persist the events in batches, so that we don't build huge
+        # requests to the event persister when joining large rooms.
+        while self._ready_events:
+            batch = self._ready_events[:_PERSIST_AUTH_TREE_BATCH_SIZE]
+            del self._ready_events[:_PERSIST_AUTH_TREE_BATCH_SIZE]
+
+            await self._maybe_upsert_room()
+
+            auth_events = await self._get_auth_events(batch, fetched_events)
+            auth_events.update((e.event_id, e) for e in batch)
+
+            events_and_contexts = []
+            for e in batch:
+                ctx = await self._handler.state_handler.compute_event_context(e)
+                try:
+                    self._check_auth(e, auth_events)
+                except SynapseError as err:
+                    # we may get SynapseErrors here as well as AuthErrors. For
+                    # instance, there are a couple of (ancient) events in some
+                    # rooms whose senders do not have the correct sigil; these
+                    # cause SynapseErrors in auth.check. We don't want to give up
+                    # the attempt to federate altogether in such cases.
+
+                    logger.warning("Rejecting %s because %s", e.event_id, err.msg)
+                    ctx.rejected = RejectedReason.AUTH_ERROR
+                events_and_contexts.append((e, ctx))
+
+            await self._handler.persist_events_and_notify(
+                self._room_id, events_and_contexts
+            )
+
+            # Now that they've been persisted, the events waiting on these ones
+            # might be ready.
+            for e in batch:
+                self._persisted_event_ids.add(e.event_id)
+
+                for waiting_event_id in self._waiting_on.pop(e.event_id, ()):
+                    waiting_event, missing = self._waiting_events[waiting_event_id]
+                    missing.discard(e.event_id)
+                    if not missing:
+                        del self._waiting_events[waiting_event_id]
+                        self._ready_events.append(waiting_event)
+
+    async def _get_auth_events(
+        self, events: Iterable[EventBase], fetched_events: Dict[str, EventBase]
+    ) -> Dict[str, EventBase]:
+        """Gets the auth events of the given events which have been persisted
+        or fetched.
+        """
+        auth_event_ids = {e_id for e in events for e_id in e.auth_event_ids()}
+        auth_events = await self._store.get_events(
+            [e_id for e_id in auth_event_ids if e_id in self._persisted_event_ids],
+            allow_rejected=True,
+        )
+        auth_events.update(
+            (e_id, fetched_events[e_id])
+            for e_id in auth_event_ids
+            if e_id in fetched_events
+        )
+        return auth_events
+
+    def _check_auth(self, event: EventBase, auth_events: Dict[str, EventBase]) -> None:
+        """Auth checks the event against those of its auth events we have.
+
+        Raises:
+            SynapseError if the event fails auth.
+        """
+        auth_for_e = {
+            (auth_events[e_id].type, auth_events[e_id].state_key): auth_events[e_id]
+            for e_id in event.auth_event_ids()
+            if e_id in auth_events
+        }
+        if self._create_event:
+            auth_for_e[(EventTypes.Create, "")] = self._create_event
+
+        event_auth.check(self._room_version, event, auth_events=auth_for_e)
+
+    async def _maybe_upsert_room(self) -> None:
+        """Adds a row to `rooms` for the room if we haven't already.
+
+        If this is the first time we've joined this room, it's time to add a
+        row to `rooms` with the correct room version. If there's already a row
+        there, we should override it, since it may have been populated based on
+        an invite request which lied about the room version.
+
+        federation_client.send_join checks that the room version in the
+        received create event is the same as the one we were given before
+        passing us any events, so we can rely on it now.
+        """
+        if self._upserted_room:
+            return
+
+        await self._store.upsert_room_on_join(
+            room_id=self._room_id, room_version=self._room_version
+        )
+        self._upserted_room = True
+
+
 class FederationHandler(BaseHandler):
     """Handles events that originated from federation.
     Responsible for:
@@ -186,6 +448,15 @@ class FederationHandler(BaseHandler):
         self._room_pdu_linearizer = Linearizer("fed_room_pdu")
 
         self._room_backfill = Linearizer("room_backfill")
+        self._backfill_concurrency = (
+            hs.config.federation.federation_backfill_concurrency
+        )
+
+        # The moving average of how long backfill requests to each server take,
+        # in seconds, used to decide which servers to try first.
+        self._backfill_latencies: LruCache[str, float] = LruCache(
+            10000, "backfill_latencies"
+        )
 
         self.third_party_event_rules = hs.get_third_party_event_rules()
 
@@ -1011,13 +1282,59 @@ class FederationHandler(BaseHandler):
         if dest == self.server_name:
             raise SynapseError(400, "Can't backfill from self.")
 
-        events = await self.federation_client.backfill(
-            dest, room_id, limit=limit, extremities=extremities
-        )
-
+        events = await self._fetch_backfill(dest, room_id, limit, extremities)
         if not events:
             return []
 
+        return await self._process_backfilled_events(dest, room_id, events)
+
+    async def _fetch_backfill(
+        self, dest: str, room_id: str, limit: int, extremities: Collection[str]
+    ) -> Optional[List[EventBase]]:
+        """Requests backfill from `dest`, recording how long it takes."""
+        start = self.clock.time()
+        try:
+            events = await self.federation_client.backfill(
+                dest, room_id, limit=limit, extremities=extremities
+            )
+        except Exception:
+            self._record_backfill_latency(dest, _FAILED_BACKFILL_LATENCY)
+            raise
+
+        self._record_backfill_latency(dest, self.clock.time() - start)
+        return events
+
+    def _record_backfill_latency(self, dest: str, latency: float) -> None:
+        previous = self._backfill_latencies.get(dest)
+        if previous is not None:
+            latency = (
+                _BACKFILL_LATENCY_WEIGHT * latency
+                + (1 - _BACKFILL_LATENCY_WEIGHT) * previous
+            )
+        self._backfill_latencies.set(dest, latency)
+
+    def _rank_backfill_domains(self, domains: List[str]) -> List[str]:
+        """Orders the servers to backfill from so that the ones which have
+        recently responded quickest are tried first.
+
+        Servers we don't know about keep their relative order.
+        """
+        return sorted(
+            domains,
+            key=lambda dom: self._backfill_latencies.get(
+                dom, _UNKNOWN_BACKFILL_LATENCY
+            ),
+        )
+
+    async def _process_backfilled_events(
+        self, dest: str, room_id: str, events: List[EventBase]
+    ) -> List[EventBase]:
+        """Checks and persists the events received in response to a backfill
+        request to `dest`.
+
+        Returns:
+            The events which we didn't already have.
+        """
         # ideally we'd sanity check the events here for excess prev_events etc,
         # but it's hard to reject events at this point without completely
         # breaking backfill in the same way that it is currently broken by
@@ -1028,12 +1345,17 @@ class FederationHandler(BaseHandler):
         # for ev in events:
         #     self._sanity_check_event(ev)
 
-        # Don't bother processing events we already have.
+        # Don't bother processing events we already have (or which the server
+        # sent us more than once).
         seen_events = await self.store.have_events_in_timeline(
             {e.event_id for e in events}
         )
 
-        events = [e for e in events if e.event_id not in seen_events]
+        events = [
+            e
+            for e in {e.event_id: e for e in events}.values()
+            if e.event_id not in seen_events
+        ]
 
         if not events:
             return []
@@ -1313,7 +1635,10 @@ class FederationHandler(BaseHandler):
         ]
 
         async def try_backfill(domains: List[str]) -> bool:
-            # TODO: Should we try multiple of these at a time?
+            domains = self._rank_backfill_domains(domains)
+            if self._backfill_concurrency > 1:
+                return await self._backfill_concurrently(domains, room_id, extremities)
+
             for dom in domains:
                 try:
                     await self.backfill(
@@ -1323,32 +1648,8 @@ class FederationHandler(BaseHandler):
                     # appropriate stuff.
                     # TODO: We can probably do something more intelligent here.
                     return True
-                except SynapseError as e:
-                    logger.info("Failed to backfill from %s because %s", dom, e)
-                    continue
-                except HttpResponseException as e:
-                    if 400 <= e.code < 500:
-                        raise e.to_synapse_error()
-
-                    logger.info("Failed to backfill from %s because %s", dom, e)
-                    continue
-                except CodeMessageException as e:
-                    if 400 <= e.code < 500:
-                        raise
-
-                    logger.info("Failed to backfill from %s because %s", dom, e)
-                    continue
-                except NotRetryingDestination as e:
-                    logger.info(str(e))
-                    continue
-                except RequestSendFailed as e:
-                    logger.info("Failed to get backfill from %s because %s", dom, e)
-                    continue
-                except FederationDeniedError as e:
-                    logger.info(e)
-                    continue
                 except Exception as e:
-                    logger.exception("Failed to backfill from %s because %s", dom, e)
+                    self._handle_backfill_failure(dom, e)
                     continue
 
             return False
@@ -1407,6 +1708,148 @@ class FederationHandler(BaseHandler):
 
         return False
 
+    async def _backfill_concurrently(
+        self, domains: List[str], room_id: str, extremities: Collection[str]
+    ) -> bool:
+        """Requests backfill from several of the given servers at once, and
+        processes the first response which has events we don't already have.
+
+        Up to `federation_backfill_concurrency` requests are in flight at a
+        time, moving on to the next server whenever one fails. We stop asking
+        new servers while we have a response to process, and stop altogether
+        once one has been processed successfully. If processing a response
+        fails we move on to the next one, asking more servers if need be.
+
+        The requests are made from background processes, so that responses
+        which arrive after the one we use still count towards the servers'
+        latencies.
+
+        Returns:
+            Whether we successfully backfilled from any server.
+
+        Raises:
+            SynapseError if we didn't backfill from any server and at least one
+            rejected the request.
+        """
+        # The responses received, as the server and the events we don't
+        # already have. Each request worker puts exactly one item on the queue:
+        # None if it stopped without getting a response.
+        responses: "defer.DeferredQueue[Optional[Tuple[str, List[EventBase]]]]"
+        responses = defer.DeferredQueue()
+
+        domains_iter = iter(domains)
+        done = False
+        pending_responses = 0
+        client_errors: List[Exception] = []
+
+        async def backfill_from_next_domain() -> None:
+            nonlocal pending_responses
+
+            response = None
+            # Check whether to stop before taking the next server, so that we
+            # don't skip it if we're asked to carry on later.
+            while not done and not pending_responses:
+                dom = next(domains_iter, None)
+                if dom is None:
+                    break
+
+                try:
+                    events = await self._fetch_backfill(dom, room_id, 100, extremities)
+                    seen_events = await self.store.have_events_in_timeline(
+                        {e.event_id for e in events or ()}
+                    )
+                except Exception as e:
+                    try:
+                        self._handle_backfill_failure(dom, e)
+                    except Exception as client_error:
+                        client_errors.append(client_error)
+                    continue
+
+                pending_responses += 1
+                response = (
+                    dom,
+                    [e for e in events or () if e.event_id not in seen_events],
+                )
+                break
+
+            # Make sure that whoever is waiting on the queue is resumed in their
+            # own logcontext rather than ours.
+            with PreserveLoggingContext():
+                responses.put(response)
+
+        workers = 0
+
+        def start_workers() -> None:
+            nonlocal workers
+            while workers < self._backfill_concurrency:
+                workers += 1
+                run_as_background_process(
+                    "backfill_from_next_domain", backfill_from_next_domain
+                )
+
+        try:
+            start_workers()
+            while workers:
+                response = await make_deferred_yieldable(responses.get())
+                workers -= 1
+                if response is None:
+                    continue
+
+                dom, events = response
+                if not events:
+                    # The server didn't have anything we don't already have.
+                    return True
+
+                try:
+                    await self._process_backfilled_events(dom, room_id, events)
+                    return True
+                except Exception as e:
+                    self._handle_backfill_failure(dom, e)
+
+                pending_responses -= 1
+                if not pending_responses:
+                    start_workers()
+        finally:
+            # Stop any remaining workers from asking more servers.
+            done = True
+
+        if client_errors:
+            raise client_errors[0]
+        return False
+
+    def _handle_backfill_failure(self, dom: str, e: Exception) -> None:
+        """Logs why backfilling from a server failed.
+
+        Raises:
+            SynapseError if the server rejected the request, in which case we
+            shouldn't try the other servers.
+        """
+        if isinstance(e, SynapseError):
+            logger.info("Failed to backfill from %s because %s", dom, e)
+        elif isinstance(e, HttpResponseException):
+            if 400 <= e.code < 500:
+                raise e.to_synapse_error()
+
+            logger.info("Failed to backfill from %s because %s", dom, e)
+        elif isinstance(e, CodeMessageException):
+            if 400 <= e.code < 500:
+                raise e
+
+            logger.info("Failed to backfill from %s because %s", dom, e)
+        elif isinstance(e, NotRetryingDestination):
+            logger.info(str(e))
+        elif isinstance(e, RequestSendFailed):
+            logger.info("Failed to get backfill from %s because %s", dom, e)
+        elif isinstance(e, FederationDeniedError):
+            logger.info(e)
+        else:
+            logger.error(
+                "Failed to backfill from %s because %s",
+                dom,
+                e,
+                exc_info=(type(e), e, e.__traceback__),
+            )
+
     async def _get_events_and_persist(
         self, destination: str, room_id: str, events: Iterable[str]
     ) -> None:
@@ -1597,38 +2040,30 @@ class FederationHandler(BaseHandler):
             except ValueError:
                 pass
 
+            # The events from the auth chain and state of each server's
+            # response are persisted as they are received.
+            persisters: Dict[str, _SendJoinPersister] = {}
+
+            def get_persister(origin: str) -> _SendJoinPersister:
+                persister = persisters.get(origin)
+                if persister is None:
+                    persister = _SendJoinPersister(self, room_id, room_version_obj)
+                    persisters[origin] = persister
+                return persister
+
+            async def on_events(origin: str, events: List[EventBase]) -> None:
+                await get_persister(origin).add_events(events)
+
             ret = await self.federation_client.send_join(
-                host_list, event, room_version_obj
+                host_list, event, room_version_obj, on_events
             )
 
             event = ret.event
             origin = ret.origin
-            state = ret.state
-            auth_chain = ret.auth_chain
-            auth_chain.sort(key=lambda e: e.depth)
-
-            logger.debug("do_invite_join auth_chain: %s", auth_chain)
-            logger.debug("do_invite_join state: %s", state)
 
             logger.debug("do_invite_join event: %s", event)
 
-            # if this is the first time we've joined this room, it's time to add
-            # a row to `rooms` with the correct room version. If there's already a
-            # row there, we should override it, since it may have been populated
-            # based on an invite request which lied about the room version.
-            #
-            # federation_client.send_join has already checked that the room
-            # version in the received create event is the same as room_version_obj,
-            # so we can rely on it now.
-            #
-            await self.store.upsert_room_on_join(
-                room_id=room_id,
-                room_version=room_version_obj,
-            )
-
-            max_stream_id = await self._persist_auth_tree(
-                origin, room_id, auth_chain, state, event, room_version_obj
-            )
+            max_stream_id = await get_persister(origin).finish(origin, ret.state, event)
 
             # We wait here until this instance has seen the events come down
             # replication (if we're using replication) as the below uses caches.
@@ -2430,119 +2865,6 @@ class FederationHandler(BaseHandler):
             backfilled=backfilled,
         )
 
-    async def _persist_auth_tree(
-        self,
-        origin: str,
-        room_id: str,
-        auth_events: List[EventBase],
-        state: List[EventBase],
-        event: EventBase,
-        room_version: RoomVersion,
-    ) -> int:
-        """Checks the auth chain is valid (and passes auth checks) for the
-        state and event. Then persists the auth chain and state atomically.
-        Persists the event separately. Notifies about the persisted events
-        where appropriate.
-
-        Will attempt to fetch missing auth events.
-
-        Args:
-            origin: Where the events came from
-            room_id,
-            auth_events
-            state
-            event
-            room_version: The room version we expect this room to have, and
-                will raise if it doesn't match the version in the create event.
-        """
-        events_to_context = {}
-        for e in itertools.chain(auth_events, state):
-            e.internal_metadata.outlier = True
-            ctx = await self.state_handler.compute_event_context(e)
-            events_to_context[e.event_id] = ctx
-
-        event_map = {
-            e.event_id: e for e in itertools.chain(auth_events, state, [event])
-        }
-
-        create_event = None
-        for e in auth_events:
-            if (e.type, e.state_key) == (EventTypes.Create, ""):
-                create_event = e
-                break
-
-        if create_event is None:
-            # If the state doesn't have a create event then the room is
-            # invalid, and it would fail auth checks anyway.
-            raise SynapseError(400, "No create event in state")
-
-        room_version_id = create_event.content.get(
-            "room_version", RoomVersions.V1.identifier
-        )
-
-        if room_version.identifier != room_version_id:
-            raise SynapseError(400, "Room version mismatch")
-
-        missing_auth_events = set()
-        for e in itertools.chain(auth_events, state, [event]):
-            for e_id in e.auth_event_ids():
-                if e_id not in event_map:
-                    missing_auth_events.add(e_id)
-
-        for e_id in missing_auth_events:
-            m_ev = await self.federation_client.get_pdu(
-                [origin],
-                e_id,
-                room_version=room_version,
-                outlier=True,
-                timeout=10000,
-            )
-            if m_ev and m_ev.event_id == e_id:
-                event_map[e_id] = m_ev
-            else:
-                logger.info("Failed to find auth event %r", e_id)
-
-        for e in itertools.chain(auth_events, state, [event]):
-            auth_for_e = {
-                (event_map[e_id].type, event_map[e_id].state_key): event_map[e_id]
-                for e_id in e.auth_event_ids()
-                if e_id in event_map
-            }
-            if create_event:
-                auth_for_e[(EventTypes.Create, "")] = create_event
-
-            try:
-                event_auth.check(room_version, e, auth_events=auth_for_e)
-            except SynapseError as err:
-                # we may get SynapseErrors here as well as AuthErrors. For
-                # instance, there are a couple of (ancient) events in some
-                # rooms whose senders do not have the correct sigil; these
-                # cause SynapseErrors in auth.check. We don't want to give up
-                # the attempt to federate altogether in such cases.
-
-                logger.warning("Rejecting %s because %s", e.event_id, err.msg)
-
-                if e == event:
-                    raise
-                events_to_context[e.event_id].rejected = RejectedReason.AUTH_ERROR
-
-        if auth_events or state:
-            await self.persist_events_and_notify(
-                room_id,
-                [
-                    (e, events_to_context[e.event_id])
-                    for e in itertools.chain(auth_events, state)
-                ],
-            )
-
-        new_event_context = await self.state_handler.compute_event_context(
-            event, old_state=state
-        )
-
-        return await self.persist_events_and_notify(
-            room_id, [(event, new_event_context)]
-        )
-
     async def _check_for_soft_fail(
         self,
         event: EventBase,
@@ -41,6 +41,7 @@ class SearchHandler(BaseHandler):
         self.storage = hs.get_storage()
         self.state_store = self.storage.state
         self.auth = hs.get_auth()
+        self._search_backend = hs.get_search_backend()
 
     async def get_old_rooms_from_upgraded_room(self, room_id: str) -> Iterable[str]:
         """Retrieves room IDs of old rooms in the history of an upgraded room.
@@ -228,7 +229,9 @@ class SearchHandler(BaseHandler):
         count = None
 
         if order_by == "rank":
-            search_result = await self.store.search_msgs(room_ids, search_term, keys)
+            search_result = await self._search_backend.search_msgs(
+                room_ids, search_term, keys
+            )
 
             count = search_result["count"]
 
@@ -272,7 +275,7 @@ class SearchHandler(BaseHandler):
             # But only go around 5 times since otherwise synapse will be sad.
             while len(room_events) < search_filter.limit() and i < 5:
                 i += 1
-                search_result = await self.store.search_rooms(
+                search_result = await self._search_backend.search_rooms(
                     room_ids,
                     search_term,
                     keys,
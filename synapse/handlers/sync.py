@@ -82,6 +82,10 @@ LAZY_LOADED_MEMBERS_CACHE_MAX_AGE = 30 * 60 * 1000
 # avoiding redundantly sending the same lazy-loaded members to the client
 LAZY_LOADED_MEMBERS_CACHE_MAX_SIZE = 100
 
+# Keep the incremental sync state for a given device for no more than 30 minutes.
+# Clients which haven't synced in that time will just have to recalculate it.
+INCREMENTAL_SYNC_STATE_CACHE_MAX_AGE = 30 * 60 * 1000
+
 
 SyncRequestKey = Tuple[Any, ...]
 
@@ -95,6 +99,22 @@ class SyncConfig:
     device_id = attr.ib(type=Optional[str])
 
 
+@attr.s(slots=True, frozen=True)
+class IncrementalSyncState:
+    """The state we remember about the last sync we sent to a device, so that
+    the next incremental sync can be advanced from it rather than recalculated
+    from scratch.
+
+    Attributes:
+        next_batch: The `next_batch` token returned to the client. The state is
+            only valid for a subsequent sync whose `since` token matches it.
+        joined_room_ids: The rooms the user was joined to at `next_batch`.
+    """
+
+    next_batch = attr.ib(type=StreamToken)
+    joined_room_ids = attr.ib(type=FrozenSet[str])
+
+
 @attr.s(slots=True, frozen=True)
 class TimelineBatch:
     prev_batch = attr.ib(type=StreamToken)
@@ -295,6 +315,16 @@ class SyncHandler:
             expiry_ms=LAZY_LOADED_MEMBERS_CACHE_MAX_AGE,
         )
 
+        # ExpiringCache((User, Device)) -> IncrementalSyncState
+        self.incremental_sync_state_cache: ExpiringCache[
+            Tuple[str, Optional[str]], IncrementalSyncState
+        ] = ExpiringCache(
+            "incremental_sync_state_cache",
+            self.clock,
+            max_len=0,
+            expiry_ms=INCREMENTAL_SYNC_STATE_CACHE_MAX_AGE,
+        )
+
     async def wait_for_sync_for_user(
         self,
         requester: Requester,
@@ -1048,16 +1078,40 @@ class SyncHandler:
             # We no longer support AS users using /sync directly.
             # See https://github.com/matrix-org/matrix-doc/issues/1144
             raise NotImplementedError()
+
+        # If this sync follows on directly from the last one we sent to this
+        # device, we can advance from the state we calculated then rather than
+        # starting from scratch.
+        cache_key = (user_id, sync_config.device_id)
+        previous_state = None
+        membership_change_events = None
+        if since_token and not full_state:
+            previous_state = self.incremental_sync_state_cache.get(cache_key)
+            if previous_state and previous_state.next_batch != since_token:
+                previous_state = None
+
+            # We fetch the membership changes up front so that the various
+            # stages below can share them.
+            membership_change_events = await self.store.get_membership_changes_for_user(
+                user_id, since_token.room_key, now_token.room_key
+            )
+
+        if previous_state and not membership_change_events:
+            # The user's membership hasn't changed since the last sync, so
+            # they're still in the same set of rooms.
+            joined_room_ids = previous_state.joined_room_ids
         else:
             joined_room_ids = await self.get_rooms_for_user_at(
                 user_id, now_token.room_key
             )
+
         sync_result_builder = SyncResultBuilder(
             sync_config,
             full_state,
             since_token=since_token,
             now_token=now_token,
             joined_room_ids=joined_room_ids,
+            membership_change_events=membership_change_events,
         )
 
         logger.debug("Fetching account data")
@@ -1123,6 +1177,11 @@ class SyncHandler:
                     "Sync result for newly joined room %s: %r", room_id, joined_room
                 )
 
+        self.incremental_sync_state_cache[cache_key] = IncrementalSyncState(
+            next_batch=sync_result_builder.now_token,
+            joined_room_ids=joined_room_ids,
+        )
+
         logger.debug("Sync response calculation complete")
         return SyncResult(
             presence=sync_result_builder.presence,
@@ -1564,16 +1623,12 @@ class SyncHandler:
         """Returns whether there may be any new events that should be sent down
         the sync. Returns True if there are.
         """
-        user_id = sync_result_builder.sync_config.user.to_string()
         since_token = sync_result_builder.since_token
-        now_token = sync_result_builder.now_token
 
         assert since_token
 
         # Get a list of membership change events that have happened.
-        rooms_changed = await self.store.get_membership_changes_for_user(
-            user_id, since_token.room_key, now_token.room_key
-        )
+        rooms_changed = await self._get_membership_changes(sync_result_builder)
 
         if rooms_changed:
             return True
@@ -1584,6 +1639,27 @@ class SyncHandler:
                 return True
         return False
 
+    async def _get_membership_changes(
+        self, sync_result_builder: "SyncResultBuilder"
+    ) -> List[EventBase]:
+        """Returns the membership events for the syncing user between the since
+        token and the now token, reusing the ones fetched at the start of the
+        sync where possible.
+        """
+        if sync_result_builder.membership_change_events is not None:
+            return sync_result_builder.membership_change_events
+
+        since_token = sync_result_builder.since_token
+        assert since_token
+
+        membership_change_events = await self.store.get_membership_changes_for_user(
+            sync_result_builder.sync_config.user.to_string(),
+            since_token.room_key,
+            sync_result_builder.now_token.room_key,
+        )
+        sync_result_builder.membership_change_events = membership_change_events
+        return membership_change_events
+
     async def _get_rooms_changed(
         self, sync_result_builder: "SyncResultBuilder", ignored_users: FrozenSet[str]
     ) -> _RoomChanges:
@@ -1596,9 +1672,7 @@ class SyncHandler:
         assert since_token
 
         # Get a list of membership change events that have happened.
-        rooms_changed = await self.store.get_membership_changes_for_user(
-            user_id, since_token.room_key, now_token.room_key
-        )
+        rooms_changed = await self._get_membership_changes(sync_result_builder)
 
         mem_change_events_by_room_id: Dict[str, List[EventBase]] = {}
         for event in rooms_changed:
@@ -2170,6 +2244,8 @@ class SyncResultBuilder:
         since_token: The token supplied by user, or None.
         now_token: The token to sync up to.
         joined_room_ids: List of rooms the user is joined to
+        membership_change_events: The user's membership events between
+            `since_token` and `now_token`, if they have been fetched yet.
 
         # The following mirror the fields in a sync response
         presence (list)
@@ -2187,6 +2263,7 @@ class SyncResultBuilder:
     since_token = attr.ib(type=Optional[StreamToken])
     now_token = attr.ib(type=StreamToken)
     joined_room_ids = attr.ib(type=FrozenSet[str])
+    membership_change_events = attr.ib(type=Optional[List[EventBase]], default=None)
 
     presence = attr.ib(type=List[JsonDict], default=attr.Factory(list))
     account_data = attr.ib(type=List[JsonDict], default=attr.Factory(list))
@@ -13,11 +13,14 @@
 # limitations under the License.
 
 import logging
-from typing import TYPE_CHECKING, Any, Dict, List, Optional
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional
+
+from prometheus_client import Counter
 
 import synapse.metrics
 from synapse.api.constants import EventTypes, HistoryVisibility, JoinRules, Membership
 from synapse.handlers.state_deltas import StateDeltasHandler
+from synapse.handlers.user_directory_index import UserDirectoryIndex
 from synapse.metrics.background_process_metrics import run_as_background_process
 from synapse.storage.roommember import ProfileInfo
 from synapse.types import JsonDict
@@ -28,6 +31,10 @@ if TYPE_CHECKING:
 
 logger = logging.getLogger(__name__)
 
+# Counts the searches answered by the in memory user directory index, labelled
+# by whether they were answered from it or had to fall back to the database.
+index_search_counter = Counter("synapse_user_directory_index_searches", "", ["result"])
+
 
 class UserDirectoryHandler(StateDeltasHandler):
     """Handles querying of and keeping updated the user_directory.
@@ -57,6 +64,21 @@ class UserDirectoryHandler(StateDeltasHandler):
         # Guard to ensure we only process deltas one at a time
         self._is_processing = False
 
+        # The in memory copy of the user directory, if enabled. It is only
+        # searched once it has been loaded from the database.
+        self._index: Optional[UserDirectoryIndex] = None
+        self._index_loaded = False
+        # Updates made to the directory while the index is being loaded, which
+        # get applied to it once it has been.
+        self._pending_index_updates: Optional[
+            List[Callable[[UserDirectoryIndex], None]]
+        ] = None
+
+        if self.update_user_directory and hs.config.user_directory_in_memory_index:
+            self._index = UserDirectoryIndex(
+                self.server_name, hs.config.user_directory_search_prefer_local_users
+            )
+
         if self.update_user_directory:
             self.notifier.add_replication_callback(self.notify_new_event)
 
@@ -83,7 +105,20 @@ class UserDirectoryHandler(StateDeltasHandler):
                     ]
                 }
         """
-        results = await self.store.search_user_dir(user_id, search_term, limit)
+        results = None
+        if self._index is not None and self._index_loaded:
+            results = self._index.search(
+                user_id, search_term, limit, self.search_all_users
+            )
+
+        # The index may not have seen updates made by other processes, so fall
+        # back to the database if it didn't find anyone.
+        if results and results["results"]:
+            index_search_counter.labels("hit").inc()
+        else:
+            if self._index is not None:
+                index_search_counter.labels("miss").inc()
+            results = await self.store.search_user_dir(user_id, search_term, limit)
 
         # Remove any spammy users from the results.
         non_spammy_users = []
@@ -129,12 +164,48 @@ class UserDirectoryHandler(StateDeltasHandler):
             await self.store.update_profile_in_user_dir(
                 user_id, profile.display_name, profile.avatar_url
             )
+            self._update_index(
+                lambda index: index.update_profile(
+                    user_id, profile.display_name, profile.avatar_url
+                )
+            )
 
     async def handle_user_deactivated(self, user_id: str) -> None:
         """Called when a user ID is deactivated"""
         # FIXME(#3714): We should probably do this in the same worker as all
         # the other changes.
         await self.store.remove_from_user_dir(user_id)
+        self._update_index(lambda index: index.remove_user(user_id))
+
+    def _update_index(self, update: Callable[[UserDirectoryIndex], None]) -> None:
+        """Applies a change made to the user directory tables to the in memory
+        index, if there is one.
+        """
+        if self._index is None:
+            return
+
+        if self._index_loaded:
+            update(self._index)
+        elif self._pending_index_updates is not None:
+            self._pending_index_updates.append(update)
+
+    async def _load_index(self) -> None:
+        """Populates the in memory index from the user directory tables."""
+        assert self._index is not None
+
+        self._pending_index_updates = []
+        with Measure(self.clock, "user_dir_load_index"):
+            # The index is built on the database thread as the rows are
+            # streamed out of the database. Nothing else touches it until it
+            # has been loaded, as updates get queued up in the meantime.
+            await self.store.get_user_directory_tables(self._index.load)
+
+            for update in self._pending_index_updates:
+                update(self._index)
+            self._pending_index_updates = None
+
+        self._index_loaded = True
+        logger.info("Loaded %d users into user directory index", len(self._index))
 
     async def _unsafe_process(self) -> None:
         # If self.pos is None then means we haven't fetched it from DB
@@ -145,6 +216,9 @@ class UserDirectoryHandler(StateDeltasHandler):
         if self.pos is None:
             return None
 
+        if self._index is not None and not self._index_loaded:
+            await self._load_index()
+
         # Loop round handling deltas until we're up to date
         while True:
             with Measure(self.clock, "user_dir_delta"):
@@ -169,7 +243,12 @@ class UserDirectoryHandler(StateDeltasHandler):
                     max_pos
                 )
 
-                await self.store.update_user_directory_stream_pos(max_pos)
+                # This gets written after every batch of deltas, so we buffer
+                # the writes. If we crash before they're flushed we just
+                # handle a few deltas again on startup.
+                await self.store.update_user_directory_stream_pos(
+                    max_pos, buffered=True
+                )
 
     async def _handle_deltas(self, deltas: List[Dict[str, Any]]) -> None:
         """Called with the state deltas to process"""
@@ -307,7 +386,7 @@ class UserDirectoryHandler(StateDeltasHandler):
 
         # Remove every user from the sharing tables for that room.
         for user_id in other_users_in_room_with_profiles.keys():
-            await self.store.remove_user_who_share_room(user_id, room_id)
+            await self._remove_user_who_share_room(user_id, room_id)
 
         # Then, re-add them to the tables.
         # NOTE: this is not the most efficient method, as handle_new_user sets
@@ -332,6 +411,11 @@ class UserDirectoryHandler(StateDeltasHandler):
         await self.store.update_profile_in_user_dir(
             user_id, profile.display_name, profile.avatar_url
         )
+        self._update_index(
+            lambda index: index.update_profile(
+                user_id, profile.display_name, profile.avatar_url
+            )
+        )
 
         is_public = await self.store.is_room_world_readable_or_publicly_joinable(
             room_id
@@ -341,6 +425,9 @@ class UserDirectoryHandler(StateDeltasHandler):
 
         if is_public:
             await self.store.add_users_in_public_rooms(room_id, (user_id,))
+            self._update_index(
+                lambda index: index.add_users_in_public_room(room_id, (user_id,))
+            )
         else:
             to_insert = set()
 
@@ -372,6 +459,11 @@ class UserDirectoryHandler(StateDeltasHandler):
 
             if to_insert:
                 await self.store.add_users_who_share_private_room(room_id, to_insert)
+                self._update_index(
+                    lambda index: index.add_users_who_share_private_room(
+                        room_id, to_insert
+                    )
+                )
 
     async def _handle_remove_user(self, room_id: str, user_id: str) -> None:
         """Called when we might need to remove user from directory
@@ -383,13 +475,20 @@ class UserDirectoryHandler(StateDeltasHandler):
         logger.debug("Removing user %r", user_id)
 
         # Remove user from sharing tables
-        await self.store.remove_user_who_share_room(user_id, room_id)
+        await self._remove_user_who_share_room(user_id, room_id)
 
         # Are they still in any rooms? If not, remove them entirely.
         rooms_user_is_in = await self.store.get_user_dir_rooms_user_is_in(user_id)
 
         if len(rooms_user_is_in) == 0:
             await self.store.remove_from_user_dir(user_id)
+            self._update_index(lambda index: index.remove_user(user_id))
+
+    async def _remove_user_who_share_room(self, user_id: str, room_id: str) -> None:
+        await self.store.remove_user_who_share_room(user_id, room_id)
+        self._update_index(
+            lambda index: index.remove_user_who_share_room(user_id, room_id)
+        )
 
     async def _handle_profile_change(
         self,
@@ -427,3 +526,6 @@ class UserDirectoryHandler(StateDeltasHandler):
 
         if prev_name != new_name or prev_avatar != new_avatar:
             await self.store.update_profile_in_user_dir(user_id, new_name, new_avatar)
+            self._update_index(
+                lambda index: index.update_profile(user_id, new_name, new_avatar)
+            )
@@ -0,0 +1,329 @@
+# Copyright 2021 The Matrix.org Foundation C.I.C.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import bisect
+import re
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from synapse.types import JsonDict, get_domain_from_id, get_localpart_from_id
+
+# The weights given to matches against the different parts of a user's
+# profile. These mirror the weights used by the postgres search query.
+_LOCALPART_WEIGHT = 1.0
+_DISPLAY_NAME_WEIGHT = 0.9
+_DOMAIN_WEIGHT = 0.1
+
+_WORD_REGEX = re.compile(r"([\w\-]+)", re.UNICODE)
+
+
+def _tokenise(value: str) -> List[str]:
+    """Splits a string into the lower case words which can be searched for,
+    in the same way as the search terms are split up by the database queries.
+    """
+    return _WORD_REGEX.findall(value.lower())
+
+
+class _Profile:
+    __slots__ = ["display_name", "avatar_url", "tokens"]
+
+    def __init__(
+        self,
+        display_name: Optional[str],
+        avatar_url: Optional[str],
+        tokens: Dict[str, float],
+    ):
+        self.display_name = display_name
+        self.avatar_url = avatar_url
+        # Map from token to the highest weight it appears with in the profile.
+        self.tokens = tokens
+
+
+def _make_profile(
+    user_id: str, display_name: Optional[str], avatar_url: Optional[str]
+) -> _Profile:
+    # If the display name or avatar URL are unexpected types, overwrite them.
+    if not isinstance(display_name, str):
+        display_name = None
+    if not isinstance(avatar_url, str):
+        avatar_url = None
+
+    tokens: Dict[str, float] = {}
+    for value, weight in (
+        (get_domain_from_id(user_id), _DOMAIN_WEIGHT),
+        (display_name or "", _DISPLAY_NAME_WEIGHT),
+        (get_localpart_from_id(user_id), _LOCALPART_WEIGHT),
+    ):
+        for token in _tokenise(value):
+            tokens[token] = max(weight, tokens.get(token, 0.0))
+
+    return _Profile(display_name, avatar_url, tokens)
+
+
+class UserDirectoryIndex:
+    """An in memory copy of the user directory tables, which can answer
+    searches without going to the database.
+
+    Users are found by looking up each search term as a prefix in a sorted list
+    of all of the words in the directory's user IDs and display names, and then
+    filtered down to those visible to the searcher using the sets of users in
+    public rooms and sharing private rooms with them.
+
+    This must be kept up to date by calling the methods corresponding to the
+    `UserDirectoryStore` functions which update the tables.
+    """
+
+    def __init__(self, server_name: str, prefer_local_users: bool):
+        self._server_name = server_name
+        self._prefer_local_users = prefer_local_users
+
+        self._profiles: Dict[str, _Profile] = {}
+
+        # All of the distinct tokens in the directory, kept sorted so that
+        # the tokens matching a prefix can be found by bisection.
+        self._sorted_tokens: List[str] = []
+        self._users_by_token: Dict[str, Set[str]] = {}
+
+        # Map from user to the public rooms they are in. This is the
+        # `users_in_public_rooms` table.
+        self._public_rooms: Dict[str, Set[str]] = {}
+
+        # Map from local user to other user to the private rooms they share.
+        # This is the `users_who_share_private_rooms` table.
+        self._private_rooms: Dict[str, Dict[str, Set[str]]] = {}
+
+        # Map from other user to the local users which have an entry for them
+        # in `_private_rooms`.
+        self._shared_with: Dict[str, Set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._profiles)
+
+    def load(
+        self,
+        profiles: Iterable[Tuple[str, Optional[str], Optional[str]]],
+        public_rows: Iterable[Tuple[str, str]],
+        private_rows: Iterable[Tuple[str, str, str]],
+    ) -> None:
+        """Replace the contents of the index with the rows of the user directory
+        tables, as returned by `UserDirectoryStore.get_user_directory_tables`.
+
+        This builds the token list in one go and sorts it once at the end,
+        rather than inserting each new token into it as `update_profile` does.
+        """
+        self._profiles = {}
+        self._users_by_token = {}
+        self._public_rooms = {}
+        self._private_rooms = {}
+        self._shared_with = {}
+
+        for user_id, display_name, avatar_url in profiles:
+            profile = _make_profile(user_id, display_name, avatar_url)
+            self._profiles[user_id] = profile
+            for token in profile.tokens:
+                self._users_by_token.setdefault(token, set()).add(user_id)
+
+        self._sorted_tokens = sorted(self._users_by_token)
+
+        for user_id, room_id in public_rows:
+            self.add_users_in_public_room(room_id, (user_id,))
+        for user_id, other_user_id, room_id in private_rows:
+            self.add_users_who_share_private_room(room_id, ((user_id, other_user_id),))
+
+    def update_profile(
+        self, user_id: str, display_name: Optional[str], avatar_url: Optional[str]
+    ) -> None:
+        """Add or update a user's profile in the directory."""
+        profile = _make_profile(user_id, display_name, avatar_url)
+
+        old_profile = self._profiles.get(user_id)
+        old_tokens = old_profile.tokens if old_profile else {}
+
+        for token in old_tokens.keys() - profile.tokens.keys():
+            self._remove_token(token, user_id)
+        for token in profile.tokens.keys() - old_tokens.keys():
+            self._add_token(token, user_id)
+
+        self._profiles[user_id] = profile
+
+    def add_users_in_public_room(self, room_id: str, user_ids: Iterable[str]) -> None:
+        for user_id in user_ids:
+            self._public_rooms.setdefault(user_id, set()).add(room_id)
+
+    def add_users_who_share_private_room(
+        self, room_id: str, user_id_tuples: Iterable[Tuple[str, str]]
+    ) -> None:
+        for user_id, other_user_id in user_id_tuples:
+            self._private_rooms.setdefault(user_id, {}).setdefault(
+                other_user_id, set()
+            ).add(room_id)
+            self._shared_with.setdefault(other_user_id, set()).add(user_id)
+
+    def remove_user_who_share_room(self, user_id: str, room_id: str) -> None:
+        """Remove the entries for the user sharing the given room with anyone."""
+        rooms = self._public_rooms.get(user_id)
+        if rooms is not None:
+            rooms.discard(room_id)
+            if not rooms:
+                del self._public_rooms[user_id]
+
+        for other_user_id in list(self._private_rooms.get(user_id, ())):
+            self._remove_private_room(user_id, other_user_id, room_id)
+
+        for local_user_id in list(self._shared_with.get(user_id, ())):
+            self._remove_private_room(local_user_id, user_id, room_id)
+
+    def remove_user(self, user_id: str) -> None:
+        """Remove a user from the directory entirely."""
+        profile = self._profiles.pop(user_id, None)
+        if profile is not None:
+            for token in profile.tokens:
+                self._remove_token(token, user_id)
+
+        self._public_rooms.pop(user_id, None)
+
+        for other_user_id in self._private_rooms.pop(user_id, {}):
+            self._discard_shared_with(other_user_id, user_id)
+
+        for local_user_id in self._shared_with.pop(user_id, ()):
+            other_users = self._private_rooms[local_user_id]
+            del other_users[user_id]
+            if not other_users:
+                del self._private_rooms[local_user_id]
+
+    def search(
+        self, user_id: str, search_term: str, limit: int, search_all_users: bool
+    ) -> Optional[JsonDict]:
+        """Searches for users visible to the given user.
+
+        Returns:
+            The results in the same form as `UserDirectoryStore.search_user_dir`,
+            or None if the search term doesn't contain anything to search for.
+        """
+        terms = _tokenise(search_term)
+        if not terms:
+            return None
+
+        # Start with the rarest term, so that the set of candidates is as
+        # small as possible.
+        matches_by_term = sorted(
+            (self._get_users_matching_prefix(term) for term in terms), key=len
+        )
+        candidates = set(matches_by_term[0])
+        for matches in matches_by_term[1:]:
+            candidates.intersection_update(matches)
+            if not candidates:
+                break
+
+        if search_all_users:
+            candidates.discard(user_id)
+        else:
+            shared = self._private_rooms.get(user_id, {})
+            candidates = {
+                candidate
+                for candidate in candidates
+                if candidate in self._public_rooms or candidate in shared
+            }
+
+        ranked = sorted(
+            (self._rank(candidate, terms), candidate) for candidate in candidates
+        )
+
+        results = []
+        for _, candidate in ranked[:limit]:
+            profile = self._profiles[candidate]
+            results.append(
+                {
+                    "user_id": candidate,
+                    "display_name": profile.display_name,
+                    "avatar_url": profile.avatar_url,
+                }
+            )
+
+        return {"limited": len(ranked) > limit, "results": results}
+
+    def _rank(self, user_id: str, terms: List[str]) -> Tuple[float, bool, bool, str]:
+        """Returns a key which orders users by how well they match the terms,
+        best match first.
+        """
+        profile = self._profiles[user_id]
+
+        # Like the database queries we rank exact matches of a word above
+        # prefix matches.
+        rank = 0.0
+        for term in terms:
+            rank += max(
+                weight * (4 if token == term else 3)
+                for token, weight in profile.tokens.items()
+                if token.startswith(term)
+            )
+
+        if profile.display_name is not None:
+            rank *= 1.2
+        if profile.avatar_url is not None:
+            rank *= 1.2
+        if self._prefer_local_users and user_id.endswith(":" + self._server_name):
+            rank *= 2
+
+        return (
+            -rank,
+            profile.display_name is None,
+            profile.avatar_url is None,
+            user_id,
+        )
+
+    def _get_users_matching_prefix(self, prefix: str) -> Set[str]:
+        users: Set[str] = set()
+        idx = bisect.bisect_left(self._sorted_tokens, prefix)
+        while idx < len(self._sorted_tokens):
+            token = self._sorted_tokens[idx]
+            if not token.startswith(prefix):
+                break
+            users.update(self._users_by_token[token])
+            idx += 1
+        return users
+
+    def _add_token(self, token: str, user_id: str) -> None:
+        users = self._users_by_token.get(token)
+        if users is None:
+            users = self._users_by_token[token] = set()
+            bisect.insort(self._sorted_tokens, token)
+        users.add(user_id)
+
+    def _remove_token(self, token: str, user_id: str) -> None:
+        users = self._users_by_token[token]
+        users.discard(user_id)
+        if not users:
+            del self._users_by_token[token]
+            idx = bisect.bisect_left(self._sorted_tokens, token)
+            del self._sorted_tokens[idx]
+
+    def _remove_private_room(
+        self, user_id: str, other_user_id: str, room_id: str
+    ) -> None:
+        other_users = self._private_rooms[user_id]
+        rooms = other_users[other_user_id]
+        rooms.discard(room_id)
+        if rooms:
+            return
+
+        del other_users[other_user_id]
+        if not other_users:
+            del self._private_rooms[user_id]
+        self._discard_shared_with(other_user_id, user_id)
+
+    def _discard_shared_with(self, other_user_id: str, user_id: str) -> None:
+        local_user_ids = self._shared_with[other_user_id]
+        local_user_ids.discard(user_id)
+        if not local_user_ids:
+            del self._shared_with[other_user_id]
@@ -36,8 +36,8 @@ import attr
 import treq
 from canonicaljson import encode_canonical_json
 from prometheus_client import Counter
-from signedjson.sign import sign_json
 from typing_extensions import Literal
+from unpaddedbase64 import encode_base64
 
 from twisted.internet import defer
 from twisted.internet.error import DNSLookupError
@@ -141,6 +141,11 @@ class MatrixFederationRequest:
     """A callback to generate the JSON.
     """
 
+    json_bytes_callback = attr.ib(default=None, type=Optional[Callable[[], bytes]])
+    """A callback to generate the canonical JSON encoding of the body. Takes
+    precedence over `json` and `json_callback`.
+    """
+
     query = attr.ib(default=None, type=Optional[dict])
     """Query arguments.
     """
@@ -178,6 +183,17 @@ class MatrixFederationRequest:
             return self.json_callback()
         return self.json
 
+    def get_json_bytes(self) -> Optional[bytes]:
+        """Returns the canonical JSON encoding of the body, or None if the request
+        has no body.
+        """
+        if self.json_bytes_callback:
+            return self.json_bytes_callback()
+        json = self.get_json()
+        if json:
+            return encode_canonical_json(json)
+        return None
+
 
 class JsonParser(ByteParser[Union[JsonDict, list]]):
     """A parser that buffers the response and tries to parse it as JSON."""
@@ -526,13 +542,15 @@ class MatrixFederationHttpClient:
 
             while True:
                 try:
-                    json = request.get_json()
-                    if json:
+                    data = request.get_json_bytes()
+                    if data:
                         headers_dict[b"Content-Type"] = [b"application/json"]
                         auth_headers = self.build_auth_headers(
-                            destination_bytes, method_bytes, url_to_sign_bytes, json
+                            destination_bytes,
+                            method_bytes,
+                            url_to_sign_bytes,
+                            content_bytes=data,
                         )
-                        data = encode_canonical_json(json)
                         producer: Optional[IBodyProducer] = QuieterFileBodyProducer(
                             BytesIO(data), cooperator=self._cooperator
                         )
@@ -691,6 +709,7 @@ class MatrixFederationHttpClient:
         url_bytes: bytes,
         content: Optional[JsonDict] = None,
         destination_is: Optional[bytes] = None,
+        content_bytes: Optional[bytes] = None,
     ) -> List[bytes]:
         """
         Builds the Authorization headers for a federation request
@@ -703,6 +722,9 @@ class MatrixFederationHttpClient:
             content: The body of the request
             destination_is: As 'destination', but if the destination is an
                 identity server
+            content_bytes: The canonical JSON encoding of the body of the
+                request. May be given instead of `content` to avoid encoding the
+                body a second time.
 
         Returns:
             A list of headers to be added as "Authorization:" headers
@@ -720,20 +742,24 @@ class MatrixFederationHttpClient:
             request["destination_is"] = destination_is.decode("ascii")
 
         if content is not None:
-            request["content"] = content
+            content_bytes = encode_canonical_json(content)
 
-        request = sign_json(request, self.server_name, self.signing_key)
+        # This is equivalent to `sign_json`, but lets us splice in the already
+        # encoded body: "content" sorts before all the other keys, so it comes
+        # first in the canonical encoding of the request.
+        request_bytes = encode_canonical_json(request)
+        if content_bytes is not None:
+            request_bytes = b'{"content":' + content_bytes + b"," + request_bytes[1:]
 
-        auth_headers = []
+        signed = self.signing_key.sign(request_bytes)
+        key = "%s:%s" % (self.signing_key.alg, self.signing_key.version)
+        sig = encode_base64(signed.signature)
 
-        for key, sig in request["signatures"][self.server_name].items():
-            auth_headers.append(
-                (
-                    'X-Matrix origin=%s,key="%s",sig="%s"'
-                    % (self.server_name, key, sig)
-                ).encode("ascii")
-            )
-        return auth_headers
+        return [
+            (
+                'X-Matrix origin=%s,key="%s",sig="%s"' % (self.server_name, key, sig)
+            ).encode("ascii")
+        ]
 
     @overload
     async def put_json(
@@ -750,6 +776,7 @@ class MatrixFederationHttpClient:
         try_trailing_slash_on_400: bool = False,
         parser: Literal[None] = None,
         max_response_size: Optional[int] = None,
+        json_bytes_callback: Optional[Callable[[], bytes]] = None,
     ) -> Union[JsonDict, list]:
         ...
 
@@ -768,6 +795,7 @@ class MatrixFederationHttpClient:
         try_trailing_slash_on_400: bool = False,
         parser: Optional[ByteParser[T]] = None,
         max_response_size: Optional[int] = None,
+        json_bytes_callback: Optional[Callable[[], bytes]] = None,
     ) -> T:
         ...
 
@@ -785,6 +813,7 @@ class MatrixFederationHttpClient:
         try_trailing_slash_on_400: bool = False,
         parser: Optional[ByteParser] = None,
         max_response_size: Optional[int] = None,
+        json_bytes_callback: Optional[Callable[[], bytes]] = None,
     ):
         """Sends the specified json data using PUT
 
@@ -822,6 +851,9 @@ class MatrixFederationHttpClient:
                 parsing as JSON.
             max_response_size: The maximum size to read from the response, if None
                 uses the default.
+            json_bytes_callback: A callable returning the canonical JSON
+                encoding of the request body. If given, it is used instead of
+                `data` and `json_data_callback`.
 
         Returns:
             Succeeds when we get a 2xx HTTP response. The
@@ -843,6 +875,7 @@ class MatrixFederationHttpClient:
             path=path,
             query=args,
             json_callback=json_data_callback,
+            json_bytes_callback=json_bytes_callback,
             json=data,
         )
 
@@ -29,7 +29,7 @@ from synapse.util.caches import CacheMetric, register_cache
 from synapse.util.caches.descriptors import lru_cache
 from synapse.util.caches.lrucache import LruCache
 
-from .push_rule_evaluator import PushRuleEvaluatorForEvent
+from .push_rule_evaluator import PushRuleEvaluatorForEvent, is_user_dependent_condition
 
 if TYPE_CHECKING:
     from synapse.server import HomeServer
@@ -209,6 +209,12 @@ class BulkPushRuleEvaluator:
 
         condition_cache: Dict[str, bool] = {}
 
+        # Most users in a room share the same list of (default) push rules, so
+        # we narrow down each distinct list to the rules which might match this
+        # event once, leaving only the conditions which depend on the user to be
+        # checked for each user. Keyed by the ID of the rules list.
+        matching_rules_by_rules: Dict[int, List[_MatchingRule]] = {}
+
         # If the event is not a state event check if any users ignore the sender.
         if not event.is_state():
             ignorers = await self.store.ignored_by(event.sender)
@@ -240,15 +246,23 @@ class BulkPushRuleEvaluator:
                 # current user, it'll be added to the dict later.
                 actions_by_user[uid] = []
 
-            for rule in rules:
-                if "enabled" in rule and not rule["enabled"]:
-                    continue
+            matching_rules = matching_rules_by_rules.get(id(rules))
+            if matching_rules is None:
+                matching_rules = _get_rules_matching_event(
+                    evaluator, rules, condition_cache
+                )
+                matching_rules_by_rules[id(rules)] = matching_rules
 
+            for matching_rule in matching_rules:
                 matches = _condition_checker(
-                    evaluator, rule["conditions"], uid, display_name, condition_cache
+                    evaluator,
+                    matching_rule.user_conditions,
+                    uid,
+                    display_name,
+                    condition_cache,
                 )
                 if matches:
-                    actions = [x for x in rule["actions"] if x != "dont_notify"]
+                    actions = matching_rule.actions
                     if actions and "notify" in actions:
                         # Push rules say we should notify the user of this event
                         actions_by_user[uid] = actions
@@ -264,11 +278,63 @@ class BulkPushRuleEvaluator:
         )
 
 
+@attr.s(slots=True, frozen=True)
+class _MatchingRule:
+    """A push rule whose user independent conditions match an event."""
+
+    # The conditions of the rule which depend on the user, and so still need
+    # to be checked for each user.
+    user_conditions = attr.ib(type=List[dict])
+    # The actions of the rule, minus any `dont_notify` actions.
+    actions = attr.ib(type=List[Union[dict, str]])
+
+
+def _get_rules_matching_event(
+    evaluator: PushRuleEvaluatorForEvent,
+    rules: List[Dict[str, Any]],
+    cache: Dict[str, bool],
+) -> List[_MatchingRule]:
+    """Narrows down a list of push rules to those which could match the event
+    for a user with that list, by checking the conditions which don't depend
+    on the user.
+
+    The first of the returned rules whose user conditions match is the rule
+    which applies to a given user. The list stops at the first rule with no
+    user conditions, as it matches for every user.
+    """
+    matching_rules = []
+    for rule in rules:
+        if "enabled" in rule and not rule["enabled"]:
+            continue
+
+        user_conditions = []
+        event_conditions = []
+        for condition in rule["conditions"]:
+            if is_user_dependent_condition(condition):
+                user_conditions.append(condition)
+            else:
+                event_conditions.append(condition)
+
+        if not _condition_checker(evaluator, event_conditions, None, None, cache):
+            continue
+
+        matching_rules.append(
+            _MatchingRule(
+                user_conditions=user_conditions,
+                actions=[x for x in rule["actions"] if x != "dont_notify"],
+            )
+        )
+        if not user_conditions:
+            break
+
+    return matching_rules
+
+
 def _condition_checker(
     evaluator: PushRuleEvaluatorForEvent,
     conditions: List[dict],
-    uid: str,
-    display_name: str,
+    uid: Optional[str],
+    display_name: Optional[str],
     cache: Dict[str, bool],
 ) -> bool:
     for cond in conditions:
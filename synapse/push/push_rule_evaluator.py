@@ -15,7 +15,7 @@
 
 import logging
 import re
-from typing import Any, Dict, List, Optional, Pattern, Tuple, Union
+from typing import Any, Dict, List, Optional, Pattern, Set, Tuple, Union
 
 from synapse.events import EventBase
 from synapse.types import UserID
@@ -28,6 +28,8 @@ logger = logging.getLogger(__name__)
 GLOB_REGEX = re.compile(r"\\\[(\\\!|)(.*)\\\]")
 IS_GLOB = re.compile(r"[\?\*\[\]]")
 INEQUALITY_EXPR = re.compile("^([=<>]*)([0-9]*)$")
+# Matches the words in a message body, for the body word index.
+WORD_REGEX = re.compile(r"\w+")
 
 
 def _room_member_count(
@@ -128,9 +130,23 @@ class PushRuleEvaluatorForEvent:
         # Maps strings of e.g. 'content.body' -> event["content"]["body"]
         self._value_cache = _flatten_dict(event)
 
+        # The set of (lowercased) words in the body of the event, used to quickly
+        # rule out patterns which can't match the body. This is only built for
+        # ASCII bodies, where lowercasing agrees with case-insensitive regex
+        # matching. Built lazily, see `_body_may_contain`.
+        self._body_words: Optional[Set[str]] = None
+
     def matches(
-        self, condition: Dict[str, Any], user_id: str, display_name: str
+        self,
+        condition: Dict[str, Any],
+        user_id: Optional[str],
+        display_name: Optional[str],
     ) -> bool:
+        """Checks whether the event matches the given push rule condition.
+
+        `user_id` and `display_name` are only needed for conditions that depend
+        on the user the rule belongs to (see `is_user_dependent_condition`).
+        """
         if condition["kind"] == "event_match":
             return self._event_match(condition, user_id)
         elif condition["kind"] == "contains_display_name":
@@ -144,10 +160,10 @@ class PushRuleEvaluatorForEvent:
         else:
             return True
 
-    def _event_match(self, condition: dict, user_id: str) -> bool:
+    def _event_match(self, condition: dict, user_id: Optional[str]) -> bool:
         pattern = condition.get("pattern", None)
 
-        if not pattern:
+        if not pattern and user_id:
             pattern_type = condition.get("pattern_type", None)
             if pattern_type == "user_id":
                 pattern = user_id
@@ -158,12 +174,16 @@ class PushRuleEvaluatorForEvent:
             logger.warning("event_match condition with no pattern")
             return False
 
-        # XXX: optimisation: cache our pattern regexps
         if condition["key"] == "content.body":
             body = self._event.content.get("body", None)
             if not body or not isinstance(body, str):
                 return False
 
+            if not IS_GLOB.search(pattern) and not self._body_may_contain(
+                body, pattern
+            ):
+                return False
+
             return _glob_matches(pattern, body, word_boundary=True)
         else:
             haystack = self._get_value(condition["key"])
@@ -172,7 +192,7 @@ class PushRuleEvaluatorForEvent:
 
             return _glob_matches(pattern, haystack)
 
-    def _contains_display_name(self, display_name: str) -> bool:
+    def _contains_display_name(self, display_name: Optional[str]) -> bool:
         if not display_name:
             return False
 
@@ -180,6 +200,9 @@ class PushRuleEvaluatorForEvent:
         if not body or not isinstance(body, str):
             return False
 
+        if not self._body_may_contain(body, display_name):
+            return False
+
         # Similar to _glob_matches, but do not treat display_name as a glob.
         r = regex_cache.get((display_name, False, True), None)
         if not r:
@@ -190,10 +213,43 @@ class PushRuleEvaluatorForEvent:
 
         return bool(r.search(body))
 
+    def _body_may_contain(self, body: str, phrase: str) -> bool:
+        """Quickly checks whether the given (non-glob) phrase could match the
+        body at word boundaries.
+
+        Any match of the phrase must include each of the phrase's words as a
+        whole word in the body, so if one is missing the phrase can't match.
+        This lets us skip the regex search for most users in a large room.
+
+        Returns:
+            False if the phrase definitely doesn't match, True if it might.
+        """
+        if not phrase.isascii() or not body.isascii():
+            return True
+
+        if self._body_words is None:
+            self._body_words = set(WORD_REGEX.findall(body.lower()))
+
+        return all(
+            word in self._body_words for word in WORD_REGEX.findall(phrase.lower())
+        )
+
     def _get_value(self, dotted_key: str) -> Optional[str]:
         return self._value_cache.get(dotted_key, None)
 
 
+def is_user_dependent_condition(condition: Dict[str, Any]) -> bool:
+    """Whether the outcome of the condition depends on the user the push rule
+    belongs to, rather than just on the event.
+    """
+    if condition["kind"] == "contains_display_name":
+        return True
+
+    # `event_match` conditions without a pattern match against the user's ID or
+    # localpart.
+    return condition["kind"] == "event_match" and not condition.get("pattern")
+
+
 # Caches (string, is_glob, word_boundary) -> regex for push. See _glob_matches
 regex_cache: LruCache[Tuple[str, bool, bool], Pattern] = LruCache(
     50000, "regex_push_cache"
@@ -111,7 +111,8 @@ CONDITIONAL_REQUIREMENTS = {
     # hiredis is not a *strict* dependency, but it makes things much faster.
     # (if it is not installed, we fall back to slow code.)
     "redis": ["txredisapi>=1.4.7", "hiredis"],
-    # Required to use experimental `caches.track_memory_usage` config option.
+    # Required to use the `caches.per_cache_max_memory` config option and the
+    # experimental `caches.track_memory_usage` config option.
     "cache_memory": ["pympler"],
 }
 
@@ -18,7 +18,7 @@ allowed to be sent by which side.
 """
 import abc
 import logging
-from typing import Tuple, Type
+from typing import Collection, List, Optional, Tuple, Type
 
 from synapse.util import json_decoder, json_encoder
 
@@ -139,6 +139,88 @@ class RdataCommand(Command):
         return "RDATA-" + self.stream_name
 
 
+class RdataBatchCommand(Command):
+    """Sent by the server when a subscribed stream has several updates with the
+    same stream token.
+
+    Format::
+
+        RDATA_BATCH <stream_name> <instance_name> <token> <rows_json>
+
+    Where `<rows_json>` is a JSON list of rows. This is equivalent to sending an
+    RDATA for each row (with all but the last having a token of "batch"), but
+    means the receiver only has to parse and dispatch a single command.
+
+    As with RDATA, `<token>` may be "batch", in which case the rows should be
+    batched with those of subsequent commands until one with a numeric token is
+    seen. This allows a large batch to be split over several lines.
+
+    This is only sent over TCP to clients which have announced support for it
+    with a FEATURES command, and over redis when `replication_batch_rdata` is
+    enabled.
+    """
+
+    NAME = "RDATA_BATCH"
+
+    def __init__(self, stream_name, instance_name, token, rows):
+        self.stream_name = stream_name
+        self.instance_name = instance_name
+        self.token = token
+        self.rows = rows
+
+    @classmethod
+    def from_line(cls, line):
+        stream_name, instance_name, token, rows_json = line.split(" ", 3)
+        return cls(
+            stream_name,
+            instance_name,
+            None if token == "batch" else int(token),
+            json_decoder.decode(rows_json),
+        )
+
+    def to_line(self):
+        return " ".join(
+            (
+                self.stream_name,
+                self.instance_name,
+                str(self.token) if self.token is not None else "batch",
+                json_encoder.encode(self.rows),
+            )
+        )
+
+    def get_logcontext_id(self):
+        return "RDATA-" + self.stream_name
+
+    def to_rdata_commands(self) -> List[RdataCommand]:
+        """Converts this into the equivalent series of RDATA commands, for peers
+        which don't support RDATA_BATCH.
+        """
+        last = len(self.rows) - 1
+        return [
+            RdataCommand(
+                self.stream_name,
+                self.instance_name,
+                self.token if i == last else None,
+                row,
+            )
+            for i, row in enumerate(self.rows)
+        ]
+
+    def split(self) -> Tuple["RdataBatchCommand", "RdataBatchCommand"]:
+        """Splits this into two equivalent RDATA_BATCH commands, e.g. because
+        this one is too long to send.
+        """
+        mid = len(self.rows) // 2
+        return (
+            RdataBatchCommand(
+                self.stream_name, self.instance_name, None, self.rows[:mid]
+            ),
+            RdataBatchCommand(
+                self.stream_name, self.instance_name, self.token, self.rows[mid:]
+            ),
+        )
+
+
 class PositionCommand(Command):
     """Sent by an instance to tell others the stream position without needing to
     send an RDATA.
@@ -208,25 +290,57 @@ class NameCommand(_SimpleCommand):
     NAME = "NAME"
 
 
+class FeaturesCommand(Command):
+    """Sent by the client to tell the server which optional protocol features it
+    supports.
+
+    Format::
+
+        FEATURES <feature> [<feature> ...]
+
+    The only feature currently defined is "rdata_batch", meaning the client
+    understands the RDATA_BATCH command.
+
+    This is only sent if `replication_batch_rdata` is enabled, as older servers
+    will drop the connection on receiving an unknown command.
+    """
+
+    NAME = "FEATURES"
+
+    def __init__(self, features: Collection[str]):
+        self.features = features
+
+    @classmethod
+    def from_line(cls, line):
+        return cls(line.split())
+
+    def to_line(self):
+        return " ".join(self.features)
+
+
 class ReplicateCommand(Command):
     """Sent by the client to subscribe to streams.
 
     Format::
 
-        REPLICATE
+        REPLICATE [<stream_name> ...]
+
+    If stream names are given then the client is only interested in updates to
+    those streams, and the server need not send it RDATA or POSITION commands
+    for any others. Otherwise the client is subscribed to all streams.
     """
 
     NAME = "REPLICATE"
 
-    def __init__(self):
-        pass
+    def __init__(self, streams: Optional[Collection[str]] = None):
+        self.streams = streams
 
     @classmethod
     def from_line(cls, line):
-        return cls()
+        return cls(line.split() or None)
 
     def to_line(self):
-        return ""
+        return " ".join(sorted(self.streams or ()))
 
 
 class UserSyncCommand(Command):
@@ -383,10 +497,12 @@ class RemoteServerUpCommand(_SimpleCommand):
 _COMMANDS: Tuple[Type[Command], ...] = (
     ServerCommand,
     RdataCommand,
+    RdataBatchCommand,
     PositionCommand,
     ErrorCommand,
     PingCommand,
     NameCommand,
+    FeaturesCommand,
     ReplicateCommand,
     UserSyncCommand,
     FederationAckCommand,
@@ -395,6 +511,13 @@ _COMMANDS: Tuple[Type[Command], ...] = (
     ClearUserSyncsCommand,
 )
 
+# The commands which relate to a particular replication stream, and so are only
+# sent to connections which are subscribed to that stream.
+STREAM_COMMANDS = (RdataCommand, RdataBatchCommand, PositionCommand)
+
+# The optional protocol features we support, as announced by FEATURES.
+RDATA_BATCH_FEATURE = "rdata_batch"
+
 # Map of command name to command type.
 COMMAND_MAP = {cmd.NAME: cmd for cmd in _COMMANDS}
 
@@ -402,6 +525,7 @@ COMMAND_MAP = {cmd.NAME: cmd for cmd in _COMMANDS}
 VALID_SERVER_COMMANDS = (
     ServerCommand.NAME,
     RdataCommand.NAME,
+    RdataBatchCommand.NAME,
     PositionCommand.NAME,
     ErrorCommand.NAME,
     PingCommand.NAME,
@@ -411,6 +535,7 @@ VALID_SERVER_COMMANDS = (
 # The commands the client is allowed to send
 VALID_CLIENT_COMMANDS = (
     NameCommand.NAME,
+    FeaturesCommand.NAME,
     ReplicateCommand.NAME,
     PingCommand.NAME,
     UserSyncCommand.NAME,
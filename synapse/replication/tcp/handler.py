@@ -41,6 +41,7 @@ from synapse.replication.tcp.commands import (
     Command,
     FederationAckCommand,
     PositionCommand,
+    RdataBatchCommand,
     RdataCommand,
     RemoteServerUpCommand,
     ReplicateCommand,
@@ -83,7 +84,10 @@ user_ip_cache_counter = Counter("synapse_replication_tcp_resource_user_ip_cache"
 
 # the type of the entries in _command_queues_by_stream
 _StreamCommandQueue = Deque[
-    Tuple[Union[RdataCommand, PositionCommand], IReplicationConnection]
+    Tuple[
+        Union[RdataCommand, RdataBatchCommand, PositionCommand],
+        IReplicationConnection,
+    ]
 ]
 
 
@@ -178,6 +182,14 @@ class ReplicationCommandHandler:
 
             self._streams_to_replicate.append(stream)
 
+        # The streams this instance consumes. We ask to only be sent updates for
+        # these streams, and ignore any others we receive.
+        self._subscribed_streams: Set[str] = set(self._streams)
+        if not hs.should_send_federation():
+            # These streams are only consumed by federation senders.
+            self._subscribed_streams.discard(FederationStream.NAME)
+            self._subscribed_streams.discard(PresenceFederationStream.NAME)
+
         # Map of stream name to batched updates. See RdataCommand for info on
         # how batching works.
         self._pending_batches: Dict[str, List[Any]] = {}
@@ -233,7 +245,9 @@ class ReplicationCommandHandler:
             self._server_notices_sender = hs.get_server_notices_sender()
 
     def _add_command_to_stream_queue(
-        self, conn: IReplicationConnection, cmd: Union[RdataCommand, PositionCommand]
+        self,
+        conn: IReplicationConnection,
+        cmd: Union[RdataCommand, RdataBatchCommand, PositionCommand],
     ) -> None:
         """Queue the given received command for processing
 
@@ -279,13 +293,13 @@ class ReplicationCommandHandler:
 
     async def _process_command(
         self,
-        cmd: Union[PositionCommand, RdataCommand],
+        cmd: Union[PositionCommand, RdataCommand, RdataBatchCommand],
         conn: IReplicationConnection,
         stream_name: str,
     ) -> None:
         if isinstance(cmd, PositionCommand):
             await self._process_position(stream_name, conn, cmd)
-        elif isinstance(cmd, RdataCommand):
+        elif isinstance(cmd, (RdataCommand, RdataBatchCommand)):
             await self._process_rdata(stream_name, conn, cmd)
         else:
             # This shouldn't be possible
@@ -330,6 +344,14 @@ class ReplicationCommandHandler:
         """Get a map from stream name to all streams."""
         return self._streams
 
+    def get_subscribed_streams(self) -> Optional[Set[str]]:
+        """Get the names of the streams this instance consumes, or None if it
+        consumes all of them.
+        """
+        if self._subscribed_streams == set(self._streams):
+            return None
+        return self._subscribed_streams
+
     def get_streams_to_replicate(self) -> List[Stream]:
         """Get a list of streams that this instances replicates."""
         return self._streams_to_replicate
@@ -415,6 +437,11 @@ class ReplicationCommandHandler:
             # Ignore RDATA that are just our own echoes
             return
 
+        if cmd.stream_name not in self._subscribed_streams:
+            # We don't consume this stream (and the other side has ignored our
+            # subscriptions).
+            return
+
         stream_name = cmd.stream_name
         inbound_rdata_count.labels(stream_name).inc()
 
@@ -426,18 +453,39 @@ class ReplicationCommandHandler:
 
         self._add_command_to_stream_queue(conn, cmd)
 
+    def on_RDATA_BATCH(self, conn: IReplicationConnection, cmd: RdataBatchCommand):
+        if cmd.instance_name == self._instance_name:
+            # Ignore RDATA that are just our own echoes
+            return
+
+        if cmd.stream_name not in self._subscribed_streams:
+            return
+
+        inbound_rdata_count.labels(cmd.stream_name).inc(len(cmd.rows))
+
+        self._add_command_to_stream_queue(conn, cmd)
+
     async def _process_rdata(
-        self, stream_name: str, conn: IReplicationConnection, cmd: RdataCommand
+        self,
+        stream_name: str,
+        conn: IReplicationConnection,
+        cmd: Union[RdataCommand, RdataBatchCommand],
     ) -> None:
-        """Process an RDATA command
+        """Process an RDATA or RDATA_BATCH command
 
         Called after the command has been popped off the queue of inbound commands
         """
+        if isinstance(cmd, RdataBatchCommand):
+            raw_rows = cmd.rows
+        else:
+            raw_rows = [cmd.row]
+
         try:
-            row = STREAMS_MAP[stream_name].parse_row(cmd.row)
+            parse_row = STREAMS_MAP[stream_name].parse_row
+            parsed_rows = [parse_row(row) for row in raw_rows]
         except Exception as e:
             raise Exception(
-                "Failed to parse RDATA: %r %r" % (stream_name, cmd.row)
+                "Failed to parse %s: %r %r" % (cmd.NAME, stream_name, raw_rows)
             ) from e
 
         # make sure that we've processed a POSITION for this stream *on this
@@ -458,12 +506,12 @@ class ReplicationCommandHandler:
             # I.e. this is part of a batch of updates for this stream (in
             # which case batch until we get an update for the stream with a non
             # None token).
-            self._pending_batches.setdefault(stream_name, []).append(row)
+            self._pending_batches.setdefault(stream_name, []).extend(parsed_rows)
             return
 
         # Check if this is the last of a batch of updates
         rows = self._pending_batches.pop(stream_name, [])
-        rows.append(row)
+        rows.extend(parsed_rows)
 
         stream = self._streams[stream_name]
 
@@ -506,6 +554,9 @@ class ReplicationCommandHandler:
             # Ignore POSITION that are just our own echoes
             return
 
+        if cmd.stream_name not in self._subscribed_streams:
+            return
+
         logger.info("Handling '%s %s'", cmd.NAME, cmd.to_line())
 
         self._add_command_to_stream_queue(conn, cmd)
@@ -706,6 +757,20 @@ class ReplicationCommandHandler:
         """
         self.send_command(RdataCommand(stream_name, self._instance_name, token, data))
 
+    def stream_updates(self, stream_name: str, token: int, rows: List[Any]):
+        """Called when new updates which share a stream token are available to
+        stream to clients.
+
+        Connections which don't support RDATA_BATCH will send the rows as a
+        series of RDATA commands.
+        """
+        if len(rows) == 1:
+            self.stream_update(stream_name, token, rows[0])
+        else:
+            self.send_command(
+                RdataBatchCommand(stream_name, self._instance_name, token, rows)
+            )
+
 
 UpdateToken = TypeVar("UpdateToken")
 UpdateRow = TypeVar("UpdateRow")
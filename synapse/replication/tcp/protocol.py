@@ -49,7 +49,7 @@ import fcntl
 import logging
 import struct
 from inspect import isawaitable
-from typing import TYPE_CHECKING, Collection, List, Optional
+from typing import TYPE_CHECKING, Collection, List, Optional, Set
 
 from prometheus_client import Counter
 from zope.interface import Interface, implementer
@@ -66,12 +66,16 @@ from synapse.metrics.background_process_metrics import (
     run_as_background_process,
 )
 from synapse.replication.tcp.commands import (
+    RDATA_BATCH_FEATURE,
+    STREAM_COMMANDS,
     VALID_CLIENT_COMMANDS,
     VALID_SERVER_COMMANDS,
     Command,
     ErrorCommand,
+    FeaturesCommand,
     NameCommand,
     PingCommand,
+    RdataBatchCommand,
     ReplicateCommand,
     ServerCommand,
     parse_command_from_line,
@@ -177,6 +181,14 @@ class BaseReplicationStreamProtocol(LineOnlyReceiver):
         # List of pending commands to send once we've established the connection
         self.pending_commands: List[Command] = []
 
+        # Whether we can send RDATA_BATCH commands down this connection, rather
+        # than an RDATA per row.
+        self.send_rdata_batches = False
+
+        # The names of the streams the remote end wants updates for, or None
+        # for all streams.
+        self.subscribed_streams: Optional[Set[str]] = None
+
         # The LoopingCall for sending pings.
         self._send_ping_loop: Optional[task.LoopingCall] = None
 
@@ -331,10 +343,22 @@ class BaseReplicationStreamProtocol(LineOnlyReceiver):
             logger.debug("[%s] Not sending, connection closed", self.id())
             return
 
+        if (
+            self.subscribed_streams is not None
+            and isinstance(cmd, STREAM_COMMANDS)
+            and cmd.stream_name not in self.subscribed_streams
+        ):
+            return
+
         if do_buffer and self.state != ConnectionStates.ESTABLISHED:
             self._queue_command(cmd)
             return
 
+        if isinstance(cmd, RdataBatchCommand) and not self.send_rdata_batches:
+            for rdata_cmd in cmd.to_rdata_commands():
+                self.send_command(rdata_cmd, do_buffer)
+            return
+
         tcp_outbound_commands_counter.labels(cmd.NAME, self.name).inc()
 
         string = "%s %s" % (cmd.NAME, cmd.to_line())
@@ -344,6 +368,11 @@ class BaseReplicationStreamProtocol(LineOnlyReceiver):
         encoded_string = string.encode("utf-8")
 
         if len(encoded_string) > self.MAX_LENGTH:
+            if isinstance(cmd, RdataBatchCommand) and len(cmd.rows) > 1:
+                for batch_cmd in cmd.split():
+                    self.send_command(batch_cmd, do_buffer)
+                return
+
             raise Exception(
                 "Failed to send command %s as too long (%d > %d)"
                 % (cmd.NAME, len(encoded_string), self.MAX_LENGTH)
@@ -460,11 +489,16 @@ class ServerReplicationStreamProtocol(BaseReplicationStreamProtocol):
     VALID_OUTBOUND_COMMANDS = VALID_SERVER_COMMANDS
 
     def __init__(
-        self, server_name: str, clock: Clock, handler: "ReplicationCommandHandler"
+        self,
+        server_name: str,
+        clock: Clock,
+        handler: "ReplicationCommandHandler",
+        batch_rdata: bool = False,
     ):
         super().__init__(clock, handler)
 
         self.server_name = server_name
+        self._batch_rdata = batch_rdata
 
     def connectionMade(self):
         self.send_command(ServerCommand(self.server_name))
@@ -474,6 +508,18 @@ class ServerReplicationStreamProtocol(BaseReplicationStreamProtocol):
         logger.info("[%s] Renamed to %r", self.id(), cmd.data)
         self.name = cmd.data
 
+    def on_REPLICATE(self, cmd):
+        if cmd.streams:
+            logger.info("[%s] Subscribed to streams: %r", self.id(), cmd.streams)
+            self.subscribed_streams = set(cmd.streams)
+        else:
+            self.subscribed_streams = None
+
+    def on_FEATURES(self, cmd):
+        logger.info("[%s] Client supports features: %r", self.id(), cmd.features)
+        if self._batch_rdata and RDATA_BATCH_FEATURE in cmd.features:
+            self.send_rdata_batches = True
+
 
 class ClientReplicationStreamProtocol(BaseReplicationStreamProtocol):
     VALID_INBOUND_COMMANDS = VALID_SERVER_COMMANDS
@@ -491,9 +537,12 @@ class ClientReplicationStreamProtocol(BaseReplicationStreamProtocol):
 
         self.client_name = client_name
         self.server_name = server_name
+        self._batch_rdata = hs.config.worker.replication_batch_rdata
 
     def connectionMade(self):
         self.send_command(NameCommand(self.client_name))
+        if self._batch_rdata:
+            self.send_command(FeaturesCommand([RDATA_BATCH_FEATURE]))
         super().connectionMade()
 
         # Once we've connected subscribe to the necessary streams
@@ -508,7 +557,9 @@ class ClientReplicationStreamProtocol(BaseReplicationStreamProtocol):
         """Send the subscription request to the server"""
         logger.info("[%s] Subscribing to replication streams", self.id())
 
-        self.send_command(ReplicateCommand())
+        self.send_command(
+            ReplicateCommand(self.command_handler.get_subscribed_streams())
+        )
 
 
 # The following simply registers metrics for the replication connections
@@ -31,7 +31,9 @@ from synapse.metrics.background_process_metrics import (
     wrap_as_background_process,
 )
 from synapse.replication.tcp.commands import (
+    STREAM_COMMANDS,
     Command,
+    RdataBatchCommand,
     ReplicateCommand,
     parse_command_from_line,
 )
@@ -40,6 +42,7 @@ from synapse.replication.tcp.protocol import (
     tcp_inbound_commands_counter,
     tcp_outbound_commands_counter,
 )
+from synapse.replication.tcp.streams import STREAMS_MAP
 
 if TYPE_CHECKING:
     from synapse.replication.tcp.handler import ReplicationCommandHandler
@@ -86,14 +89,21 @@ class RedisSubscriber(txredisapi.SubscriberProtocol):
     Attributes:
         synapse_handler: The command handler to handle incoming commands.
         synapse_stream_name: The *redis* stream name to subscribe to and publish
-            from (not anything to do with Synapse replication streams).
+            from (not anything to do with Synapse replication streams). Commands
+            for a particular replication stream are instead published to
+            `<synapse_stream_name>/<replication stream name>`, so that instances
+            only receive the replication streams they consume.
         synapse_outbound_redis_connection: The connection to redis to use to send
             commands.
+        synapse_batch_rdata: Whether to send RDATA_BATCH commands, rather than
+            an RDATA per row. There is no negotiation over redis, so all
+            instances must understand RDATA_BATCH if this is set.
     """
 
     synapse_handler: "ReplicationCommandHandler"
     synapse_stream_name: str
     synapse_outbound_redis_connection: txredisapi.RedisProtocol
+    synapse_batch_rdata: bool = False
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -113,8 +123,14 @@ class RedisSubscriber(txredisapi.SubscriberProtocol):
         # it's important to make sure that we only send the REPLICATE command once we
         # have successfully subscribed to the stream - otherwise we might miss the
         # POSITION response sent back by the other end.
-        logger.info("Sending redis SUBSCRIBE for %s", self.synapse_stream_name)
-        await make_deferred_yieldable(self.subscribe(self.synapse_stream_name))
+        streams = self.synapse_handler.get_subscribed_streams()
+        if streams is None:
+            streams = STREAMS_MAP
+        channels = [self.synapse_stream_name]
+        channels.extend(self._channel_for_stream(stream) for stream in sorted(streams))
+
+        logger.info("Sending redis SUBSCRIBE for %s", channels)
+        await make_deferred_yieldable(self.subscribe(channels))
         logger.info(
             "Successfully subscribed to redis stream, sending REPLICATE command"
         )
@@ -191,6 +207,11 @@ class RedisSubscriber(txredisapi.SubscriberProtocol):
         Args:
             cmd (Command)
         """
+        if isinstance(cmd, RdataBatchCommand) and not self.synapse_batch_rdata:
+            for rdata_cmd in cmd.to_rdata_commands():
+                self.send_command(rdata_cmd)
+            return
+
         run_as_background_process(
             "send-cmd", self._async_send_command, cmd, bg_start_span=False
         )
@@ -207,12 +228,20 @@ class RedisSubscriber(txredisapi.SubscriberProtocol):
         # remote instances.
         tcp_outbound_commands_counter.labels(cmd.NAME, "redis").inc()
 
+        channel = self.synapse_stream_name
+        if isinstance(cmd, STREAM_COMMANDS):
+            channel = self._channel_for_stream(cmd.stream_name)
+
         await make_deferred_yieldable(
-            self.synapse_outbound_redis_connection.publish(
-                self.synapse_stream_name, encoded_string
-            )
+            self.synapse_outbound_redis_connection.publish(channel, encoded_string)
         )
 
+    def _channel_for_stream(self, stream_name: str) -> str:
+        """Get the redis channel that commands for the given replication stream
+        are published to.
+        """
+        return "%s/%s" % (self.synapse_stream_name, stream_name)
+
 
 class SynapseRedisFactory(txredisapi.RedisFactory):
     """A subclass of RedisFactory that periodically sends pings to ensure that
@@ -321,6 +350,7 @@ class RedisDirectTcpReplicationClientFactory(SynapseRedisFactory):
         self.synapse_stream_name = hs.hostname
 
         self.synapse_outbound_redis_connection = outbound_redis_connection
+        self.synapse_batch_rdata = hs.config.worker.replication_batch_rdata
 
     def buildProtocol(self, addr):
         p = super().buildProtocol(addr)
@@ -333,6 +363,7 @@ class RedisDirectTcpReplicationClientFactory(SynapseRedisFactory):
         p.synapse_handler = self.synapse_handler
         p.synapse_outbound_redis_connection = self.synapse_outbound_redis_connection
         p.synapse_stream_name = self.synapse_stream_name
+        p.synapse_batch_rdata = self.synapse_batch_rdata
 
         return p
 
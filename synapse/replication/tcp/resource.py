@@ -14,6 +14,7 @@
 """The server side of the replication stream.
 """
 
+import itertools
 import logging
 import random
 
@@ -41,6 +42,7 @@ class ReplicationStreamProtocolFactory(Factory):
         self.command_handler = hs.get_tcp_replication()
         self.clock = hs.get_clock()
         self.server_name = hs.config.server_name
+        self.batch_rdata = hs.config.worker.replication_batch_rdata
 
         # If we've created a `ReplicationStreamProtocolFactory` then we're
         # almost certainly registering a replication listener, so let's ensure
@@ -54,7 +56,10 @@ class ReplicationStreamProtocolFactory(Factory):
 
     def buildProtocol(self, addr):
         return ServerReplicationStreamProtocol(
-            self.server_name, self.clock, self.command_handler
+            self.server_name,
+            self.clock,
+            self.command_handler,
+            batch_rdata=self.batch_rdata,
         )
 
 
@@ -214,16 +219,14 @@ class ReplicationStreamer:
                             continue
 
                         # Some streams return multiple rows with the same stream IDs,
-                        # we need to make sure they get sent out in batches. We do
-                        # this by setting the current token to all but the last of
-                        # a series of updates with the same token to have a None
-                        # token. See RdataCommand for more details.
+                        # we need to make sure they get sent out in batches. See
+                        # RdataCommand and RdataBatchCommand for more details.
                         batched_updates = _batch_updates(updates)
 
-                        for token, row in batched_updates:
+                        for token, rows in batched_updates:
                             try:
-                                self.command_handler.stream_update(
-                                    stream.NAME, token, row
+                                self.command_handler.stream_updates(
+                                    stream.NAME, token, rows
                                 )
                             except Exception:
                                 logger.exception("Failed to replicate")
@@ -235,27 +238,19 @@ class ReplicationStreamer:
 
 
 def _batch_updates(updates):
-    """Takes a list of updates of form [(token, row)] and sets the token to
-    None for all rows where the next row has the same token. This is used to
+    """Takes a list of updates of form [(token, row)] and groups together the
+    rows of consecutive updates which share the same token. This is used to
     implement batching.
 
     For example:
 
-        [(1, _), (1, _), (2, _), (3, _), (3, _)]
+        [(1, a), (1, b), (2, c), (3, d), (3, e)]
 
     becomes:
 
-        [(None, _), (1, _), (2, _), (None, _), (3, _)]
+        [(1, [a, b]), (2, [c]), (3, [d, e])]
     """
-    if not updates:
-        return []
-
-    new_updates = []
-    for i, update in enumerate(updates[:-1]):
-        if update[0] == updates[i + 1][0]:
-            new_updates.append((None, update[1]))
-        else:
-            new_updates.append(update)
-
-    new_updates.append(updates[-1])
-    return new_updates
+    return [
+        (token, [row for _, row in group])
+        for token, group in itertools.groupby(updates, key=lambda update: update[0])
+    ]
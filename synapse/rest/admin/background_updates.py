@@ -0,0 +1,123 @@
+# Copyright 2021 The Matrix.org Foundation C.I.C.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+from typing import TYPE_CHECKING, Tuple
+
+from synapse.api.errors import Codes, NotFoundError, SynapseError
+from synapse.http.servlet import (
+    RestServlet,
+    assert_params_in_dict,
+    parse_json_object_from_request,
+)
+from synapse.http.site import SynapseRequest
+from synapse.rest.admin._base import admin_patterns, assert_requester_is_admin
+from synapse.types import JsonDict
+
+if TYPE_CHECKING:
+    from synapse.server import HomeServer
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundUpdateEnabledRestServlet(RestServlet):
+    """Allows pausing and resuming background updates."""
+
+    PATTERNS = admin_patterns("/background_updates/enabled$")
+
+    def __init__(self, hs: "HomeServer"):
+        self.auth = hs.get_auth()
+        self.data_stores = hs.get_datastores()
+
+    async def on_GET(self, request: SynapseRequest) -> Tuple[int, JsonDict]:
+        await assert_requester_is_admin(self.auth, request)
+
+        # We need to check that all configured databases have updates enabled.
+        # (They *should* all be in sync.)
+        enabled = all(db.updates.enabled for db in self.data_stores.databases)
+
+        return 200, {"enabled": enabled}
+
+    async def on_POST(self, request: SynapseRequest) -> Tuple[int, JsonDict]:
+        await assert_requester_is_admin(self.auth, request)
+
+        body = parse_json_object_from_request(request)
+        assert_params_in_dict(body, ["enabled"])
+
+        enabled = body["enabled"]
+        if not isinstance(enabled, bool):
+            raise SynapseError(
+                400, "'enabled' parameter must be a boolean", Codes.INVALID_PARAM
+            )
+
+        for db in self.data_stores.databases:
+            db.updates.enabled = enabled
+
+        return 200, {"enabled": enabled}
+
+
+class BackgroundUpdateStatusRestServlet(RestServlet):
+    """Fetch the progress of the background updates which are running."""
+
+    PATTERNS = admin_patterns("/background_updates/status$")
+
+    def __init__(self, hs: "HomeServer"):
+        self.auth = hs.get_auth()
+        self.data_stores = hs.get_datastores()
+
+    async def on_GET(self, request: SynapseRequest) -> Tuple[int, JsonDict]:
+        await assert_requester_is_admin(self.auth, request)
+
+        # We need to check that all configured databases have updates enabled.
+        # (They *should* all be in sync.)
+        enabled = all(db.updates.enabled for db in self.data_stores.databases)
+
+        current_updates = {
+            db.name(): db.updates.get_current_update_stats()
+            for db in self.data_stores.databases
+        }
+
+        return 200, {"enabled": enabled, "current_updates": current_updates}
+
+
+class BackgroundUpdatePrioritiseRestServlet(RestServlet):
+    """Move a pending background update to the front of the queue."""
+
+    PATTERNS = admin_patterns("/background_updates/prioritise$")
+
+    def __init__(self, hs: "HomeServer"):
+        self.auth = hs.get_auth()
+        self.data_stores = hs.get_datastores()
+
+    async def on_POST(self, request: SynapseRequest) -> Tuple[int, JsonDict]:
+        await assert_requester_is_admin(self.auth, request)
+
+        body = parse_json_object_from_request(request)
+        assert_params_in_dict(body, ["update_name"])
+
+        update_name = body["update_name"]
+        if not isinstance(update_name, str):
+            raise SynapseError(
+                400, "'update_name' parameter must be a string", Codes.INVALID_PARAM
+            )
+
+        found = False
+        for db in self.data_stores.databases:
+            if await db.updates.prioritise_background_update(update_name):
+                found = True
+
+        if not found:
+            raise NotFoundError("Unknown background update")
+
+        return 200, {}
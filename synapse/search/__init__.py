@@ -0,0 +1,108 @@
+# Copyright 2021 The Matrix.org Foundation C.I.C.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import abc
+from typing import TYPE_CHECKING, Any, Collection, List, Optional
+
+from synapse.types import JsonDict
+
+if TYPE_CHECKING:
+    from synapse.server import HomeServer
+
+
+class SearchBackend(metaclass=abc.ABCMeta):
+    """A backend which performs full text searches over the events in rooms, on
+    behalf of the search handler.
+
+    Backends are configured with `search.backend`, and are constructed with
+    the homeserver and their parsed config.
+    """
+
+    # Whether the backend keeps its own copy of the contents of rooms, and so
+    # needs the events which get purged recording in the
+    # `search_index_deletions` table, so that it can remove them.
+    needs_deletions = False
+
+    @abc.abstractmethod
+    async def search_msgs(
+        self, room_ids: Collection[str], search_term: str, keys: List[str]
+    ) -> JsonDict:
+        """Performs a full text search over events with given keys, ordering
+        the results by rank.
+
+        Args:
+            room_ids: The room_ids to search in
+            search_term: Search term to search for
+            keys: List of keys to search in, currently supports "content.body",
+                "content.name", "content.topic"
+
+        Returns:
+            A dict with keys:
+                results: a list of dicts with the matching `event` and its `rank`
+                highlights: an optional set of words to highlight in the results
+                count: the total number of matching events
+        """
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    async def search_rooms(
+        self,
+        room_ids: Collection[str],
+        search_term: str,
+        keys: List[str],
+        limit: int,
+        pagination_token: Optional[str] = None,
+    ) -> JsonDict:
+        """Performs a full text search over events with given keys, ordering
+        the results by recency.
+
+        Args:
+            room_ids: The room_ids to search in
+            search_term: Search term to search for
+            keys: List of keys to search in, currently supports "content.body",
+                "content.name", "content.topic"
+            limit: The maximum number of results to return
+            pagination_token: A pagination token previously returned
+
+        Returns:
+            As `search_msgs`, except that each result also has a
+            `pagination_token` which can be used to fetch the results after it.
+        """
+        raise NotImplementedError()
+
+
+class DatabaseSearchBackend(SearchBackend):
+    """Searches using the full text search support of the database, via the
+    `event_search` table.
+    """
+
+    def __init__(self, hs: "HomeServer", config: Any):
+        self.store = hs.get_datastore()
+
+    async def search_msgs(
+        self, room_ids: Collection[str], search_term: str, keys: List[str]
+    ) -> JsonDict:
+        return await self.store.search_msgs(room_ids, search_term, keys)
+
+    async def search_rooms(
+        self,
+        room_ids: Collection[str],
+        search_term: str,
+        keys: List[str],
+        limit: int,
+        pagination_token: Optional[str] = None,
+    ) -> JsonDict:
+        return await self.store.search_rooms(
+            room_ids, search_term, keys, limit, pagination_token=pagination_token
+        )
@@ -0,0 +1,1258 @@
+# Copyright 2021 The Matrix.org Foundation C.I.C.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A search backend which keeps an inverted index of the contents of rooms in
+files on disk.
+
+The index is made up of immutable *segments*. Each segment holds a posting list
+for every word in every room it covers, so that searches only ever read the
+posting lists of the rooms being searched. A manifest file lists the segments
+which make up the index, along with how far through the events stream the index
+has got.
+
+A single instance (the `indexer_instance`) follows the events stream, buffering
+newly indexed events in memory and periodically writing them out as a new
+segment. When there are too many segments, the smallest are merged together.
+Other instances read the same files, picking up changes to the manifest as they
+search.
+
+Events which get redacted or purged are recorded as *tombstones*, in a file
+listed in the manifest. Searches skip tombstoned events, and merging segments
+drops them. Once enough tombstones have been added, or the oldest new tombstone
+is old enough, the segments are checked for tombstoned events. Those where a
+large enough proportion of the documents have been deleted are rewritten
+without them, and only the tombstones for events in the other segments are
+kept.
+
+Merging and rewriting segments streams through their posting lists one at a
+time, so whole segments are never read into memory.
+"""
+
+import bisect
+import heapq
+import itertools
+import logging
+import math
+import os
+import re
+from typing import (
+    TYPE_CHECKING,
+    Callable,
+    Collection,
+    Dict,
+    FrozenSet,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
+
+import attr
+
+from synapse.api.errors import SynapseError
+from synapse.config._base import ConfigError
+from synapse.logging.context import defer_to_thread
+from synapse.metrics import event_processing_positions
+from synapse.metrics.background_process_metrics import (
+    run_as_background_process,
+    wrap_as_background_process,
+)
+from synapse.search import SearchBackend
+from synapse.storage.databases.main.events_worker import EventRedactBehaviour
+from synapse.storage.databases.main.search import SearchEntry
+from synapse.types import JsonDict
+from synapse.util import json_decoder, json_encoder
+from synapse.util.async_helpers import Linearizer
+
+if TYPE_CHECKING:
+    from synapse.server import HomeServer
+
+logger = logging.getLogger(__name__)
+
+# How many events to fetch from the database at a time when indexing.
+_INDEX_BATCH_SIZE = 1000
+
+# How many documents to buffer in memory before writing them out as a segment.
+_FLUSH_THRESHOLD = 10000
+
+# How often to write out buffered documents, however few there are, in ms.
+_FLUSH_INTERVAL_MS = 10 * 1000
+
+# When there are more than this many segments we merge the smallest together.
+_MAX_SEGMENTS = 10
+
+# How many segments to merge together at once.
+_MERGE_FACTOR = 4
+
+# How long to keep segments around for after they've been merged, so that
+# searches (including those on other instances) can finish using them, in ms.
+_SEGMENT_DELETE_DELAY_MS = 60 * 1000
+
+# When this many tombstones have been added since the segments were last
+# checked for tombstoned events, we check them again.
+_MAX_TOMBSTONES = 100000
+
+# How long to wait before checking the segments for newly tombstoned events,
+# however few tombstones have been added, in ms.
+_MAX_TOMBSTONE_AGE_MS = 24 * 60 * 60 * 1000
+
+# Segments where more than this proportion of the documents have been deleted
+# get rewritten without them.
+_COMPACT_TOMBSTONE_RATIO = 0.2
+
+# The maximum number of results to return when ordering by rank.
+_MAX_RANKED_RESULTS = 500
+
+# Words longer than this aren't indexed.
+_MAX_TOKEN_LENGTH = 64
+
+# Parameters for the BM25 ranking function.
+_BM25_K1 = 1.2
+_BM25_B = 0.75
+
+_MANIFEST_NAME = "manifest.json"
+
+# A posting, recording an occurrence of a word in a document, as a list of:
+#   stream ordering, origin_server_ts, event ID, key (e.g. "content.body"),
+#   number of occurrences of the word, number of words in the document.
+_Posting = List[Union[int, str]]
+
+
+@attr.s(slots=True, frozen=True, auto_attribs=True)
+class InvertedIndexConfig:
+    index_directory: str
+    indexer_instance: str
+
+
+@attr.s(slots=True, frozen=True, auto_attribs=True)
+class _Match:
+    event_id: str
+    stream_ordering: int
+    origin_server_ts: int
+    rank: float
+    # The words in the document which matched the search terms.
+    highlights: FrozenSet[str]
+
+
+@attr.s(slots=True, frozen=True, auto_attribs=True)
+class _Tombstones:
+    """Events which have been redacted or purged, and so must not be returned
+    by searches.
+    """
+
+    # The IDs of the deleted events.
+    events: FrozenSet[str] = frozenset()
+    # Map from the ID of a purged room to the range of stream orderings
+    # (inclusive) of the events which were purged.
+    rooms: Dict[str, Tuple[int, int]] = attr.Factory(dict)
+    # When the oldest of the tombstones added since the segments were last
+    # checked was added, in ms.
+    since: Optional[int] = None
+    # How many tombstones there were when the segments were last checked.
+    num_checked: int = 0
+
+    def __len__(self) -> int:
+        return len(self.events) + len(self.rooms)
+
+    def is_deleted(self, room_id: str, event_id: str, stream_ordering: int) -> bool:
+        if event_id in self.events:
+            return True
+
+        room_range = self.rooms.get(room_id)
+        return (
+            room_range is not None and room_range[0] <= stream_ordering <= room_range[1]
+        )
+
+    def add(
+        self,
+        now: int,
+        event_ids: Iterable[str] = (),
+        rooms: Iterable[Tuple[str, int, int]] = (),
+    ) -> "_Tombstones":
+        """Returns a copy with the given events and purged rooms added."""
+        new_rooms = dict(self.rooms)
+        for room_id, min_stream_ordering, max_stream_ordering in rooms:
+            room_range = new_rooms.get(room_id)
+            if room_range is not None:
+                # The room has been purged before. Everything in between the
+                # two purges got purged by the second one.
+                min_stream_ordering = min(min_stream_ordering, room_range[0])
+                max_stream_ordering = max(max_stream_ordering, room_range[1])
+            new_rooms[room_id] = (min_stream_ordering, max_stream_ordering)
+
+        tombstones = attr.evolve(
+            self, events=self.events.union(event_ids), rooms=new_rooms
+        )
+        if tombstones.since is None and (
+            tombstones.events != self.events or tombstones.rooms != self.rooms
+        ):
+            tombstones = attr.evolve(tombstones, since=now)
+        return tombstones
+
+    def to_json(self) -> JsonDict:
+        return {
+            "events": sorted(self.events),
+            "rooms": {room_id: list(r) for room_id, r in self.rooms.items()},
+            "since": self.since,
+            "num_checked": self.num_checked,
+        }
+
+    @classmethod
+    def from_json(cls, data: JsonDict) -> "_Tombstones":
+        return cls(
+            events=frozenset(data["events"]),
+            rooms={room_id: (r[0], r[1]) for room_id, r in data["rooms"].items()},
+            since=data["since"],
+            # Older tombstones files don't record this.
+            num_checked=data.get("num_checked", 0),
+        )
+
+
+def tokenise(value: str) -> List[str]:
+    """Split some text into the lower-cased words which get indexed. This
+    splits text up in the same way as search terms are split up.
+    """
+    return [
+        token
+        for token in re.findall(r"[\w\-]+", value.lower(), re.UNICODE)
+        if len(token) <= _MAX_TOKEN_LENGTH
+    ]
+
+
+@attr.s(slots=True, auto_attribs=True)
+class _RoomIndex:
+    """The posting lists for a single room."""
+
+    # The number of documents in the room.
+    num_docs: int = 0
+    # The total number of words in all the documents in the room.
+    length: int = 0
+    # Map from word to its posting list.
+    postings: Dict[str, List[_Posting]] = attr.Factory(dict)
+
+
+def _merge_rooms(sources: Iterable[Dict[str, _RoomIndex]]) -> Dict[str, _RoomIndex]:
+    """Combine the posting lists from the given sources."""
+    rooms: Dict[str, _RoomIndex] = {}
+    for source in sources:
+        for room_id, source_room in source.items():
+            room = rooms.setdefault(room_id, _RoomIndex())
+            room.num_docs += source_room.num_docs
+            room.length += source_room.length
+            for token, postings in source_room.postings.items():
+                room.postings.setdefault(token, []).extend(postings)
+    return rooms
+
+
+class _MemorySegment:
+    """An immutable set of indexed documents held in memory, until they get
+    written out as a segment.
+    """
+
+    def __init__(self, rooms: Dict[str, _RoomIndex]):
+        self.rooms = rooms
+        self.num_docs = sum(room.num_docs for room in rooms.values())
+        self._sorted_tokens = {
+            room_id: sorted(room.postings) for room_id, room in rooms.items()
+        }
+
+    @classmethod
+    def from_entries(cls, entries: Iterable[SearchEntry]) -> "_MemorySegment":
+        rooms: Dict[str, _RoomIndex] = {}
+        for entry in entries:
+            tokens = tokenise(entry.value)
+            if not tokens:
+                continue
+
+            room = rooms.setdefault(entry.room_id, _RoomIndex())
+            room.num_docs += 1
+            room.length += len(tokens)
+
+            counts: Dict[str, int] = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+
+            for token, count in counts.items():
+                room.postings.setdefault(token, []).append(
+                    [
+                        entry.stream_ordering,
+                        entry.origin_server_ts or 0,
+                        entry.event_id,
+                        entry.key,
+                        count,
+                        len(tokens),
+                    ]
+                )
+
+        return cls(rooms)
+
+    def room_stats(self, room_id: str) -> Tuple[int, int]:
+        room = self.rooms.get(room_id)
+        if room is None:
+            return 0, 0
+        return room.num_docs, room.length
+
+    def postings_for_prefix(
+        self, room_id: str, prefix: str
+    ) -> Iterator[Tuple[str, List[_Posting]]]:
+        tokens = self._sorted_tokens.get(room_id)
+        if not tokens:
+            return
+
+        room = self.rooms[room_id]
+        for i in range(bisect.bisect_left(tokens, prefix), len(tokens)):
+            token = tokens[i]
+            if not token.startswith(prefix):
+                break
+            yield token, room.postings[token]
+
+
+class _Segment:
+    """A segment of the index on disk.
+
+    Each segment is made up of two files:
+      * `<name>.postings`: the JSON encoded posting lists, one after another.
+      * `<name>.terms`: a JSON encoded dictionary, giving for each room the
+        number of documents and words in it, and the offset and length of
+        the posting list for each word.
+
+    The dictionary is held in memory, while posting lists are read from disk
+    as needed.
+    """
+
+    def __init__(self, directory: str, name: str):
+        self.name = name
+        self._paths = _segment_paths(directory, name)
+
+        with open(self._paths[1], "rb") as f:
+            terms = json_decoder.decode(f.read().decode("utf-8"))
+
+        self.num_docs: int = terms["num_docs"]
+
+        # Map from room ID to (number of docs, number of words, sorted words,
+        # offsets, lengths).
+        self._rooms: Dict[str, Tuple[int, int, List[str], List[int], List[int]]] = {}
+        for room_id, (num_docs, length, room_terms) in terms["rooms"].items():
+            self._rooms[room_id] = (
+                num_docs,
+                length,
+                [t[0] for t in room_terms],
+                [t[1] for t in room_terms],
+                [t[2] for t in room_terms],
+            )
+
+        self._fd = os.open(self._paths[0], os.O_RDONLY)
+
+    def room_stats(self, room_id: str) -> Tuple[int, int]:
+        room = self._rooms.get(room_id)
+        if room is None:
+            return 0, 0
+        return room[0], room[1]
+
+    def postings_for_prefix(
+        self, room_id: str, prefix: str
+    ) -> Iterator[Tuple[str, List[_Posting]]]:
+        room = self._rooms.get(room_id)
+        if room is None:
+            return
+
+        _, _, tokens, offsets, lengths = room
+        for i in range(bisect.bisect_left(tokens, prefix), len(tokens)):
+            token = tokens[i]
+            if not token.startswith(prefix):
+                break
+            yield token, self._read(offsets[i], lengths[i])
+
+    def iter_postings(self) -> Iterator[Tuple[str, str, List[_Posting]]]:
+        """Read the posting lists in the segment one at a time, as tuples of
+        room ID, word and postings, ordered by room ID and then by word.
+        """
+        for room_id in sorted(self._rooms):
+            _, _, tokens, offsets, lengths = self._rooms[room_id]
+            for token, offset, length in zip(tokens, offsets, lengths):
+                yield room_id, token, self._read(offset, length)
+
+    def _read(self, offset: int, length: int) -> List[_Posting]:
+        # We use pread so that searches can read from the same segment from
+        # different threads.
+        return json_decoder.decode(os.pread(self._fd, length, offset).decode("utf-8"))
+
+    def close(self, delete: bool = False) -> None:
+        os.close(self._fd)
+        if delete:
+            for path in self._paths:
+                _delete_file(path)
+
+
+def _segment_paths(directory: str, name: str) -> Tuple[str, str]:
+    """Get the paths of the postings and terms files of a segment."""
+    return (
+        os.path.join(directory, name + ".postings"),
+        os.path.join(directory, name + ".terms"),
+    )
+
+
+def _write_file(path: str, data: bytes) -> None:
+    """Write out a file, making sure that it is complete on disk."""
+    with open(path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _write_segment(
+    directory: str,
+    name: str,
+    postings: Iterable[Tuple[str, str, List[_Posting]]],
+    room_stats: Callable[[str], Tuple[int, int]],
+) -> int:
+    """Write a new segment to disk.
+
+    Args:
+        directory: The directory to write the segment to.
+        name: The name of the segment.
+        postings: The posting lists to write, as tuples of room ID, word and
+            postings, ordered by room ID and then by word.
+        room_stats: Gets the number of documents and words in a room. Called
+            for each room once all of its posting lists have been read from
+            `postings`.
+
+    Returns:
+        The number of documents in the segment.
+    """
+    postings_path, terms_path = _segment_paths(directory, name)
+
+    num_docs = 0
+    terms_rooms = {}
+    offset = 0
+    with open(postings_path, "wb") as f:
+        for room_id, room_postings in itertools.groupby(postings, key=lambda p: p[0]):
+            room_terms = []
+            for _, token, token_postings in room_postings:
+                line = json_encoder.encode(token_postings).encode("utf-8")
+                f.write(line + b"\n")
+                room_terms.append([token, offset, len(line)])
+                offset += len(line) + 1
+
+            room_num_docs, room_length = room_stats(room_id)
+            num_docs += room_num_docs
+            terms_rooms[room_id] = [room_num_docs, room_length, room_terms]
+
+        f.flush()
+        os.fsync(f.fileno())
+
+    terms = {"num_docs": num_docs, "rooms": terms_rooms}
+    _write_file(terms_path, json_encoder.encode(terms).encode("utf-8"))
+
+    return num_docs
+
+
+def _write_rooms(directory: str, name: str, rooms: Dict[str, _RoomIndex]) -> int:
+    """Write the given posting lists out as a new segment.
+
+    Returns:
+        The number of documents in the segment.
+    """
+    postings = (
+        (room_id, token, rooms[room_id].postings[token])
+        for room_id in sorted(rooms)
+        for token in sorted(rooms[room_id].postings)
+    )
+    return _write_segment(
+        directory,
+        name,
+        postings,
+        lambda room_id: (rooms[room_id].num_docs, rooms[room_id].length),
+    )
+
+
+class _MergedPostings:
+    """The posting lists of several segments merged together, without the
+    tombstoned events.
+
+    The segments' posting lists are already sorted by room ID and word, so they
+    are merged as they are read, holding only one posting list from each
+    segment in memory at a time.
+    """
+
+    def __init__(self, segments: List[_Segment], tombstones: _Tombstones):
+        self._segments = segments
+        self._tombstones = tombstones
+        # Map from room ID to a map from the ID of each removed document to
+        # its number of words.
+        self._removed: Dict[str, Dict[str, int]] = {}
+
+    def __iter__(self) -> Iterator[Tuple[str, str, List[_Posting]]]:
+        merged = heapq.merge(
+            *(segment.iter_postings() for segment in self._segments),
+            key=lambda p: (p[0], p[1]),
+        )
+        for (room_id, token), group in itertools.groupby(
+            merged, key=lambda p: (p[0], p[1])
+        ):
+            remaining = []
+            for _, _, postings in group:
+                for posting in postings:
+                    if self._tombstones.is_deleted(room_id, posting[2], posting[0]):
+                        self._removed.setdefault(room_id, {})[posting[2]] = posting[5]
+                    else:
+                        remaining.append(posting)
+
+            if remaining:
+                yield room_id, token, remaining
+
+    def room_stats(self, room_id: str) -> Tuple[int, int]:
+        """Get the number of documents and words in a room, once all of its
+        posting lists have been read.
+        """
+        num_docs = 0
+        length = 0
+        for segment in self._segments:
+            segment_docs, segment_length = segment.room_stats(room_id)
+            num_docs += segment_docs
+            length += segment_length
+
+        removed = self._removed.pop(room_id, {})
+        return num_docs - len(removed), length - sum(removed.values())
+
+
+def _merge_segments(
+    directory: str, name: str, segments: List[_Segment], tombstones: _Tombstones
+) -> int:
+    """Merge the given segments into a new segment, dropping the tombstoned
+    events.
+
+    Returns:
+        The number of documents in the new segment.
+    """
+    merged = _MergedPostings(segments, tombstones)
+    return _write_segment(directory, name, merged, merged.room_stats)
+
+
+def _find_tombstoned(
+    segment: _Segment, tombstones: _Tombstones
+) -> Tuple[Set[str], Set[str]]:
+    """Find the tombstoned events in the given segment.
+
+    Returns:
+        The IDs of the tombstoned events in the segment, and the IDs of the
+        purged rooms with tombstoned events in the segment.
+    """
+    event_ids = set()
+    room_ids = set()
+    for room_id, _, postings in segment.iter_postings():
+        for posting in postings:
+            if tombstones.is_deleted(room_id, posting[2], posting[0]):
+                event_ids.add(posting[2])
+                if room_id in tombstones.rooms:
+                    room_ids.add(room_id)
+    return event_ids, room_ids
+
+
+def _delete_file(path: str) -> None:
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def _tombstones_path(directory: str, name: str) -> str:
+    return os.path.join(directory, name + ".tombstones")
+
+
+def _read_tombstones(path: str) -> _Tombstones:
+    with open(path, "rb") as f:
+        return _Tombstones.from_json(json_decoder.decode(f.read().decode("utf-8")))
+
+
+def _write_tombstones(path: str, tombstones: _Tombstones) -> None:
+    _write_file(path, json_encoder.encode(tombstones.to_json()).encode("utf-8"))
+
+
+def _read_manifest(path: str) -> JsonDict:
+    with open(path, "rb") as f:
+        return json_decoder.decode(f.read().decode("utf-8"))
+
+
+def _write_manifest(path: str, manifest: JsonDict) -> None:
+    # Write the new manifest alongside the old one and then atomically replace
+    # it, so that the manifest is never seen half written.
+    tmp_path = path + ".tmp"
+    _write_file(tmp_path, json_encoder.encode(manifest).encode("utf-8"))
+    os.replace(tmp_path, path)
+
+
+def _match(
+    sources: List[Union[_Segment, _MemorySegment]],
+    room_ids: Collection[str],
+    terms: List[str],
+    keys: Set[str],
+    tombstones: _Tombstones,
+) -> List[_Match]:
+    """Find the documents in the given rooms which contain all of the given
+    terms (each of which may be a prefix of a word in the document), and rank
+    them with BM25. Tombstoned events are skipped.
+    """
+    matches = []
+
+    for room_id in room_ids:
+        num_docs = 0
+        length = 0
+        for source in sources:
+            source_docs, source_length = source.room_stats(room_id)
+            num_docs += source_docs
+            length += source_length
+
+        if not num_docs:
+            continue
+
+        avg_length = length / num_docs
+
+        # Map from event ID to the matching posting, the rank so far and the
+        # matching words, for the documents which have matched all of the terms
+        # so far.
+        room_matches: Optional[Dict[str, Tuple[_Posting, float, Set[str]]]] = None
+        for term in terms:
+            # Map from event ID to a posting, the number of occurrences of
+            # words matching the term, and those words.
+            term_hits: Dict[str, Tuple[_Posting, int, Set[str]]] = {}
+            for source in sources:
+                for token, postings in source.postings_for_prefix(room_id, term):
+                    for posting in postings:
+                        if posting[3] not in keys:
+                            continue
+
+                        event_id = posting[2]
+                        if room_matches is not None and event_id not in room_matches:
+                            continue
+
+                        if tombstones.is_deleted(room_id, event_id, posting[0]):
+                            continue
+
+                        hit = term_hits.get(event_id)
+                        if hit:
+                            hit[2].add(token)
+                            term_hits[event_id] = (posting, posting[4] + hit[1], hit[2])
+                        else:
+                            term_hits[event_id] = (posting, posting[4], {token})
+
+            idf = math.log(
+                1 + (num_docs - len(term_hits) + 0.5) / (len(term_hits) + 0.5)
+            )
+
+            new_matches = {}
+            for event_id, (posting, count, tokens) in term_hits.items():
+                doc_length = posting[5]
+                score = (
+                    idf
+                    * count
+                    * (_BM25_K1 + 1)
+                    / (
+                        count
+                        + _BM25_K1 * (1 - _BM25_B + _BM25_B * doc_length / avg_length)
+                    )
+                )
+                if room_matches is not None:
+                    score += room_matches[event_id][1]
+                    tokens |= room_matches[event_id][2]
+                new_matches[event_id] = (posting, score, tokens)
+
+            room_matches = new_matches
+            if not room_matches:
+                break
+
+        for event_id, (posting, score, tokens) in (room_matches or {}).items():
+            matches.append(
+                _Match(
+                    event_id=event_id,
+                    stream_ordering=posting[0],
+                    origin_server_ts=posting[1],
+                    rank=score,
+                    highlights=frozenset(tokens),
+                )
+            )
+
+    return matches
+
+
+class _SearchIndex:
+    """The segments making up the search index, as listed in its manifest."""
+
+    def __init__(self, hs: "HomeServer", directory: str, is_writer: bool):
+        self._reactor = hs.get_reactor()
+        self._clock = hs.get_clock()
+        self._directory = directory
+        self._manifest_path = os.path.join(directory, _MANIFEST_NAME)
+        self._is_writer = is_writer
+
+        self.segments: Dict[str, _Segment] = {}
+        self.tombstones = _Tombstones()
+        self.manifest: JsonDict = {
+            "segments": [],
+            "next_segment": 0,
+            "position": 0,
+            "backfill_position": 0,
+            "tombstones": None,
+        }
+        self._manifest_mtime: Optional[int] = None
+        self._reload_linearizer = Linearizer(name="search_index_reload")
+
+    async def reload(self) -> None:
+        """Pick up any changes to the manifest."""
+        with (await self._reload_linearizer.queue(())):
+            try:
+                mtime = os.stat(self._manifest_path).st_mtime_ns
+            except FileNotFoundError:
+                # Nothing has been indexed yet.
+                return
+
+            if mtime == self._manifest_mtime:
+                return
+
+            manifest = await defer_to_thread(
+                self._reactor, _read_manifest, self._manifest_path
+            )
+            try:
+                await self._apply_manifest(manifest, mtime)
+            except FileNotFoundError:
+                # The segments in the manifest have already been merged away,
+                # so there'll be a newer manifest to use next time.
+                logger.warning("Failed to load search index segments", exc_info=True)
+
+    async def write_manifest(self, manifest: JsonDict) -> None:
+        """Replace the manifest, and start using the segments it lists."""
+        assert self._is_writer
+
+        await defer_to_thread(
+            self._reactor, _write_manifest, self._manifest_path, manifest
+        )
+        await self._apply_manifest(manifest, os.stat(self._manifest_path).st_mtime_ns)
+
+    def allocate_segment_name(self, prefix: str = "segment") -> str:
+        assert self._is_writer
+
+        segment_id = self.manifest["next_segment"]
+        self.manifest["next_segment"] += 1
+        return "%s-%08d" % (prefix, segment_id)
+
+    async def write_tombstones(self, tombstones: _Tombstones) -> str:
+        """Write out a new tombstones file, to be listed in the next manifest.
+
+        Returns:
+            The name of the file.
+        """
+        name = self.allocate_segment_name("tombstones")
+        await defer_to_thread(
+            self._reactor,
+            _write_tombstones,
+            _tombstones_path(self._directory, name),
+            tombstones,
+        )
+        return name
+
+    async def _apply_manifest(self, manifest: JsonDict, mtime: int) -> None:
+        # Older manifests don't list tombstones.
+        tombstones_name = manifest.get("tombstones")
+        if tombstones_name is None:
+            tombstones = _Tombstones()
+        elif tombstones_name == self.manifest.get("tombstones"):
+            tombstones = self.tombstones
+        else:
+            tombstones = await defer_to_thread(
+                self._reactor,
+                _read_tombstones,
+                _tombstones_path(self._directory, tombstones_name),
+            )
+
+        segments = {}
+        for name, _ in manifest["segments"]:
+            segment = self.segments.get(name)
+            if segment is None:
+                segment = await defer_to_thread(
+                    self._reactor, _Segment, self._directory, name
+                )
+            segments[name] = segment
+
+        removed = [
+            segment for name, segment in self.segments.items() if name not in segments
+        ]
+
+        old_tombstones_name = self.manifest.get("tombstones")
+
+        self.segments = segments
+        self.tombstones = tombstones
+        self.manifest = manifest
+        self._manifest_mtime = mtime
+
+        if removed:
+            self._clock.call_later(
+                _SEGMENT_DELETE_DELAY_MS / 1000, self._close_segments, removed
+            )
+
+        if (
+            self._is_writer
+            and old_tombstones_name is not None
+            and old_tombstones_name != tombstones_name
+        ):
+            self._clock.call_later(
+                _SEGMENT_DELETE_DELAY_MS / 1000,
+                _delete_file,
+                _tombstones_path(self._directory, old_tombstones_name),
+            )
+
+    def _close_segments(self, segments: List[_Segment]) -> None:
+        for segment in segments:
+            segment.close(delete=self._is_writer)
+
+
+class InvertedIndexSearchBackend(SearchBackend):
+    """Searches using an inverted index stored in files on disk."""
+
+    needs_deletions = True
+
+    def __init__(self, hs: "HomeServer", config: InvertedIndexConfig):
+        self.store = hs.get_datastore()
+        self.clock = hs.get_clock()
+        self.notifier = hs.get_notifier()
+        self._reactor = hs.get_reactor()
+        self._directory = config.index_directory
+
+        self._is_indexer = hs.get_instance_name() == config.indexer_instance
+        self._index = _SearchIndex(hs, self._directory, self._is_indexer)
+
+        # Documents which have been indexed but not yet written out as a segment.
+        self._memory_segments: List[_MemorySegment] = []
+
+        # Events which have been redacted, but not yet written out as
+        # tombstones.
+        self._pending_redactions: List[str] = []
+
+        # How far through the events stream we have indexed, including any
+        # documents held in memory. Backfilled events have negative stream
+        # orderings, so are followed separately.
+        self._position: Optional[int] = None
+        self._backfill_position: Optional[int] = None
+
+        # Guard to ensure we only process events one at a time
+        self._is_processing = False
+
+        self._flush_linearizer = Linearizer(name="search_index_flush")
+
+        if self._is_indexer:
+            os.makedirs(self._directory, exist_ok=True)
+
+            self.notifier.add_replication_callback(self.notify_new_event)
+            self.clock.looping_call(self._flush, _FLUSH_INTERVAL_MS)
+
+            # We kick this off so that we don't have to wait for a new event
+            # before we start building the index
+            self.clock.call_later(0, self.notify_new_event)
+
+    @staticmethod
+    def parse_config(config: JsonDict) -> InvertedIndexConfig:
+        index_directory = config.get("index_directory", "search_index")
+        if not isinstance(index_directory, str):
+            raise ConfigError("expected a string", ("index_directory",))
+
+        indexer_instance = config.get("indexer_instance") or "master"
+        if not isinstance(indexer_instance, str):
+            raise ConfigError("expected a string", ("indexer_instance",))
+
+        return InvertedIndexConfig(
+            index_directory=os.path.abspath(index_directory),
+            indexer_instance=indexer_instance,
+        )
+
+    def notify_new_event(self) -> None:
+        """Called when there may be more events to index"""
+        if self._is_processing:
+            return
+
+        self._is_processing = True
+
+        async def process():
+            try:
+                await self._unsafe_process()
+            finally:
+                self._is_processing = False
+
+        run_as_background_process("search_index.notify_new_event", process)
+
+    async def _unsafe_process(self) -> None:
+        if self._position is None or self._backfill_position is None:
+            await self._index.reload()
+            self._position = self._index.manifest["position"]
+            self._backfill_position = self._index.manifest["backfill_position"]
+
+        # Loop round indexing events until we're up to date
+        while True:
+            max_stream_ordering = self.store.get_room_max_stream_ordering()
+            min_stream_ordering = self.store.get_room_min_stream_ordering()
+            if (
+                self._position == max_stream_ordering
+                and self._backfill_position == min_stream_ordering
+            ):
+                break
+
+            (
+                entries,
+                redacted_event_ids,
+                position,
+            ) = await self.store.get_search_entries_to_index(
+                self._position, max_stream_ordering, _INDEX_BATCH_SIZE
+            )
+            (
+                backfill_entries,
+                backfill_redacted_event_ids,
+                backfill_position,
+            ) = await self.store.get_search_entries_to_index(
+                self._backfill_position, min_stream_ordering, _INDEX_BATCH_SIZE
+            )
+
+            redacted_event_ids += backfill_redacted_event_ids
+            if redacted_event_ids:
+                # Only tombstone events whose redactions have actually been
+                # applied.
+                events = await self.store.get_events_as_list(
+                    redacted_event_ids, redact_behaviour=EventRedactBehaviour.BLOCK
+                )
+                not_redacted = {event.event_id for event in events}
+                redacted_event_ids = [
+                    event_id
+                    for event_id in redacted_event_ids
+                    if event_id not in not_redacted
+                ]
+
+            # Don't index events which have already been deleted, e.g. if the
+            # redaction arrived before the event.
+            tombstones = self._get_tombstones()
+            newly_redacted = set(redacted_event_ids)
+            entries = [
+                entry
+                for entry in entries + backfill_entries
+                if entry.event_id not in newly_redacted
+                and not tombstones.is_deleted(
+                    entry.room_id, entry.event_id, entry.stream_ordering
+                )
+            ]
+
+            # We update the positions at the same time as adding the new
+            # documents and redactions, so that a flush never records positions
+            # beyond the documents and tombstones it writes out.
+            if entries:
+                self._memory_segments.append(_MemorySegment.from_entries(entries))
+            self._pending_redactions.extend(redacted_event_ids)
+            self._position = position
+            self._backfill_position = backfill_position
+
+            event_processing_positions.labels("search_index").set(position)
+
+            if sum(s.num_docs for s in self._memory_segments) >= _FLUSH_THRESHOLD:
+                await self._flush()
+
+    @wrap_as_background_process("search_index_flush")
+    async def _flush(self) -> None:
+        """Write out any documents held in memory as a new segment, and then
+        merge segments together if there are too many.
+        """
+        with (await self._flush_linearizer.queue(())):
+            memory_segments = list(self._memory_segments)
+            redactions = list(self._pending_redactions)
+            position = self._position
+            backfill_position = self._backfill_position
+
+            if position is None or backfill_position is None:
+                # We haven't started indexing yet.
+                return
+
+            # Events which have been purged from the database.
+            deletions = await self.store.get_search_index_deletions(_MAX_TOMBSTONES)
+
+            manifest = self._index.manifest
+            if (
+                memory_segments
+                or redactions
+                or deletions
+                or position != manifest["position"]
+                or backfill_position != manifest["backfill_position"]
+            ):
+                segments = list(manifest["segments"])
+                if memory_segments:
+                    name = self._index.allocate_segment_name()
+                    num_docs = await defer_to_thread(
+                        self._reactor,
+                        _write_rooms,
+                        self._directory,
+                        name,
+                        _merge_rooms(s.rooms for s in memory_segments),
+                    )
+                    segments.append([name, num_docs])
+
+                tombstones_name = self._index.manifest["tombstones"]
+                if redactions or deletions:
+                    tombstones = self._index.tombstones.add(
+                        self.clock.time_msec(),
+                        redactions
+                        + [event_id for _, event_id, _, _ in deletions if event_id],
+                        [
+                            (room_id, min_stream_ordering, max_stream_ordering)
+                            for room_id, event_id, min_stream_ordering, max_stream_ordering in deletions
+                            if not event_id
+                        ],
+                    )
+                    tombstones_name = await self._index.write_tombstones(tombstones)
+
+                await self._index.write_manifest(
+                    dict(
+                        self._index.manifest,
+                        segments=segments,
+                        position=position,
+                        backfill_position=backfill_position,
+                        tombstones=tombstones_name,
+                    )
+                )
+
+                # The documents and tombstones have been written out, so we can
+                # drop them.
+                del self._memory_segments[: len(memory_segments)]
+                del self._pending_redactions[: len(redactions)]
+                if deletions:
+                    await self.store.remove_search_index_deletions(deletions)
+
+                if len(segments) > _MAX_SEGMENTS:
+                    await self._merge_segments()
+
+            tombstones = self._index.tombstones
+            if tombstones.since is not None and (
+                len(tombstones) - tombstones.num_checked >= _MAX_TOMBSTONES
+                or self.clock.time_msec() - tombstones.since >= _MAX_TOMBSTONE_AGE_MS
+            ):
+                await self._compact_segments()
+
+    async def _merge_segments(self) -> None:
+        """Merge the smallest segments together."""
+        manifest = self._index.manifest
+        to_merge = sorted(manifest["segments"], key=lambda s: s[1])[:_MERGE_FACTOR]
+        names_to_merge = {name for name, _ in to_merge}
+
+        logger.info("Merging search index segments %s", names_to_merge)
+
+        name = self._index.allocate_segment_name()
+        num_docs = await defer_to_thread(
+            self._reactor,
+            _merge_segments,
+            self._directory,
+            name,
+            [self._index.segments[n] for n, _ in to_merge],
+            self._index.tombstones,
+        )
+
+        manifest = self._index.manifest
+        segments = [s for s in manifest["segments"] if s[0] not in names_to_merge]
+        segments.append([name, num_docs])
+
+        await self._index.write_manifest(dict(manifest, segments=segments))
+
+    async def _compact_segments(self) -> None:
+        """Rewrite the segments where enough of the documents have been deleted
+        without the tombstoned events, and then drop the tombstones for events
+        which aren't in any of the remaining segments.
+
+        Must be called from within the flush linearizer, so that no new
+        tombstones get written out in the meantime.
+        """
+        tombstones = self._index.tombstones
+
+        logger.info("Checking search index segments for %d tombstones", len(tombstones))
+
+        segments = []
+        # The tombstones for the events in segments which aren't rewritten.
+        remaining_event_ids: Set[str] = set()
+        remaining_room_ids: Set[str] = set()
+        num_rewritten = 0
+        for name, num_docs in self._index.manifest["segments"]:
+            segment = self._index.segments[name]
+            event_ids, room_ids = await defer_to_thread(
+                self._reactor, _find_tombstoned, segment, tombstones
+            )
+
+            if len(event_ids) <= num_docs * _COMPACT_TOMBSTONE_RATIO:
+                segments.append([name, num_docs])
+                remaining_event_ids.update(event_ids.intersection(tombstones.events))
+                remaining_room_ids.update(room_ids)
+                continue
+
+            num_rewritten += 1
+            if len(event_ids) < num_docs:
+                new_name = self._index.allocate_segment_name()
+                new_num_docs = await defer_to_thread(
+                    self._reactor,
+                    _merge_segments,
+                    self._directory,
+                    new_name,
+                    [segment],
+                    tombstones,
+                )
+                segments.append([new_name, new_num_docs])
+            # Otherwise everything in the segment has been deleted, so we just
+            # drop it.
+
+        remaining = _Tombstones(
+            events=frozenset(remaining_event_ids),
+            rooms={
+                room_id: tombstones.rooms[room_id] for room_id in remaining_room_ids
+            },
+            num_checked=len(remaining_event_ids) + len(remaining_room_ids),
+        )
+
+        logger.info(
+            "Rewrote %d search index segments, keeping %d tombstones",
+            num_rewritten,
+            len(remaining),
+        )
+
+        tombstones_name = None
+        if remaining:
+            tombstones_name = await self._index.write_tombstones(remaining)
+
+        await self._index.write_manifest(
+            dict(self._index.manifest, segments=segments, tombstones=tombstones_name)
+        )
+
+    def _get_tombstones(self) -> _Tombstones:
+        """Get the tombstones for the events which have been deleted, including
+        any which haven't been written out yet.
+        """
+        tombstones = self._index.tombstones
+        if self._pending_redactions:
+            tombstones = tombstones.add(
+                self.clock.time_msec(), self._pending_redactions
+            )
+        return tombstones
+
+    async def _get_matches(
+        self, room_ids: Collection[str], search_term: str, keys: List[str]
+    ) -> List[_Match]:
+        terms = tokenise(search_term)
+        if not terms:
+            return []
+
+        if not self._is_indexer:
+            await self._index.reload()
+
+        sources: List[Union[_Segment, _MemorySegment]] = []
+        sources.extend(self._index.segments.values())
+        sources.extend(self._memory_segments)
+
+        return await defer_to_thread(
+            self._reactor,
+            _match,
+            sources,
+            room_ids,
+            terms,
+            set(keys),
+            self._get_tombstones(),
+        )
+
+    async def _to_results(
+        self, matches: List[_Match]
+    ) -> Tuple[List[_Match], Dict, Set[str]]:
+        """Fetch the events for the given matches, dropping any which have been
+        redacted or purged since they were indexed and haven't been tombstoned
+        yet.
+
+        Returns:
+            The remaining matches, the map from event ID to event, and the
+            words to highlight.
+        """
+        # We set redact_behaviour to BLOCK here to prevent redacted events being
+        # returned in search results (which is a data leak)
+        events = await self.store.get_events_as_list(
+            [m.event_id for m in matches],
+            redact_behaviour=EventRedactBehaviour.BLOCK,
+        )
+        event_map = {ev.event_id: ev for ev in events}
+        results = [m for m in matches if m.event_id in event_map]
+
+        # Only highlight the words from the events we return, so that we don't
+        # leak the words of deleted events.
+        highlights: Set[str] = set()
+        for m in results:
+            highlights.update(m.highlights)
+
+        return results, event_map, highlights
+
+    async def search_msgs(
+        self, room_ids: Collection[str], search_term: str, keys: List[str]
+    ) -> JsonDict:
+        matches = await self._get_matches(room_ids, search_term, keys)
+
+        ranked = sorted(matches, key=lambda m: m.rank, reverse=True)
+        page = ranked[:_MAX_RANKED_RESULTS]
+        results, event_map, highlights = await self._to_results(page)
+
+        return {
+            "results": [
+                {"event": event_map[m.event_id], "rank": m.rank} for m in results
+            ],
+            "highlights": highlights,
+            # Don't count the matches we found had been deleted.
+            "count": len(matches) - (len(page) - len(results)),
+        }
+
+    async def search_rooms(
+        self,
+        room_ids: Collection[str],
+        search_term: str,
+        keys: List[str],
+        limit: int,
+        pagination_token: Optional[str] = None,
+    ) -> JsonDict:
+        matches = await self._get_matches(room_ids, search_term, keys)
+
+        page = matches
+        if pagination_token:
+            try:
+                origin_server_ts_str, stream_str = pagination_token.split(",")
+                before = (int(origin_server_ts_str), int(stream_str))
+            except Exception:
+                raise SynapseError(400, "Invalid pagination token")
+
+            page = [
+                m for m in matches if (m.origin_server_ts, m.stream_ordering) < before
+            ]
+
+        page = sorted(
+            page, key=lambda m: (m.origin_server_ts, m.stream_ordering), reverse=True
+        )
+        page = page[:limit]
+        results, event_map, highlights = await self._to_results(page)
+
+        return {
+            "results": [
+                {
+                    "event": event_map[m.event_id],
+                    "rank": m.rank,
+                    "pagination_token": "%s,%s"
+                    % (m.origin_server_ts, m.stream_ordering),
+                }
+                for m in results
+            ],
+            "highlights": highlights,
+            # Don't count the matches we found had been deleted.
+            "count": len(matches) - (len(page) - len(results)),
+        }
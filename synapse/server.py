@@ -123,6 +123,7 @@ from synapse.rest.media.v1.media_repository import (
     MediaRepository,
     MediaRepositoryResource,
 )
+from synapse.search import SearchBackend
 from synapse.server_notices.server_notices_manager import ServerNoticesManager
 from synapse.server_notices.server_notices_sender import ServerNoticesSender
 from synapse.server_notices.worker_server_notices_sender import (
@@ -315,6 +316,17 @@ class HomeServer(metaclass=abc.ABCMeta):
         if self.config.run_background_tasks:
             self.setup_background_tasks()
 
+        # The search backend may need to start keeping its index up to date.
+        self.get_search_backend()
+
+        # Instances which process inbound federation events need to start doing
+        # so, even if they don't receive any federation traffic themselves.
+        if (
+            self.get_instance_name()
+            in self.config.worker.federation_inbound_shard_config.instances
+        ):
+            self.get_federation_server()
+
     def start_listening(self) -> None:
         """Start the HTTP, manhole, metrics, etc listeners
 
@@ -570,6 +582,11 @@ class HomeServer(metaclass=abc.ABCMeta):
     def get_search_handler(self) -> SearchHandler:
         return SearchHandler(self)
 
+    @cache_in_self
+    def get_search_backend(self) -> SearchBackend:
+        backend_class, backend_config = self.config.search.search_backend
+        return backend_class(self, backend_config)
+
     @cache_in_self
     def get_send_email_handler(self) -> SendEmailHandler:
         return SendEmailHandler(self)
@@ -261,7 +261,10 @@ class StateHandler:
         return await self.store.get_joined_hosts(room_id, entry)
 
     async def compute_event_context(
-        self, event: EventBase, old_state: Optional[Iterable[EventBase]] = None
+        self,
+        event: EventBase,
+        old_state: Optional[Iterable[EventBase]] = None,
+        old_state_ids: Optional[StateMap[str]] = None,
     ) -> EventContext:
         """Build an EventContext structure for the event.
 
@@ -274,9 +277,13 @@ class StateHandler:
                 calculated from existing events. This is normally only specified
                 when receiving an event from federation where we don't have the
                 prev events for, e.g. when backfilling.
+            old_state_ids: As `old_state`, but as a map to the IDs of the
+                events, for when we don't have the events themselves to hand.
         Returns:
             The event context.
         """
+        if old_state:
+            old_state_ids = {(s.type, s.state_key): s.event_id for s in old_state}
 
         if event.internal_metadata.is_outlier():
             # If this is an outlier, then we know it shouldn't have any current
@@ -285,8 +292,8 @@ class StateHandler:
 
             # FIXME: why do we populate current_state_ids? I thought the point was
             # that we weren't supposed to have any state for outliers?
-            if old_state:
-                prev_state_ids = {(s.type, s.state_key): s.event_id for s in old_state}
+            if old_state_ids:
+                prev_state_ids = dict(old_state_ids)
                 if event.is_state():
                     current_state_ids = dict(prev_state_ids)
                     key = (event.type, event.state_key)
@@ -312,11 +319,9 @@ class StateHandler:
         # first of all, figure out the state before the event
         #
 
-        if old_state:
+        if old_state_ids:
             # if we're given the state before the event, then we use that
-            state_ids_before_event: StateMap[str] = {
-                (s.type, s.state_key): s.event_id for s in old_state
-            }
+            state_ids_before_event: StateMap[str] = dict(old_state_ids)
             state_group_before_event = None
             state_group_before_event_prev_group = None
             deltas_to_state_group_before_event = None
@@ -469,6 +469,10 @@ async def _reverse_topological_power_sort(
         if idx % _AWAIT_AFTER_ITERATIONS == 0:
             await clock.sleep(0)
 
+    # Load the auth events of everything in the graph in one go, so that
+    # looking up the senders' power levels doesn't hit the store per event.
+    await _prefetch_auth_events(graph, event_map, state_res_store)
+
     event_to_pl = {}
     for idx, event_id in enumerate(graph, start=1):
         pl = await _get_power_level_for_sender(
@@ -520,6 +524,19 @@ async def _iterative_auth_checks(
     """
     resolved_state = dict(base_state)
 
+    # Load all the events we might need for the auth checks up front. The only
+    # state that gets added to `resolved_state` as we go comes from `event_ids`
+    # themselves, so this is everything we need.
+    auth_state_event_ids: Set[str] = set()
+    for event_id in event_ids:
+        event = event_map[event_id]
+        auth_state_event_ids.update(event.auth_event_ids())
+        for key in event_auth.auth_types_for_event(room_version, event):
+            ev_id = base_state.get(key)
+            if ev_id is not None:
+                auth_state_event_ids.add(ev_id)
+    await _prefetch_events(auth_state_event_ids, event_map, state_res_store)
+
     for idx, event_id in enumerate(event_ids, start=1):
         event = event_map[event_id]
 
@@ -593,6 +610,17 @@ async def _mainline_sort(
         # skip calculating the mainline in that case.
         return []
 
+    # Load the chains of power level events referenced by the events we're
+    # sorting, so that calculating the mainline depths doesn't need to hit the
+    # store per event.
+    await _prefetch_power_level_chains(
+        itertools.chain(
+            event_ids, [resolved_power_event_id] if resolved_power_event_id else []
+        ),
+        event_map,
+        state_res_store,
+    )
+
     mainline = []
     pl = resolved_power_event_id
     idx = 0
@@ -620,10 +648,14 @@ async def _mainline_sort(
 
     event_ids = list(event_ids)
 
+    # The mainline depths of the power level events we've walked through, so
+    # that we only walk each power level chain once.
+    depth_cache: Dict[str, int] = {}
+
     order_map = {}
     for idx, ev_id in enumerate(event_ids, start=1):
         depth = await _get_mainline_depth_for_event(
-            event_map[ev_id], mainline_map, event_map, state_res_store
+            event_map[ev_id], mainline_map, event_map, state_res_store, depth_cache
         )
         order_map[ev_id] = (depth, event_map[ev_id].origin_server_ts, ev_id)
 
@@ -642,6 +674,7 @@ async def _get_mainline_depth_for_event(
     mainline_map: Dict[str, int],
     event_map: Dict[str, EventBase],
     state_res_store: "synapse.state.StateResolutionStore",
+    depth_cache: Optional[Dict[str, int]] = None,
 ) -> int:
     """Get the mainline depths for the given event based on the mainline map
 
@@ -650,6 +683,9 @@ async def _get_mainline_depth_for_event(
         mainline_map: Map from event_id to mainline depth for events in the mainline.
         event_map
         state_res_store
+        depth_cache: If given, a map from power level event ID to its mainline
+            depth, which is used to short-circuit the search and is updated
+            with the power level events visited.
 
     Returns:
         The mainline depth
@@ -658,13 +694,24 @@ async def _get_mainline_depth_for_event(
     room_id = event.room_id
     tmp_event: Optional[EventBase] = event
 
+    # The power level events we've walked through, which all share the depth
+    # we end up finding.
+    visited: List[str] = []
+
     # We do an iterative search, replacing `event with the power level in its
     # auth events (if any)
     while tmp_event:
         depth = mainline_map.get(tmp_event.event_id)
+        if depth is None and depth_cache is not None:
+            depth = depth_cache.get(tmp_event.event_id)
         if depth is not None:
+            if depth_cache is not None:
+                depth_cache.update((eid, depth) for eid in visited)
             return depth
 
+        if tmp_event is not event:
+            visited.append(tmp_event.event_id)
+
         auth_events = tmp_event.auth_event_ids()
         tmp_event = None
 
@@ -677,9 +724,77 @@ async def _get_mainline_depth_for_event(
                 break
 
     # Didn't find a power level auth event, so we just return 0
+    if depth_cache is not None:
+        depth_cache.update((eid, 0) for eid in visited)
     return 0
 
 
+async def _prefetch_events(
+    event_ids: Iterable[str],
+    event_map: Dict[str, EventBase],
+    state_res_store: "synapse.state.StateResolutionStore",
+) -> None:
+    """Loads any of the given events that aren't already in the event map from
+    the store in a single batch, so that subsequent calls to `_get_event` for
+    them don't each need to hit the store.
+
+    Args:
+        event_ids
+        event_map: The event map, which is updated with the fetched events.
+        state_res_store
+    """
+    missing = {event_id for event_id in event_ids if event_id not in event_map}
+    if not missing:
+        return
+
+    events = await state_res_store.get_events(missing, allow_rejected=True)
+    event_map.update(events)
+
+
+async def _prefetch_auth_events(
+    event_ids: Iterable[str],
+    event_map: Dict[str, EventBase],
+    state_res_store: "synapse.state.StateResolutionStore",
+) -> None:
+    """Loads the auth events of the given events into the event map in a single
+    batch. The given events must already be in the event map (or be unknown,
+    in which case they are ignored).
+    """
+    auth_event_ids: Set[str] = set()
+    for event_id in event_ids:
+        event = event_map.get(event_id)
+        if event:
+            auth_event_ids.update(event.auth_event_ids())
+
+    await _prefetch_events(auth_event_ids, event_map, state_res_store)
+
+
+async def _prefetch_power_level_chains(
+    event_ids: Iterable[str],
+    event_map: Dict[str, EventBase],
+    state_res_store: "synapse.state.StateResolutionStore",
+) -> None:
+    """Loads the chains of power level events referenced by the auth events of
+    the given events into the event map, fetching one level of the chains at a
+    time rather than one event at a time.
+    """
+    seen: Set[str] = set()
+    to_search = {event_id for event_id in event_ids if event_id in event_map}
+    while to_search:
+        seen.update(to_search)
+        await _prefetch_auth_events(to_search, event_map, state_res_store)
+
+        next_search = set()
+        for event_id in to_search:
+            for aid in event_map[event_id].auth_event_ids():
+                aev = event_map.get(aid)
+                if aev and (aev.type, aev.state_key) == (EventTypes.PowerLevels, ""):
+                    if aid not in seen:
+                        next_search.add(aid)
+                    break
+        to_search = next_search
+
+
 @overload
 async def _get_event(
     room_id: str,
@@ -63,8 +63,13 @@ class SQLBaseStore(metaclass=ABCMeta):
             room_id: Room where state changed
             members_changed: The user_ids of members that have changed
         """
-        for host in {get_domain_from_id(u) for u in members_changed}:
-            self._attempt_to_invalidate_cache("is_host_joined", (room_id, host))
+        self._attempt_to_invalidate_cache_many(
+            "is_host_joined",
+            [
+                (room_id, host)
+                for host in {get_domain_from_id(u) for u in members_changed}
+            ],
+        )
 
         self._attempt_to_invalidate_cache("get_users_in_room", (room_id,))
         self._attempt_to_invalidate_cache("get_users_in_room_with_profiles", (room_id,))
@@ -96,6 +101,35 @@ class SQLBaseStore(metaclass=ABCMeta):
         else:
             cache.invalidate(tuple(key))
 
+    def _attempt_to_invalidate_cache_many(
+        self, cache_name: str, keys: Collection[Collection[Any]]
+    ) -> None:
+        """Attempts to invalidate many entries of the cache of the given name in
+        a single pass, ignoring if the cache doesn't exist.
+
+        Args:
+            cache_name
+            keys: Entries to invalidate.
+        """
+        if not keys:
+            return
+
+        try:
+            cache = getattr(self, cache_name)
+        except AttributeError:
+            # We probably haven't pulled in the cache in this worker,
+            # which is fine.
+            return
+
+        invalidate_many = getattr(cache, "invalidate_many", None)
+        if invalidate_many is None:
+            # Not all caches support bulk invalidation, so fall back to
+            # invalidating one entry at a time.
+            for key in keys:
+                cache.invalidate(tuple(key))
+        else:
+            invalidate_many([tuple(key) for key in keys])
+
 
 def db_to_json(db_content: Union[memoryview, bytes, bytearray, str]) -> Any:
     """
@@ -12,8 +12,13 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 import logging
-from typing import TYPE_CHECKING, Awaitable, Callable, Dict, Iterable, Optional
+from typing import TYPE_CHECKING, Awaitable, Callable, Dict, Iterable, List, Optional
 
+from prometheus_client import Counter, Gauge
+
+from twisted.internet import defer
+
+from synapse.logging.context import make_deferred_yieldable, run_in_background
 from synapse.metrics.background_process_metrics import run_as_background_process
 from synapse.storage.types import Connection
 from synapse.types import JsonDict
@@ -27,6 +32,42 @@ if TYPE_CHECKING:
 
 logger = logging.getLogger(__name__)
 
+background_update_items = Counter(
+    "synapse_background_update_items",
+    "Number of items processed by background updates",
+    ["database", "update_name"],
+)
+background_update_rate = Gauge(
+    "synapse_background_update_items_per_second",
+    "Recent rate at which background updates are processing items",
+    ["database", "update_name"],
+)
+background_update_eta = Gauge(
+    "synapse_background_update_eta_seconds",
+    "Estimated time until background updates complete, where it can be estimated",
+    ["database", "update_name"],
+)
+
+
+def _estimate_remaining_items(progress: JsonDict) -> Optional[int]:
+    """Estimate how many items a background update has left to process, from
+    its progress.
+
+    This relies on the conventions used by many of our background updates,
+    which either keep a count of the `remaining` items or work down through a
+    range of stream orderings. Returns None if no estimate can be made.
+    """
+    remaining = progress.get("remaining")
+    if isinstance(remaining, int):
+        return remaining
+
+    max_stream_id = progress.get("max_stream_id_exclusive")
+    min_stream_id = progress.get("target_min_stream_id_inclusive")
+    if isinstance(max_stream_id, int) and isinstance(min_stream_id, int):
+        return max(0, max_stream_id - min_stream_id)
+
+    return None
+
 
 class BackgroundUpdatePerformance:
     """Tracks the how long a background update is taking to update its items"""
@@ -37,11 +78,15 @@ class BackgroundUpdatePerformance:
         self.total_duration_ms = 0.0
         self.avg_item_count = 0.0
         self.avg_duration_ms = 0.0
+        self.last_item_count = 0
+        # An estimate of how long until the update completes, if known.
+        self.eta_seconds: Optional[float] = None
 
     def update(self, item_count: int, duration_ms: float) -> None:
         """Update the stats after doing an update"""
         self.total_item_count += item_count
         self.total_duration_ms += duration_ms
+        self.last_item_count = item_count
 
         # Exponential moving averages for the number of items updated and
         # the duration.
@@ -80,6 +125,11 @@ class BackgroundUpdater:
     background. Each update processes a batch of data at once. We attempt to
     limit the impact of each update by monitoring how long each batch takes to
     process and autotuning the batch size.
+
+    Updates which don't depend on each other may be run concurrently, up to
+    `max_concurrent_background_updates` (from the database config) at a time.
+    How many are run at once, and how long each batch should take, is scaled
+    back when the database is busy with other work.
     """
 
     MINIMUM_BACKGROUND_BATCH_SIZE = 100
@@ -91,8 +141,18 @@ class BackgroundUpdater:
         self._clock = hs.get_clock()
         self.db_pool = database
 
-        # if a background update is currently running, its name.
-        self._current_background_update: Optional[str] = None
+        # The names of the background updates which are currently running, in
+        # the order they were started.
+        self._current_background_updates: List[str] = []
+
+        # The maximum number of background updates to run at once.
+        self._max_concurrent_updates = (
+            database._database_config.max_concurrent_background_updates
+        )
+
+        # Whether background updates are enabled. Can be toggled via the admin
+        # API, to pause background updates.
+        self.enabled = True
 
         self._background_update_performance: Dict[str, BackgroundUpdatePerformance] = {}
         self._background_update_handlers: Dict[
@@ -109,9 +169,15 @@ class BackgroundUpdater:
             if sleep:
                 await self._clock.sleep(self.BACKGROUND_UPDATE_INTERVAL_MS / 1000.0)
 
+            if not self.enabled:
+                if not sleep:
+                    return None
+                continue
+
             try:
-                result = await self.do_next_background_update(
-                    self.BACKGROUND_UPDATE_DURATION_MS
+                result = await self.do_next_background_updates(
+                    self.BACKGROUND_UPDATE_DURATION_MS,
+                    self._get_update_concurrency(),
                 )
             except Exception:
                 logger.exception("Error doing update")
@@ -136,7 +202,7 @@ class BackgroundUpdater:
             return True
 
         # obviously, if we are currently processing an update, we're not done.
-        if self._current_background_update:
+        if self._current_background_updates:
             return False
 
         # otherwise, check if there are updates to be run. This is important,
@@ -159,7 +225,7 @@ class BackgroundUpdater:
         if self._all_done:
             return True
 
-        if update_name == self._current_background_update:
+        if update_name in self._current_background_updates:
             return False
 
         update_exists = await self.db_pool.simple_select_one_onecol(
@@ -182,6 +248,98 @@ class BackgroundUpdater:
         Returns:
             True if we have finished running all the background updates, otherwise False
         """
+        return await self.do_next_background_updates(desired_duration_ms, 1)
+
+    async def do_next_background_updates(
+        self, desired_duration_ms: float, max_concurrent_updates: int
+    ) -> bool:
+        """Does a batch of work on each of up to `max_concurrent_updates`
+        queued background updates which don't depend on each other, running
+        them concurrently.
+
+        Returns once each batch of work is done.
+
+        Args:
+            desired_duration_ms: How long we want to spend updating.
+            max_concurrent_updates: The maximum number of updates to work on.
+        Returns:
+            True if we have finished running all the background updates, otherwise False
+        """
+        if len(self._current_background_updates) < max_concurrent_updates:
+            pending_updates = await self.get_pending_background_updates()
+            if not pending_updates and not self._current_background_updates:
+                # no work left to do
+                return True
+
+            # Start on those updates which aren't dependent on another one in
+            # the queue.
+            pending = {update["update_name"] for update in pending_updates}
+            for upd in pending_updates:
+                if len(self._current_background_updates) >= max_concurrent_updates:
+                    break
+
+                update_name = upd["update_name"]
+                if update_name in self._current_background_updates:
+                    continue
+
+                depends_on = upd["depends_on"]
+                if depends_on and depends_on in pending:
+                    logger.info(
+                        "Not starting on bg update %s until %s is done",
+                        update_name,
+                        depends_on,
+                    )
+                    continue
+
+                self._current_background_updates.append(update_name)
+
+            if not self._current_background_updates:
+                # if we didn't find anything to run, there is a problem
+                raise Exception(
+                    "Unable to find a background update which doesn't depend on "
+                    "another: dependency cycle?"
+                )
+
+        desired_duration_ms = self._get_desired_duration_ms(desired_duration_ms)
+        update_names = self._current_background_updates[:max_concurrent_updates]
+        if len(update_names) == 1:
+            await self._do_background_update(update_names[0], desired_duration_ms)
+        else:
+            # Avoid a circular import.
+            from synapse.storage.database import TransactionLane
+
+            # The updates share our logcontext, so put it in the bulk lane for
+            # the duration, rather than leaving each update to do so.
+            with self.db_pool.transaction_lane(TransactionLane.BULK):
+                # Wait for every batch to finish, even if one of them fails,
+                # so that we don't start another batch of an update while one
+                # is still running.
+                results = await make_deferred_yieldable(
+                    defer.DeferredList(
+                        [
+                            run_in_background(
+                                self._do_background_update,
+                                update_name,
+                                desired_duration_ms,
+                            )
+                            for update_name in update_names
+                        ],
+                        consumeErrors=True,
+                    )
+                )
+
+            for success, result in results:
+                if not success:
+                    result.raiseException()
+        return False
+
+    async def get_pending_background_updates(self) -> List[JsonDict]:
+        """Get the background updates which are yet to complete, in the order
+        they should be run.
+
+        Returns:
+            A list of dicts with `update_name` and `depends_on` keys.
+        """
 
         def get_background_updates_txn(txn):
             txn.execute(
@@ -192,41 +350,76 @@ class BackgroundUpdater:
             )
             return self.db_pool.cursor_to_dict(txn)
 
-        if not self._current_background_update:
-            all_pending_updates = await self.db_pool.runInteraction(
-                "background_updates",
-                get_background_updates_txn,
+        return await self.db_pool.runInteraction(
+            "background_updates",
+            get_background_updates_txn,
+        )
+
+    async def prioritise_background_update(self, update_name: str) -> bool:
+        """Move a pending background update to the front of the queue.
+
+        The update will still wait for any update it depends on to complete.
+
+        Returns:
+            False if there is no such pending update, otherwise True.
+        """
+
+        def prioritise_background_update_txn(txn):
+            txn.execute("SELECT COALESCE(MIN(ordering), 0) FROM background_updates")
+            (min_ordering,) = txn.fetchone()
+
+            txn.execute(
+                "UPDATE background_updates SET ordering = ? WHERE update_name = ?",
+                (min_ordering - 1, update_name),
             )
-            if not all_pending_updates:
-                # no work left to do
-                return True
+            return txn.rowcount > 0
 
-            # find the first update which isn't dependent on another one in the queue.
-            pending = {update["update_name"] for update in all_pending_updates}
-            for upd in all_pending_updates:
-                depends_on = upd["depends_on"]
-                if not depends_on or depends_on not in pending:
-                    break
-                logger.info(
-                    "Not starting on bg update %s until %s is done",
-                    upd["update_name"],
-                    depends_on,
-                )
-            else:
-                # if we get to the end of that for loop, there is a problem
-                raise Exception(
-                    "Unable to find a background update which doesn't depend on "
-                    "another: dependency cycle?"
-                )
+        return await self.db_pool.runInteraction(
+            "prioritise_background_update", prioritise_background_update_txn
+        )
 
-            self._current_background_update = upd["update_name"]
+    def get_current_update_stats(self) -> Dict[str, JsonDict]:
+        """Get the progress of the background updates which are currently
+        running, as reported by the admin API.
+        """
+        stats = {}
+        for update_name in self._current_background_updates:
+            performance = self._background_update_performance.get(update_name)
+            if performance is None:
+                performance = BackgroundUpdatePerformance(update_name)
+
+            stats[update_name] = {
+                "total_item_count": performance.total_item_count,
+                "total_duration_ms": performance.total_duration_ms,
+                "average_items_per_ms": performance.average_items_per_ms(),
+                "eta_seconds": performance.eta_seconds,
+            }
+        return stats
 
-        await self._do_background_update(desired_duration_ms)
-        return False
+    def _get_update_concurrency(self) -> int:
+        """Work out how many background updates to run at once.
 
-    async def _do_background_update(self, desired_duration_ms: float) -> int:
-        assert self._current_background_update is not None
-        update_name = self._current_background_update
+        We only run more than one while the database has connections to spare
+        for bulk work, which it will stop doing if other work starts backing up.
+        """
+        return max(
+            1, min(self._max_concurrent_updates, self.db_pool.bulk_connection_limit())
+        )
+
+    def _get_desired_duration_ms(self, desired_duration_ms: float) -> float:
+        """Scale back how long we want each batch to take if the database is
+        busy, which in turn shrinks the batch sizes.
+        """
+        load = self.db_pool.get_load_factor()
+        if load > 1:
+            desired_duration_ms = max(
+                desired_duration_ms / 10, desired_duration_ms / load
+            )
+        return desired_duration_ms
+
+    async def _do_background_update(
+        self, update_name: str, desired_duration_ms: float
+    ) -> int:
         logger.info("Starting update batch on background update '%s'", update_name)
 
         update_handler = self._background_update_handlers[update_name]
@@ -254,11 +447,15 @@ class BackgroundUpdater:
 
         # Avoid a circular import.
         from synapse.storage._base import db_to_json
+        from synapse.storage.database import TransactionLane
 
         progress = db_to_json(progress_json)
 
         time_start = self._clock.time_msec()
-        items_updated = await update_handler(progress, batch_size)
+        # Background updates shouldn't hog the database connections at the
+        # expense of other work.
+        with self.db_pool.transaction_lane(TransactionLane.BULK):
+            items_updated = await update_handler(progress, batch_size)
         time_stop = self._clock.time_msec()
 
         duration_ms = time_stop - time_start
@@ -276,9 +473,33 @@ class BackgroundUpdater:
         )
 
         performance.update(items_updated, duration_ms)
+        self._update_metrics(performance, progress)
 
         return len(self._background_update_performance)
 
+    def _update_metrics(
+        self, performance: BackgroundUpdatePerformance, progress: JsonDict
+    ) -> None:
+        """Update the throughput and ETA metrics for a background update, given
+        its progress before its most recent batch.
+        """
+        labels = (self.db_pool.name(), performance.name)
+        background_update_items.labels(*labels).inc(performance.last_item_count)
+
+        # Only report the rate and ETA of updates which are still running.
+        if performance.name not in self._current_background_updates:
+            return
+
+        items_per_ms = performance.average_items_per_ms()
+        if items_per_ms is not None:
+            background_update_rate.labels(*labels).set(items_per_ms * 1000)
+
+        remaining = _estimate_remaining_items(progress)
+        if remaining is not None and items_per_ms:
+            remaining = max(0, remaining - performance.last_item_count)
+            performance.eta_seconds = remaining / items_per_ms / 1000
+            background_update_eta.labels(*labels).set(performance.eta_seconds)
+
     def register_background_update_handler(
         self,
         update_name: str,
@@ -433,12 +654,20 @@ class BackgroundUpdater:
         Returns:
             None, completes once the task is removed.
         """
-        if update_name != self._current_background_update:
+        if update_name not in self._current_background_updates:
             raise Exception(
                 "Cannot end background update %s which isn't currently running"
                 % update_name
             )
-        self._current_background_update = None
+        self._current_background_updates.remove(update_name)
+
+        labels = (self.db_pool.name(), update_name)
+        for gauge in (background_update_rate, background_update_eta):
+            try:
+                gauge.remove(*labels)
+            except KeyError:
+                pass
+
         await self.db_pool.simple_delete_one(
             "background_updates", keyvalues={"update_name": update_name}
         )
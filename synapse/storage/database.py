@@ -13,15 +13,18 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import contextlib
+import itertools
 import logging
 import time
-from collections import defaultdict
+from collections import defaultdict, deque
 from sys import intern
 from time import monotonic as monotonic_time
 from typing import (
     Any,
     Callable,
     Collection,
+    Deque,
     Dict,
     Iterable,
     Iterator,
@@ -34,16 +37,19 @@ from typing import (
 )
 
 import attr
-from prometheus_client import Histogram
+from prometheus_client import Counter, Gauge, Histogram
 from typing_extensions import Literal
 
 from twisted.enterprise import adbapi
+from twisted.internet import defer
+from twisted.python.failure import Failure
 
 from synapse.api.errors import StoreError
 from synapse.config.database import DatabaseConnectionConfig
 from synapse.logging import opentracing
 from synapse.logging.context import (
     LoggingContext,
+    PreserveLoggingContext,
     current_context,
     make_deferred_yieldable,
 )
@@ -66,6 +72,54 @@ sql_scheduling_timer = Histogram("synapse_storage_schedule_time", "sec")
 sql_query_timer = Histogram("synapse_storage_query_time", "sec", ["verb"])
 sql_txn_timer = Histogram("synapse_storage_transaction_time", "sec", ["desc"])
 
+sql_lane_queue_timer = Histogram(
+    "synapse_storage_lane_queue_time",
+    "Time spent waiting for a database connection, by lane and transaction",
+    ["lane", "desc"],
+)
+sql_lane_queue_length = Gauge(
+    "synapse_storage_lane_queue_length",
+    "Number of transactions waiting for a database connection",
+    ["database", "lane"],
+)
+sql_bulk_lane_limit = Gauge(
+    "synapse_storage_bulk_lane_limit",
+    "Maximum number of database connections bulk transactions may use",
+    ["database"],
+)
+
+replica_txn_counter = Counter(
+    "synapse_storage_replica_transactions",
+    "Number of read-only transactions run against a read replica",
+    ["desc"],
+)
+replica_fallback_counter = Counter(
+    "synapse_storage_replica_fallbacks",
+    "Number of read-only transactions sent to the primary because the read "
+    "replica had not caught up or was unavailable",
+    ["desc"],
+)
+
+upsert_buffer_added_counter = Counter(
+    "synapse_storage_upsert_buffer_added",
+    "Number of upserts added to the write-behind upsert buffer",
+    ["table"],
+)
+upsert_buffer_coalesced_counter = Counter(
+    "synapse_storage_upsert_buffer_coalesced",
+    "Number of buffered upserts which replaced a pending upsert of the same row",
+    ["table"],
+)
+upsert_buffer_flushed_counter = Counter(
+    "synapse_storage_upsert_buffer_flushed",
+    "Number of rows written by flushes of the write-behind upsert buffer",
+    ["table"],
+)
+upsert_buffer_flush_failures_counter = Counter(
+    "synapse_storage_upsert_buffer_flush_failures",
+    "Number of failed flushes of the write-behind upsert buffer",
+)
+
 
 # Unique indexes which have been added in background updates. Maps from table name
 # to the name of the background update which added the unique index to that table.
@@ -82,6 +136,54 @@ UNIQUE_INDEX_BACKGROUND_UPDATES = {
 }
 
 
+class _ReplicaBehindError(Exception):
+    """Raised when a read replica hasn't yet replayed all the changes a
+    read-only transaction needs to see.
+    """
+
+
+class _ReplicaUnavailableError(Exception):
+    """Raised when a read-only transaction can't be run on a read replica,
+    e.g. because the replica is down or we couldn't connect to it.
+    """
+
+
+# How long (in milliseconds) to stop sending transactions to a read replica for
+# after it fails.
+_REPLICA_RETRY_INTERVAL_MS = 30 * 1000
+
+
+class TransactionLane:
+    """The lanes which database work is queued in while waiting for a
+    connection.
+
+    Work in the latency critical lane is given a connection before normal work,
+    which in turn is given one before bulk work. Bulk work (e.g. background
+    updates and purges) is also limited to a subset of the connections, which
+    shrinks when other work has to wait too long for a connection.
+    """
+
+    LATENCY_CRITICAL = "latency_critical"
+    NORMAL = "normal"
+    BULK = "bulk"
+
+
+# The lanes, in the order in which they are given connections.
+_LANES_BY_PRIORITY = (
+    TransactionLane.LATENCY_CRITICAL,
+    TransactionLane.NORMAL,
+    TransactionLane.BULK,
+)
+
+# If non-bulk work has to wait longer than this (in seconds, on average) for a
+# connection then we reduce the number of connections bulk work may use.
+_TARGET_LANE_QUEUE_TIME = 0.05
+
+# How often (in seconds) we may increase the number of connections bulk work
+# may use.
+_BULK_LANE_GROWTH_INTERVAL = 1.0
+
+
 def make_pool(
     reactor, db_config: DatabaseConnectionConfig, engine: BaseDatabaseEngine
 ) -> adbapi.ConnectionPool:
@@ -185,6 +287,14 @@ _CallbackListEntry = Tuple[Callable[..., None], Iterable[Any], Dict[str, Any]]
 R = TypeVar("R")
 
 
+# The default number of rows to pull from the database at a time when streaming
+# the results of a query with `LoggingTransaction.stream_rows`.
+_STREAM_BATCH_SIZE = 1000
+
+# Used to give each server-side cursor on postgres a unique name.
+_stream_cursor_ids = itertools.count()
+
+
 class LoggingTransaction:
     """An object that almost-transparently proxies for the 'txn' object
     passed to the constructor. Adds logging and metrics to the .execute()
@@ -297,6 +407,55 @@ class LoggingTransaction:
     def execute(self, sql: str, *args: Any) -> None:
         self._do_execute(self.txn.execute, sql, *args)
 
+    def stream_rows(
+        self,
+        sql: str,
+        args: Iterable[Any] = (),
+        batch_size: int = _STREAM_BATCH_SIZE,
+    ) -> Iterator[Tuple]:
+        """Execute a query and lazily yield the resulting rows, without holding
+        the entire result set in memory.
+
+        On PostgreSQL this uses a named (server-side) cursor, so that rows are
+        only sent to us `batch_size` at a time. On SQLite the rows are fetched
+        from a separate cursor in chunks of `batch_size`.
+
+        The query is run on its own cursor, so other queries may be executed
+        on this transaction while the results are being consumed. The returned
+        iterator must be consumed (or closed) before the transaction finishes.
+
+        Args:
+            sql: The query to run
+            args: The arguments for the query
+            batch_size: The number of rows to fetch from the database at a time
+
+        Returns:
+            An iterator over the rows returned by the query.
+        """
+        conn = self.txn.connection  # type: ignore[attr-defined]
+
+        if isinstance(self.database_engine, PostgresEngine):
+            # Server-side cursors are closed at the end of the transaction unless
+            # they are declared WITH HOLD, which we need to do in autocommit mode.
+            cursor = conn.cursor(
+                name="synapse_stream_%d" % (next(_stream_cursor_ids),),
+                withhold=conn.autocommit,
+            )
+            cursor.itersize = batch_size
+        else:
+            cursor = conn.cursor()
+
+        try:
+            self._do_execute(cursor.execute, sql, list(args))
+
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            cursor.close()
+
     def executemany(self, sql: str, *args: Any) -> None:
         self._do_execute(self.txn.executemany, sql, *args)
 
@@ -402,6 +561,23 @@ class DatabasePool:
         self._database_config = database_config
         self._db_pool = make_pool(hs.get_reactor(), database_config, engine)
 
+        # Hot standby replicas of this database, which read-only transactions
+        # may be run against. See `runInteraction`.
+        self._replica_pools = [
+            make_pool(hs.get_reactor(), replica_config, engine)
+            for replica_config in database_config.replicas
+        ]
+        self._next_replica = 0
+
+        # Map from the index of a replica which has failed to the time (in
+        # milliseconds) until which we stop using it.
+        self._replica_retry_after: Dict[int, int] = {}
+
+        # Requests for the primary's current WAL position, which get batched up
+        # so that only one query is in flight at a time.
+        self._wal_position_waiters: List["defer.Deferred[str]"] = []
+        self._fetching_wal_position = False
+
         self.updates = BackgroundUpdater(hs, self)
 
         self._previous_txn_total_time = 0.0
@@ -418,6 +594,30 @@ class DatabasePool:
 
         self.engine = engine
 
+        # We queue work waiting for a connection ourselves, so that we can decide
+        # which work gets the next free connection. We never hand the
+        # underlying pool more work than it has connections for.
+        self._max_connections = self._db_pool.max
+        self._connections_in_use = 0
+        self._lane_queues: Dict[str, Deque["defer.Deferred[None]"]] = {
+            lane: deque() for lane in _LANES_BY_PRIORITY
+        }
+        # The logcontexts which have asked for their work to go in a particular
+        # lane. See `transaction_lane`.
+        self._context_lanes: Dict[LoggingContext, str] = {}
+
+        # Bulk work may use all but one of the connections, unless that makes
+        # other work wait. `_recent_lane_queue_time` is a moving average of how
+        # long non-bulk work has waited for a connection.
+        self._max_bulk_connections = max(1, self._max_connections - 1)
+        self._bulk_connection_limit = self._max_bulk_connections
+        self._bulk_connections_in_use = 0
+        self._recent_lane_queue_time = 0.0
+        self._last_bulk_limit_increase = 0.0
+        sql_bulk_lane_limit.labels(database_config.name).set(
+            self._bulk_connection_limit
+        )
+
         # A set of tables that are not safe to use native upserts in.
         self._unsafe_to_upsert_tables = set(UNIQUE_INDEX_BACKGROUND_UPDATES.keys())
 
@@ -427,6 +627,31 @@ class DatabasePool:
         if isinstance(self.engine, Sqlite3Engine):
             self._unsafe_to_upsert_tables.add("user_directory_search")
 
+        # How long (in seconds) to buffer upserts passed to
+        # `simple_upsert_buffered` for before writing them out. If zero, such
+        # upserts are written immediately.
+        self._upsert_flush_interval = database_config.upsert_flush_interval_ms / 1000
+
+        # Upserts waiting to be written, grouped by the table and the key and
+        # value columns being written, and then mapping from the key column
+        # values to the value column values.
+        self._upsert_buffer: Dict[
+            Tuple[str, Tuple[str, ...], Tuple[str, ...]],
+            Dict[Tuple[Any, ...], Tuple[Any, ...]],
+        ] = {}
+        self._upsert_flush_scheduled = False
+
+        if self._upsert_flush_interval:
+            # The trigger has to return a Deferred for the reactor to wait for
+            # the flush to finish before shutting down.
+            hs.get_reactor().addSystemEventTrigger(
+                "before",
+                "shutdown",
+                run_as_background_process,
+                "flush_upsert_buffer",
+                self.flush_upsert_buffer,
+            )
+
         if self.engine.can_native_upsert:
             # Check ASAP (and then later, every 1s) to see if we have finished
             # background updates of tables that aren't safe to update.
@@ -437,6 +662,10 @@ class DatabasePool:
                 self._check_safe_to_upsert,
             )
 
+    def name(self) -> str:
+        """Return the name of this database"""
+        return self._database_config.name
+
     def is_running(self) -> bool:
         """Is the database pool currently running"""
         return self._db_pool.running
@@ -647,6 +876,7 @@ class DatabasePool:
         func: Callable[..., R],
         *args: Any,
         db_autocommit: bool = False,
+        db_read_only: bool = False,
         **kwargs: Any,
     ) -> R:
         """Starts a transaction on the database and runs a given function
@@ -669,21 +899,185 @@ class DatabasePool:
                 called multiple times if the transaction is retried, so must
                 correctly handle that case.
 
+            db_read_only: Whether `func` only reads from the database. If so,
+                and read replicas are configured, it may be run against a
+                replica instead of the primary. The replica must have caught up
+                with everything committed on the primary before this function
+                was called, so the results are never older than the stream
+                tokens the caller is working from; if it hasn't, the function
+                is run against the primary instead.
+
             args: positional args to pass to `func`
             kwargs: named args to pass to `func`
 
         Returns:
             The result of func
         """
-        after_callbacks: List[_CallbackListEntry] = []
-        exception_callbacks: List[_CallbackListEntry] = []
-
         if not current_context():
             logger.warning("Starting db txn '%s' from sentinel context", desc)
 
+        if db_read_only and self._replica_pools:
+            try:
+                return await self._run_interaction_on_replica(
+                    desc, func, *args, **kwargs
+                )
+            except (_ReplicaBehindError, _ReplicaUnavailableError):
+                replica_fallback_counter.labels(desc).inc()
+
+        return await self._run_interaction(
+            desc, func, *args, db_autocommit=db_autocommit, **kwargs
+        )
+
+    async def _run_interaction_on_replica(
+        self, desc: str, func: Callable[..., R], *args: Any, **kwargs: Any
+    ) -> R:
+        """Runs a read-only transaction on one of the read replicas.
+
+        Raises:
+            _ReplicaBehindError if the replica hasn't caught up with the
+            primary's position at the time of the call.
+
+            _ReplicaUnavailableError if all the replicas have recently failed,
+            or the transaction failed on the replica because of a connection or
+            other operational error.
+        """
+        now = self._clock.time_msec()
+        for _ in range(len(self._replica_pools)):
+            index = self._next_replica
+            self._next_replica = (self._next_replica + 1) % len(self._replica_pools)
+            if self._replica_retry_after.get(index, 0) <= now:
+                break
+        else:
+            raise _ReplicaUnavailableError()
+
+        wal_position = await self._get_primary_wal_position()
+
+        replica_txn_counter.labels(desc).inc()
+        try:
+            return await self._run_interaction(
+                desc,
+                self._check_replica_position_txn,
+                wal_position,
+                func,
+                *args,
+                db_replica=self._replica_pools[index],
+                **kwargs,
+            )
+        except (
+            self.engine.module.OperationalError,
+            self.engine.module.InterfaceError,
+        ) as e:
+            if not self.engine.is_deadlock(e):
+                # The replica is probably down or unreachable, so give it a
+                # while to recover before trying it again.
+                logger.warning(
+                    "Read replica %d of database %s failed, not using it for"
+                    " %ds: %s",
+                    index,
+                    self._database_config.name,
+                    _REPLICA_RETRY_INTERVAL_MS // 1000,
+                    e,
+                )
+                self._replica_retry_after[index] = (
+                    self._clock.time_msec() + _REPLICA_RETRY_INTERVAL_MS
+                )
+            raise _ReplicaUnavailableError() from e
+
+    def _check_replica_position_txn(
+        self,
+        txn: "LoggingTransaction",
+        wal_position: str,
+        func: Callable[..., R],
+        *args: Any,
+        **kwargs: Any,
+    ) -> R:
+        """Checks that the replica has replayed the primary's WAL up to the
+        given position, and then runs the given function.
+        """
+        txn.execute("SELECT pg_last_wal_replay_lsn() >= ?::pg_lsn", (wal_position,))
+        row = txn.fetchone()
+        if not row or not row[0]:
+            raise _ReplicaBehindError()
+
+        return func(txn, *args, **kwargs)
+
+    async def _get_primary_wal_position(self) -> str:
+        """Get the primary's current WAL position.
+
+        Any position fetched after we were called will do, so concurrent
+        callers share a single query.
+        """
+        d: "defer.Deferred[str]" = defer.Deferred()
+        self._wal_position_waiters.append(d)
+        if not self._fetching_wal_position:
+            run_as_background_process(
+                "fetch_wal_position", self._fetch_primary_wal_positions
+            )
+        return await make_deferred_yieldable(d)
+
+    async def _fetch_primary_wal_positions(self) -> None:
+        """Fetch the primary's WAL position for everyone waiting for it, until
+        nobody is.
+        """
+        self._fetching_wal_position = True
+        try:
+            while self._wal_position_waiters:
+                # Anyone who starts waiting from now on needs a newer position,
+                # so they'll be handled by the next iteration.
+                waiters = self._wal_position_waiters
+                self._wal_position_waiters = []
+
+                try:
+                    position = await self._run_interaction(
+                        "get_wal_position",
+                        self._get_wal_position_txn,
+                        db_autocommit=True,
+                    )
+                except Exception:
+                    failure = Failure()
+                    with PreserveLoggingContext():
+                        for d in waiters:
+                            d.errback(failure)
+                else:
+                    with PreserveLoggingContext():
+                        for d in waiters:
+                            d.callback(position)
+        finally:
+            self._fetching_wal_position = False
+
+    @staticmethod
+    def _get_wal_position_txn(txn: "LoggingTransaction") -> str:
+        txn.execute("SELECT pg_current_wal_lsn()")
+        row = txn.fetchone()
+        assert row is not None
+        return row[0]
+
+    async def _run_interaction(
+        self,
+        desc: str,
+        func: Callable[..., R],
+        *args: Any,
+        db_autocommit: bool = False,
+        db_replica: Optional[adbapi.ConnectionPool] = None,
+        **kwargs: Any,
+    ) -> R:
+        """Implements `runInteraction`, optionally against a read replica.
+
+        Args:
+            desc: description of the transaction, for logging and metrics
+            func: the function to run, as per `runInteraction`
+            args: positional args to pass to `func`
+            db_autocommit: as per `runInteraction`
+            db_replica: the read replica to run the transaction on, if any
+            kwargs: named args to pass to `func`
+        """
+        after_callbacks: List[_CallbackListEntry] = []
+        exception_callbacks: List[_CallbackListEntry] = []
+
         try:
             with opentracing.start_active_span(f"db.{desc}"):
-                result = await self.runWithConnection(
+                result = await self._run_with_connection(
+                    desc,
                     self.new_transaction,
                     desc,
                     after_callbacks,
@@ -691,6 +1085,7 @@ class DatabasePool:
                     func,
                     *args,
                     db_autocommit=db_autocommit,
+                    db_replica=db_replica,
                     **kwargs,
                 )
 
@@ -722,6 +1117,173 @@ class DatabasePool:
                 that are only a single query. Currently only affects postgres.
             kwargs: named args to pass to `func`
 
+        Returns:
+            The result of func
+        """
+        return await self._run_with_connection(
+            "runWithConnection", func, *args, db_autocommit=db_autocommit, **kwargs
+        )
+
+    def bulk_connection_limit(self) -> int:
+        """The number of connections which bulk work may currently use, which
+        is reduced when other work is having to wait for a connection.
+        """
+        return self._bulk_connection_limit
+
+    def get_load_factor(self) -> float:
+        """How busy the database is, as the ratio of how long work has recently
+        been waiting for a connection to how long we'd like it to wait. Values
+        greater than 1 mean the database is overloaded.
+        """
+        return self._recent_lane_queue_time / _TARGET_LANE_QUEUE_TIME
+
+    @contextlib.contextmanager
+    def transaction_lane(self, lane: str) -> Iterator[None]:
+        """Queue database work started from the current logcontext (and any
+        logcontexts nested inside it) in the given lane.
+
+        Args:
+            lane: One of the `TransactionLane` constants.
+        """
+        context = current_context()
+        if not context:
+            # We can't tell the sentinel context's work apart from anyone else's.
+            yield
+            return
+
+        assert isinstance(context, LoggingContext)
+        previous_lane = self._context_lanes.get(context)
+        self._context_lanes[context] = lane
+        try:
+            yield
+        finally:
+            if previous_lane is None:
+                self._context_lanes.pop(context, None)
+            else:
+                self._context_lanes[context] = previous_lane
+
+    def _lane_for_context(self, context: Optional[LoggingContext]) -> str:
+        """Work out which lane work started from the given logcontext goes in."""
+        while context is not None and self._context_lanes:
+            lane = self._context_lanes.get(context)
+            if lane is not None:
+                return lane
+            context = context.parent_context
+        return TransactionLane.NORMAL
+
+    async def _acquire_connection_slot(self, lane: str) -> None:
+        """Wait until work in the given lane may use a database connection.
+
+        `_release_connection_slot` must be called once the work has finished.
+        """
+        # We can start straight away if there's a free connection, unless there
+        # is work of the same or higher priority already waiting for it.
+        higher_lanes = _LANES_BY_PRIORITY[: _LANES_BY_PRIORITY.index(lane) + 1]
+        if self._may_start_in_lane(lane) and not any(
+            self._lane_queues[other_lane] for other_lane in higher_lanes
+        ):
+            self._start_in_lane(lane)
+            return
+
+        d: "defer.Deferred[None]" = defer.Deferred()
+        self._lane_queues[lane].append(d)
+        sql_lane_queue_length.labels(self._database_config.name, lane).inc()
+        try:
+            await make_deferred_yieldable(d)
+        except defer.CancelledError:
+            if d in self._lane_queues[lane]:
+                self._lane_queues[lane].remove(d)
+                sql_lane_queue_length.labels(self._database_config.name, lane).dec()
+            else:
+                # We were handed a connection just as we were cancelled, so
+                # pass it on to the next waiting work.
+                self._release_connection_slot(lane)
+            raise
+
+    def _may_start_in_lane(self, lane: str) -> bool:
+        if self._connections_in_use >= self._max_connections:
+            return False
+        if lane == TransactionLane.BULK:
+            return self._bulk_connections_in_use < self._bulk_connection_limit
+        return True
+
+    def _start_in_lane(self, lane: str) -> None:
+        self._connections_in_use += 1
+        if lane == TransactionLane.BULK:
+            self._bulk_connections_in_use += 1
+
+    def _release_connection_slot(self, lane: str) -> None:
+        """Mark that work in the given lane has finished with its connection,
+        and hand the connection on to the next waiting work.
+        """
+        self._connections_in_use -= 1
+        if lane == TransactionLane.BULK:
+            self._bulk_connections_in_use -= 1
+
+        for next_lane in _LANES_BY_PRIORITY:
+            queue = self._lane_queues[next_lane]
+            while queue and self._may_start_in_lane(next_lane):
+                d = queue.popleft()
+                sql_lane_queue_length.labels(
+                    self._database_config.name, next_lane
+                ).dec()
+                self._start_in_lane(next_lane)
+                with PreserveLoggingContext():
+                    d.callback(None)
+
+    def _record_lane_queue_time(self, lane: str, desc: str, queue_time: float) -> None:
+        """Record how long some work waited for a connection, and adjust how
+        many connections bulk work may use accordingly.
+        """
+        sql_lane_queue_timer.labels(lane, desc).observe(queue_time)
+
+        if lane == TransactionLane.BULK:
+            return
+
+        self._recent_lane_queue_time = (
+            0.8 * self._recent_lane_queue_time + 0.2 * queue_time
+        )
+
+        now = monotonic_time()
+        if self._recent_lane_queue_time > _TARGET_LANE_QUEUE_TIME:
+            # Other work is backing up behind bulk work, so halve the number of
+            # connections bulk work may use.
+            new_limit = max(1, self._bulk_connection_limit // 2)
+        elif (
+            self._recent_lane_queue_time < _TARGET_LANE_QUEUE_TIME / 2
+            and now - self._last_bulk_limit_increase > _BULK_LANE_GROWTH_INTERVAL
+        ):
+            new_limit = min(self._max_bulk_connections, self._bulk_connection_limit + 1)
+            self._last_bulk_limit_increase = now
+        else:
+            return
+
+        if new_limit != self._bulk_connection_limit:
+            logger.debug("Changing bulk database connection limit to %d", new_limit)
+            self._bulk_connection_limit = new_limit
+            sql_bulk_lane_limit.labels(self._database_config.name).set(new_limit)
+
+    async def _run_with_connection(
+        self,
+        desc: str,
+        func: Callable[..., R],
+        *args: Any,
+        db_autocommit: bool = False,
+        db_replica: Optional[adbapi.ConnectionPool] = None,
+        **kwargs: Any,
+    ) -> R:
+        """Implements `runWithConnection`, first waiting for a connection in the
+        lane requested by the current logcontext.
+
+        Arguments:
+            desc: description of the work, for metrics
+            func: callback function, as per `runWithConnection`
+            args: positional args to pass to `func`
+            db_autocommit: as per `runWithConnection`
+            db_replica: the read replica to run `func` against. If None, it is
+                run against the primary.
+            kwargs: named args to pass to `func`
+
         Returns:
             The result of func
         """
@@ -737,6 +1299,16 @@ class DatabasePool:
 
         start_time = monotonic_time()
 
+        # Until the connection pool has started (which happens once the reactor
+        # is running) it queues work itself, so there's no point in us doing so.
+        # Lanes only apply to the primary.
+        pool = self._db_pool if db_replica is None else db_replica
+        lane: Optional[str] = None
+        if db_replica is None and self.is_running():
+            lane = self._lane_for_context(parent_context)
+            await self._acquire_connection_slot(lane)
+            self._record_lane_queue_time(lane, desc, monotonic_time() - start_time)
+
         def inner_func(conn, *args, **kwargs):
             # We shouldn't be in a transaction. If we are then something
             # somewhere hasn't committed after doing work. (This is likely only
@@ -756,7 +1328,7 @@ class DatabasePool:
                     context.add_database_scheduled(sched_duration_sec)
 
                     if self._txn_limit > 0:
-                        tid = self._db_pool.threadID()
+                        tid = pool.threadID()
                         self._txn_counters[tid] += 1
 
                         if self._txn_counters[tid] > self._txn_limit:
@@ -788,9 +1360,13 @@ class DatabasePool:
                         if db_autocommit:
                             self.engine.attempt_to_set_autocommit(conn, False)
 
-        return await make_deferred_yieldable(
-            self._db_pool.runWithConnection(inner_func, *args, **kwargs)
-        )
+        try:
+            return await make_deferred_yieldable(
+                pool.runWithConnection(inner_func, *args, **kwargs)
+            )
+        finally:
+            if lane is not None:
+                self._release_connection_slot(lane)
 
     @staticmethod
     def cursor_to_dict(cursor: Cursor) -> List[Dict[str, Any]]:
@@ -1187,6 +1763,103 @@ class DatabasePool:
             db_autocommit=autocommit,
         )
 
+    async def simple_upsert_buffered(
+        self,
+        table: str,
+        keyvalues: Dict[str, Any],
+        values: Dict[str, Any],
+        desc: str = "simple_upsert_buffered",
+    ) -> None:
+        """Upsert a row, buffering the write so that it can be batched with other
+        upserts to the same table.
+
+        Upserts to the same row within the flush window are coalesced, with the
+        last write winning. The buffer is flushed in a single transaction,
+        using `simple_upsert_many_txn`, after `upsert_flush_interval_ms` and
+        when the server shuts down.
+
+        This must only be used for writes where it doesn't matter if they are
+        delayed (or, if the server crashes, lost), and where nothing relies on
+        reading the row straight back out of the database: e.g. bookkeeping
+        which is only used to save work after a restart.
+
+        Args:
+            table: The table to upsert into
+            keyvalues: The unique key columns and their new values
+            values: The nonunique columns and their new values
+            desc: description of the transaction, for logging and metrics, if
+                the upsert is not buffered.
+        """
+        if not self._upsert_flush_interval:
+            await self.simple_upsert(table, keyvalues, values, desc=desc)
+            return
+
+        key_names = tuple(keyvalues)
+        value_names = tuple(values)
+        rows = self._upsert_buffer.setdefault((table, key_names, value_names), {})
+
+        key = tuple(keyvalues.values())
+        if key in rows:
+            upsert_buffer_coalesced_counter.labels(table).inc()
+        rows[key] = tuple(values.values())
+        upsert_buffer_added_counter.labels(table).inc()
+
+        self._schedule_upsert_flush()
+
+    def _schedule_upsert_flush(self) -> None:
+        """Schedule a flush of the upsert buffer, if one isn't already pending."""
+        if self._upsert_flush_scheduled:
+            return
+
+        self._upsert_flush_scheduled = True
+        self._clock.call_later(
+            self._upsert_flush_interval,
+            run_as_background_process,
+            "flush_upsert_buffer",
+            self.flush_upsert_buffer,
+        )
+
+    async def flush_upsert_buffer(self) -> None:
+        """Write out any upserts buffered by `simple_upsert_buffered`."""
+        self._upsert_flush_scheduled = False
+
+        # If the DB pool has already terminated, don't try updating
+        if not self._upsert_buffer or not self.is_running():
+            return
+
+        to_flush = self._upsert_buffer
+        self._upsert_buffer = {}
+
+        def flush_upsert_buffer_txn(txn: LoggingTransaction) -> None:
+            for (table, key_names, value_names), rows in to_flush.items():
+                self.simple_upsert_many_txn(
+                    txn,
+                    table,
+                    key_names,
+                    list(rows.keys()),
+                    value_names,
+                    list(rows.values()),
+                )
+
+        try:
+            await self.runInteraction("flush_upsert_buffer", flush_upsert_buffer_txn)
+        except Exception:
+            logger.exception("Failed to flush buffered upserts; will retry")
+            upsert_buffer_flush_failures_counter.inc()
+
+            # Put the rows back in the buffer, unless they've been superseded by
+            # upserts made since we started flushing.
+            for group, rows in to_flush.items():
+                pending = self._upsert_buffer.setdefault(group, {})
+                for key, value in rows.items():
+                    pending.setdefault(key, value)
+
+            self._schedule_upsert_flush()
+            return
+
+        for (table, _, _), rows in to_flush.items():
+            upsert_buffer_flushed_counter.labels(table).inc(len(rows))
+
     def simple_upsert_many_txn(
         self,
         txn: LoggingTransaction,
@@ -15,7 +15,7 @@
 
 import itertools
 import logging
-from typing import Any, Iterable, List, Optional, Tuple
+from typing import Any, Collection, Iterable, Iterator, List, Optional, Tuple
 
 from synapse.api.constants import EventTypes
 from synapse.replication.tcp.streams import BackfillStream, CachesStream
@@ -24,10 +24,10 @@ from synapse.replication.tcp.streams.events import (
     EventsStreamCurrentStateRow,
     EventsStreamEventRow,
 )
-from synapse.storage._base import SQLBaseStore
+from synapse.storage._base import SQLBaseStore, db_to_json
 from synapse.storage.database import DatabasePool
 from synapse.storage.engines import PostgresEngine
-from synapse.util.iterutils import batch_iter
+from synapse.util import json_encoder
 
 logger = logging.getLogger(__name__)
 
@@ -36,6 +36,42 @@ logger = logging.getLogger(__name__)
 # based on the current state when notifying workers over replication.
 CURRENT_STATE_CACHE_NAME = "cs_cache_fake"
 
+# This is a special cache name we use to send many invalidations of a single
+# cache in one row over replication. The first key of such a row is the name of
+# the cache being invalidated, and each subsequent key is a JSON-encoded list
+# giving the key of an entry to invalidate.
+#
+# Workers which predate these rows ignore them, so all workers need to be
+# upgraded together with the main process (see docs/upgrade.md).
+BULK_CACHE_INVALIDATION_NAME = "bulk_cache_fake"
+
+# The maximum (approximate) size in bytes of the keys we pack into a single
+# batched invalidation row. Rows get sent as single lines over replication,
+# which are limited to 16K, so this leaves plenty of room for the rest of the
+# line.
+MAX_INVALIDATION_ROW_KEYS_SIZE = 8 * 1024
+
+
+def _chunk_keys_by_size(keys: Iterable[str]) -> Iterator[List[str]]:
+    """Split the given keys into lists which are small enough to be sent in a
+    single row of the caches stream.
+    """
+    chunk: List[str] = []
+    chunk_size = 0
+    for key in keys:
+        # The keys end up JSON-encoded on the wire, which may well make them
+        # bigger, so we measure their encoded length.
+        key_size = len(json_encoder.encode(key)) + 1
+        if chunk and chunk_size + key_size > MAX_INVALIDATION_ROW_KEYS_SIZE:
+            yield chunk
+            chunk = []
+            chunk_size = 0
+        chunk.append(key)
+        chunk_size += key_size
+
+    if chunk:
+        yield chunk
+
 
 class CacheInvalidationWorkerStore(SQLBaseStore):
     def __init__(self, database: DatabasePool, db_conn, hs):
@@ -125,6 +161,16 @@ class CacheInvalidationWorkerStore(SQLBaseStore):
                     room_id = row.keys[0]
                     members_changed = set(row.keys[1:])
                     self._invalidate_state_caches(room_id, members_changed)
+                elif row.cache_func == BULK_CACHE_INVALIDATION_NAME:
+                    if row.keys is None:
+                        raise Exception(
+                            "Can't send an 'invalidate all' for bulk invalidations"
+                        )
+
+                    cache_name = row.keys[0]
+                    self._attempt_to_invalidate_cache_many(
+                        cache_name, [tuple(db_to_json(key)) for key in row.keys[1:]]
+                    )
                 else:
                     self._attempt_to_invalidate_cache(row.cache_func, row.keys)
 
@@ -220,6 +266,32 @@ class CacheInvalidationWorkerStore(SQLBaseStore):
         txn.call_after(cache_func.invalidate, keys)
         self._send_invalidation_to_replication(txn, cache_func.__name__, keys)
 
+    def _invalidate_cache_and_stream_bulk(
+        self, txn, cache_func, key_tuples: Collection[Tuple[Any, ...]]
+    ) -> None:
+        """Invalidates many entries of a cache and adds them to the cache stream
+        so slaves will know to invalidate their caches.
+
+        Unlike calling `_invalidate_cache_and_stream` for each key, duplicate
+        keys are only invalidated once, and the invalidations are batched into
+        as few replication rows as possible so that they can be handled in one
+        go by the workers.
+
+        Args:
+            txn
+            cache_func: The cached function to invalidate.
+            key_tuples: The keys of the entries to invalidate.
+        """
+        # Remove duplicates while preserving order.
+        key_tuples = list(dict.fromkeys(tuple(k) for k in key_tuples))
+        if not key_tuples:
+            return
+
+        txn.call_after(cache_func.invalidate_many, key_tuples)
+        self._send_invalidation_to_replication_bulk(
+            txn, cache_func.__name__, key_tuples
+        )
+
     def _invalidate_all_cache_and_stream(self, txn, cache_func):
         """Invalidates the entire cache and adds it to the cache stream so slaves
         will know to invalidate their caches.
@@ -244,10 +316,9 @@ class CacheInvalidationWorkerStore(SQLBaseStore):
         if members_changed:
             # We need to be careful that the size of the `members_changed` list
             # isn't so large that it causes problems sending over replication, so we
-            # send them in chunks.
-            # Max line length is 16K, and max user ID length is 255, so 50 should
-            # be safe.
-            for chunk in batch_iter(members_changed, 50):
+            # send them in chunks, packing as many members as will safely fit on a
+            # replication line into each.
+            for chunk in _chunk_keys_by_size(members_changed):
                 keys = itertools.chain([room_id], chunk)
                 self._send_invalidation_to_replication(
                     txn, CURRENT_STATE_CACHE_NAME, keys
@@ -271,10 +342,11 @@ class CacheInvalidationWorkerStore(SQLBaseStore):
             keys: Entry to invalidate. If None will invalidate all.
         """
 
-        if cache_name == CURRENT_STATE_CACHE_NAME and keys is None:
-            raise Exception(
-                "Can't stream invalidate all with magic current state cache"
-            )
+        if (
+            cache_name in (CURRENT_STATE_CACHE_NAME, BULK_CACHE_INVALIDATION_NAME)
+            and keys is None
+        ):
+            raise Exception("Can't stream invalidate all with magic %s" % (cache_name,))
 
         if isinstance(self.database_engine, PostgresEngine):
             # get_next() returns a context manager which is designed to wrap
@@ -299,6 +371,27 @@ class CacheInvalidationWorkerStore(SQLBaseStore):
                 },
             )
 
+    def _send_invalidation_to_replication_bulk(
+        self, txn, cache_name: str, key_tuples: Iterable[Tuple[Any, ...]]
+    ) -> None:
+        """Notifies replication that the given entries of a cache have been
+        invalidated, batching many keys into each row.
+
+        Note that this does *not* invalidate the cache locally.
+
+        Args:
+            txn
+            cache_name
+            key_tuples: The keys of the entries to invalidate.
+        """
+        encoded_keys = (json_encoder.encode(list(key)) for key in key_tuples)
+        for chunk in _chunk_keys_by_size(encoded_keys):
+            self._send_invalidation_to_replication(
+                txn,
+                BULK_CACHE_INVALIDATION_NAME,
+                itertools.chain([cache_name], chunk),
+            )
+
     def get_cache_stream_token_for_writer(self, instance_name: str) -> int:
         if self._cache_id_gen:
             return self._cache_id_gen.get_current_token_for_writer(instance_name)
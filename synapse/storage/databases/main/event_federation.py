@@ -22,13 +22,18 @@ from synapse.api.constants import MAX_DEPTH
 from synapse.api.errors import StoreError
 from synapse.api.room_versions import EventFormatVersions, RoomVersion
 from synapse.events import EventBase, make_event_from_dict
-from synapse.metrics.background_process_metrics import wrap_as_background_process
+from synapse.metrics.background_process_metrics import (
+    run_as_background_process,
+    wrap_as_background_process,
+)
+from synapse.replication.tcp.streams.events import EventsStream, EventsStreamEventRow
 from synapse.storage._base import SQLBaseStore, db_to_json, make_in_list_sql_clause
 from synapse.storage.database import DatabasePool, LoggingTransaction
 from synapse.storage.databases.main.events_worker import EventsWorkerStore
 from synapse.storage.databases.main.signatures import SignatureWorkerStore
 from synapse.storage.engines import PostgresEngine
 from synapse.storage.types import Cursor
+from synapse.storage.util.auth_chain_index import AuthChain, AuthChainIndex
 from synapse.util import json_encoder
 from synapse.util.caches.descriptors import cached
 from synapse.util.caches.lrucache import LruCache
@@ -72,8 +77,59 @@ class EventFederationWorkerStore(EventsWorkerStore, SignatureWorkerStore, SQLBas
             500000, "_event_auth_cache", size_callback=len
         )
 
+        # An in memory copy of the chain cover index for recently used rooms.
+        self._auth_chain_index = AuthChainIndex(500000)
+
+        # Map from room ID to new state events whose chains we should load into
+        # `_auth_chain_index`.
+        self._auth_chain_index_to_warm: Dict[str, Set[str]] = {}
+        self._warming_auth_chain_index = False
+
         self._clock.looping_call(self._get_stats_for_federation_staging, 30 * 1000)
 
+    def process_replication_rows(self, stream_name, instance_name, token, rows):
+        if stream_name == EventsStream.NAME:
+            # Keep the in memory chain cover index of rooms that we're using it
+            # for up to date with their new state.
+            for row in rows:
+                if (
+                    row.type == EventsStreamEventRow.TypeId
+                    and row.data.state_key is not None
+                    and self._auth_chain_index.is_room_in_use(row.data.room_id)
+                ):
+                    self._auth_chain_index_to_warm.setdefault(
+                        row.data.room_id, set()
+                    ).add(row.data.event_id)
+
+            if self._auth_chain_index_to_warm and not self._warming_auth_chain_index:
+                run_as_background_process(
+                    "warm_auth_chain_index", self._warm_auth_chain_index
+                )
+
+        super().process_replication_rows(stream_name, instance_name, token, rows)
+
+    async def _warm_auth_chain_index(self) -> None:
+        """Loads the chains of new state events into the in memory chain cover
+        index, so that they don't have to be fetched when the index is next
+        used.
+        """
+        self._warming_auth_chain_index = True
+        try:
+            while self._auth_chain_index_to_warm:
+                to_warm = self._auth_chain_index_to_warm
+                self._auth_chain_index_to_warm = {}
+
+                for room_id, event_ids in to_warm.items():
+                    positions = await self._get_auth_chain_positions(room_id, event_ids)
+
+                    min_seqs: Dict[int, int] = {}
+                    for chain_id, seq_no in positions.values():
+                        min_seqs[chain_id] = max(seq_no, min_seqs.get(chain_id, 0))
+
+                    await self._get_auth_chains(room_id, min_seqs)
+        finally:
+            self._warming_auth_chain_index = False
+
     async def get_auth_chain(
         self, room_id: str, event_ids: Collection[str], include_given: bool = False
     ) -> List[EventBase]:
@@ -114,12 +170,8 @@ class EventFederationWorkerStore(EventsWorkerStore, SignatureWorkerStore, SQLBas
         room = await self.get_room(room_id)
         if room["has_auth_chain_index"]:
             try:
-                return await self.db_pool.runInteraction(
-                    "get_auth_chain_ids_chains",
-                    self._get_auth_chain_ids_using_cover_index_txn,
-                    room_id,
-                    event_ids,
-                    include_given,
+                return await self._get_auth_chain_ids_using_cover_index(
+                    room_id, event_ids, include_given
                 )
             except _NoChainCoverIndex:
                 # For whatever reason we don't actually have a chain cover index
@@ -133,80 +185,41 @@ class EventFederationWorkerStore(EventsWorkerStore, SignatureWorkerStore, SQLBas
             include_given,
         )
 
-    def _get_auth_chain_ids_using_cover_index_txn(
-        self, txn: Cursor, room_id: str, event_ids: Collection[str], include_given: bool
+    async def _get_auth_chain_ids_using_cover_index(
+        self, room_id: str, event_ids: Collection[str], include_given: bool
     ) -> List[str]:
         """Calculates the auth chain IDs using the chain index."""
 
         # First we look up the chain ID/sequence numbers for the given events.
 
         initial_events = set(event_ids)
-
-        # All the events that we've found that are reachable from the events.
-        seen_events: Set[str] = set()
+        positions = await self._get_auth_chain_positions_for_query(
+            room_id, initial_events
+        )
 
         # A map from chain ID to max sequence number of the given events.
         event_chains: Dict[int, int] = {}
-
-        sql = """
-            SELECT event_id, chain_id, sequence_number
-            FROM event_auth_chains
-            WHERE %s
-        """
-        for batch in batch_iter(initial_events, 1000):
-            clause, args = make_in_list_sql_clause(
-                txn.database_engine, "event_id", batch
-            )
-            txn.execute(sql % (clause,), args)
-
-            for event_id, chain_id, sequence_number in txn:
-                seen_events.add(event_id)
-                event_chains[chain_id] = max(
-                    sequence_number, event_chains.get(chain_id, 0)
-                )
-
-        # Check that we actually have a chain ID for all the events.
-        events_missing_chain_info = initial_events.difference(seen_events)
-        if events_missing_chain_info:
-            # This can happen due to e.g. downgrade/upgrade of the server. We
-            # raise an exception and fall back to the previous algorithm.
-            logger.info(
-                "Unexpectedly found that events don't have chain IDs in room %s: %s",
-                room_id,
-                events_missing_chain_info,
-            )
-            raise _NoChainCoverIndex(room_id)
+        for chain_id, sequence_number in positions.values():
+            event_chains[chain_id] = max(sequence_number, event_chains.get(chain_id, 0))
 
         # Now we look up all links for the chains we have, adding chains that
         # are reachable from any event.
-        sql = """
-            SELECT
-                origin_chain_id, origin_sequence_number,
-                target_chain_id, target_sequence_number
-            FROM event_auth_chain_links
-            WHERE %s
-        """
 
         # A map from chain ID to max sequence number *reachable* from any event ID.
         chains: Dict[int, int] = {}
 
         # Add all linked chains reachable from initial set of chains.
-        for batch in batch_iter(event_chains, 1000):
-            clause, args = make_in_list_sql_clause(
-                txn.database_engine, "origin_chain_id", batch
-            )
-            txn.execute(sql % (clause,), args)
-
+        origin_chains = await self._get_auth_chains(room_id, event_chains)
+        for origin_chain_id, origin_chain in origin_chains.items():
             for (
-                origin_chain_id,
                 origin_sequence_number,
                 target_chain_id,
                 target_sequence_number,
-            ) in txn:
+            ) in origin_chain.links:
                 # chains are only reachable if the origin sequence number of
                 # the link is less than the max sequence number in the
                 # origin chain.
-                if origin_sequence_number <= event_chains.get(origin_chain_id, 0):
+                if origin_sequence_number <= event_chains[origin_chain_id]:
                     chains[target_chain_id] = max(
                         target_sequence_number,
                         chains.get(target_chain_id, 0),
@@ -225,28 +238,14 @@ class EventFederationWorkerStore(EventsWorkerStore, SignatureWorkerStore, SQLBas
         else:
             results = set()
 
-        if isinstance(self.database_engine, PostgresEngine):
-            # We can use `execute_values` to efficiently fetch the gaps when
-            # using postgres.
-            sql = """
-                SELECT event_id
-                FROM event_auth_chains AS c, (VALUES ?) AS l(chain_id, max_seq)
-                WHERE
-                    c.chain_id = l.chain_id
-                    AND sequence_number <= max_seq
-            """
-
-            rows = txn.execute_values(sql, chains.items())
-            results.update(r for r, in rows)
-        else:
-            # For SQLite we just fall back to doing a noddy for loop.
-            sql = """
-                SELECT event_id FROM event_auth_chains
-                WHERE chain_id = ? AND sequence_number <= ?
-            """
-            for chain_id, max_no in chains.items():
-                txn.execute(sql, (chain_id, max_no))
-                results.update(r for r, in txn)
+        reachable_chains = await self._get_auth_chains(room_id, chains)
+        for chain_id, chain in reachable_chains.items():
+            max_no = chains[chain_id]
+            results.update(
+                event_id
+                for sequence_number, event_id in chain.events.items()
+                if sequence_number <= max_no
+            )
 
         return list(results)
 
@@ -328,11 +327,8 @@ class EventFederationWorkerStore(EventsWorkerStore, SignatureWorkerStore, SQLBas
         room = await self.get_room(room_id)
         if room["has_auth_chain_index"]:
             try:
-                return await self.db_pool.runInteraction(
-                    "get_auth_chain_difference_chains",
-                    self._get_auth_chain_difference_using_cover_index_txn,
-                    room_id,
-                    state_sets,
+                return await self._get_auth_chain_difference_using_cover_index(
+                    room_id, state_sets
                 )
             except _NoChainCoverIndex:
                 # For whatever reason we don't actually have a chain cover index
@@ -345,8 +341,8 @@ class EventFederationWorkerStore(EventsWorkerStore, SignatureWorkerStore, SQLBas
             state_sets,
         )
 
-    def _get_auth_chain_difference_using_cover_index_txn(
-        self, txn: Cursor, room_id: str, state_sets: List[Set[str]]
+    async def _get_auth_chain_difference_using_cover_index(
+        self, room_id: str, state_sets: List[Set[str]]
     ) -> Set[str]:
         """Calculates the auth chain difference using the chain index.
 
@@ -359,42 +355,9 @@ class EventFederationWorkerStore(EventsWorkerStore, SignatureWorkerStore, SQLBas
         initial_events = set(state_sets[0]).union(*state_sets[1:])
 
         # Map from event_id -> (chain ID, seq no)
-        chain_info: Dict[str, Tuple[int, int]] = {}
-
-        # Map from chain ID -> seq no -> event Id
-        chain_to_event: Dict[int, Dict[int, str]] = {}
-
-        # All the chains that we've found that are reachable from the state
-        # sets.
-        seen_chains: Set[int] = set()
-
-        sql = """
-            SELECT event_id, chain_id, sequence_number
-            FROM event_auth_chains
-            WHERE %s
-        """
-        for batch in batch_iter(initial_events, 1000):
-            clause, args = make_in_list_sql_clause(
-                txn.database_engine, "event_id", batch
-            )
-            txn.execute(sql % (clause,), args)
-
-            for event_id, chain_id, sequence_number in txn:
-                chain_info[event_id] = (chain_id, sequence_number)
-                seen_chains.add(chain_id)
-                chain_to_event.setdefault(chain_id, {})[sequence_number] = event_id
-
-        # Check that we actually have a chain ID for all the events.
-        events_missing_chain_info = initial_events.difference(chain_info)
-        if events_missing_chain_info:
-            # This can happen due to e.g. downgrade/upgrade of the server. We
-            # raise an exception and fall back to the previous algorithm.
-            logger.info(
-                "Unexpectedly found that events don't have chain IDs in room %s: %s",
-                room_id,
-                events_missing_chain_info,
-            )
-            raise _NoChainCoverIndex(room_id)
+        chain_info = await self._get_auth_chain_positions_for_query(
+            room_id, initial_events
+        )
 
         # Corresponds to `state_sets`, except as a map from chain ID to max
         # sequence number reachable from the state set.
@@ -408,101 +371,238 @@ class EventFederationWorkerStore(EventsWorkerStore, SignatureWorkerStore, SQLBas
 
                 chains[chain_id] = max(seq_no, chains.get(chain_id, 0))
 
-        # Now we look up all links for the chains we have, adding chains to
-        # set_to_chain that are reachable from each set.
-        sql = """
-            SELECT
-                origin_chain_id, origin_sequence_number,
-                target_chain_id, target_sequence_number
-            FROM event_auth_chain_links
-            WHERE %s
-        """
+        # The max sequence number of the state events in each chain, across
+        # all the state sets.
+        origin_seqs: Dict[int, int] = {}
+        for chains in set_to_chain:
+            for chain_id, seq_no in chains.items():
+                origin_seqs[chain_id] = max(seq_no, origin_seqs.get(chain_id, 0))
 
-        # (We need to take a copy of `seen_chains` as we want to mutate it in
-        # the loop)
-        for batch in batch_iter(set(seen_chains), 1000):
-            clause, args = make_in_list_sql_clause(
-                txn.database_engine, "origin_chain_id", batch
-            )
-            txn.execute(sql % (clause,), args)
+        # Now we look up all links for the chains we have, adding chains to
+        # set_to_chain that are reachable from each set. The links are the
+        # transitive closure, so we only need to look at the links from the
+        # chains of the state events themselves.
+        initial_set_to_chain = [dict(chains) for chains in set_to_chain]
 
+        origin_chains = await self._get_auth_chains(room_id, origin_seqs)
+        for origin_chain_id, origin_chain in origin_chains.items():
             for (
-                origin_chain_id,
                 origin_sequence_number,
                 target_chain_id,
                 target_sequence_number,
-            ) in txn:
-                for chains in set_to_chain:
+            ) in origin_chain.links:
+                for initial_chains, chains in zip(initial_set_to_chain, set_to_chain):
                     # chains are only reachable if the origin sequence number of
                     # the link is less than the max sequence number in the
                     # origin chain.
-                    if origin_sequence_number <= chains.get(origin_chain_id, 0):
+                    if origin_sequence_number <= initial_chains.get(origin_chain_id, 0):
                         chains[target_chain_id] = max(
                             target_sequence_number,
                             chains.get(target_chain_id, 0),
                         )
 
-                seen_chains.add(target_chain_id)
-
         # Now for each chain we figure out the maximum sequence number reachable
         # from *any* state set and the minimum sequence number reachable from
         # *all* state sets. Events in that range are in the auth chain
         # difference.
-        result = set()
-
-        # Mapping from chain ID to the range of sequence numbers that should be
-        # pulled from the database.
         chain_to_gap: Dict[int, Tuple[int, int]] = {}
-
-        for chain_id in seen_chains:
+        for chain_id in set().union(*set_to_chain):
             min_seq_no = min(chains.get(chain_id, 0) for chains in set_to_chain)
             max_seq_no = max(chains.get(chain_id, 0) for chains in set_to_chain)
 
             if min_seq_no < max_seq_no:
-                # We have a non empty gap, try and fill it from the events that
-                # we have, otherwise add them to the list of gaps to pull out
-                # from the DB.
-                for seq_no in range(min_seq_no + 1, max_seq_no + 1):
-                    event_id = chain_to_event.get(chain_id, {}).get(seq_no)
-                    if event_id:
-                        result.add(event_id)
-                    else:
-                        chain_to_gap[chain_id] = (min_seq_no, max_seq_no)
-                        break
+                chain_to_gap[chain_id] = (min_seq_no, max_seq_no)
+
+        result = set()
+
+        gap_chains = await self._get_auth_chains(
+            room_id,
+            {chain_id: max_no for chain_id, (_, max_no) in chain_to_gap.items()},
+            {chain_id: min_no for chain_id, (min_no, _) in chain_to_gap.items()},
+        )
+        for chain_id, chain in gap_chains.items():
+            min_no, max_no = chain_to_gap[chain_id]
+            for seq_no in range(min_no + 1, max_no + 1):
+                event_id = chain.events.get(seq_no)
+                if event_id:
+                    result.add(event_id)
+
+        return result
+
+    async def _get_auth_chain_positions_for_query(
+        self, room_id: str, event_ids: Set[str]
+    ) -> Dict[str, Tuple[int, int]]:
+        """Get the chain ID and sequence number of the given events, for
+        calculating auth chains with the chain index.
 
-        if not chain_to_gap:
-            # If there are no gaps to fetch, we're done!
-            return result
+        Raises:
+            _NoChainCoverIndex if some of the events don't have a chain ID.
+        """
+        self._auth_chain_index.mark_room_in_use(room_id)
+
+        positions = await self._get_auth_chain_positions(room_id, event_ids)
+
+        # Check that we actually have a chain ID for all the events.
+        events_missing_chain_info = event_ids.difference(positions)
+        if events_missing_chain_info:
+            # This can happen due to e.g. downgrade/upgrade of the server. We
+            # raise an exception and fall back to the previous algorithm.
+            logger.info(
+                "Unexpectedly found that events don't have chain IDs in room %s: %s",
+                room_id,
+                events_missing_chain_info,
+            )
+            raise _NoChainCoverIndex(room_id)
+
+        return positions
+
+    async def _get_auth_chain_positions(
+        self, room_id: str, event_ids: Collection[str]
+    ) -> Dict[str, Tuple[int, int]]:
+        """Get the chain ID and sequence number of the given events, using the
+        in memory index where possible.
+
+        Events which don't have a chain ID are omitted.
+        """
+        positions = self._auth_chain_index.get_positions(room_id, event_ids)
+
+        missing = set(event_ids).difference(positions)
+        if missing:
+            rows = await self.db_pool.simple_select_many_batch(
+                table="event_auth_chains",
+                column="event_id",
+                iterable=missing,
+                retcols=("event_id", "chain_id", "sequence_number"),
+                desc="_get_auth_chain_positions",
+            )
+            new_positions = {
+                row["event_id"]: (row["chain_id"], row["sequence_number"])
+                for row in rows
+            }
+            self._auth_chain_index.add_positions(room_id, new_positions)
+            positions.update(new_positions)
+
+        return positions
+
+    async def _get_auth_chains(
+        self,
+        room_id: str,
+        max_seqs: Dict[int, int],
+        from_seqs: Optional[Dict[int, int]] = None,
+    ) -> Dict[int, AuthChain]:
+        """Get the given chains of the chain index, using the in memory index
+        where possible.
+
+        Args:
+            room_id: The room the chains are in.
+            max_seqs: Map from chain ID to the sequence number the chain must
+                be loaded up to.
+            from_seqs: Map from chain ID to the sequence number after which the
+                chain is needed, if not all of it is. The returned chains may
+                not include anything up to this.
+        """
+        chains, to_load = self._auth_chain_index.get_chains(
+            room_id, max_seqs, from_seqs
+        )
+        if to_load:
+            loaded = await self.db_pool.runInteraction(
+                "_get_auth_chains",
+                self._load_auth_chains_txn,
+                {
+                    chain_id: (from_seq, max_seqs[chain_id])
+                    for chain_id, (_, from_seq) in to_load.items()
+                },
+            )
+            chains.update(self._auth_chain_index.add_chains(room_id, to_load, loaded))
+
+        return chains
+
+    def _load_auth_chains_txn(
+        self, txn: Cursor, seq_ranges: Dict[int, Tuple[int, int]]
+    ) -> Dict[int, Tuple[int, List[Tuple[int, str]], List[Tuple[int, int, int]]]]:
+        """Loads the events and links of the given chains which have sequence
+        numbers in the given ranges.
+
+        Args:
+            seq_ranges: Map from chain ID to the sequence number to load the
+                chain after, and the sequence number to load it up to and
+                including.
+
+        Returns:
+            Map from chain ID to the sequence number the chain has been loaded
+            up to, the list of (sequence number, event ID) of the events, and
+            the list of links as (origin sequence number, target chain ID,
+            target sequence number).
+        """
+        events: Dict[int, List[Tuple[int, str]]] = {c: [] for c in seq_ranges}
+        links: Dict[int, List[Tuple[int, int, int]]] = {c: [] for c in seq_ranges}
 
         if isinstance(self.database_engine, PostgresEngine):
-            # We can use `execute_values` to efficiently fetch the gaps when
+            # We can use `execute_values` to efficiently fetch the chains when
             # using postgres.
+            values = [
+                (chain_id, min_seq, max_seq)
+                for chain_id, (min_seq, max_seq) in seq_ranges.items()
+            ]
+
             sql = """
-                SELECT event_id
-                FROM event_auth_chains AS c, (VALUES ?) AS l(chain_id, min_seq, max_seq)
-                WHERE
-                    c.chain_id = l.chain_id
+                SELECT c.chain_id, sequence_number, event_id
+                FROM event_auth_chains AS c,
+                    (VALUES ?) AS l(chain_id, min_seq, max_seq)
+                WHERE c.chain_id = l.chain_id
                     AND min_seq < sequence_number AND sequence_number <= max_seq
             """
+            rows = txn.execute_values(sql, values)
+            for chain_id, sequence_number, event_id in rows:
+                events[chain_id].append((sequence_number, event_id))
 
-            args = [
-                (chain_id, min_no, max_no)
-                for chain_id, (min_no, max_no) in chain_to_gap.items()
-            ]
-
-            rows = txn.execute_values(sql, args)
-            result.update(r for r, in rows)
-        else:
-            # For SQLite we just fall back to doing a noddy for loop.
             sql = """
-                SELECT event_id FROM event_auth_chains
-                WHERE chain_id = ? AND ? < sequence_number AND sequence_number <= ?
+                SELECT
+                    origin_chain_id, origin_sequence_number,
+                    target_chain_id, target_sequence_number
+                FROM event_auth_chain_links,
+                    (VALUES ?) AS l(chain_id, min_seq, max_seq)
+                WHERE origin_chain_id = l.chain_id
+                    AND min_seq < origin_sequence_number
+                    AND origin_sequence_number <= max_seq
             """
-            for chain_id, (min_no, max_no) in chain_to_gap.items():
-                txn.execute(sql, (chain_id, min_no, max_no))
-                result.update(r for r, in txn)
+            rows = txn.execute_values(sql, values)
+            for origin_chain_id, origin_seq_no, target_chain_id, target_seq_no in rows:
+                links[origin_chain_id].append(
+                    (origin_seq_no, target_chain_id, target_seq_no)
+                )
+        else:
+            # For SQLite we just fall back to doing a noddy for loop.
+            for chain_id, (min_seq, max_seq) in seq_ranges.items():
+                txn.execute(
+                    """
+                    SELECT sequence_number, event_id FROM event_auth_chains
+                    WHERE chain_id = ? AND ? < sequence_number
+                        AND sequence_number <= ?
+                    """,
+                    (chain_id, min_seq, max_seq),
+                )
+                events[chain_id].extend(txn)
 
-        return result
+                txn.execute(
+                    """
+                    SELECT
+                        origin_sequence_number,
+                        target_chain_id, target_sequence_number
+                    FROM event_auth_chain_links
+                    WHERE origin_chain_id = ? AND ? < origin_sequence_number
+                        AND origin_sequence_number <= ?
+                    """,
+                    (chain_id, min_seq, max_seq),
+                )
+                links[chain_id].extend(txn)
+
+        # The events we've been asked about have already been persisted, along
+        # with the links from them, so everything up to `max_seq` is there.
+        return {
+            chain_id: (max_seq, events[chain_id], links[chain_id])
+            for chain_id, (_, max_seq) in seq_ranges.items()
+        }
 
     def _get_auth_chain_difference_txn(
         self, txn, state_sets: List[Set[str]]
@@ -1468,6 +1568,57 @@ class EventFederationWorkerStore(EventsWorkerStore, SignatureWorkerStore, SQLBas
             desc="get_all_rooms_with_staged_incoming_events",
         )
 
+    async def get_staged_event_counts_by_room(
+        self, from_room_id: str, limit: int
+    ) -> Tuple[Dict[str, int], Optional[str]]:
+        """Get the number of events currently staged in each room, looking at
+        no more than `limit` staged events at a time.
+
+        Args:
+            from_room_id: Only rooms with IDs after this are returned. Use the
+                empty string to start from the beginning.
+            limit: The maximum number of staged events to look at.
+
+        Returns:
+            A map from room ID to the number of events staged in the room, and
+            the room ID to continue from, or None if there are no more rooms.
+            If a single room has more than `limit` events staged its count will
+            be `limit`.
+        """
+
+        def _get_staged_event_counts_by_room_txn(txn):
+            # This makes use of the index on `(room_id, received_ts)`, so that
+            # we don't have to scan the whole table.
+            txn.execute(
+                """
+                SELECT room_id, COUNT(*) FROM (
+                    SELECT room_id FROM federation_inbound_events_staging
+                    WHERE room_id > ?
+                    ORDER BY room_id
+                    LIMIT ?
+                ) AS s
+                GROUP BY room_id
+                """,
+                (from_room_id, limit),
+            )
+            counts = dict(txn)
+
+            if sum(counts.values()) < limit:
+                return counts, None
+
+            # We may only have seen some of the events in the last room, so we
+            # leave it for next time, unless it is the only room.
+            room_ids = sorted(counts)
+            if len(room_ids) == 1:
+                return counts, room_ids[0]
+
+            del counts[room_ids[-1]]
+            return counts, room_ids[-2]
+
+        return await self.db_pool.runInteraction(
+            "get_staged_event_counts_by_room", _get_staged_event_counts_by_room_txn
+        )
+
     @wrap_as_background_process("_get_stats_for_federation_staging")
     async def _get_stats_for_federation_staging(self):
         """Update the prometheus metrics for the inbound federation staging area."""
@@ -83,8 +83,10 @@ class EventPushActionsWorkerStore(SQLBaseStore):
         self._rotate_count = 10000
         self._doing_notif_rotation = False
         if hs.config.run_background_tasks:
+            # Rotation is cheap when there is nothing to do, so we run it often to
+            # keep each batch small rather than letting a backlog build up.
             self._rotate_notif_loop = self._clock.looping_call(
-                self._rotate_notifs, 30 * 60 * 1000
+                self._rotate_notifs, 60 * 1000
             )
 
     @cached(num_args=3, tree=True, max_entries=5000)
@@ -155,6 +157,8 @@ class EventPushActionsWorkerStore(SQLBaseStore):
         )
 
     def _get_unread_counts_by_pos_txn(self, txn, room_id, user_id, stream_ordering):
+        # This is a range scan over `event_push_actions_unread_index`, and only
+        # covers push actions which haven't been rotated into event_push_summary.
         sql = (
             "SELECT"
             "   COUNT(CASE WHEN notif = 1 THEN 1 END),"
@@ -694,15 +698,23 @@ class EventPushActionsWorkerStore(SQLBaseStore):
             retcol="stream_ordering",
         )
 
+        if old_rotate_stream_ordering >= self.stream_ordering_day_ago:
+            # Nothing is old enough to rotate yet.
+            return True
+
         # We don't to try and rotate millions of rows at once, so we cap the
         # maximum stream ordering we'll rotate before.
         txn.execute(
             """
             SELECT stream_ordering FROM event_push_actions
-            WHERE stream_ordering > ?
+            WHERE ? < stream_ordering AND stream_ordering < ?
             ORDER BY stream_ordering ASC LIMIT 1 OFFSET ?
         """,
-            (old_rotate_stream_ordering, self._rotate_count),
+            (
+                old_rotate_stream_ordering,
+                self.stream_ordering_day_ago,
+                self._rotate_count,
+            ),
         )
         stream_row = txn.fetchone()
         if stream_row:
@@ -730,65 +742,39 @@ class EventPushActionsWorkerStore(SQLBaseStore):
             retcol="stream_ordering",
         )
 
-        # Calculate the new counts that should be upserted into event_push_summary
+        # Calculate the new counts that should be upserted into event_push_summary,
+        # counting notifications and unread messages in a single pass.
         sql = """
             SELECT user_id, room_id,
-                coalesce(old.%s, 0) + upd.cnt,
+                coalesce(old.notif_count, 0) + upd.notif_count,
+                coalesce(old.unread_count, 0) + upd.unread_count,
                 upd.stream_ordering,
                 old.user_id
             FROM (
-                SELECT user_id, room_id, count(*) as cnt,
+                SELECT user_id, room_id,
+                    COUNT(CASE WHEN notif = 1 THEN 1 END) AS notif_count,
+                    COUNT(CASE WHEN unread = 1 THEN 1 END) AS unread_count,
                     max(stream_ordering) as stream_ordering
                 FROM event_push_actions
                 WHERE ? <= stream_ordering AND stream_ordering < ?
                     AND highlight = 0
-                    AND %s = 1
+                    AND (notif = 1 OR unread = 1)
                 GROUP BY user_id, room_id
             ) AS upd
             LEFT JOIN event_push_summary AS old USING (user_id, room_id)
         """
 
-        # First get the count of unread messages.
-        txn.execute(
-            sql % ("unread_count", "unread"),
-            (old_rotate_stream_ordering, rotate_to_stream_ordering),
-        )
+        txn.execute(sql, (old_rotate_stream_ordering, rotate_to_stream_ordering))
 
-        # We need to merge results from the two requests (the one that retrieves the
-        # unread count and the one that retrieves the notifications count) into a single
-        # object because we might not have the same amount of rows in each of them. To do
-        # this, we use a dict indexed on the user ID and room ID to make it easier to
-        # populate.
         summaries: Dict[Tuple[str, str], _EventPushSummary] = {}
         for row in txn:
             summaries[(row[0], row[1])] = _EventPushSummary(
-                unread_count=row[2],
-                stream_ordering=row[3],
-                old_user_id=row[4],
-                notif_count=0,
+                notif_count=row[2],
+                unread_count=row[3],
+                stream_ordering=row[4],
+                old_user_id=row[5],
             )
 
-        # Then get the count of notifications.
-        txn.execute(
-            sql % ("notif_count", "notif"),
-            (old_rotate_stream_ordering, rotate_to_stream_ordering),
-        )
-
-        for row in txn:
-            if (row[0], row[1]) in summaries:
-                summaries[(row[0], row[1])].notif_count = row[2]
-            else:
-                # Because the rules on notifying are different than the rules on marking
-                # a message unread, we might end up with messages that notify but aren't
-                # marked unread, so we might not have a summary for this (user, room)
-                # tuple to complete.
-                summaries[(row[0], row[1])] = _EventPushSummary(
-                    unread_count=0,
-                    stream_ordering=row[3],
-                    old_user_id=row[4],
-                    notif_count=row[2],
-                )
-
         logger.info("Rotating notifications, handling %d rows", len(summaries))
 
         # If the `old.user_id` above is NULL then we know there isn't already an
@@ -910,6 +896,13 @@ class EventPushActionsStore(EventPushActionsWorkerStore):
             where_clause="highlight=1",
         )
 
+        self.db_pool.updates.register_background_index_update(
+            "event_push_actions_unread_index",
+            index_name="event_push_actions_unread_index",
+            table="event_push_actions",
+            columns=["user_id", "room_id", "stream_ordering"],
+        )
+
     async def get_push_actions_for_user(
         self, user_id, before=None, limit=50, only_highlight=False
     ):
@@ -122,7 +122,7 @@ class PersistEventsStore:
         events_and_contexts: List[Tuple[EventBase, EventContext]],
         current_state_for_room: Dict[str, StateMap[str]],
         state_delta_for_room: Dict[str, DeltaState],
-        new_forward_extremeties: Dict[str, List[str]],
+        new_forward_extremeties: Dict[str, Set[str]],
         backfilled: bool = False,
     ) -> None:
         """Persist a set of events alongside updates to the current state and
@@ -134,7 +134,7 @@ class PersistEventsStore:
                 the room based on forward extremities
             state_delta_for_room: Map from room_id to the delta to apply to
                 room state
-            new_forward_extremities: Map from room_id to list of event IDs
+            new_forward_extremities: Map from room_id to set of event IDs
                 that are the new forward extremities of the room.
             backfilled
 
@@ -318,7 +318,7 @@ class PersistEventsStore:
         events_and_contexts: List[Tuple[EventBase, EventContext]],
         backfilled: bool,
         state_delta_for_room: Optional[Dict[str, DeltaState]] = None,
-        new_forward_extremeties: Optional[Dict[str, List[str]]] = None,
+        new_forward_extremeties: Optional[Dict[str, Set[str]]] = None,
     ):
         """Insert some number of room events into the necessary database tables.
 
@@ -1953,6 +1953,10 @@ class PersistEventsStore:
         Also ensures that all events in `all_events_and_contexts` are removed
         from the push action staging area.
 
+        The rooms and orderings of the push actions are taken from the given
+        events, so this can be called before or after the events themselves
+        are stored.
+
         Args:
             events_and_contexts (list[(EventBase, EventContext)]): events
                 we are persisting
@@ -1962,51 +1966,52 @@ class PersistEventsStore:
                 events_and_context.
         """
 
-        sql = """
-            INSERT INTO event_push_actions (
-                room_id, event_id, user_id, actions, stream_ordering,
-                topological_ordering, notif, highlight, unread
-            )
-            SELECT ?, event_id, user_id, actions, ?, ?, notif, highlight, unread
-            FROM event_push_actions_staging
-            WHERE event_id = ?
-        """
-
-        if events_and_contexts:
-            txn.execute_batch(
-                sql,
-                (
+        # Copy the staged push actions for the events over in bulk, rather than
+        # event by event. We pass in the events' rooms and orderings, rather
+        # than taking them from the `events` table, so that this doesn't depend
+        # on the events having been stored yet.
+        for chunk in batch_iter(events_and_contexts, 100):
+            values_clause = ", ".join("(?, ?, ?, ?)" for _ in chunk)
+            args = []
+            for event, _ in chunk:
+                args.extend(
                     (
+                        event.event_id,
                         event.room_id,
                         event.internal_metadata.stream_ordering,
                         event.depth,
-                        event.event_id,
                     )
-                    for event, _ in events_and_contexts
-                ),
-            )
-
-            room_to_event_ids: Dict[str, List[str]] = {}
-            for e, _ in events_and_contexts:
-                room_to_event_ids.setdefault(e.room_id, []).append(e.event_id)
+                )
 
-            for room_id, event_ids in room_to_event_ids.items():
-                rows = self.db_pool.simple_select_many_txn(
-                    txn,
-                    table="event_push_actions_staging",
-                    column="event_id",
-                    iterable=event_ids,
-                    keyvalues={},
-                    retcols=("user_id",),
+            sql = """
+                WITH v (event_id, room_id, stream_ordering, topological_ordering)
+                AS (VALUES %s)
+                INSERT INTO event_push_actions (
+                    room_id, event_id, user_id, actions, stream_ordering,
+                    topological_ordering, notif, highlight, unread
                 )
+                SELECT
+                    v.room_id, s.event_id, s.user_id, s.actions, v.stream_ordering,
+                    v.topological_ordering, s.notif, s.highlight, s.unread
+                FROM event_push_actions_staging AS s
+                INNER JOIN v USING (event_id)
+            """
+            txn.execute(sql % (values_clause,), args)
 
-                user_ids = {row["user_id"] for row in rows}
+            sql = """
+                WITH v (event_id, room_id, stream_ordering, topological_ordering)
+                AS (VALUES %s)
+                SELECT DISTINCT v.room_id, s.user_id
+                FROM event_push_actions_staging AS s
+                INNER JOIN v USING (event_id)
+            """
+            txn.execute(sql % (values_clause,), args)
 
-                for user_id in user_ids:
-                    txn.call_after(
-                        self.store.get_unread_event_push_actions_by_room_for_user.invalidate,
-                        (room_id, user_id),
-                    )
+            for room_id, user_id in txn.fetchall():
+                txn.call_after(
+                    self.store.get_unread_event_push_actions_by_room_for_user.invalidate,
+                    (room_id, user_id),
+                )
 
         # Now we delete the staging area for *all* events that were being
         # persisted.
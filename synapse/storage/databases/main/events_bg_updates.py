@@ -231,19 +231,21 @@ class EventsBackgroundUpdatesStore(SQLBaseStore):
                 " LIMIT ?"
             )
 
-            txn.execute(sql, (target_min_stream_id, max_stream_id, batch_size))
-
-            rows = txn.fetchall()
-            if not rows:
-                return 0
-
-            min_stream_id = rows[-1][0]
+            # Stream the rows, as the batch size can grow large and we only
+            # need to hold on to the parsed fields rather than the event JSON.
+            rows = txn.stream_rows(
+                sql, (target_min_stream_id, max_stream_id, batch_size)
+            )
 
+            num_rows = 0
+            min_stream_id = None
             update_rows = []
-            for row in rows:
+            for stream_ordering, event_id, json in rows:
+                num_rows += 1
+                min_stream_id = stream_ordering
+
                 try:
-                    event_id = row[1]
-                    event_json = db_to_json(row[2])
+                    event_json = db_to_json(json)
                     sender = event_json["sender"]
                     content = event_json["content"]
 
@@ -257,6 +259,9 @@ class EventsBackgroundUpdatesStore(SQLBaseStore):
 
                 update_rows.append((sender, contains_url, event_id))
 
+            if not num_rows:
+                return 0
+
             sql = "UPDATE events SET sender = ?, contains_url = ? WHERE event_id = ?"
 
             txn.execute_batch(sql, update_rows)
@@ -264,14 +269,14 @@ class EventsBackgroundUpdatesStore(SQLBaseStore):
             progress = {
                 "target_min_stream_id_inclusive": target_min_stream_id,
                 "max_stream_id_exclusive": min_stream_id,
-                "rows_inserted": rows_inserted + len(rows),
+                "rows_inserted": rows_inserted + num_rows,
             }
 
             self.db_pool.updates._background_update_progress_txn(
                 txn, _BackgroundUpdates.EVENT_FIELDS_SENDER_URL_UPDATE_NAME, progress
             )
 
-            return len(rows)
+            return num_rows
 
         result = await self.db_pool.runInteraction(
             _BackgroundUpdates.EVENT_FIELDS_SENDER_URL_UPDATE_NAME, reindex_txn
@@ -1032,22 +1037,23 @@ class EventsBackgroundUpdatesStore(SQLBaseStore):
                 LEFT JOIN events AS e USING (event_id)
                 WHERE event_id > ? ORDER BY event_auth_chains.event_id ASC LIMIT ?
             """
-            txn.execute(sql, (current_event_id, batch_size))
-
-            rows = txn.fetchall()
-            if not rows:
-                return 0
+            rows = txn.stream_rows(sql, (current_event_id, batch_size))
 
             # The event IDs and chain IDs / sequence numbers where the event has
             # been purged.
             unreferenced_event_ids = []
             unreferenced_chain_id_tuples = []
             event_id = ""
+            num_rows = 0
             for event_id, chain_id, sequence_number, has_event in rows:
+                num_rows += 1
                 if not has_event:
                     unreferenced_event_ids.append((event_id,))
                     unreferenced_chain_id_tuples.append((chain_id, sequence_number))
 
+            if not num_rows:
+                return 0
+
             # Delete the unreferenced auth chains from event_auth_chain_links and
             # event_auth_chains.
             txn.executemany(
@@ -1076,7 +1082,7 @@ class EventsBackgroundUpdatesStore(SQLBaseStore):
                 txn, "purged_chain_cover", progress
             )
 
-            return len(rows)
+            return num_rows
 
         result = await self.db_pool.runInteraction(
             "_purged_chain_cover_index",
@@ -14,6 +14,7 @@
 
 import logging
 import threading
+from time import monotonic as monotonic_time
 from typing import (
     Collection,
     Container,
@@ -28,6 +29,7 @@ from typing import (
 
 import attr
 from constantly import NamedConstant, Names
+from prometheus_client import Histogram
 from typing_extensions import Literal
 
 from twisted.internet import defer
@@ -47,6 +49,7 @@ from synapse.logging.context import (
     current_context,
     make_deferred_yieldable,
 )
+from synapse.metrics import LaterGauge
 from synapse.metrics.background_process_metrics import (
     run_as_background_process,
     wrap_as_background_process,
@@ -55,7 +58,7 @@ from synapse.replication.slave.storage._slaved_id_tracker import SlavedIdTracker
 from synapse.replication.tcp.streams import BackfillStream
 from synapse.replication.tcp.streams.events import EventsStream
 from synapse.storage._base import SQLBaseStore, db_to_json, make_in_list_sql_clause
-from synapse.storage.database import DatabasePool
+from synapse.storage.database import DatabasePool, TransactionLane
 from synapse.storage.engines import PostgresEngine
 from synapse.storage.util.id_generators import MultiWriterIdGenerator, StreamIdGenerator
 from synapse.storage.util.sequence import build_sequence_generator
@@ -78,6 +81,22 @@ logger = logging.getLogger(__name__)
 EVENT_QUEUE_THREADS = 3  # Max number of threads that will fetch events
 EVENT_QUEUE_ITERATIONS = 3  # No. times we block waiting for requests for events
 EVENT_QUEUE_TIMEOUT_S = 0.1  # Timeout when waiting for requests for events
+# Max number of events a fetch thread will take off the queue at once. Larger
+# requests are split up so that they can be fetched by several threads in
+# parallel.
+EVENT_QUEUE_BATCH_SIZE = 1000
+
+
+event_fetch_queue_wait_time = Histogram(
+    "synapse_storage_event_fetch_queue_wait_seconds",
+    "Time event fetch requests spent waiting in the queue before a fetch thread"
+    " picked them up",
+)
+
+event_fetch_duration = Histogram(
+    "synapse_storage_event_fetch_duration_seconds",
+    "Time taken by a fetch thread to fetch and decode a batch of events",
+)
 
 
 @attr.s(slots=True, auto_attribs=True)
@@ -86,6 +105,23 @@ class _EventCacheEntry:
     redacted_event: Optional[EventBase]
 
 
+def _decode_event_row(row: Dict) -> None:
+    """Decodes the JSON of an event row returned by `_fetch_event_rows`,
+    replacing the `json` and `internal_metadata` keys with `event_dict` and
+    `internal_metadata_dict`. These are None if the JSON could not be parsed.
+
+    This is safe to call from a database thread.
+    """
+    try:
+        row["event_dict"] = db_to_json(row.pop("json"))
+    except ValueError:
+        row["event_dict"] = None
+    try:
+        row["internal_metadata_dict"] = db_to_json(row.pop("internal_metadata"))
+    except ValueError:
+        row["internal_metadata_dict"] = None
+
+
 class EventRedactBehaviour(Names):
     """
     What to do when retrieving a redacted event from the database.
@@ -181,6 +217,19 @@ class EventsWorkerStore(SQLBaseStore):
         self._event_fetch_list = []
         self._event_fetch_ongoing = 0
 
+        LaterGauge(
+            "synapse_storage_event_fetch_queue_depth",
+            "Number of events waiting to be fetched from the database",
+            [],
+            lambda: sum(len(events) for events, _, _ in self._event_fetch_list),
+        )
+        LaterGauge(
+            "synapse_storage_event_fetch_ongoing",
+            "Number of threads currently fetching events from the database",
+            [],
+            lambda: self._event_fetch_ongoing,
+        )
+
         # We define this sequence here so that it can be referenced from both
         # the DataStore and PersistEventStore.
         def get_chain_id_txn(txn):
@@ -669,6 +718,13 @@ class EventsWorkerStore(SQLBaseStore):
             for e in state_to_include.values()
         ]
 
+    async def _fetch_event_thread(self) -> None:
+        """Runs `_do_fetch` on a database connection, ahead of less urgent
+        database work.
+        """
+        with self.db_pool.transaction_lane(TransactionLane.LATENCY_CRITICAL):
+            await self.db_pool.runWithConnection(self._do_fetch)
+
     def _do_fetch(self, conn):
         """Takes a database connection and waits for requests for events from
         the _event_fetch_list queue.
@@ -676,8 +732,24 @@ class EventsWorkerStore(SQLBaseStore):
         i = 0
         while True:
             with self._event_fetch_lock:
-                event_list = self._event_fetch_list
-                self._event_fetch_list = []
+                # Take requests off the front of the queue up to the batch size,
+                # leaving the rest for the other fetch threads.
+                num_events = 0
+                num_requests = 0
+                for events, _, _ in self._event_fetch_list:
+                    if num_requests and num_events + len(events) > (
+                        EVENT_QUEUE_BATCH_SIZE
+                    ):
+                        break
+                    num_events += len(events)
+                    num_requests += 1
+
+                event_list = self._event_fetch_list[:num_requests]
+                self._event_fetch_list = self._event_fetch_list[num_requests:]
+
+                if self._event_fetch_list:
+                    # Wake up another fetch thread to deal with the rest.
+                    self._event_fetch_lock.notify()
 
                 if not event_list:
                     single_threaded = self.database_engine.single_threaded
@@ -702,10 +774,10 @@ class EventsWorkerStore(SQLBaseStore):
         Args:
             conn (twisted.enterprise.adbapi.Connection): database connection
 
-            event_list (list[Tuple[list[str], Deferred]]):
+            event_list (list[Tuple[list[str], Deferred, float]]):
                 The fetch requests. Each entry consists of a list of event
-                ids to be fetched, and a deferred to be completed once the
-                events have been fetched.
+                ids to be fetched, a deferred to be completed once the
+                events have been fetched, and the time the request was queued.
 
                 The deferreds are callbacked with a dictionary mapping from event id
                 to event row. Note that it may well contain additional events that
@@ -713,17 +785,28 @@ class EventsWorkerStore(SQLBaseStore):
         """
         with Measure(self._clock, "_fetch_event_list"):
             try:
+                start = monotonic_time()
+                for _, _, queued in event_list:
+                    event_fetch_queue_wait_time.observe(start - queued)
+
                 events_to_fetch = {
-                    event_id for events, _ in event_list for event_id in events
+                    event_id for events, _, _ in event_list for event_id in events
                 }
 
                 row_dict = self.db_pool.new_transaction(
                     conn, "do_fetch", [], [], self._fetch_event_rows, events_to_fetch
                 )
 
+                # We decode the events here, rather than on the main thread, so
+                # that we don't block the reactor.
+                for row in row_dict.values():
+                    _decode_event_row(row)
+
+                event_fetch_duration.observe(monotonic_time() - start)
+
                 # We only want to resolve deferreds from the main thread
                 def fire():
-                    for _, d in event_list:
+                    for _, d, _ in event_list:
                         d.callback(row_dict)
 
                 with PreserveLoggingContext():
@@ -733,7 +816,7 @@ class EventsWorkerStore(SQLBaseStore):
 
                 # We only want to resolve deferreds from the main thread
                 def fire(evs, exc):
-                    for _, d in evs:
+                    for _, d, _ in evs:
                         if not d.called:
                             with PreserveLoggingContext():
                                 d.errback(exc)
@@ -788,14 +871,12 @@ class EventsWorkerStore(SQLBaseStore):
 
             # If the event or metadata cannot be parsed, log the error and act
             # as if the event is unknown.
-            try:
-                d = db_to_json(row["json"])
-            except ValueError:
+            d = row["event_dict"]
+            if d is None:
                 logger.error("Unable to parse json from event: %s", event_id)
                 continue
-            try:
-                internal_metadata = db_to_json(row["internal_metadata"])
-            except ValueError:
+            internal_metadata = row["internal_metadata_dict"]
+            if internal_metadata is None:
                 logger.error(
                     "Unable to parse internal_metadata from event: %s", event_id
                 )
@@ -904,30 +985,43 @@ class EventsWorkerStore(SQLBaseStore):
             events (Iterable[str]): events to be fetched.
 
         Returns:
-            Dict[str, Dict]: map from event id to row data from the database.
-                May contain events that weren't requested.
+            Dict[str, Dict]: map from event id to row data from the database,
+                with the event JSON decoded (see `_decode_event_row`). May
+                contain events that weren't requested.
         """
 
-        events_d = defer.Deferred()
+        # We split up large requests so that they can be fetched in parallel.
+        deferreds = []
         with self._event_fetch_lock:
-            self._event_fetch_list.append((events, events_d))
-
-            self._event_fetch_lock.notify()
+            queued = monotonic_time()
+            for chunk in batch_iter(events, EVENT_QUEUE_BATCH_SIZE):
+                events_d: "defer.Deferred[Dict[str, Dict]]" = defer.Deferred()
+                self._event_fetch_list.append((chunk, events_d, queued))
+                deferreds.append(events_d)
 
-            if self._event_fetch_ongoing < EVENT_QUEUE_THREADS:
-                self._event_fetch_ongoing += 1
-                should_start = True
-            else:
-                should_start = False
+            self._event_fetch_lock.notify_all()
 
-        if should_start:
-            run_as_background_process(
-                "fetch_events", self.db_pool.runWithConnection, self._do_fetch
+            threads_to_start = min(
+                len(deferreds), EVENT_QUEUE_THREADS - self._event_fetch_ongoing
             )
+            threads_to_start = max(threads_to_start, 0)
+            self._event_fetch_ongoing += threads_to_start
+
+        for _ in range(threads_to_start):
+            run_as_background_process("fetch_events", self._fetch_event_thread)
 
         logger.debug("Loading %d events: %s", len(events), events)
         with PreserveLoggingContext():
-            row_map = await events_d
+            if len(deferreds) == 1:
+                row_map = await deferreds[0]
+            else:
+                row_maps = await defer.gatherResults(
+                    deferreds, consumeErrors=True
+                ).addErrback(unwrapFirstError)
+
+                row_map = {}
+                for m in row_maps:
+                    row_map.update(m)
         logger.debug("Loaded %d events (%d rows)", len(events), len(row_map))
 
         return row_map
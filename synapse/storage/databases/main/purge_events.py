@@ -16,14 +16,25 @@ import logging
 from typing import Any, List, Set, Tuple
 
 from synapse.api.errors import SynapseError
+from synapse.storage.database import DatabasePool
 from synapse.storage.databases.main import CacheInvalidationWorkerStore
 from synapse.storage.databases.main.state import StateGroupWorkerStore
 from synapse.types import RoomStreamToken
+from synapse.util.iterutils import batch_iter
 
 logger = logging.getLogger(__name__)
 
 
 class PurgeEventsStore(StateGroupWorkerStore, CacheInvalidationWorkerStore):
+    def __init__(self, database: DatabasePool, db_conn, hs):
+        super().__init__(database, db_conn, hs)
+
+        # Whether we need to tell the search backend about the events we purge.
+        search_backend_class, _ = hs.config.search.search_backend
+        self._record_search_index_deletions = getattr(
+            search_backend_class, "needs_deletions", False
+        )
+
     async def purge_history(
         self, room_id: str, token: str, delete_local_events: bool
     ) -> Set[int]:
@@ -204,6 +215,13 @@ class PurgeEventsStore(StateGroupWorkerStore, CacheInvalidationWorkerStore):
             "WHERE event_id IN (SELECT event_id from events_to_purge)"
         )
 
+        if self._record_search_index_deletions:
+            txn.execute(
+                "INSERT INTO search_index_deletions (room_id, event_id)"
+                " SELECT ?, event_id FROM events_to_purge WHERE should_delete",
+                (room_id,),
+            )
+
         # Delete all remote non-state events
         for table in (
             "events",
@@ -282,19 +300,25 @@ class PurgeEventsStore(StateGroupWorkerStore, CacheInvalidationWorkerStore):
         # so make sure to keep this actually last.
         txn.execute("DROP TABLE events_to_purge")
 
-        for event_id, should_delete in event_rows:
-            self._invalidate_cache_and_stream(
-                txn, self._get_state_group_for_event, (event_id,)
-            )
+        self._invalidate_cache_and_stream_bulk(
+            txn,
+            self._get_state_group_for_event,
+            [(event_id,) for event_id, _ in event_rows],
+        )
 
-            # XXX: This is racy, since have_seen_events could be called between the
-            #    transaction completing and the invalidation running. On the other hand,
-            #    that's no different to calling `have_seen_events` just before the
-            #    event is deleted from the database.
-            if should_delete:
-                self._invalidate_cache_and_stream(
-                    txn, self.have_seen_event, (room_id, event_id)
-                )
+        # XXX: This is racy, since have_seen_events could be called between the
+        #    transaction completing and the invalidation running. On the other hand,
+        #    that's no different to calling `have_seen_events` just before the
+        #    event is deleted from the database.
+        self._invalidate_cache_and_stream_bulk(
+            txn,
+            self.have_seen_event,
+            [
+                (room_id, event_id)
+                for event_id, should_delete in event_rows
+                if should_delete
+            ],
+        )
 
         logger.info("[purge] done")
 
@@ -327,9 +351,29 @@ class PurgeEventsStore(StateGroupWorkerStore, CacheInvalidationWorkerStore):
 
         state_groups = [row[0] for row in txn]
 
+        if self._record_search_index_deletions:
+            txn.execute(
+                "SELECT MIN(stream_ordering), MAX(stream_ordering) FROM events"
+                " WHERE room_id = ?",
+                (room_id,),
+            )
+            min_stream_ordering, max_stream_ordering = txn.fetchone()
+            if max_stream_ordering is not None:
+                self.db_pool.simple_insert_txn(
+                    txn,
+                    table="search_index_deletions",
+                    values={
+                        "room_id": room_id,
+                        "event_id": None,
+                        "min_stream_ordering": min_stream_ordering,
+                        "max_stream_ordering": max_stream_ordering,
+                    },
+                )
+
         # Get all the auth chains that are referenced by events that are to be
-        # deleted.
-        txn.execute(
+        # deleted. Large rooms can reference millions of chains, so we stream
+        # them rather than pulling them all into memory at once.
+        referenced_chain_id_tuples = txn.stream_rows(
             """
             SELECT chain_id, sequence_number FROM events
             LEFT JOIN event_auth_chains USING (event_id)
@@ -337,16 +381,16 @@ class PurgeEventsStore(StateGroupWorkerStore, CacheInvalidationWorkerStore):
             """,
             (room_id,),
         )
-        referenced_chain_id_tuples = list(txn)
 
         logger.info("[purge] removing events from event_auth_chain_links")
-        txn.executemany(
-            """
-            DELETE FROM event_auth_chain_links WHERE
-            origin_chain_id = ? AND origin_sequence_number = ?
-            """,
-            referenced_chain_id_tuples,
-        )
+        for batch in batch_iter(referenced_chain_id_tuples, 1000):
+            txn.executemany(
+                """
+                DELETE FROM event_auth_chain_links WHERE
+                origin_chain_id = ? AND origin_sequence_number = ?
+                """,
+                batch,
+            )
 
         # Now we delete tables which lack an index on room_id but have one on event_id
         for table in (
@@ -440,6 +484,13 @@ class PurgeEventsStore(StateGroupWorkerStore, CacheInvalidationWorkerStore):
         #   that already exist.
         self._invalidate_cache_and_stream(txn, self.have_seen_event, (room_id,))
 
+        # The events will get new chain IDs if the room is joined again, so we
+        # need to forget the room's chains in the in memory chain cover index.
+        txn.call_after(
+            self._attempt_to_invalidate_cache, "_auth_chain_index", (room_id,)
+        )
+        self._send_invalidation_to_replication(txn, "_auth_chain_index", (room_id,))
+
         logger.info("[purge] done")
 
         return state_groups
@@ -14,7 +14,7 @@
 # limitations under the License.
 import abc
 import logging
-from typing import List, Tuple, Union
+from typing import Any, Dict, List, Tuple, Union
 
 from synapse.api.errors import NotFoundError, StoreError
 from synapse.push.baserules import list_with_base_rules
@@ -31,12 +31,45 @@ from synapse.storage.push_rule import InconsistentRuleException, RuleNotFoundExc
 from synapse.storage.util.id_generators import StreamIdGenerator
 from synapse.util import json_encoder
 from synapse.util.caches.descriptors import cached, cachedList
+from synapse.util.caches.lrucache import LruCache
 from synapse.util.caches.stream_change_cache import StreamChangeCache
 
 logger = logging.getLogger(__name__)
 
 
+# Most users have no push rules of their own, so they end up with identical
+# lists of the default rules. We share a single list between them, keyed by
+# the user's enabled map, which saves memory and lets the bulk push rule
+# evaluator handle each distinct list once per event rather than once per user.
+_default_rules_cache: LruCache[
+    Tuple[Tuple[Tuple[str, bool], ...], bool], List[Dict[str, Any]]
+] = LruCache(1000, "default_push_rules_cache")
+
+
 def _load_rules(rawrules, enabled_map, use_new_defaults=False):
+    """Builds a user's list of push rules from their rows in the `push_rules`
+    table and their enabled map.
+
+    The returned list may be shared with other users, so must not be mutated.
+    """
+    if rawrules:
+        return _load_rules_uncached(rawrules, enabled_map, use_new_defaults)
+
+    key = (
+        tuple(
+            sorted((rule_id, bool(enabled)) for rule_id, enabled in enabled_map.items())
+        ),
+        use_new_defaults,
+    )
+    rules = _default_rules_cache.get(key)
+    if rules is None:
+        rules = _load_rules_uncached(rawrules, enabled_map, use_new_defaults)
+        _default_rules_cache[key] = rules
+
+    return rules
+
+
+def _load_rules_uncached(rawrules, enabled_map, use_new_defaults=False):
     ruleslist = []
     for rawrule in rawrules:
         rule = dict(rawrule)
@@ -15,14 +15,16 @@
 import logging
 import re
 from collections import namedtuple
-from typing import Collection, List, Optional, Set
+from typing import Collection, List, Optional, Set, Tuple
 
+from synapse.api.constants import EventTypes
 from synapse.api.errors import SynapseError
 from synapse.events import EventBase
 from synapse.storage._base import SQLBaseStore, db_to_json, make_in_list_sql_clause
 from synapse.storage.database import DatabasePool
 from synapse.storage.databases.main.events_worker import EventRedactBehaviour
 from synapse.storage.engines import PostgresEngine, Sqlite3Engine
+from synapse.types import JsonDict
 
 logger = logging.getLogger(__name__)
 
@@ -31,6 +33,13 @@ SearchEntry = namedtuple(
     ["key", "value", "event_id", "room_id", "stream_ordering", "origin_server_ts"],
 )
 
+# The content key of each type of event which is searchable.
+_SEARCHABLE_CONTENT_KEYS = {
+    EventTypes.Message: "body",
+    EventTypes.Name: "name",
+    EventTypes.Topic: "topic",
+}
+
 
 class SearchWorkerStore(SQLBaseStore):
     def store_search_entries_txn(self, txn, entries):
@@ -79,6 +88,149 @@ class SearchWorkerStore(SQLBaseStore):
             # This should be unreachable.
             raise Exception("Unrecognized database engine")
 
+    async def get_search_entries_to_index(
+        self, from_stream_ordering: int, to_stream_ordering: int, limit: int
+    ) -> Tuple[List[SearchEntry], List[str], int]:
+        """Get the search entries for the events between the given stream
+        orderings, for building a search index outside of the database, along
+        with the events which have been redacted by the events in that range.
+
+        Works in either direction: if `to_stream_ordering` is less than
+        `from_stream_ordering` then events are returned newest first, which is
+        useful for following backfilled events.
+
+        Args:
+            from_stream_ordering: The stream ordering to start after (exclusive)
+            to_stream_ordering: The stream ordering to stop at (inclusive)
+            limit: The maximum number of events to look at
+
+        Returns:
+            The search entries, the IDs of the redacted events, and the stream
+            ordering up to which all events have been looked at.
+        """
+        if from_stream_ordering == to_stream_ordering:
+            return [], [], to_stream_ordering
+
+        if from_stream_ordering < to_stream_ordering:
+            clause = "? < e.stream_ordering AND e.stream_ordering <= ?"
+            order = "ASC"
+        else:
+            clause = "? > e.stream_ordering AND e.stream_ordering >= ?"
+            order = "DESC"
+
+        sql = """
+            SELECT e.stream_ordering, e.origin_server_ts, e.event_id, e.room_id,
+                e.type, ej.json
+            FROM events AS e
+            INNER JOIN event_json AS ej USING (event_id)
+            LEFT JOIN rejections AS r USING (event_id)
+            WHERE %s AND NOT e.outlier AND r.event_id IS NULL
+            ORDER BY e.stream_ordering %s
+            LIMIT ?
+        """ % (
+            clause,
+            order,
+        )
+
+        def get_search_entries_to_index_txn(txn):
+            txn.execute(sql, (from_stream_ordering, to_stream_ordering, limit))
+
+            entries = []
+            redacted_event_ids = []
+            num_rows = 0
+            stream_ordering = to_stream_ordering
+            for stream_ordering, ts, event_id, room_id, event_type, json in txn:
+                num_rows += 1
+
+                if event_type == EventTypes.Redaction:
+                    redacts = db_to_json(json).get("redacts")
+                    if isinstance(redacts, str):
+                        redacted_event_ids.append(redacts)
+                    continue
+
+                content_key = _SEARCHABLE_CONTENT_KEYS.get(event_type)
+                if content_key is None:
+                    continue
+
+                value = db_to_json(json).get("content", {}).get(content_key)
+                if not isinstance(value, str):
+                    continue
+
+                entries.append(
+                    SearchEntry(
+                        key="content." + content_key,
+                        value=value,
+                        event_id=event_id,
+                        room_id=room_id,
+                        stream_ordering=stream_ordering,
+                        origin_server_ts=ts,
+                    )
+                )
+
+            if num_rows < limit:
+                stream_ordering = to_stream_ordering
+
+            return entries, redacted_event_ids, stream_ordering
+
+        return await self.db_pool.runInteraction(
+            "get_search_entries_to_index", get_search_entries_to_index_txn
+        )
+
+    async def get_search_index_deletions(
+        self, limit: int
+    ) -> List[Tuple[str, Optional[str], Optional[int], Optional[int]]]:
+        """Get purged events which need removing from search indexes kept
+        outside of the database.
+
+        Args:
+            limit: The maximum number of deletions to return
+
+        Returns:
+            A list of (room ID, event ID, min stream ordering, max stream
+            ordering). If the event ID is None then the events in the room
+            between the stream orderings (inclusive) were purged.
+        """
+        rows = await self.db_pool.execute(
+            "get_search_index_deletions",
+            None,
+            "SELECT room_id, event_id, min_stream_ordering, max_stream_ordering"
+            " FROM search_index_deletions LIMIT ?",
+            limit,
+        )
+        return [tuple(row) for row in rows]
+
+    async def remove_search_index_deletions(
+        self,
+        deletions: Collection[Tuple[str, Optional[str], Optional[int], Optional[int]]],
+    ) -> None:
+        """Remove deletions returned by `get_search_index_deletions`, once they
+        have been recorded by the search index.
+        """
+
+        def remove_search_index_deletions_txn(txn):
+            txn.execute_batch(
+                "DELETE FROM search_index_deletions"
+                " WHERE room_id = ? AND event_id = ?",
+                [
+                    (room_id, event_id)
+                    for room_id, event_id, _, _ in deletions
+                    if event_id
+                ],
+            )
+            txn.execute_batch(
+                "DELETE FROM search_index_deletions"
+                " WHERE room_id = ? AND event_id IS NULL AND max_stream_ordering = ?",
+                [
+                    (room_id, max_stream_ordering)
+                    for room_id, event_id, _, max_stream_ordering in deletions
+                    if not event_id
+                ],
+            )
+
+        await self.db_pool.runInteraction(
+            "remove_search_index_deletions", remove_search_index_deletions_txn
+        )
+
 
 class SearchBackgroundUpdateStore(SearchWorkerStore):
 
@@ -464,7 +616,7 @@ class SearchStore(SearchBackgroundUpdateStore):
         keys: List[str],
         limit,
         pagination_token: Optional[str] = None,
-    ) -> List[dict]:
+    ) -> JsonDict:
         """Performs a full text search over events with given keys.
 
         Args:
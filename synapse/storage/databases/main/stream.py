@@ -517,7 +517,9 @@ class StreamWorkerStore(EventsWorkerStore, SQLBaseStore, metaclass=abc.ABCMeta):
             ][:limit]
             return rows
 
-        rows = await self.db_pool.runInteraction("get_room_events_stream_for_room", f)
+        rows = await self.db_pool.runInteraction(
+            "get_room_events_stream_for_room", f, db_read_only=True
+        )
 
         ret = await self.get_events_as_list(
             [r.event_id for r in rows], get_prev_content=True
@@ -587,7 +589,9 @@ class StreamWorkerStore(EventsWorkerStore, SQLBaseStore, metaclass=abc.ABCMeta):
 
             return rows
 
-        rows = await self.db_pool.runInteraction("get_membership_changes_for_user", f)
+        rows = await self.db_pool.runInteraction(
+            "get_membership_changes_for_user", f, db_read_only=True
+        )
 
         ret = await self.get_events_as_list(
             [r.event_id for r in rows], get_prev_content=True
@@ -1232,6 +1236,7 @@ class StreamWorkerStore(EventsWorkerStore, SQLBaseStore, metaclass=abc.ABCMeta):
             direction,
             limit,
             event_filter,
+            db_read_only=True,
         )
 
         events = await self.get_events_as_list(
@@ -14,7 +14,17 @@
 
 import logging
 import re
-from typing import Any, Dict, Iterable, Optional, Set, Tuple
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+)
 
 from synapse.api.constants import EventTypes, HistoryVisibility, JoinRules
 from synapse.storage.database import DatabasePool
@@ -26,6 +36,8 @@ from synapse.util.caches.descriptors import cached
 
 logger = logging.getLogger(__name__)
 
+R = TypeVar("R")
+
 
 TEMP_TABLE = "_temp_populate_user_directory"
 
@@ -490,13 +502,33 @@ class UserDirectoryBackgroundUpdateStore(StateDeltasStore):
             desc="get_user_in_directory",
         )
 
-    async def update_user_directory_stream_pos(self, stream_id: int) -> None:
-        await self.db_pool.simple_update_one(
-            table="user_directory_stream_pos",
-            keyvalues={},
-            updatevalues={"stream_id": stream_id},
-            desc="update_user_directory_stream_pos",
-        )
+    async def update_user_directory_stream_pos(
+        self, stream_id: Optional[int], buffered: bool = False
+    ) -> None:
+        """Update the position the user directory has processed state deltas
+        up to.
+
+        Args:
+            stream_id: The new position, or None if the user directory is
+                being rebuilt.
+            buffered: Whether the write may be delayed and batched with later
+                writes (see `simple_upsert_buffered`). This is only safe if
+                losing the write on a crash just means redoing some work.
+        """
+        if buffered:
+            await self.db_pool.simple_upsert_buffered(
+                table="user_directory_stream_pos",
+                keyvalues={"lock": "X"},
+                values={"stream_id": stream_id},
+                desc="update_user_directory_stream_pos",
+            )
+        else:
+            await self.db_pool.simple_upsert(
+                table="user_directory_stream_pos",
+                keyvalues={"lock": "X"},
+                values={"stream_id": stream_id},
+                desc="update_user_directory_stream_pos",
+            )
 
 
 class UserDirectoryStore(UserDirectoryBackgroundUpdateStore):
@@ -677,6 +709,50 @@ class UserDirectoryStore(UserDirectoryBackgroundUpdateStore):
             desc="get_user_directory_stream_pos",
         )
 
+    async def get_user_directory_tables(
+        self,
+        process_rows: Callable[
+            [
+                Iterator[Tuple[str, Optional[str], Optional[str]]],
+                Iterator[Tuple[str, str]],
+                Iterator[Tuple[str, str, str]],
+            ],
+            R,
+        ],
+    ) -> R:
+        """Streams the entire contents of the user directory, for building an
+        in memory index of it.
+
+        Args:
+            process_rows: Called on the database thread with iterators over the
+                rows of `user_directory` as (user_id, display_name, avatar_url),
+                `users_in_public_rooms` as (user_id, room_id) and
+                `users_who_share_private_rooms` as (user_id, other_user_id,
+                room_id). The iterators must be consumed in that order. It may
+                be called more than once if the transaction is retried.
+
+        Returns:
+            The result of `process_rows`.
+        """
+
+        def _get_user_directory_tables_txn(txn):
+            return process_rows(
+                txn.stream_rows(
+                    "SELECT user_id, display_name, avatar_url FROM user_directory"
+                ),
+                txn.stream_rows("SELECT user_id, room_id FROM users_in_public_rooms"),
+                txn.stream_rows(
+                    """
+                    SELECT user_id, other_user_id, room_id
+                    FROM users_who_share_private_rooms
+                    """
+                ),
+            )
+
+        return await self.db_pool.runInteraction(
+            "get_user_directory_tables", _get_user_directory_tables_txn
+        )
+
     async def search_user_dir(self, user_id, search_term, limit):
         """Searches for users in directory
 
@@ -12,11 +12,14 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import copy
 import logging
-from typing import Optional
+from typing import Collection, Dict, List, Optional
+
+from prometheus_client import Counter
 
 from synapse.storage._base import SQLBaseStore
-from synapse.storage.database import DatabasePool
+from synapse.storage.database import DatabasePool, make_in_list_sql_clause
 from synapse.storage.engines import PostgresEngine
 from synapse.storage.state import StateFilter
 
@@ -25,6 +28,32 @@ logger = logging.getLogger(__name__)
 
 MAX_STATE_DELTA_HOPS = 100
 
+# The maximum length of the delta chains at each level of the layout that the
+# state group compression background update rewrites state groups into, from
+# the finest level up. A room's state groups end up chained in runs of at most
+# 10 groups, with every 10th group chained in runs of 10 at the next level up,
+# and so on. A full snapshot is only stored every 1000 state groups, and no
+# delta chain is longer than 30 hops.
+STATE_GROUP_COMPRESSION_LEVELS = (10, 10, 10)
+
+state_groups_compressed_counter = Counter(
+    "synapse_storage_state_groups_compressed",
+    "Number of state groups rewritten by the state group compression background"
+    " update",
+)
+
+state_group_rows_deleted_counter = Counter(
+    "synapse_storage_state_group_compression_rows_deleted",
+    "Number of rows deleted from state_groups_state by the state group"
+    " compression background update",
+)
+
+state_group_rows_inserted_counter = Counter(
+    "synapse_storage_state_group_compression_rows_inserted",
+    "Number of rows inserted into state_groups_state by the state group"
+    " compression background update",
+)
+
 
 class StateGroupBackgroundUpdateStore(SQLBaseStore):
     """Defines functions related to state groups needed to run the state background
@@ -176,11 +205,47 @@ class StateGroupBackgroundUpdateStore(SQLBaseStore):
         return results
 
 
+def _pick_compressed_prev_group(
+    levels: List[List[int]], state_group: int
+) -> Optional[int]:
+    """Picks the state group that the given state group should be stored as a
+    delta against in the compressed layout, and updates the levels to add the
+    state group to the layout.
+
+    Args:
+        levels: For each level of the layout (from the finest level up), a
+            two-element list of the group at the head of the chain at that level
+            and the length of that chain. The heads are updated in place.
+        state_group: The next state group in the room.
+
+    Returns:
+        The state group to store `state_group` as a delta against, or None if it
+        should be stored as a full snapshot.
+    """
+    for level, max_length in zip(levels, STATE_GROUP_COMPRESSION_LEVELS):
+        head, length = level
+        if head and length < max_length:
+            # There is space in the chain at this level, so we add the group to
+            # the end of it. The chains at the lower levels start from here.
+            level[0] = state_group
+            level[1] = length + 1
+            return head
+
+        # The chain at this level is full, so we start a new one from this
+        # group and try the next level up.
+        level[0] = state_group
+        level[1] = 1
+
+    # All the levels are full, so this group starts a new snapshot.
+    return None
+
+
 class StateBackgroundUpdateStore(StateGroupBackgroundUpdateStore):
 
     STATE_GROUP_DEDUPLICATION_UPDATE_NAME = "state_group_state_deduplication"
     STATE_GROUP_INDEX_UPDATE_NAME = "state_group_state_type_index"
     STATE_GROUPS_ROOM_INDEX_UPDATE_NAME = "state_groups_room_id_idx"
+    STATE_GROUP_COMPRESSION_UPDATE_NAME = "state_group_chain_compression"
 
     def __init__(self, database: DatabasePool, db_conn, hs):
         super().__init__(database, db_conn, hs)
@@ -197,6 +262,10 @@ class StateBackgroundUpdateStore(StateGroupBackgroundUpdateStore):
             table="state_groups",
             columns=["room_id"],
         )
+        self.db_pool.updates.register_background_update_handler(
+            self.STATE_GROUP_COMPRESSION_UPDATE_NAME,
+            self._background_compress_state_group_chains,
+        )
 
     async def _background_deduplicate_state(self, progress, batch_size):
         """This background update will slowly deduplicate state by reencoding
@@ -370,3 +439,273 @@ class StateBackgroundUpdateStore(StateGroupBackgroundUpdateStore):
         )
 
         return 1
+
+    async def _background_compress_state_group_chains(self, progress, batch_size):
+        """This background update rewrites the state groups of each room, in
+        order, into a layout of bounded-length delta chains (see
+        `STATE_GROUP_COMPRESSION_LEVELS`), which both reduces the number of rows
+        in `state_groups_state` and the number of hops needed to look up the
+        state of a group.
+
+        The full state of every group is unchanged, so the state group caches
+        remain valid.
+        """
+        max_group = progress.get("max_group", None)
+        groups_compressed = progress.get("groups_compressed", 0)
+
+        BATCH_SIZE_SCALE_FACTOR = 100
+
+        batch_size = max(1, int(batch_size / BATCH_SIZE_SCALE_FACTOR))
+
+        if max_group is None:
+            rows = await self.db_pool.execute(
+                "_background_compress_state_group_chains",
+                None,
+                "SELECT coalesce(max(id), 0) FROM state_groups",
+            )
+            max_group = rows[0][0]
+
+        def compress_txn(txn):
+            # We take copies of the progress so that we start from the same
+            # place if the transaction gets retried.
+            room_id = progress.get("room_id", "")
+            last_state_group = progress.get("last_state_group", 0)
+            levels = copy.deepcopy(progress.get("levels"))
+
+            if levels:
+                # The groups at the heads of the chains may have been purged
+                # since the last batch, in which case we start again from a new
+                # snapshot.
+                heads = {head for head, _ in levels}
+                rows = self.db_pool.simple_select_many_txn(
+                    txn,
+                    table="state_groups",
+                    column="id",
+                    iterable=heads,
+                    keyvalues={},
+                    retcols=("id",),
+                )
+                if len(rows) != len(heads):
+                    levels = None
+                else:
+                    self._lock_state_groups_txn(txn, heads)
+
+            # The full state of the groups at the heads of the chains, which
+            # are the groups that we'll be storing deltas against.
+            head_states: Dict[int, Dict] = {}
+
+            count = 0
+            while count < batch_size:
+                txn.execute(
+                    "SELECT id FROM state_groups"
+                    " WHERE room_id = ? AND ? < id AND id <= ?"
+                    " ORDER BY id ASC"
+                    " LIMIT ?",
+                    (room_id, last_state_group, max_group, batch_size - count),
+                )
+                state_groups = [row[0] for row in txn]
+
+                if not state_groups:
+                    # We've finished with this room, so move on to the next.
+                    txn.execute(
+                        "SELECT min(room_id) FROM state_groups WHERE room_id > ?",
+                        (room_id,),
+                    )
+                    row = txn.fetchone()
+                    if not row or row[0] is None:
+                        return True, count
+
+                    room_id = row[0]
+                    last_state_group = 0
+                    levels = None
+                    head_states = {}
+                    continue
+
+                # Any of these may become the head of a chain that we store
+                # deltas against.
+                self._lock_state_groups_txn(txn, state_groups)
+
+                for state_group in state_groups:
+                    if not levels:
+                        levels = [[0, 0] for _ in STATE_GROUP_COMPRESSION_LEVELS]
+
+                    prev_group = _pick_compressed_prev_group(levels, state_group)
+                    self._compress_state_group_txn(
+                        txn, room_id, state_group, prev_group, levels, head_states
+                    )
+
+                    last_state_group = state_group
+                    count += 1
+
+            new_progress = {
+                "room_id": room_id,
+                "last_state_group": last_state_group,
+                "levels": levels,
+                "max_group": max_group,
+                "groups_compressed": groups_compressed + count,
+            }
+
+            self.db_pool.updates._background_update_progress_txn(
+                txn, self.STATE_GROUP_COMPRESSION_UPDATE_NAME, new_progress
+            )
+
+            return False, count
+
+        finished, result = await self.db_pool.runInteraction(
+            self.STATE_GROUP_COMPRESSION_UPDATE_NAME, compress_txn
+        )
+
+        state_groups_compressed_counter.inc(result)
+
+        if finished:
+            await self.db_pool.updates._end_background_update(
+                self.STATE_GROUP_COMPRESSION_UPDATE_NAME
+            )
+
+        return result * BATCH_SIZE_SCALE_FACTOR
+
+    def _lock_state_groups_txn(self, txn, state_groups: Collection[int]) -> None:
+        """Stops the given state groups from being purged until the end of the
+        transaction, as part of the state group compression background update.
+
+        The purge code finds the groups which are stored as deltas against the
+        groups it deletes (and so need to be rewritten as snapshots) before
+        deleting them. So if we store a group as a delta against a head while a
+        purge of that head is in flight, the purge won't see the new delta and
+        the group ends up as a delta against a group which no longer exists.
+
+        To prevent that we update the rows of the heads in `state_groups`. A
+        purge which has already deleted a head makes us block and then fail
+        with a serialization error, and a purge which tries to delete a head
+        after us blocks and then fails in the same way. Either way the loser
+        is retried and sees the other's changes. Merely locking the rows with
+        `SELECT ... FOR UPDATE` is not enough, as under REPEATABLE READ a
+        transaction only fails if the row it's waiting on was actually changed.
+
+        This isn't needed on SQLite, where transactions don't run concurrently.
+        """
+        if not isinstance(self.database_engine, PostgresEngine) or not state_groups:
+            return
+
+        clause, args = make_in_list_sql_clause(self.database_engine, "id", state_groups)
+        txn.execute("UPDATE state_groups SET room_id = room_id WHERE " + clause, args)
+
+    def _compress_state_group_txn(
+        self,
+        txn,
+        room_id: str,
+        state_group: int,
+        prev_group: Optional[int],
+        levels: List[List[int]],
+        head_states: Dict[int, Dict],
+    ) -> None:
+        """Rewrites the given state group as a delta against `prev_group` (or
+        as a full snapshot if that is None), as part of the state group
+        compression background update.
+
+        Args:
+            txn
+            room_id: The room the state group belongs to.
+            state_group: The state group to rewrite.
+            prev_group: The group to store `state_group` as a delta against.
+            levels: The heads of the chains of the compressed layout. These are
+                reset if we have to store `state_group` as a full snapshot.
+            head_states: The full state of the groups at the heads of the chains,
+                which is updated to match `levels`.
+        """
+        curr_state = self._get_state_groups_from_groups_txn(txn, [state_group])[
+            state_group
+        ]
+
+        prev_state: Optional[Dict] = None
+        if prev_group is not None:
+            prev_state = head_states.get(prev_group)
+            if prev_state is None:
+                prev_state = self._get_state_groups_from_groups_txn(txn, [prev_group])[
+                    prev_group
+                ]
+
+            if set(prev_state.keys()) - set(curr_state.keys()):
+                # We can only do a delta if the current has a strict super set
+                # of keys, so we have to start again from a full snapshot.
+                prev_group = None
+                for level in levels:
+                    level[0] = state_group
+                    level[1] = 1
+
+        if prev_group is not None:
+            assert prev_state is not None
+            delta_state = {
+                key: value
+                for key, value in curr_state.items()
+                if prev_state.get(key, None) != value
+            }
+        else:
+            delta_state = curr_state
+
+        # Only keep hold of the state of the groups we might store deltas
+        # against.
+        heads = {head for head, _ in levels}
+        for group in list(head_states):
+            if group not in heads:
+                del head_states[group]
+        if state_group in heads:
+            head_states[state_group] = curr_state
+
+        current_prev_group = self.db_pool.simple_select_one_onecol_txn(
+            txn,
+            table="state_group_edges",
+            keyvalues={"state_group": state_group},
+            retcol="prev_state_group",
+            allow_none=True,
+        )
+        txn.execute(
+            "SELECT count(*) FROM state_groups_state WHERE state_group = ?",
+            (state_group,),
+        )
+        (current_rows,) = txn.fetchone()
+
+        if current_prev_group == prev_group and current_rows == len(delta_state):
+            # The group is already stored in the right layout.
+            return
+
+        self.db_pool.simple_delete_txn(
+            txn,
+            table="state_group_edges",
+            keyvalues={"state_group": state_group},
+        )
+
+        if prev_group is not None:
+            self.db_pool.simple_insert_txn(
+                txn,
+                table="state_group_edges",
+                values={"state_group": state_group, "prev_state_group": prev_group},
+            )
+
+        self.db_pool.simple_delete_txn(
+            txn,
+            table="state_groups_state",
+            keyvalues={"state_group": state_group},
+        )
+
+        self.db_pool.simple_insert_many_txn(
+            txn,
+            table="state_groups_state",
+            values=[
+                {
+                    "state_group": state_group,
+                    "room_id": room_id,
+                    "type": key[0],
+                    "state_key": key[1],
+                    "event_id": state_id,
+                }
+                for key, state_id in delta_state.items()
+            ],
+        )
+
+        # Note that any cached `get_state_group_delta` result for this group is
+        # still correct, since the full state of its old prev group hasn't
+        # changed.
+
+        state_group_rows_deleted_counter.inc(current_rows)
+        state_group_rows_inserted_counter.inc(len(delta_state))
@@ -24,6 +24,7 @@ from synapse.storage.state import StateFilter
 from synapse.storage.types import Cursor
 from synapse.storage.util.sequence import build_sequence_generator
 from synapse.types import MutableStateMap, StateMap
+from synapse.util.caches import intern_string
 from synapse.util.caches.descriptors import cached
 from synapse.util.caches.dictionary_cache import DictionaryCache
 
@@ -163,6 +164,7 @@ class StateGroupDataStore(StateBackgroundUpdateStore, SQLBaseStore):
                 self._get_state_groups_from_groups_txn,
                 chunk,
                 state_filter,
+                db_read_only=True,
             )
             results.update(res)
 
@@ -351,11 +353,15 @@ class StateGroupDataStore(StateBackgroundUpdateStore, SQLBaseStore):
             state_dict_members = {}
             state_dict_non_members = {}
 
-            for k, v in group_state_dict.items():
-                if k[0] == EventTypes.Member:
-                    state_dict_members[k] = v
+            # The same types, state keys and event IDs turn up in the state of
+            # many different groups, so we intern them to avoid each cache entry
+            # holding its own copy.
+            for (typ, state_key), event_id in group_state_dict.items():
+                k = (intern_string(typ), intern_string(state_key))
+                if typ == EventTypes.Member:
+                    state_dict_members[k] = intern_string(event_id)
                 else:
-                    state_dict_non_members[k] = v
+                    state_dict_non_members[k] = intern_string(event_id)
 
             self._state_group_members_cache.update(
                 cache_seq_num_members,
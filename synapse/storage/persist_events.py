@@ -17,6 +17,7 @@
 import itertools
 import logging
 from collections import deque
+from time import monotonic as monotonic_time
 from typing import (
     Any,
     Awaitable,
@@ -105,6 +106,18 @@ times_pruned_extremities = Counter(
 )
 
 
+# The time spent in each stage of persisting a batch of events.
+persist_stage_timer = Histogram(
+    "synapse_storage_events_persist_stage_seconds",
+    "Time spent in each stage of persisting a batch of events",
+    ["stage"],
+)
+
+# The maximum number of events `_persist_event_batch` writes in a single
+# transaction.
+PERSIST_EVENTS_CHUNK_SIZE = 100
+
+
 @attr.s(auto_attribs=True, slots=True)
 class _EventPersistQueueItem:
     events_and_contexts: List[Tuple[EventBase, EventContext]]
@@ -117,6 +130,9 @@ class _EventPersistQueueItem:
     opentracing_span_context: Any = None
     """The opentracing span under which the persistence actually happened"""
 
+    queued_time: float = attr.ib(factory=monotonic_time)
+    """When the item was added to the queue"""
+
 
 _PersistResult = TypeVar("_PersistResult")
 
@@ -227,6 +243,9 @@ class _EventPeristenceQueue(Generic[_PersistResult]):
             try:
                 queue = self._get_drainining_queue(room_id)
                 for item in queue:
+                    persist_stage_timer.labels("queue_wait").observe(
+                        monotonic_time() - item.queued_time
+                    )
                     try:
                         with opentracing.start_active_span_follows_from(
                             "persist_event_batch",
@@ -412,8 +431,8 @@ class EventsPersistenceStorage:
                 return replaced_events
 
         chunks = [
-            events_and_contexts[x : x + 100]
-            for x in range(0, len(events_and_contexts), 100)
+            events_and_contexts[x : x + PERSIST_EVENTS_CHUNK_SIZE]
+            for x in range(0, len(events_and_contexts), PERSIST_EVENTS_CHUNK_SIZE)
         ]
 
         for chunk in chunks:
@@ -425,19 +444,19 @@ class EventsPersistenceStorage:
 
             # map room_id->list[event_ids] giving the new forward
             # extremities in each room
-            new_forward_extremeties = {}
+            new_forward_extremeties: Dict[str, Set[str]] = {}
 
             # map room_id->(type,state_key)->event_id tracking the full
             # state in each room after adding these events.
             # This is simply used to prefill the get_current_state_ids
             # cache
-            current_state_for_room = {}
+            current_state_for_room: Dict[str, StateMap[str]] = {}
 
             # map room_id->(to_delete, to_insert) where to_delete is a list
             # of type/state keys to remove from current state, and to_insert
             # is a map (type,key)->event_id giving the state delta in each
             # room
-            state_delta_for_room = {}
+            state_delta_for_room: Dict[str, DeltaState] = {}
 
             # Set of remote users which were in rooms the server has left. We
             # should check if we still share any rooms and if not we mark their
@@ -455,136 +474,162 @@ class EventsPersistenceStorage:
                             (event, context)
                         )
 
-                    for room_id, ev_ctx_rm in events_by_room.items():
-                        latest_event_ids = (
-                            await self.main_store.get_latest_event_ids_in_room(room_id)
-                        )
-                        new_latest_event_ids = await self._calculate_new_extremities(
-                            room_id, ev_ctx_rm, latest_event_ids
+                    for room_and_events in events_by_room.items():
+                        await self._calculate_state_and_extrem_for_room(
+                            room_and_events,
+                            new_forward_extremeties,
+                            current_state_for_room,
+                            state_delta_for_room,
+                            potentially_left_users,
                         )
 
-                        latest_event_ids = set(latest_event_ids)
-                        if new_latest_event_ids == latest_event_ids:
-                            # No change in extremities, so no change in state
-                            continue
+            with persist_stage_timer.labels("persist").time():
+                await self.persist_events_store._persist_events_and_state_updates(
+                    chunk,
+                    current_state_for_room=current_state_for_room,
+                    state_delta_for_room=state_delta_for_room,
+                    new_forward_extremeties=new_forward_extremeties,
+                    backfilled=backfilled,
+                )
+
+            with persist_stage_timer.labels("handle_left_users").time():
+                await self._handle_potentially_left_users(potentially_left_users)
 
-                        # there should always be at least one forward extremity.
-                        # (except during the initial persistence of the send_join
-                        # results, in which case there will be no existing
-                        # extremities, so we'll `continue` above and skip this bit.)
-                        assert new_latest_event_ids, "No forward extremities left!"
+        return replaced_events
 
-                        new_forward_extremeties[room_id] = new_latest_event_ids
+    async def _calculate_state_and_extrem_for_room(
+        self,
+        room_and_events: Tuple[str, List[Tuple[EventBase, EventContext]]],
+        new_forward_extremeties: Dict[str, Set[str]],
+        current_state_for_room: Dict[str, StateMap[str]],
+        state_delta_for_room: Dict[str, DeltaState],
+        potentially_left_users: Set[str],
+    ) -> None:
+        """Works out the new forward extremities and current state of a room
+        after persisting the given events.
 
-                        len_1 = (
-                            len(latest_event_ids) == 1
-                            and len(new_latest_event_ids) == 1
-                        )
-                        if len_1:
-                            all_single_prev_not_state = all(
-                                len(event.prev_event_ids()) == 1
-                                and not event.is_state()
-                                for event, ctx in ev_ctx_rm
-                            )
-                            # Don't bother calculating state if they're just
-                            # a long chain of single ancestor non-state events.
-                            if all_single_prev_not_state:
-                                continue
-
-                        state_delta_counter.inc()
-                        if len(new_latest_event_ids) == 1:
-                            state_delta_single_event_counter.inc()
-
-                            # This is a fairly handwavey check to see if we could
-                            # have guessed what the delta would have been when
-                            # processing one of these events.
-                            # What we're interested in is if the latest extremities
-                            # were the same when we created the event as they are
-                            # now. When this server creates a new event (as opposed
-                            # to receiving it over federation) it will use the
-                            # forward extremities as the prev_events, so we can
-                            # guess this by looking at the prev_events and checking
-                            # if they match the current forward extremities.
-                            for ev, _ in ev_ctx_rm:
-                                prev_event_ids = set(ev.prev_event_ids())
-                                if latest_event_ids == prev_event_ids:
-                                    state_delta_reuse_delta_counter.inc()
-                                    break
-
-                        logger.debug("Calculating state delta for room %s", room_id)
-                        with Measure(
-                            self._clock, "persist_events.get_new_state_after_events"
-                        ):
-                            res = await self._get_new_state_after_events(
-                                room_id,
-                                ev_ctx_rm,
-                                latest_event_ids,
-                                new_latest_event_ids,
-                            )
-                            current_state, delta_ids, new_latest_event_ids = res
-
-                            # there should always be at least one forward extremity.
-                            # (except during the initial persistence of the send_join
-                            # results, in which case there will be no existing
-                            # extremities, so we'll `continue` above and skip this bit.)
-                            assert new_latest_event_ids, "No forward extremities left!"
-
-                            new_forward_extremeties[room_id] = new_latest_event_ids
-
-                        # If either are not None then there has been a change,
-                        # and we need to work out the delta (or use that
-                        # given)
-                        delta = None
-                        if delta_ids is not None:
-                            # If there is a delta we know that we've
-                            # only added or replaced state, never
-                            # removed keys entirely.
-                            delta = DeltaState([], delta_ids)
-                        elif current_state is not None:
-                            with Measure(
-                                self._clock, "persist_events.calculate_state_delta"
-                            ):
-                                delta = await self._calculate_state_delta(
-                                    room_id, current_state
-                                )
-
-                        if delta:
-                            # If we have a change of state then lets check
-                            # whether we're actually still a member of the room,
-                            # or if our last user left. If we're no longer in
-                            # the room then we delete the current state and
-                            # extremities.
-                            is_still_joined = await self._is_server_still_joined(
-                                room_id,
-                                ev_ctx_rm,
-                                delta,
-                                current_state,
-                                potentially_left_users,
-                            )
-                            if not is_still_joined:
-                                logger.info("Server no longer in room %s", room_id)
-                                latest_event_ids = []
-                                current_state = {}
-                                delta.no_longer_in_room = True
-
-                            state_delta_for_room[room_id] = delta
-
-                        # If we have the current_state then lets prefill
-                        # the cache with it.
-                        if current_state is not None:
-                            current_state_for_room[room_id] = current_state
-
-            await self.persist_events_store._persist_events_and_state_updates(
-                chunk,
-                current_state_for_room=current_state_for_room,
-                state_delta_for_room=state_delta_for_room,
-                new_forward_extremeties=new_forward_extremeties,
-                backfilled=backfilled,
+        Args:
+            room_and_events: The room ID, and the events being persisted in it.
+            new_forward_extremeties: Updated with the room's new forward
+                extremities, if they've changed.
+            current_state_for_room: Updated with the room's new current state,
+                if it has been calculated.
+            state_delta_for_room: Updated with the change to the room's current
+                state, if any.
+            potentially_left_users: Updated with remote users who were in the
+                room, if the server has left it.
+        """
+        room_id, ev_ctx_rm = room_and_events
+
+        with persist_stage_timer.labels("calculate_extremities").time():
+            latest_event_ids = await self.main_store.get_latest_event_ids_in_room(
+                room_id
+            )
+            new_latest_event_ids = await self._calculate_new_extremities(
+                room_id, ev_ctx_rm, latest_event_ids
             )
 
-            await self._handle_potentially_left_users(potentially_left_users)
+        latest_event_ids = set(latest_event_ids)
+        if new_latest_event_ids == latest_event_ids:
+            # No change in extremities, so no change in state
+            return
 
-        return replaced_events
+        # there should always be at least one forward extremity.
+        # (except during the initial persistence of the send_join
+        # results, in which case there will be no existing
+        # extremities, so we'll `return` above and skip this bit.)
+        assert new_latest_event_ids, "No forward extremities left!"
+
+        new_forward_extremeties[room_id] = new_latest_event_ids
+
+        len_1 = len(latest_event_ids) == 1 and len(new_latest_event_ids) == 1
+        if len_1:
+            all_single_prev_not_state = all(
+                len(event.prev_event_ids()) == 1 and not event.is_state()
+                for event, ctx in ev_ctx_rm
+            )
+            # Don't bother calculating state if they're just
+            # a long chain of single ancestor non-state events.
+            if all_single_prev_not_state:
+                return
+
+        state_delta_counter.inc()
+        if len(new_latest_event_ids) == 1:
+            state_delta_single_event_counter.inc()
+
+            # This is a fairly handwavey check to see if we could
+            # have guessed what the delta would have been when
+            # processing one of these events.
+            # What we're interested in is if the latest extremities
+            # were the same when we created the event as they are
+            # now. When this server creates a new event (as opposed
+            # to receiving it over federation) it will use the
+            # forward extremities as the prev_events, so we can
+            # guess this by looking at the prev_events and checking
+            # if they match the current forward extremities.
+            for ev, _ in ev_ctx_rm:
+                prev_event_ids = set(ev.prev_event_ids())
+                if latest_event_ids == prev_event_ids:
+                    state_delta_reuse_delta_counter.inc()
+                    break
+
+        logger.debug("Calculating state delta for room %s", room_id)
+        with Measure(
+            self._clock, "persist_events.get_new_state_after_events"
+        ), persist_stage_timer.labels("calculate_state").time():
+            res = await self._get_new_state_after_events(
+                room_id,
+                ev_ctx_rm,
+                latest_event_ids,
+                new_latest_event_ids,
+            )
+            current_state, delta_ids, new_latest_event_ids = res
+
+            # there should always be at least one forward extremity.
+            # (except during the initial persistence of the send_join
+            # results, in which case there will be no existing
+            # extremities, so we'll `return` above and skip this bit.)
+            assert new_latest_event_ids, "No forward extremities left!"
+
+            new_forward_extremeties[room_id] = new_latest_event_ids
+
+        # If either are not None then there has been a change,
+        # and we need to work out the delta (or use that
+        # given)
+        delta = None
+        if delta_ids is not None:
+            # If there is a delta we know that we've
+            # only added or replaced state, never
+            # removed keys entirely.
+            delta = DeltaState([], delta_ids)
+        elif current_state is not None:
+            with Measure(self._clock, "persist_events.calculate_state_delta"):
+                delta = await self._calculate_state_delta(room_id, current_state)
+
+        if delta:
+            # If we have a change of state then lets check
+            # whether we're actually still a member of the room,
+            # or if our last user left. If we're no longer in
+            # the room then we delete the current state and
+            # extremities.
+            is_still_joined = await self._is_server_still_joined(
+                room_id,
+                ev_ctx_rm,
+                delta,
+                current_state,
+                potentially_left_users,
+            )
+            if not is_still_joined:
+                logger.info("Server no longer in room %s", room_id)
+                current_state = {}
+                delta.no_longer_in_room = True
+
+            state_delta_for_room[room_id] = delta
+
+        # If we have the current_state then lets prefill
+        # the cache with it.
+        if current_state is not None:
+            current_state_for_room[room_id] = current_state
 
     async def _calculate_new_extremities(
         self,
@@ -12,10 +12,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import contextlib
 import itertools
 import logging
-from typing import TYPE_CHECKING, Set
+from typing import TYPE_CHECKING, Iterator, Set
 
+from synapse.storage.database import TransactionLane
 from synapse.storage.databases import Databases
 
 if TYPE_CHECKING:
@@ -33,8 +35,9 @@ class PurgeEventsStorage:
     async def purge_room(self, room_id: str) -> None:
         """Deletes all record of a room"""
 
-        state_groups_to_delete = await self.stores.main.purge_room(room_id)
-        await self.stores.state.purge_room_state(room_id, state_groups_to_delete)
+        with self._bulk_transaction_lane():
+            state_groups_to_delete = await self.stores.main.purge_room(room_id)
+            await self.stores.state.purge_room_state(room_id, state_groups_to_delete)
 
     async def purge_history(
         self, room_id: str, token: str, delete_local_events: bool
@@ -51,15 +54,30 @@ class PurgeEventsStorage:
                 (instead of just marking them as outliers and deleting their
                 state groups).
         """
-        state_groups = await self.stores.main.purge_history(
-            room_id, token, delete_local_events
-        )
+        with self._bulk_transaction_lane():
+            state_groups = await self.stores.main.purge_history(
+                room_id, token, delete_local_events
+            )
+
+            logger.info("[purge] finding state groups that can be deleted")
 
-        logger.info("[purge] finding state groups that can be deleted")
+            sg_to_delete = await self._find_unreferenced_groups(state_groups)
 
-        sg_to_delete = await self._find_unreferenced_groups(state_groups)
+            await self.stores.state.purge_unreferenced_state_groups(
+                room_id, sg_to_delete
+            )
 
-        await self.stores.state.purge_unreferenced_state_groups(room_id, sg_to_delete)
+    @contextlib.contextmanager
+    def _bulk_transaction_lane(self) -> Iterator[None]:
+        """Run the purge's transactions in the bulk lane, so that they don't
+        delay client requests.
+        """
+        with contextlib.ExitStack() as stack:
+            for store in (self.stores.main, self.stores.state):
+                stack.enter_context(
+                    store.db_pool.transaction_lane(TransactionLane.BULK)
+                )
+            yield
 
     async def _find_unreferenced_groups(self, state_groups: Set[int]) -> Set[int]:
         """Used when purging history to figure out which state groups can be
@@ -0,0 +1,27 @@
+/* Copyright 2021 The Matrix.org Foundation C.I.C
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *    http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+-- Events which have been purged, and which search backends that keep their own
+-- index of room contents (e.g. the inverted index) need to remove. Rows are
+-- removed once the backend has recorded the deletion.
+CREATE TABLE IF NOT EXISTS search_index_deletions (
+    room_id TEXT NOT NULL,
+    -- The purged event, or NULL if the whole room was purged, in which case
+    -- all the events with stream orderings between min_stream_ordering and
+    -- max_stream_ordering (inclusive) were purged.
+    event_id TEXT,
+    min_stream_ordering BIGINT,
+    max_stream_ordering BIGINT
+);
@@ -0,0 +1,19 @@
+/* Copyright 2021 The Matrix.org Foundation C.I.C
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *    http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+-- Rewrite existing state groups into bounded-length delta chains, to reduce
+-- the size of state_groups_state and speed up state lookups.
+INSERT INTO background_updates (ordering, update_name, progress_json, depends_on) VALUES
+    (6201, 'state_group_chain_compression', '{}', 'state_groups_room_id_idx');
@@ -0,0 +1,239 @@
+# Copyright 2021 The Matrix.org Foundation C.I.C.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from typing import Collection, Dict, Iterable, List, Mapping, Optional, Tuple
+
+import attr
+
+from synapse.util.caches.lrucache import LruCache
+from synapse.util.caches.treecache import TreeCache
+
+
+@attr.s(slots=True, auto_attribs=True)
+class AuthChain:
+    """The part of a chain in the chain cover index that we have loaded.
+
+    All the events in the chain, and the links from the chain, with sequence
+    numbers up to and including `max_seq` are included. Chains which are too
+    big to be cached may instead only include the range of the chain that was
+    asked for.
+    """
+
+    # Map from sequence number to event ID.
+    events: Dict[int, str]
+
+    # The links from the chain as (origin sequence number, target chain ID,
+    # target sequence number).
+    links: List[Tuple[int, int, int]]
+
+    max_seq: int
+
+    def __len__(self) -> int:
+        return len(self.events) + len(self.links)
+
+    def extend(
+        self,
+        events: Iterable[Tuple[int, str]],
+        links: Iterable[Tuple[int, int, int]],
+        max_seq: int,
+    ) -> None:
+        """Add the given events and links to the end of the chain, in place.
+
+        Anything with a sequence number up to `self.max_seq` is ignored, as the
+        chain may have been extended by someone else in the meantime. Readers
+        of the chain only look at sequence numbers up to those they asked for,
+        so can't tell that it has been extended.
+        """
+        if max_seq <= self.max_seq:
+            return
+
+        self.events.update((seq, e_id) for seq, e_id in events if seq > self.max_seq)
+        self.links.extend(link for link in links if link[0] > self.max_seq)
+        self.max_seq = max_seq
+
+
+class AuthChainIndex:
+    """An in memory copy of parts of the chain cover index of rooms, i.e. the
+    `event_auth_chains` and `event_auth_chain_links` tables.
+
+    The chain ID and sequence number of an event never change once they have
+    been calculated, and new events and links only ever get added to the end
+    of a chain. So we can cache the start of a chain, and only need to load
+    more of it when we see an event with a higher sequence number.
+
+    Chains which would take up too much of the cache aren't cached at all, and
+    only the part of them which is needed gets loaded each time.
+
+    The entries are keyed by room, so that they can be invalidated when a room
+    is purged.
+    """
+
+    def __init__(self, max_size: int):
+        # Map from (room ID, event ID) to the event's chain ID and sequence
+        # number.
+        self._positions: LruCache[tuple, Tuple[int, int]] = LruCache(
+            max_size, "auth_chain_index_positions", cache_type=TreeCache
+        )
+
+        # Map from (room ID, chain ID) to the chain and its size when it was
+        # added. The chains get extended in place, so we record the size
+        # rather than the cache calling `len` on them when they are removed.
+        self._chains: LruCache[tuple, Tuple[AuthChain, int]] = LruCache(
+            max_size,
+            "auth_chain_index_chains",
+            cache_type=TreeCache,
+            size_callback=lambda entry: entry[1],
+        )
+
+        # Chains bigger than this would push most other chains out of the
+        # cache, so we don't cache them.
+        self._max_chain_size = max_size // 10
+
+        # The rooms which we've recently used the index for.
+        self._rooms: LruCache[str, bool] = LruCache(
+            max_size // 100, "auth_chain_index_rooms"
+        )
+
+    def get_positions(
+        self, room_id: str, event_ids: Iterable[str]
+    ) -> Dict[str, Tuple[int, int]]:
+        """Get the chain ID and sequence number of the given events, if known."""
+        positions = {}
+        for event_id in event_ids:
+            position = self._positions.get((room_id, event_id))
+            if position is not None:
+                positions[event_id] = position
+        return positions
+
+    def add_positions(
+        self, room_id: str, positions: Mapping[str, Tuple[int, int]]
+    ) -> None:
+        for event_id, position in positions.items():
+            self._positions.set((room_id, event_id), position)
+
+    def get_chains(
+        self,
+        room_id: str,
+        max_seqs: Mapping[int, int],
+        from_seqs: Optional[Mapping[int, int]] = None,
+    ) -> Tuple[Dict[int, AuthChain], Dict[int, Tuple[Optional[AuthChain], int]]]:
+        """Get the given chains, if we have loaded them at least up to the
+        given sequence numbers.
+
+        Args:
+            room_id: The room the chains are in.
+            max_seqs: Map from chain ID to the sequence number we need the chain
+                up to.
+            from_seqs: Map from chain ID to the sequence number after which we
+                need the chain, if we don't need all of it.
+
+        Returns:
+            A tuple of the chains which we have loaded enough of, and the chains
+            which need more loading from the database. The latter are given as
+            what we've got of them so far, if anything, and the sequence number
+            to load them from.
+        """
+        if from_seqs is None:
+            from_seqs = {}
+
+        chains = {}
+        to_load: Dict[int, Tuple[Optional[AuthChain], int]] = {}
+        for chain_id, max_seq in max_seqs.items():
+            entry = self._chains.get((room_id, chain_id))
+            chain = entry[0] if entry else None
+            if chain is not None and chain.max_seq >= max_seq:
+                chains[chain_id] = chain
+            elif max_seq > self._max_chain_size:
+                # Sequence numbers start at one and go up by one for each event,
+                # so we wouldn't cache the chain. We just load what we need.
+                to_load[chain_id] = (None, from_seqs.get(chain_id, 0))
+            elif chain is not None:
+                to_load[chain_id] = (chain, chain.max_seq)
+            else:
+                to_load[chain_id] = (None, 0)
+        return chains, to_load
+
+    def add_chains(
+        self,
+        room_id: str,
+        to_load: Mapping[int, Tuple[Optional[AuthChain], int]],
+        loaded: Mapping[
+            int, Tuple[int, Collection[Tuple[int, str]], List[Tuple[int, int, int]]]
+        ],
+    ) -> Dict[int, AuthChain]:
+        """Add the rows loaded from the database to the chains.
+
+        Args:
+            room_id: The room the chains are in.
+            to_load: The chains which were loaded, as returned by `get_chains`.
+            loaded: Map from chain ID to the sequence number the chain was
+                loaded up to, the (sequence number, event ID) of the new events
+                and the new links.
+
+        Returns:
+            The updated chains.
+        """
+        chains = {}
+        for chain_id, (max_seq, events, links) in loaded.items():
+            chain, from_seq = to_load[chain_id]
+            if chain is not None:
+                chain.extend(events, links, max_seq)
+                chains[chain_id] = chain
+            else:
+                chain = AuthChain(events=dict(events), links=links, max_seq=max_seq)
+                chains[chain_id] = chain
+                if from_seq > 0:
+                    # We only loaded part of the chain, so can't cache it.
+                    continue
+
+            key = (room_id, chain_id)
+            if len(chain) > self._max_chain_size:
+                self._chains.pop(key, None)
+                continue
+
+            # The chain may have been loaded further by someone else while we
+            # were loading it.
+            current = self._chains.get(key)
+            if (
+                current is None
+                or current[0] is chain
+                or current[0].max_seq < chain.max_seq
+            ):
+                self._chains.set(key, (chain, len(chain)))
+
+        return chains
+
+    def mark_room_in_use(self, room_id: str) -> None:
+        self._rooms.set(room_id, True)
+
+    def is_room_in_use(self, room_id: str) -> bool:
+        """Whether we have recently used the index for the room, and so should
+        keep it up to date as new events arrive.
+        """
+        return self._rooms.get(room_id, False)
+
+    def invalidate(self, key: Tuple[str]) -> None:
+        """Remove everything we know about the given room, which should be
+        given as a 1-tuple for compatibility with the cache invalidation
+        replication stream.
+        """
+        (room_id,) = key
+        self._positions.del_multi((room_id,))
+        self._chains.del_multi((room_id,))
+        self._rooms.pop(room_id, None)
+
+    def invalidate_all(self) -> None:
+        self._positions.clear()
+        self._chains.clear()
+        self._rooms.clear()
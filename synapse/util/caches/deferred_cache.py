@@ -314,6 +314,23 @@ class DeferredCache(Generic[KT, VT]):
             for entry in iterate_tree_cache_entry(entry):
                 entry.invalidate()
 
+    def invalidate_many(self, keys: Iterable[KT]) -> None:
+        """Delete many keys, or trees of entries, in a single pass.
+
+        This is equivalent to calling `invalidate` for each key, but only takes
+        the underlying cache's lock once, which matters when invalidating large
+        batches of keys received over replication.
+        """
+        self.check_thread()
+        keys = list(keys)
+        self.cache.del_multi_many(keys)
+
+        for key in keys:
+            entry = self._pending_deferred_cache.pop(key, None)
+            if entry:
+                for entry in iterate_tree_cache_entry(entry):
+                    entry.invalidate()
+
     def invalidate_all(self):
         self.check_thread()
         self.cache.clear()
@@ -47,6 +47,7 @@ F = TypeVar("F", bound=Callable[..., Any])
 
 class _CachedFunction(Generic[F]):
     invalidate: Any = None
+    invalidate_many: Any = None
     invalidate_all: Any = None
     prefill: Any = None
     cache: Any = None
@@ -308,9 +309,13 @@ class DeferredCacheDescriptor(_CacheDescriptorBase):
         if self.num_args == 1:
             assert not self.tree
             wrapped.invalidate = lambda key: cache.invalidate(key[0])
+            wrapped.invalidate_many = lambda keys: cache.invalidate_many(
+                key[0] for key in keys
+            )
             wrapped.prefill = lambda key, val: cache.prefill(key[0], val)
         else:
             wrapped.invalidate = cache.invalidate
+            wrapped.invalidate_many = cache.invalidate_many
             wrapped.prefill = cache.prefill
 
         wrapped.invalidate_all = cache.invalidate_all
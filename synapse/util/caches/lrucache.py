@@ -201,6 +201,7 @@ class _Node:
         cache: "weakref.ReferenceType[LruCache]",
         clock: Clock,
         callbacks: Collection[Callable[[], None]] = (),
+        track_memory: bool = False,
     ):
         self._list_node = ListNode.insert_after(self, root)
         self._global_list_node = None
@@ -230,19 +231,25 @@ class _Node:
         self.add_callbacks(callbacks)
 
         self.memory = 0
-        if caches.TRACK_MEMORY_USAGE:
-            self.memory = (
-                _get_size_of(key)
-                + _get_size_of(value)
-                + _get_size_of(self._list_node, recurse=False)
-                + _get_size_of(self.callbacks, recurse=False)
-                + _get_size_of(self, recurse=False)
-            )
-            self.memory += _get_size_of(self.memory, recurse=False)
+        if caches.TRACK_MEMORY_USAGE or track_memory:
+            self.memory = self.estimate_memory()
+
+    def estimate_memory(self) -> int:
+        """Estimate the size in bytes of this node, including its key and value."""
+        memory = (
+            _get_size_of(self.key)
+            + _get_size_of(self.value)
+            + _get_size_of(self._list_node, recurse=False)
+            + _get_size_of(self.callbacks, recurse=False)
+            + _get_size_of(self, recurse=False)
+        )
+        memory += _get_size_of(memory, recurse=False)
+
+        if self._global_list_node:
+            memory += _get_size_of(self._global_list_node, recurse=False)
+            memory += _get_size_of(self._global_list_node.last_access_ts_secs)
 
-            if self._global_list_node:
-                self.memory += _get_size_of(self._global_list_node, recurse=False)
-                self.memory += _get_size_of(self._global_list_node.last_access_ts_secs)
+        return memory
 
     def add_callbacks(self, callbacks: Collection[Callable[[], None]]) -> None:
         """Add to stored list of callbacks, removing duplicates."""
@@ -313,6 +320,7 @@ class LruCache(Generic[KT, VT]):
         metrics_collection_callback: Optional[Callable[[], None]] = None,
         apply_cache_factor_from_config: bool = True,
         clock: Optional[Clock] = None,
+        max_size_bytes: Optional[int] = None,
     ):
         """
         Args:
@@ -337,6 +345,13 @@ class LruCache(Generic[KT, VT]):
 
             apply_cache_factor_from_config (bool): If true, `max_size` will be
                 multiplied by a cache factor derived from the homeserver config
+
+            max_size_bytes: If set, the maximum estimated size in bytes of the
+                cache's contents. Entries are evicted once either this or
+                `max_size` is exceeded. Defaults to the limit configured for
+                `cache_name` in `caches.per_cache_max_memory`, if any. Sizes are
+                estimated with pympler; if it is not installed every entry is
+                reported as zero bytes, so this limit has no effect.
         """
         # Default `clock` to something sensible. Note that we rename it to
         # `real_clock` so that mypy doesn't think its still `Optional`.
@@ -359,6 +374,10 @@ class LruCache(Generic[KT, VT]):
         else:
             self.max_size = int(max_size)
 
+        if max_size_bytes is None and cache_name is not None:
+            max_size_bytes = cache_config.get_cache_max_memory(cache_name)
+        self.max_size_bytes = max_size_bytes
+
         # register_cache might call our "set_cache_factor" callback; there's nothing to
         # do yet when we get resized.
         self._on_resize: Optional[Callable[[], None]] = None
@@ -384,8 +403,17 @@ class LruCache(Generic[KT, VT]):
 
         lock = threading.Lock()
 
+        # The estimated size in bytes of the cache's contents. Only tracked if
+        # the cache is bounded by memory usage.
+        track_memory = max_size_bytes is not None
+        cached_cache_bytes = [0]
+        memory_limit = max_size_bytes if max_size_bytes is not None else 0
+
+        def over_memory_limit() -> bool:
+            return track_memory and cached_cache_bytes[0] > memory_limit
+
         def evict():
-            while cache_len() > self.max_size:
+            while cache_len() > self.max_size or over_memory_limit():
                 # Get the last node in the list (i.e. the oldest node).
                 todelete = list_root.prev_node
 
@@ -426,12 +454,23 @@ class LruCache(Generic[KT, VT]):
         self.len = synchronized(cache_len)
 
         def add_node(key, value, callbacks: Collection[Callable[[], None]] = ()):
-            node = _Node(list_root, key, value, weak_ref_to_self, real_clock, callbacks)
+            node = _Node(
+                list_root,
+                key,
+                value,
+                weak_ref_to_self,
+                real_clock,
+                callbacks,
+                track_memory=track_memory,
+            )
             cache[key] = node
 
             if size_callback:
                 cached_cache_len[0] += size_callback(node.value)
 
+            if track_memory:
+                cached_cache_bytes[0] += node.memory
+
             if caches.TRACK_MEMORY_USAGE and metrics:
                 metrics.inc_memory_usage(node.memory)
 
@@ -446,6 +485,9 @@ class LruCache(Generic[KT, VT]):
                 deleted_len = size_callback(node.value)
                 cached_cache_len[0] -= deleted_len
 
+            if track_memory:
+                cached_cache_bytes[0] -= node.memory
+
             node.run_and_clear_callbacks()
 
             if caches.TRACK_MEMORY_USAGE and metrics:
@@ -512,6 +554,15 @@ class LruCache(Generic[KT, VT]):
 
                 move_node_to_front(node)
                 node.value = value
+
+                if track_memory:
+                    # The new value may be a different size to the old one.
+                    new_memory = node.estimate_memory()
+                    cached_cache_bytes[0] += new_memory - node.memory
+                    if caches.TRACK_MEMORY_USAGE and metrics:
+                        metrics.dec_memory_usage(node.memory)
+                        metrics.inc_memory_usage(new_memory)
+                    node.memory = new_memory
             else:
                 add_node(key, value, set(callbacks))
 
@@ -564,6 +615,20 @@ class LruCache(Generic[KT, VT]):
             for leaf in iterate_tree_cache_entry(popped):
                 delete_node(leaf)
 
+        @synchronized
+        def cache_del_multi_many(keys: Iterable[KT]) -> None:
+            """Delete many entries, or trees of entries, while holding the lock
+            only once.
+
+            Each key is interpreted as for `del_multi`.
+            """
+            for key in keys:
+                popped = cache.pop(key, None)
+                if popped is None:
+                    continue
+                for leaf in iterate_tree_cache_entry(popped):
+                    delete_node(leaf)
+
         @synchronized
         def cache_clear() -> None:
             for node in cache.values():
@@ -576,6 +641,7 @@ class LruCache(Generic[KT, VT]):
             cache.clear()
             if size_callback:
                 cached_cache_len[0] = 0
+            cached_cache_bytes[0] = 0
 
             if caches.TRACK_MEMORY_USAGE and metrics:
                 metrics.clear_memory_usage()
@@ -597,6 +663,8 @@ class LruCache(Generic[KT, VT]):
         # `invalidate` is exposed for consistency with DeferredCache, so that it can be
         # invalidated by the cache invalidation replication stream.
         self.invalidate = cache_del_multi
+        self.del_multi_many = cache_del_multi_many
+        self.invalidate_many = cache_del_multi_many
         self.len = synchronized(cache_len)
         self.contains = cache_contains
         self.clear = cache_clear
@@ -12,6 +12,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from unittest.mock import patch
+
 from synapse.config._base import Config, RootConfig
 from synapse.config.cache import CacheConfig, add_resizable_cache
 from synapse.util.caches.lrucache import LruCache
@@ -168,3 +170,19 @@ class CacheConfigTests(TestCase):
         add_resizable_cache("event_cache", cache_resize_callback=cache.set_cache_factor)
 
         self.assertEqual(cache.max_size, 10240)
+
+    @patch("synapse.config.cache.check_requirements")
+    def test_cache_max_memory_from_config(self, check_requirements):
+        """Caches named in per_cache_max_memory are bounded by memory usage."""
+        config = {"caches": {"per_cache_max_memory": {"*getEvent*": "512M"}}}
+        t = TestConfig()
+        t.read_config(config, config_dir_path="", data_dir_path="")
+
+        check_requirements.assert_called_once_with("cache_memory")
+        self.assertEqual(t.caches.cache_max_memory, {"getevent": 512 * 1024 * 1024})
+
+        cache = LruCache(100, "*getEvent*")
+        self.assertEqual(cache.max_size_bytes, 512 * 1024 * 1024)
+
+        other_cache = LruCache(100, "other_cache")
+        self.assertIsNone(other_cache.max_size_bytes)
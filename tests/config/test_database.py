@@ -14,7 +14,8 @@
 
 import yaml
 
-from synapse.config.database import DatabaseConfig
+from synapse.config import ConfigError
+from synapse.config.database import DatabaseConfig, DatabaseConnectionConfig
 
 from tests import unittest
 
@@ -31,3 +32,45 @@ class DatabaseConfigTestCase(unittest.TestCase):
         }
 
         self.assertEqual(conf["database"], expected_database_conf)
+
+    def test_replicas(self):
+        """Replicas inherit the primary's connection args."""
+        db_config = DatabaseConnectionConfig(
+            "master",
+            {
+                "name": "psycopg2",
+                "txn_limit": 100,
+                "args": {"database": "synapse", "host": "primary", "cp_max": 10},
+                "replicas": [{"args": {"host": "replica1"}}, {}],
+            },
+        )
+
+        self.assertEqual(len(db_config.replicas), 2)
+        self.assertEqual(
+            db_config.replicas[0].config["args"],
+            {"database": "synapse", "host": "replica1", "cp_max": 10},
+        )
+        self.assertEqual(db_config.replicas[0].config["txn_limit"], 100)
+        self.assertEqual(db_config.replicas[1].config["args"]["host"], "primary")
+        self.assertEqual(db_config.replicas[1].databases, ["main", "state"])
+
+    def test_replicas_require_postgres(self):
+        with self.assertRaises(ConfigError):
+            DatabaseConnectionConfig(
+                "master", {"name": "sqlite3", "replicas": [{"args": {}}]}
+            )
+
+    def test_upsert_flush_interval_must_be_int(self):
+        for value in ("500", -1, 0.5, True):
+            with self.assertRaises(ConfigError):
+                DatabaseConnectionConfig(
+                    "master", {"name": "sqlite3", "upsert_flush_interval_ms": value}
+                )
+
+    def test_max_concurrent_background_updates_must_be_int(self):
+        for value in ("2", 0, 1.5, None):
+            with self.assertRaises(ConfigError):
+                DatabaseConnectionConfig(
+                    "master",
+                    {"name": "sqlite3", "max_concurrent_background_updates": value},
+                )
@@ -13,7 +13,7 @@
 # limitations under the License.
 import time
 from typing import Dict, List
-from unittest.mock import Mock
+from unittest.mock import Mock, patch
 
 import attr
 import canonicaljson
@@ -25,16 +25,20 @@ from signedjson.key import encode_verify_key_base64, get_verify_key
 from twisted.internet.defer import Deferred, ensureDeferred
 
 from synapse.api.errors import SynapseError
+from synapse.api.room_versions import EventFormatVersions, RoomVersions
 from synapse.crypto import keyring
+from synapse.crypto.event_signing import compute_event_signature
 from synapse.crypto.keyring import (
     PerspectivesKeyFetcher,
     ServerKeyFetcher,
     StoreKeyFetcher,
 )
+from synapse.events import make_event_from_dict
 from synapse.logging.context import (
     LoggingContext,
     current_context,
     make_deferred_yieldable,
+    run_in_background,
 )
 from synapse.storage.keys import FetchKeyResult
 
@@ -336,6 +340,90 @@ class KeyringTestCase(unittest.HomeserverTestCase):
         mock_fetcher1.get_keys.assert_called_once()
         mock_fetcher2.get_keys.assert_called_once()
 
+    def _make_event(self, room_version, key, body, server_name="server1"):
+        event_dict = {
+            "room_id": "!room:server1",
+            "type": "m.room.message",
+            "sender": "@user:%s" % (server_name,),
+            "content": {"body": body},
+            "prev_events": [],
+            "auth_events": [],
+            "depth": 1,
+            "origin_server_ts": 1000,
+        }
+        if room_version.event_format == EventFormatVersions.V1:
+            event_dict["event_id"] = "$%s:%s" % (body, server_name)
+        event_dict["signatures"] = compute_event_signature(
+            room_version, event_dict, server_name, key
+        )
+        return make_event_from_dict(event_dict, room_version)
+
+    def test_verify_events_in_batches(self):
+        """Signatures which are checked at the same time get verified together
+        on a thread.
+        """
+        key1 = signedjson.key.generate_signing_key(1)
+        other_key = signedjson.key.generate_signing_key(1)
+        mock_fetcher = Mock()
+        mock_fetcher.get_keys = Mock(
+            return_value=make_awaitable(
+                {get_key_id(key1): FetchKeyResult(get_verify_key(key1), 2000)}
+            )
+        )
+        kr = keyring.Keyring(self.hs, key_fetchers=(mock_fetcher,))
+
+        events = [
+            self._make_event(RoomVersions.V6, key1, "event%d" % (i,)) for i in range(20)
+        ]
+        # One of the events is signed with the wrong key.
+        events.append(self._make_event(RoomVersions.V6, other_key, "bad"))
+
+        with patch.object(
+            keyring, "defer_to_thread", wraps=keyring.defer_to_thread
+        ) as defer_to_thread:
+            results = [
+                run_in_background(kr.verify_event_for_server, "server1", event, 1000)
+                for event in events
+            ]
+            for d in results[:-1]:
+                self.get_success(d)
+            e = self.get_failure(results[-1], SynapseError).value
+            self.assertEqual(e.code, 401)
+
+        defer_to_thread.assert_called_once()
+        mock_fetcher.get_keys.assert_called_once()
+
+    def test_verified_events_are_cached(self):
+        """We remember which events we've verified the signatures of, as long as
+        their event IDs are hashes of the event.
+        """
+        key1 = signedjson.key.generate_signing_key(1)
+        mock_fetcher = Mock()
+        mock_fetcher.get_keys = Mock(
+            side_effect=lambda *args: make_awaitable(
+                {get_key_id(key1): FetchKeyResult(get_verify_key(key1), 2000)}
+            )
+        )
+        kr = keyring.Keyring(self.hs, key_fetchers=(mock_fetcher,))
+
+        event = self._make_event(RoomVersions.V6, key1, "event")
+        self.get_success(kr.verify_event_for_server("server1", event, 1000))
+        self.get_success(kr.verify_event_for_server("server1", event, 1000))
+        self.assertEqual(mock_fetcher.get_keys.call_count, 1)
+
+        # The key isn't valid late enough for this request.
+        self.get_failure(
+            kr.verify_event_for_server("server1", event, 3000), SynapseError
+        )
+        self.assertEqual(mock_fetcher.get_keys.call_count, 2)
+
+        # Event IDs in the original event format aren't hashes, so the result
+        # can't be cached.
+        event = self._make_event(RoomVersions.V1, key1, "event")
+        self.get_success(kr.verify_event_for_server("server1", event, 1000))
+        self.get_success(kr.verify_event_for_server("server1", event, 1000))
+        self.assertEqual(mock_fetcher.get_keys.call_count, 4)
+
 
 @logcontext_clean
 class ServerKeyFetcherTestCase(unittest.HomeserverTestCase):
@@ -42,7 +42,7 @@ class FederationCatchUpTestCases(FederatingHomeserverTestCase):
             self.record_transaction
         )
 
-    async def record_transaction(self, txn, json_cb):
+    async def record_transaction(self, txn, json_cb, json_bytes_callback=None):
         if self.is_online:
             data = json_cb()
             self.pdus.extend(data["pdus"])
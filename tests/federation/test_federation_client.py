@@ -0,0 +1,132 @@
+# Copyright 2021 The Matrix.org Foundation C.I.C.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+from unittest.mock import Mock, patch
+
+from synapse.api.errors import SynapseError
+from synapse.api.room_versions import RoomVersions
+from synapse.events import make_event_from_dict
+from synapse.federation.transport.client import SendJoinParser
+
+from tests import unittest
+from tests.test_utils import make_awaitable
+
+
+class SendJoinTestCase(unittest.HomeserverTestCase):
+    def prepare(self, reactor, clock, hs):
+        self.client = hs.get_federation_client()
+
+        # Skip checking the signatures and hashes of the events.
+        self.client._check_sigs_and_hash_and_fetch = Mock(
+            side_effect=lambda origin, pdus, room_version, outlier: make_awaitable(
+                list(pdus)
+            )
+        )
+
+        self.create = self._make_event("m.room.create", "", 1, {"room_version": "6"})
+        self.member = self._make_event("m.room.member", "@user:remote", 2)
+        self.topic = self._make_event("m.room.topic", "", 3)
+        self.join = make_event_from_dict(
+            self._make_event("m.room.member", "@user:test", 4), RoomVersions.V6
+        )
+
+    def _make_event(self, event_type, state_key, depth, content=None):
+        return {
+            "room_id": "!room:remote",
+            "type": event_type,
+            "state_key": state_key,
+            "sender": "@user:remote",
+            "content": content or {},
+            "prev_events": [],
+            "auth_events": [],
+            "depth": depth,
+            "origin_server_ts": depth,
+            "hashes": {"sha256": "aaa"},
+            "signatures": {},
+        }
+
+    def _send_join(self, response):
+        """Sends a join, to which the given response is received.
+
+        Returns:
+            A deferred which resolves to the result of the join, and a list of
+            the chunks of events passed on by `send_join`.
+        """
+
+        async def send_join_v2(room_version, destination, room_id, event_id, content):
+            parser = SendJoinParser(room_version, v1_api=False)
+            parser.write(json.dumps(response).encode("utf-8"))
+            return parser.finish()
+
+        self.client.transport_layer.send_join_v2 = Mock(side_effect=send_join_v2)
+
+        chunks = []
+
+        async def on_events(origin, events):
+            self.assertEqual(origin, "remote")
+            chunks.append([e.type for e in events])
+
+        d = self.client.send_join(["remote"], self.join, RoomVersions.V6, on_events)
+        return d, chunks
+
+    def test_send_join(self):
+        """The auth chain and then the state are passed on a chunk at a time,
+        each event only once.
+        """
+        d, chunks = self._send_join(
+            {
+                "state": [self.create, self.member, self.topic],
+                "auth_chain": [self.member, self.create],
+            }
+        )
+        with patch("synapse.federation.federation_client.SEND_JOIN_CHUNK_SIZE", 2):
+            result = self.get_success(d)
+
+        self.assertEqual(
+            chunks,
+            [["m.room.member", "m.room.create"], ["m.room.topic"]],
+        )
+        self.assertEqual(result.origin, "remote")
+        self.assertIs(result.event, self.join)
+        self.assertEqual(
+            result.state,
+            {
+                ("m.room.create", ""): make_event_from_dict(
+                    self.create, RoomVersions.V6
+                ).event_id,
+                ("m.room.member", "@user:remote"): make_event_from_dict(
+                    self.member, RoomVersions.V6
+                ).event_id,
+                ("m.room.topic", ""): make_event_from_dict(
+                    self.topic, RoomVersions.V6
+                ).event_id,
+            },
+        )
+
+    def test_send_join_wrong_room_version(self):
+        """We don't pass on a create event with the wrong room version."""
+        self.create["content"]["room_version"] = "5"
+        d, chunks = self._send_join(
+            {"state": [self.create, self.member], "auth_chain": [self.create]}
+        )
+        self.get_failure(d, SynapseError)
+        self.assertEqual(chunks, [])
+
+    def test_send_join_no_create_event_in_state(self):
+        """The state must include the create event."""
+        d, chunks = self._send_join(
+            {"state": [self.member], "auth_chain": [self.create, self.member]}
+        )
+        self.get_failure(d, SynapseError)
@@ -14,12 +14,15 @@
 from typing import Optional
 from unittest.mock import Mock
 
+from canonicaljson import encode_canonical_json
 from signedjson import key, sign
 from signedjson.types import BaseKey, SigningKey
 
 from twisted.internet import defer
 
 from synapse.api.constants import RoomEncryptionAlgorithms
+from synapse.events import make_event_from_dict
+from synapse.federation.units import Edu
 from synapse.rest import admin
 from synapse.rest.client.v1 import login
 from synapse.types import JsonDict, ReadReceipt
@@ -154,6 +157,52 @@ class FederationSenderReceiptsTestCases(HomeserverTestCase):
         )
 
 
+class TransactionManagerTestCase(HomeserverTestCase):
+    def make_homeserver(self, reactor, clock):
+        return self.setup_test_homeserver(
+            federation_transport_client=Mock(spec=["send_transaction"]),
+        )
+
+    @override_config({"send_federation": True})
+    def test_encode_transaction(self):
+        """The pre-encoded transaction body matches the encoding of the
+        transaction dict, and PDU encodings are shared between destinations.
+        """
+        mock_send_transaction = (
+            self.hs.get_federation_transport_client().send_transaction
+        )
+        mock_send_transaction.side_effect = lambda *args, **kwargs: make_awaitable({})
+
+        transaction_manager = self.hs.get_federation_sender()._transaction_manager
+        pdus = [
+            make_event_from_dict(
+                {
+                    "event_id": "$event%d" % (i,),
+                    "room_id": "!room:test",
+                    "sender": "@user:test",
+                    "type": "m.room.message",
+                    "content": {"body": "héllo %d" % (i,)},
+                    "unsigned": {"age_ts": 1000},
+                }
+            )
+            for i in range(2)
+        ]
+        edus = [Edu(origin="test", destination="", edu_type="m.test", content={})]
+
+        for destination in ("host2", "host3"):
+            self.get_success(
+                transaction_manager.send_new_transaction(destination, pdus, edus)
+            )
+
+            json_cb = mock_send_transaction.call_args[0][1]
+            json_bytes_cb = mock_send_transaction.call_args[1]["json_bytes_callback"]
+            self.assertEqual(json_bytes_cb(), encode_canonical_json(json_cb()))
+
+        cache = transaction_manager._pdu_json_cache
+        self.assertEqual(len(cache), 2)
+        self.assertIs(cache.get("$event0")[0], pdus[0])
+
+
 class FederationSenderDevicesTestCases(HomeserverTestCase):
     servlets = [
         admin.register_servlets,
@@ -186,7 +235,7 @@ class FederationSenderDevicesTestCases(HomeserverTestCase):
             self.record_transaction
         )
 
-    def record_transaction(self, txn, json_cb):
+    def record_transaction(self, txn, json_cb, json_bytes_callback=None):
         data = json_cb()
         self.edus.extend(data["edus"])
         return defer.succeed({})
@@ -16,12 +16,19 @@ import logging
 
 from parameterized import parameterized
 
+from twisted.internet import defer
+
 from synapse.events import make_event_from_dict
-from synapse.federation.federation_server import server_matches_acl_event
+from synapse.federation.federation_server import (
+    room_backlog_gauge,
+    server_matches_acl_event,
+)
+from synapse.logging.context import make_deferred_yieldable
 from synapse.rest import admin
 from synapse.rest.client.v1 import login, room
 
 from tests import unittest
+from tests.unittest import override_config
 
 
 class FederationServerTests(unittest.FederatingHomeserverTestCase):
@@ -54,6 +61,156 @@ class FederationServerTests(unittest.FederatingHomeserverTestCase):
         self.assertEqual(channel.json_body["errcode"], "M_NOT_JSON")
 
 
+class StagedEventsTestCase(unittest.HomeserverTestCase):
+    """Tests processing the events in the inbound federation staging area."""
+
+    servlets = [
+        admin.register_servlets,
+        room.register_servlets,
+        login.register_servlets,
+    ]
+
+    def prepare(self, reactor, clock, hs):
+        self.store = hs.get_datastore()
+        self.federation_server = hs.get_federation_server()
+
+        # Record the events which get processed, letting the test decide when
+        # each of them finishes.
+        self.processed = []
+        self.finish_processing = {}
+
+        async def on_receive_pdu(origin, pdu, sent_to_us_directly):
+            self.processed.append(pdu.content["body"])
+            d = self.finish_processing[pdu.content["body"]] = defer.Deferred()
+            await make_deferred_yieldable(d)
+
+        self.federation_server.handler.on_receive_pdu = on_receive_pdu
+
+        user_id = self.register_user("user", "pass")
+        self.token = self.login("user", "pass")
+        self.room_ids = [
+            self.helper.create_room_as(user_id, tok=self.token) for _ in range(2)
+        ]
+
+    def _stage_event(self, room_id, body):
+        room_version = self.get_success(self.store.get_room_version(room_id))
+        event = make_event_from_dict(
+            {
+                "room_id": room_id,
+                "type": "m.room.message",
+                "sender": "@user:other.example.com",
+                "content": {"body": body},
+                "prev_events": [],
+                "auth_events": [],
+                "depth": 1,
+                "origin_server_ts": self.clock.time_msec(),
+            },
+            room_version,
+        )
+        self.get_success(
+            self.store.insert_received_event_to_staging("other.example.com", event)
+        )
+        self.reactor.advance(0.01)
+
+    def _finish(self, body):
+        self.finish_processing.pop(body).callback(None)
+        self.pump(0.1)
+
+    def _staged_event_counts(self):
+        counts, _ = self.get_success(
+            self.store.get_staged_event_counts_by_room("", 1000)
+        )
+        return counts
+
+    @override_config({"federation_inbound_concurrency": 1})
+    def test_rooms_take_turns(self):
+        """Rooms with lots of events staged don't hold up other rooms."""
+        room_a, room_b = self.room_ids
+        self._stage_event(room_a, "a1")
+        self._stage_event(room_a, "a2")
+        self._stage_event(room_a, "a3")
+        self._stage_event(room_b, "b1")
+
+        self.federation_server._dispatch_staged_events()
+        self.pump(1)
+
+        # Only one event gets processed at a time.
+        self.assertEqual(len(self.processed), 1)
+
+        for body in list(self.processed):
+            self._finish(body)
+        while self.finish_processing:
+            self._finish(self.processed[-1])
+
+        # Both rooms were being processed at once, so the room with one event
+        # didn't have to wait for all of the other room's events.
+        self.assertLess(self.processed.index("b1"), self.processed.index("a3"))
+        self.assertCountEqual(self.processed, ["a1", "a2", "a3", "b1"])
+        self.assertEqual(self._staged_event_counts(), {})
+        self.assertEqual(self.federation_server._rooms_processing_staged_events, set())
+
+    def test_started_without_transaction(self):
+        """Staged events get processed even if we don't receive any
+        transactions, e.g. after a restart.
+        """
+        room_a, _ = self.room_ids
+        self._stage_event(room_a, "a1")
+
+        self.reactor.advance(61)
+        self.assertEqual(self.processed, ["a1"])
+
+    def test_staged_event_counts_paginate(self):
+        """The staging area is looked at a bit at a time."""
+        room_a, room_b = sorted(self.room_ids)
+        for i in range(3):
+            self._stage_event(room_a, "a%d" % (i,))
+        self._stage_event(room_b, "b0")
+
+        # The last room is left for next time, unless it's the only room.
+        counts, next_room_id = self.get_success(
+            self.store.get_staged_event_counts_by_room("", 2)
+        )
+        self.assertEqual((counts, next_room_id), ({room_a: 2}, room_a))
+
+        counts, next_room_id = self.get_success(
+            self.store.get_staged_event_counts_by_room("", 4)
+        )
+        self.assertEqual((counts, next_room_id), ({room_a: 3}, room_a))
+
+        counts, next_room_id = self.get_success(
+            self.store.get_staged_event_counts_by_room(room_a, 4)
+        )
+        self.assertEqual((counts, next_room_id), ({room_b: 1}, None))
+
+    @override_config({"federation_inbound_instances": ["master", "other_worker"]})
+    def test_sharded(self):
+        """Only the rooms assigned to this instance get processed."""
+        shard_config = self.hs.config.worker.federation_inbound_shard_config
+
+        # Make sure we have rooms assigned to both instances.
+        rooms_by_instance = {"master": [], "other_worker": []}
+        while not all(rooms_by_instance.values()):
+            room_id = self.helper.create_room_as("@user:test", tok=self.token)
+            rooms_by_instance[shard_config._get_instance(room_id)].append(room_id)
+            self._stage_event(room_id, room_id)
+
+        self.federation_server._dispatch_staged_events()
+        self.pump(1)
+
+        self.assertCountEqual(self.processed, rooms_by_instance["master"])
+
+        # Only the rooms this instance is responsible for are reported.
+        self.assertCountEqual(
+            self.federation_server._rooms_in_backlog_metric,
+            rooms_by_instance["master"],
+        )
+        backlog = {
+            sample.labels["room_id"]
+            for sample in room_backlog_gauge.collect()[0].samples
+        }
+        self.assertFalse(backlog & set(rooms_by_instance["other_worker"]))
+
+
 class ServerACLsTestCase(unittest.TestCase):
     def test_blacklisted_server(self):
         e = _create_acl_event({"allow": ["*"], "deny": ["evil.com"]})
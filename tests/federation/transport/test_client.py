@@ -0,0 +1,111 @@
+# Copyright 2021 The Matrix.org Foundation C.I.C.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+from unittest.mock import patch
+
+import ijson
+
+from synapse.api.room_versions import RoomVersions
+from synapse.federation.transport.client import SendJoinParser
+
+from tests.unittest import TestCase
+
+
+class SendJoinParserTestCase(TestCase):
+    def _make_event(self, event_type, state_key, depth):
+        return {
+            "room_id": "!room:test",
+            "type": event_type,
+            "state_key": state_key,
+            "sender": "@user:test",
+            "content": {},
+            "prev_events": [],
+            "auth_events": [],
+            "depth": depth,
+            "origin_server_ts": depth,
+            "hashes": {"sha256": "aaa"},
+            "signatures": {},
+        }
+
+    def _parse(self, response, v1_api):
+        parser = SendJoinParser(RoomVersions.V6, v1_api=v1_api)
+
+        # Feed the response in small chunks, as it would arrive over the
+        # network.
+        body = json.dumps(response).encode("utf-8")
+        for i in range(0, len(body), 100):
+            parser.write(body[i : i + 100])
+
+        return parser.finish()
+
+    def test_parse(self):
+        """The state and auth chain are parsed a chunk at a time, after the
+        response has been received.
+        """
+        create = self._make_event("m.room.create", "", 1)
+        member = self._make_event("m.room.member", "@user:test", 2)
+        topic = self._make_event("m.room.topic", "", 3)
+        response = {"state": [create, member, topic], "auth_chain": [create, member]}
+
+        for v1_api in (False, True):
+            result = self._parse([200, response] if v1_api else response, v1_api)
+
+            self.assertEqual(
+                [[e.type for e in chunk] for chunk in result.iter_state(2)],
+                [["m.room.create", "m.room.member"], ["m.room.topic"]],
+            )
+            self.assertEqual(
+                [[e.type for e in chunk] for chunk in result.iter_auth_events(2)],
+                [["m.room.create", "m.room.member"]],
+            )
+            self.assertIsNone(result.event)
+
+            result.close()
+
+    def test_parse_event(self):
+        """The join event is parsed as the response is received."""
+        member = self._make_event("m.room.member", "@user:test", 2)
+        response = {
+            "state": [],
+            "auth_chain": [],
+            "org.matrix.msc3083.v2.event": member,
+        }
+
+        result = self._parse(response, v1_api=False)
+        self.assertEqual(result.event.type, "m.room.member")
+        self.assertEqual(list(result.iter_state(2)), [])
+
+    def test_parse_invalid(self):
+        """Invalid JSON is rejected as the response is received."""
+        parser = SendJoinParser(RoomVersions.V6, v1_api=False)
+        with self.assertRaises(ijson.JSONError):
+            parser.write(b'{"state": [}')
+
+    def test_spool_large_response(self):
+        """Large responses are spooled to disk rather than held in memory."""
+        events = [
+            self._make_event("m.room.member", "@user%d:test" % (i,), i)
+            for i in range(100)
+        ]
+        response = {"state": events, "auth_chain": events}
+
+        with patch("synapse.federation.transport.client.SEND_JOIN_SPOOL_SIZE", 1000):
+            result = self._parse(response, v1_api=False)
+
+        self.assertTrue(result.body._rolled)
+        self.assertEqual(
+            [len(chunk) for chunk in result.iter_auth_events(30)], [30, 30, 30, 10]
+        )
+        result.close()
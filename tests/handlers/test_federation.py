@@ -14,18 +14,34 @@
 import logging
 from typing import List
 from unittest import TestCase
+from unittest.mock import Mock, patch
+
+from twisted.internet import defer
 
 from synapse.api.constants import EventTypes
-from synapse.api.errors import AuthError, Codes, LimitExceededError, SynapseError
+from synapse.api.errors import (
+    AuthError,
+    Codes,
+    LimitExceededError,
+    RequestSendFailed,
+    SynapseError,
+)
 from synapse.api.room_versions import RoomVersions
 from synapse.events import EventBase
 from synapse.federation.federation_base import event_from_pdu_json
-from synapse.logging.context import LoggingContext, run_in_background
+from synapse.handlers.federation import _SendJoinPersister
+from synapse.logging.context import (
+    LoggingContext,
+    current_context,
+    make_deferred_yieldable,
+    run_in_background,
+)
 from synapse.rest import admin
 from synapse.rest.client.v1 import login, room
 from synapse.util.stringutils import random_string
 
 from tests import unittest
+from tests.test_utils import make_awaitable
 
 logger = logging.getLogger(__name__)
 
@@ -373,6 +389,111 @@ class FederationTestCase(unittest.HomeserverTestCase):
             exc=LimitExceededError,
         )
 
+    def _prepare_send_join_persister(self):
+        """Sets up a room, and a persister for its state, with persisting events
+        mocked out.
+
+        The IDs of each batch of persisted events are added to `self.persisted`.
+
+        Returns:
+            The persister, the room's state (as a map and as a list with the
+            create event last), and a message in the room.
+        """
+        user_id = self.register_user("kermit", "test")
+        tok = self.login("kermit", "test")
+        room_id = self.helper.create_room_as(room_creator=user_id, tok=tok)
+        event_id = self.helper.send(room_id, "hi", tok=tok)["event_id"]
+
+        room_version = self.get_success(self.store.get_room_version(room_id))
+        event = self.get_success(self.store.get_event(event_id))
+        state_ids = self.get_success(self.store.get_current_state_ids(room_id))
+        state = list(
+            self.get_success(self.store.get_events(state_ids.values())).values()
+        )
+        # Put the create event, which everything else refers to, last.
+        state.sort(key=lambda e: e.type == EventTypes.Create)
+
+        self.persisted: List[List[str]] = []
+
+        async def persist_events_and_notify(room_id, events_and_contexts):
+            self.persisted.append([e.event_id for e, _ in events_and_contexts])
+            # All the events should pass auth.
+            self.assertFalse([e for e, ctx in events_and_contexts if ctx.rejected])
+            return 0
+
+        self.handler.persist_events_and_notify = persist_events_and_notify
+
+        persister = _SendJoinPersister(self.handler, room_id, room_version)
+        return persister, state_ids, state, event
+
+    def test_send_join_persister(self):
+        """The auth chain and state from a /send_join response get persisted
+        in batches as they are received, with each event's auth events before
+        it, whatever order the response had them in.
+        """
+        persister, state_ids, state, event = self._prepare_send_join_persister()
+        persisted = self.persisted
+
+        with patch("synapse.handlers.federation._PERSIST_AUTH_TREE_BATCH_SIZE", 2):
+            # Nothing can be persisted until we've got the create event.
+            self.get_success(persister.add_events(state[:-1]))
+            self.assertEqual(persisted, [])
+
+            self.get_success(persister.add_events(state[-1:]))
+
+            # Everything has been persisted before we finish.
+            persisted_ids = [e_id for batch in persisted for e_id in batch]
+            self.assertCountEqual(persisted_ids, [e.event_id for e in state])
+
+            self.get_success(persister.finish("test", state_ids, event))
+
+        # The events are persisted in batches, followed by the event itself.
+        self.assertEqual(persisted[-1], [event.event_id])
+        self.assertTrue(all(len(batch) <= 2 for batch in persisted))
+
+        for e in state:
+            for auth_id in e.auth_event_ids():
+                self.assertLess(
+                    persisted_ids.index(auth_id), persisted_ids.index(e.event_id)
+                )
+
+    def test_send_join_persister_missing_auth_events(self):
+        """Events whose auth events aren't in the /send_join response are held
+        on to until we finish, when we try to fetch the missing auth events.
+        """
+        persister, state_ids, state, event = self._prepare_send_join_persister()
+        persisted = self.persisted
+
+        # Leave out the power levels, which all the later events refer to.
+        power_levels = next(e for e in state if e.type == EventTypes.PowerLevels)
+        events = [e for e in state if e is not power_levels]
+
+        self.handler.federation_client.get_pdu = Mock(
+            side_effect=lambda *args, **kwargs: make_awaitable(power_levels)
+        )
+
+        self.get_success(persister.add_events(events))
+        persisted_ids = [e_id for batch in persisted for e_id in batch]
+        waiting_ids = [
+            e.event_id for e in events if power_levels.event_id in e.auth_event_ids()
+        ]
+        self.assertTrue(waiting_ids)
+        self.assertFalse(set(waiting_ids) & set(persisted_ids))
+
+        self.get_success(persister.finish("test", state_ids, event))
+
+        self.handler.federation_client.get_pdu.assert_called_once()
+        self.assertEqual(
+            self.handler.federation_client.get_pdu.call_args[0][1],
+            power_levels.event_id,
+        )
+
+        # The fetched power levels are only used to auth the other events, and
+        # aren't persisted themselves.
+        persisted_ids = [e_id for batch in persisted[:-1] for e_id in batch]
+        self.assertCountEqual(persisted_ids, [e.event_id for e in events])
+        self.assertEqual(persisted[-1], [event.event_id])
+
     def _build_and_send_join_event(self, other_server, other_user, room_id):
         join_event = self.get_success(
             self.handler.on_make_join_request(other_server, room_id, other_user)
@@ -393,6 +514,186 @@ class FederationTestCase(unittest.HomeserverTestCase):
         return join_event
 
 
+class BackfillTestCase(unittest.HomeserverTestCase):
+    def make_homeserver(self, reactor, clock):
+        self.federation_client = Mock()
+        hs = self.setup_test_homeserver(
+            federation_http_client=None, federation_client=self.federation_client
+        )
+        self.handler = hs.get_federation_handler()
+        self.handler._process_backfilled_events = Mock(
+            side_effect=lambda dest, room_id, events: make_awaitable(events)
+        )
+        return hs
+
+    def _mock_backfill(self):
+        """Sets up backfill requests to a server which is down, one which
+        responds slowly and one which responds quickly.
+        """
+        self.slow_response: "defer.Deferred[List[Mock]]" = defer.Deferred()
+
+        async def backfill(dest, room_id, limit, extremities):
+            if dest == "down.example.com":
+                raise RequestSendFailed(Exception("down"), can_retry=True)
+            if dest == "slow.example.com":
+                return await make_deferred_yieldable(self.slow_response)
+            self.reactor.advance(1)
+            return [Mock(event_id="$fast")]
+
+        self.federation_client.backfill = Mock(side_effect=backfill)
+
+    @unittest.override_config({"federation_backfill_concurrency": 2})
+    def test_backfill_concurrently(self):
+        """We use the first response from the servers we backfill from at once,
+        moving on from servers which fail.
+        """
+        self._mock_backfill()
+
+        d = defer.ensureDeferred(
+            self.handler._backfill_concurrently(
+                ["down.example.com", "slow.example.com", "fast.example.com"],
+                "!room:test",
+                ["$extremity"],
+            )
+        )
+        self.assertTrue(self.get_success(d))
+
+        self.assertEqual(self.federation_client.backfill.call_count, 3)
+        self.handler._process_backfilled_events.assert_called_once()
+        dest, _, events = self.handler._process_backfilled_events.call_args[0]
+        self.assertEqual(dest, "fast.example.com")
+        self.assertEqual([e.event_id for e in events], ["$fast"])
+
+        # The slow response is ignored when it does arrive.
+        self.reactor.advance(5)
+        self.slow_response.callback([Mock(event_id="$slow")])
+        self.handler._process_backfilled_events.assert_called_once()
+
+        # We try the quickest servers first next time.
+        self.assertEqual(
+            self.handler._rank_backfill_domains(
+                [
+                    "down.example.com",
+                    "slow.example.com",
+                    "new.example.com",
+                    "fast.example.com",
+                ]
+            ),
+            [
+                "fast.example.com",
+                "slow.example.com",
+                "new.example.com",
+                "down.example.com",
+            ],
+        )
+
+    @unittest.override_config({"federation_backfill_concurrency": 2})
+    def test_backfill_concurrently_fails(self):
+        """If none of the servers respond we give up."""
+        self._mock_backfill()
+
+        d = defer.ensureDeferred(
+            self.handler._backfill_concurrently(
+                ["down.example.com"], "!room:test", ["$extremity"]
+            )
+        )
+        self.assertFalse(self.get_success(d))
+        self.handler._process_backfilled_events.assert_not_called()
+
+    @unittest.override_config({"federation_backfill_concurrency": 2})
+    def test_backfill_concurrently_processing_fails(self):
+        """If processing the events from a server fails we move on to the next
+        server, and carry on in the caller's logcontext.
+        """
+        self._mock_backfill()
+
+        contexts = []
+
+        async def process_backfilled_events(dest, room_id, events):
+            contexts.append(current_context())
+            if len(contexts) == 1:
+                raise RequestSendFailed(Exception("bad"), can_retry=True)
+
+        self.handler._process_backfilled_events = Mock(
+            side_effect=process_backfilled_events
+        )
+
+        async def backfill():
+            result = await self.handler._backfill_concurrently(
+                ["down.example.com", "fast.example.com", "fast2.example.com"],
+                "!room:test",
+                ["$extremity"],
+            )
+            contexts.append(current_context())
+            return result
+
+        with LoggingContext("test") as context:
+            d = run_in_background(backfill)
+            self.assertTrue(self.get_success(d))
+
+        self.assertEqual(contexts, [context, context, context])
+        dests = [
+            c[0][0] for c in self.handler._process_backfilled_events.call_args_list
+        ]
+        self.assertCountEqual(dests, ["fast.example.com", "fast2.example.com"])
+
+    @unittest.override_config({"federation_backfill_concurrency": 3})
+    def test_backfill_concurrently_processing_fails_with_requests_in_flight(self):
+        """If processing the events from a server fails while other requests
+        are in flight, we go on to ask the servers which haven't been tried.
+        """
+        slow_response: "defer.Deferred[List[Mock]]" = defer.Deferred()
+        failing_response: "defer.Deferred[List[Mock]]" = defer.Deferred()
+
+        async def backfill(dest, room_id, limit, extremities):
+            if dest == "slow.example.com":
+                return await make_deferred_yieldable(slow_response)
+            if dest == "failing.example.com":
+                return await make_deferred_yieldable(failing_response)
+            return [Mock(event_id="$" + dest)]
+
+        self.federation_client.backfill = Mock(side_effect=backfill)
+
+        processing: "defer.Deferred[None]" = defer.Deferred()
+
+        async def process_backfilled_events(dest, room_id, events):
+            if dest == "fast.example.com":
+                await make_deferred_yieldable(processing)
+
+        self.handler._process_backfilled_events = Mock(
+            side_effect=process_backfilled_events
+        )
+
+        d = defer.ensureDeferred(
+            self.handler._backfill_concurrently(
+                [
+                    "fast.example.com",
+                    "slow.example.com",
+                    "failing.example.com",
+                    "good.example.com",
+                ],
+                "!room:test",
+                ["$extremity"],
+            )
+        )
+        self.pump()
+
+        # We're processing the response from the fast server, so the request
+        # which fails now shouldn't move on to the next server...
+        failing_response.errback(RequestSendFailed(Exception("bad"), can_retry=True))
+        self.pump()
+        self.assertEqual(self.federation_client.backfill.call_count, 3)
+
+        # ... but we should once processing that response fails.
+        processing.errback(RequestSendFailed(Exception("bad"), can_retry=True))
+        self.assertTrue(self.get_success(d))
+
+        dests = [
+            c[0][0] for c in self.handler._process_backfilled_events.call_args_list
+        ]
+        self.assertEqual(dests, ["fast.example.com", "good.example.com"])
+
+
 class EventFromPduTestCase(TestCase):
     def test_valid_json(self):
         """Valid JSON should be turned into an event."""
@@ -12,9 +12,13 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from unittest.mock import Mock
+
 from synapse.api.errors import Codes, ResourceLimitError
 from synapse.api.filtering import DEFAULT_FILTER_COLLECTION
 from synapse.handlers.sync import SyncConfig
+from synapse.rest import admin
+from synapse.rest.client.v1 import login, room
 from synapse.types import UserID, create_requester
 
 import tests.unittest
@@ -24,6 +28,12 @@ import tests.utils
 class SyncTestCase(tests.unittest.HomeserverTestCase):
     """Tests Sync Handler."""
 
+    servlets = [
+        admin.register_servlets,
+        login.register_servlets,
+        room.register_servlets,
+    ]
+
     def prepare(self, reactor, clock, hs):
         self.hs = hs
         self.sync_handler = self.hs.get_sync_handler()
@@ -68,12 +78,66 @@ class SyncTestCase(tests.unittest.HomeserverTestCase):
         )
         self.assertEquals(e.value.errcode, Codes.RESOURCE_LIMIT_EXCEEDED)
 
+    def test_incremental_sync_state_reused(self):
+        """Tests that an incremental sync which follows on from the previous one
+        reuses the joined rooms calculated for it, and that membership changes
+        are still picked up.
+        """
+        user_id = self.register_user("kermit", "monkey")
+        tok = self.login("kermit", "monkey")
+        room_id1 = self.helper.create_room_as(user_id, tok=tok)
+
+        sync_config = generate_sync_config(user_id)
+        requester = create_requester(user_id)
+
+        result = self.get_success(
+            self.sync_handler.wait_for_sync_for_user(requester, sync_config)
+        )
+        self.assertEqual([r.room_id for r in result.joined], [room_id1])
+
+        state = self.sync_handler.incremental_sync_state_cache.get(
+            (user_id, "device_id")
+        )
+        self.assertEqual(state.next_batch, result.next_batch)
+        self.assertEqual(state.joined_room_ids, {room_id1})
+
+        # Nothing has changed, so the next sync should reuse the stored set of
+        # joined rooms rather than calculating it again.
+        self.sync_handler.get_rooms_for_user_at = Mock(
+            side_effect=self.sync_handler.get_rooms_for_user_at
+        )
+        result = self.get_success(
+            self.sync_handler.wait_for_sync_for_user(
+                requester,
+                generate_sync_config(user_id, "request_key2"),
+                since_token=result.next_batch,
+            )
+        )
+        self.sync_handler.get_rooms_for_user_at.assert_not_called()
+
+        # Joining a new room means we have to recalculate.
+        room_id2 = self.helper.create_room_as(user_id, tok=tok)
+        result = self.get_success(
+            self.sync_handler.wait_for_sync_for_user(
+                requester,
+                generate_sync_config(user_id, "request_key3"),
+                since_token=result.next_batch,
+            )
+        )
+        self.sync_handler.get_rooms_for_user_at.assert_called_once()
+        self.assertEqual([r.room_id for r in result.joined], [room_id2])
+
+        state = self.sync_handler.incremental_sync_state_cache.get(
+            (user_id, "device_id")
+        )
+        self.assertEqual(state.joined_room_ids, {room_id1, room_id2})
+
 
-def generate_sync_config(user_id: str) -> SyncConfig:
+def generate_sync_config(user_id: str, request_key: str = "request_key") -> SyncConfig:
     return SyncConfig(
         user=UserID(user_id.split(":")[0][1:], user_id.split(":")[1]),
         filter_collection=DEFAULT_FILTER_COLLECTION,
         is_guest=False,
-        request_key="request_key",
+        request_key=request_key,
         device_id="device_id",
     )
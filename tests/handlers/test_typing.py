@@ -210,6 +210,7 @@ class TypingNotificationsTestCase(unittest.HomeserverTestCase):
                 },
             ),
             json_data_callback=ANY,
+            json_bytes_callback=ANY,
             long_retries=True,
             backoff_on_404=True,
             try_trailing_slash_on_400=True,
@@ -317,6 +318,7 @@ class TypingNotificationsTestCase(unittest.HomeserverTestCase):
                 },
             ),
             json_data_callback=ANY,
+            json_bytes_callback=ANY,
             long_retries=True,
             backoff_on_404=True,
             try_trailing_slash_on_400=True,
@@ -11,16 +11,18 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-from unittest.mock import Mock
+from unittest.mock import Mock, patch
 
 from twisted.internet import defer
 
 import synapse.rest.admin
 from synapse.api.constants import EventTypes, RoomEncryptionAlgorithms, UserTypes
 from synapse.api.room_versions import RoomVersion, RoomVersions
+from synapse.handlers.user_directory_index import UserDirectoryIndex
 from synapse.rest.client.v1 import login, room
 from synapse.rest.client.v2_alpha import user_directory
 from synapse.storage.roommember import ProfileInfo
+from synapse.types import UserID, create_requester
 
 from tests import unittest
 from tests.unittest import override_config
@@ -684,3 +686,136 @@ class TestUserDirSearchDisabled(unittest.HomeserverTestCase):
         )
         self.assertEquals(200, channel.code, channel.result)
         self.assertTrue(len(channel.json_body["results"]) == 0)
+
+
+class UserDirectoryIndexTestCase(unittest.HomeserverTestCase):
+    """
+    Tests searching the in memory user directory index.
+    """
+
+    servlets = [
+        login.register_servlets,
+        synapse.rest.admin.register_servlets_for_client_rest_resource,
+        room.register_servlets,
+    ]
+
+    def make_homeserver(self, reactor, clock):
+        config = self.default_config()
+        config["update_user_directory"] = True
+        config["user_directory"] = {"in_memory_index": True}
+        return self.setup_test_homeserver(config=config)
+
+    def prepare(self, reactor, clock, hs):
+        self.store = hs.get_datastore()
+        self.handler = hs.get_user_directory_handler()
+
+        self.u1 = self.register_user("user1", "pass")
+        self.u1_token = self.login(self.u1, "pass")
+        self.u2 = self.register_user("user2", "pass")
+        self.u2_token = self.login(self.u2, "pass")
+        self.u3 = self.register_user("user3", "pass")
+
+    def _search(self, user_id, search_term):
+        """Searches the index, checking that it gives the same results as the
+        database.
+        """
+        from_db = self.get_success(self.store.search_user_dir(user_id, search_term, 10))
+
+        with patch.object(
+            self.store, "search_user_dir", wraps=self.store.search_user_dir
+        ) as search_user_dir:
+            s = self.get_success(self.handler.search_users(user_id, search_term, 10))
+            self.assertEqual(search_user_dir.called, not s["results"])
+
+        self.assertCountEqual(s["results"], from_db["results"])
+        return [r["user_id"] for r in s["results"]]
+
+    def test_private_room(self):
+        """The index only returns users who share a room with the searcher."""
+        self.assertTrue(self.handler._index_loaded)
+
+        room = self.helper.create_room_as(self.u1, is_public=False, tok=self.u1_token)
+        self.helper.invite(room, src=self.u1, targ=self.u2, tok=self.u1_token)
+        self.helper.join(room, user=self.u2, tok=self.u2_token)
+
+        self.assertEqual(self._search(self.u1, "user2"), [self.u2])
+        self.assertEqual(self._search(self.u3, "user2"), [])
+        self.assertEqual(self._search(self.u1, "user3"), [])
+
+        self.helper.leave(room, user=self.u2, tok=self.u2_token)
+
+        self.assertEqual(self._search(self.u1, "user2"), [])
+        self.assertEqual(len(self.handler._index), 1)
+
+    def test_public_room(self):
+        """Users in public rooms are visible to everyone, and can be searched
+        for by prefixes of their display name.
+        """
+        room = self.helper.create_room_as(self.u1, is_public=True, tok=self.u1_token)
+        self.helper.join(room, user=self.u2, tok=self.u2_token)
+
+        self.get_success(
+            self.hs.get_profile_handler().set_displayname(
+                UserID.from_string(self.u2),
+                create_requester(self.u2),
+                "Bob Smith",
+            )
+        )
+
+        self.assertEqual(self._search(self.u3, "bob sm"), [self.u2])
+        self.assertEqual(self._search(self.u3, "smith"), [self.u2])
+        self.assertEqual(self._search(self.u3, "user"), [self.u1, self.u2])
+        self.assertEqual(self._search(self.u3, "bob jones"), [])
+
+        # The room becoming private removes the users from the public rooms.
+        self.helper.send_state(
+            room,
+            EventTypes.JoinRules,
+            {"join_rule": "invite"},
+            tok=self.u1_token,
+        )
+        self.assertEqual(self._search(self.u3, "bob"), [])
+        self.assertEqual(self._search(self.u1, "bob"), [self.u2])
+
+    def test_load_index(self):
+        """The index can be loaded from the contents of the database."""
+        room = self.helper.create_room_as(self.u1, is_public=False, tok=self.u1_token)
+        self.helper.invite(room, src=self.u1, targ=self.u2, tok=self.u1_token)
+        self.helper.join(room, user=self.u2, tok=self.u2_token)
+
+        self.handler._index = UserDirectoryIndex(self.hs.hostname, False)
+        self.handler._index_loaded = False
+
+        # Searches fall back to the database until the index has been loaded.
+        with patch.object(self.handler._index, "search") as search:
+            s = self.get_success(self.handler.search_users(self.u1, "user2", 10))
+            self.assertEqual(len(s["results"]), 1)
+            search.assert_not_called()
+
+        self.get_success(self.handler._load_index())
+        self.assertEqual(len(self.handler._index), 2)
+        self.assertEqual(self._search(self.u1, "user2"), [self.u2])
+        self.assertEqual(self._search(self.u2, "user1"), [self.u1])
+
+    def test_load_replaces_contents(self):
+        """Loading the index replaces anything already in it, and the result
+        can be updated incrementally afterwards.
+        """
+        index = UserDirectoryIndex(self.hs.hostname, False)
+        index.update_profile("@stale:test", "Stale", None)
+        index.add_users_in_public_room("!room:test", ["@stale:test"])
+
+        index.load(
+            iter([("@bob:test", "Bob", None), ("@alice:test", "Alice", None)]),
+            iter([("@bob:test", "!room:test"), ("@alice:test", "!room:test")]),
+            iter([]),
+        )
+        self.assertEqual(len(index), 2)
+        self.assertEqual(index._sorted_tokens, sorted(index._users_by_token))
+        self.assertEqual(index.search("@bob:test", "stale", 10, False)["results"], [])
+
+        index.update_profile("@carol:test", "Carol", None)
+        index.add_users_in_public_room("!room:test", ["@carol:test"])
+        self.assertEqual(index._sorted_tokens, sorted(index._users_by_token))
+        results = index.search("@bob:test", "carol", 10, False)["results"]
+        self.assertEqual([r["user_id"] for r in results], ["@carol:test"])
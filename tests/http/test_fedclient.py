@@ -14,8 +14,10 @@
 
 from unittest.mock import Mock
 
+from canonicaljson import encode_canonical_json
 from netaddr import IPSet
 from parameterized import parameterized
+from signedjson.sign import sign_json
 
 from twisted.internet import defer
 from twisted.internet.defer import TimeoutError
@@ -617,3 +619,40 @@ class FederationClientTests(HomeserverTestCase):
         self.assertIsInstance(f.value, RequestSendFailed)
 
         self.assertTrue(transport.disconnecting)
+
+    def test_auth_headers_from_bytes(self):
+        """Signing a pre-encoded request body gives the same signature as signing
+        the decoded body.
+        """
+        content = {"pdus": [{"a": 1, "b": "\u00e9"}], "origin": "test"}
+        expected = sign_json(
+            {
+                "method": "PUT",
+                "uri": "/foo",
+                "origin": self.hs.hostname,
+                "destination": "testserv",
+                "content": content,
+            },
+            self.hs.hostname,
+            self.hs.signing_key,
+        )
+        ((key_id, sig),) = expected["signatures"][self.hs.hostname].items()
+        expected_header = 'X-Matrix origin=%s,key="%s",sig="%s"' % (
+            self.hs.hostname,
+            key_id,
+            sig,
+        )
+
+        self.assertEqual(
+            self.cl.build_auth_headers(b"testserv", b"PUT", b"/foo", content),
+            [expected_header.encode("ascii")],
+        )
+        self.assertEqual(
+            self.cl.build_auth_headers(
+                b"testserv",
+                b"PUT",
+                b"/foo",
+                content_bytes=encode_canonical_json(content),
+            ),
+            [expected_header.encode("ascii")],
+        )
@@ -17,6 +17,10 @@ from typing import Any, Dict
 from synapse.api.room_versions import RoomVersions
 from synapse.events import FrozenEvent
 from synapse.push import push_rule_evaluator
+from synapse.push.bulk_push_rule_evaluator import (
+    _get_rules_matching_event,
+    _MatchingRule,
+)
 from synapse.push.push_rule_evaluator import PushRuleEvaluatorForEvent
 
 from tests import unittest
@@ -68,6 +72,76 @@ class PushRuleEvaluatorTestCase(unittest.TestCase):
         # A display name with spaces should work fine.
         self.assertTrue(evaluator.matches(condition, "@user:test", "foo bar"))
 
+    def test_display_name_word_index(self):
+        """Display names are matched at word boundaries, even when they contain
+        punctuation or non-ASCII characters.
+        """
+        evaluator = self._get_evaluator({"body": "Hi @alice.smith, how are you?"})
+        condition = {"kind": "contains_display_name"}
+
+        self.assertTrue(evaluator.matches(condition, "@user:test", "alice"))
+        self.assertTrue(evaluator.matches(condition, "@user:test", "Alice.Smith"))
+        self.assertTrue(evaluator.matches(condition, "@user:test", "smith,"))
+        self.assertFalse(evaluator.matches(condition, "@user:test", "alic"))
+        self.assertFalse(evaluator.matches(condition, "@user:test", "alice smith"))
+
+        evaluator = self._get_evaluator({"body": "Hej ÅSA!"})
+        self.assertTrue(evaluator.matches(condition, "@user:test", "åsa"))
+        self.assertFalse(evaluator.matches(condition, "@user:test", "ås"))
+
+    def test_get_rules_matching_event(self):
+        """Rules are narrowed down to those whose user independent conditions
+        match, stopping at the first rule which matches for every user.
+        """
+        evaluator = self._get_evaluator({"body": "foo bar"})
+
+        display_name_condition = {"kind": "contains_display_name"}
+        rules = [
+            {
+                "rule_id": "no_match",
+                "conditions": [
+                    {"kind": "event_match", "key": "content.body", "pattern": "baz"}
+                ],
+                "actions": ["notify"],
+            },
+            {
+                "rule_id": "display_name",
+                "conditions": [display_name_condition],
+                "actions": ["notify", {"set_tweak": "highlight"}],
+            },
+            {
+                "rule_id": "disabled",
+                "enabled": False,
+                "conditions": [],
+                "actions": ["notify"],
+            },
+            {
+                "rule_id": "body",
+                "conditions": [
+                    {"kind": "event_match", "key": "content.body", "pattern": "foo"}
+                ],
+                "actions": ["notify", "dont_notify"],
+            },
+            {
+                "rule_id": "fallback",
+                "conditions": [],
+                "actions": ["dont_notify"],
+            },
+        ]
+
+        matching_rules = _get_rules_matching_event(evaluator, rules, {})
+
+        self.assertEqual(
+            matching_rules,
+            [
+                _MatchingRule(
+                    user_conditions=[display_name_condition],
+                    actions=["notify", {"set_tweak": "highlight"}],
+                ),
+                _MatchingRule(user_conditions=[], actions=["notify"]),
+            ],
+        )
+
     def _assert_matches(
         self, condition: Dict[str, Any], content: Dict[str, Any], msg=None
     ) -> None:
@@ -460,22 +460,26 @@ class FakeRedisPubSubServer:
     """A fake Redis server for pub/sub."""
 
     def __init__(self):
-        self._subscribers = set()
+        # Map from subscribed connection to the channels it is subscribed to.
+        self._subscribers = {}
 
-    def add_subscriber(self, conn):
+    def add_subscriber(self, conn, channel):
         """A connection has called SUBSCRIBE"""
-        self._subscribers.add(conn)
+        self._subscribers.setdefault(conn, set()).add(channel)
 
     def remove_subscriber(self, conn):
         """A connection has called UNSUBSCRIBE"""
-        self._subscribers.discard(conn)
+        self._subscribers.pop(conn, None)
 
     def publish(self, conn, channel, msg) -> int:
         """A connection want to publish a message to subscribers."""
-        for sub in self._subscribers:
-            sub.send(["message", channel, msg])
+        num_subscribers = 0
+        for sub, channels in self._subscribers.items():
+            if channel in channels:
+                sub.send(["message", channel, msg])
+                num_subscribers += 1
 
-        return len(self._subscribers)
+        return num_subscribers
 
     def buildProtocol(self, addr):
         return FakeRedisPubSubProtocol(self)
@@ -516,9 +520,9 @@ class FakeRedisPubSubProtocol(Protocol):
             num_subscribers = self._server.publish(self, channel, message)
             self.send(num_subscribers)
         elif command == b"SUBSCRIBE":
-            (channel,) = args
-            self._server.add_subscriber(self)
-            self.send(["subscribe", channel, 1])
+            for num_channels, channel in enumerate(args, 1):
+                self._server.add_subscriber(self, channel)
+                self.send(["subscribe", channel, num_channels])
 
         # Since we use SET/GET to cache things we can safely no-op them.
         elif command == b"SET":
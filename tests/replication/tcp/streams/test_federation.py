@@ -78,3 +78,24 @@ class FederationStreamTestCase(BaseStreamTestCase):
         self.assertEqual(edurow.edu.origin, self.hs.hostname)
         self.assertEqual(edurow.edu.destination, "testdest")
         self.assertEqual(edurow.edu.content, {"c": "d"})
+
+
+class FederationStreamSubscriptionTestCase(BaseStreamTestCase):
+    def test_not_subscribed(self):
+        """Workers which don't send federation aren't sent the federation stream."""
+        fed_sender = self.hs.get_federation_sender()
+        received_rows = self.test_handler.received_rdata_rows
+
+        self.reconnect()
+        self.reactor.advance(0)
+
+        self.assertIsNotNone(self.server.subscribed_streams)
+        self.assertNotIn("federation", self.server.subscribed_streams)
+        self.assertIn("events", self.server.subscribed_streams)
+
+        fed_sender.build_and_send_edu("testdest", "m.test_edu", {"a": "b"})
+        self.reactor.advance(0)
+
+        # there should be no http hit, and no row
+        self.assertEqual(len(self.reactor.tcpClients), 0)
+        self.assertEqual(received_rows, [])
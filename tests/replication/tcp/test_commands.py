@@ -12,6 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 from synapse.replication.tcp.commands import (
+    RdataBatchCommand,
     RdataCommand,
     ReplicateCommand,
     parse_command_from_line,
@@ -26,6 +27,17 @@ class ParseCommandTestCase(TestCase):
         cmd = parse_command_from_line(line)
         self.assertIsInstance(cmd, ReplicateCommand)
 
+    def test_parse_replicate_with_streams(self):
+        line = "REPLICATE events caches"
+        cmd = parse_command_from_line(line)
+        assert isinstance(cmd, ReplicateCommand)
+        self.assertEqual(cmd.streams, ["events", "caches"])
+        self.assertEqual(cmd.to_line(), "caches events")
+
+        cmd = parse_command_from_line("REPLICATE")
+        assert isinstance(cmd, ReplicateCommand)
+        self.assertIsNone(cmd.streams)
+
     def test_parse_rdata(self):
         line = 'RDATA events master 6287863 ["ev", ["$eventid", "!roomid", "type", null, null, null]]'
         cmd = parse_command_from_line(line)
@@ -41,3 +53,26 @@ class ParseCommandTestCase(TestCase):
         self.assertEqual(cmd.stream_name, "presence")
         self.assertEqual(cmd.instance_name, "master")
         self.assertIsNone(cmd.token)
+
+    def test_parse_rdata_batch_command(self):
+        line = 'RDATA_BATCH presence master 59 [["@foo:example.com", "online"], ["@bar:example.com", "offline"]]'
+        cmd = parse_command_from_line(line)
+        assert isinstance(cmd, RdataBatchCommand)
+        self.assertEqual(cmd.stream_name, "presence")
+        self.assertEqual(cmd.instance_name, "master")
+        self.assertEqual(cmd.token, 59)
+        self.assertEqual(
+            cmd.rows, [["@foo:example.com", "online"], ["@bar:example.com", "offline"]]
+        )
+
+    def test_rdata_batch_to_rdata_commands(self):
+        cmd = RdataBatchCommand("presence", "master", 59, [["a"], ["b"], ["c"]])
+
+        rdata_cmds = cmd.to_rdata_commands()
+        self.assertEqual([c.token for c in rdata_cmds], [None, None, 59])
+        self.assertEqual([c.row for c in rdata_cmds], [["a"], ["b"], ["c"]])
+
+        first, second = cmd.split()
+        self.assertIsNone(first.token)
+        self.assertEqual(second.token, 59)
+        self.assertEqual(first.rows + second.rows, [["a"], ["b"], ["c"]])
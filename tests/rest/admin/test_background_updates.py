@@ -0,0 +1,164 @@
+# Copyright 2021 The Matrix.org Foundation C.I.C.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import synapse.rest.admin
+from synapse.api.errors import Codes
+from synapse.rest.client.v1 import login
+
+from tests import unittest
+
+
+class BackgroundUpdatesTestCase(unittest.HomeserverTestCase):
+    servlets = [
+        synapse.rest.admin.register_servlets,
+        login.register_servlets,
+    ]
+
+    def prepare(self, reactor, clock, hs):
+        self.store = hs.get_datastore()
+        self.updater = self.store.db_pool.updates
+
+        self.admin_user = self.register_user("admin", "pass", admin=True)
+        self.admin_user_tok = self.login("admin", "pass")
+
+        self.other_user = self.register_user("user", "pass")
+        self.other_user_tok = self.login("user", "pass")
+
+    def _register_bg_update(self):
+        """Adds a background update which makes a little progress per batch."""
+
+        async def update(progress, batch_size):
+            await self.clock.sleep(1)
+            return 100
+
+        self.updater.register_background_update_handler("test_update", update)
+        self.get_success(
+            self.store.db_pool.simple_insert(
+                "background_updates",
+                values={"update_name": "test_update", "progress_json": "{}"},
+            )
+        )
+
+    def test_requester_is_no_admin(self):
+        """
+        If the user is not a server admin, an error 403 is returned.
+        """
+        for method, url in (
+            ("GET", "/_synapse/admin/v1/background_updates/status"),
+            ("GET", "/_synapse/admin/v1/background_updates/enabled"),
+            ("POST", "/_synapse/admin/v1/background_updates/enabled"),
+            ("POST", "/_synapse/admin/v1/background_updates/prioritise"),
+        ):
+            channel = self.make_request(
+                method, url, {}, access_token=self.other_user_tok
+            )
+
+            self.assertEqual(403, channel.code, msg=channel.json_body)
+            self.assertEqual(Codes.FORBIDDEN, channel.json_body["errcode"])
+
+    def test_status(self):
+        """The status of running background updates is reported."""
+        self._register_bg_update()
+        self.get_success(self.updater.do_next_background_update(1000), by=0.1)
+
+        channel = self.make_request(
+            "GET",
+            "/_synapse/admin/v1/background_updates/status",
+            access_token=self.admin_user_tok,
+        )
+        self.assertEqual(200, channel.code, msg=channel.json_body)
+
+        self.assertTrue(channel.json_body["enabled"])
+        status = channel.json_body["current_updates"]["master"]["test_update"]
+        self.assertEqual(status["total_item_count"], 100)
+        self.assertIsNone(status["eta_seconds"])
+
+    def test_enabled(self):
+        """Background updates can be paused and resumed."""
+        self._register_bg_update()
+
+        channel = self.make_request(
+            "POST",
+            "/_synapse/admin/v1/background_updates/enabled",
+            {"enabled": False},
+            access_token=self.admin_user_tok,
+        )
+        self.assertEqual(200, channel.code, msg=channel.json_body)
+        self.assertFalse(channel.json_body["enabled"])
+
+        channel = self.make_request(
+            "GET",
+            "/_synapse/admin/v1/background_updates/enabled",
+            access_token=self.admin_user_tok,
+        )
+        self.assertEqual(200, channel.code, msg=channel.json_body)
+        self.assertFalse(channel.json_body["enabled"])
+
+        # Nothing gets run while the updates are paused.
+        self.get_success(self.updater.run_background_updates(sleep=False))
+        self.assertEqual(self.updater.get_current_update_stats(), {})
+
+        channel = self.make_request(
+            "POST",
+            "/_synapse/admin/v1/background_updates/enabled",
+            {"enabled": True},
+            access_token=self.admin_user_tok,
+        )
+        self.assertEqual(200, channel.code, msg=channel.json_body)
+        self.assertTrue(channel.json_body["enabled"])
+
+    def test_enabled_invalid(self):
+        """An error is returned if `enabled` isn't a boolean."""
+        channel = self.make_request(
+            "POST",
+            "/_synapse/admin/v1/background_updates/enabled",
+            {"enabled": "no"},
+            access_token=self.admin_user_tok,
+        )
+        self.assertEqual(400, channel.code, msg=channel.json_body)
+        self.assertEqual(Codes.INVALID_PARAM, channel.json_body["errcode"])
+
+    def test_prioritise(self):
+        """Pending updates can be moved to the front of the queue."""
+        self._register_bg_update()
+        self.get_success(
+            self.store.db_pool.simple_insert(
+                "background_updates",
+                values={
+                    "update_name": "other_update",
+                    "progress_json": "{}",
+                    "ordering": -10,
+                },
+            )
+        )
+
+        channel = self.make_request(
+            "POST",
+            "/_synapse/admin/v1/background_updates/prioritise",
+            {"update_name": "test_update"},
+            access_token=self.admin_user_tok,
+        )
+        self.assertEqual(200, channel.code, msg=channel.json_body)
+
+        pending = self.get_success(self.updater.get_pending_background_updates())
+        self.assertEqual(pending[0]["update_name"], "test_update")
+
+        channel = self.make_request(
+            "POST",
+            "/_synapse/admin/v1/background_updates/prioritise",
+            {"update_name": "unknown_update"},
+            access_token=self.admin_user_tok,
+        )
+        self.assertEqual(404, channel.code, msg=channel.json_body)
+        self.assertEqual(Codes.NOT_FOUND, channel.json_body["errcode"])
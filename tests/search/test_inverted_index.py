@@ -0,0 +1,363 @@
+# Copyright 2021 The Matrix.org Foundation C.I.C.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+from unittest.mock import patch
+
+import synapse.rest.admin
+from synapse.rest.client.v1 import login, room
+from synapse.search.inverted_index import (
+    InvertedIndexSearchBackend,
+    _SearchIndex,
+    tokenise,
+)
+
+from tests import unittest
+
+
+class InvertedIndexTestCase(unittest.HomeserverTestCase):
+    servlets = [
+        synapse.rest.admin.register_servlets_for_client_rest_resource,
+        room.register_servlets,
+        login.register_servlets,
+    ]
+
+    def default_config(self):
+        config = super().default_config()
+        self.index_directory = self.mktemp()
+        config["search"] = {
+            "backend": "inverted_index",
+            "index_directory": self.index_directory,
+        }
+        return config
+
+    def prepare(self, reactor, clock, hs):
+        self.backend = hs.get_search_backend()
+        self.assertIsInstance(self.backend, InvertedIndexSearchBackend)
+
+        self.user_id = self.register_user("user", "pass")
+        self.tok = self.login("user", "pass")
+        self.room_id = self.helper.create_room_as(self.user_id, tok=self.tok)
+        self.other_room_id = self.helper.create_room_as(self.user_id, tok=self.tok)
+
+    def _search_msgs(self, backend, search_term, room_ids=None):
+        return self.get_success(
+            backend.search_msgs(
+                room_ids or [self.room_id], search_term, ["content.body"]
+            )
+        )
+
+    def _bodies(self, result):
+        return [r["event"].content["body"] for r in result["results"]]
+
+    def test_tokenise(self):
+        self.assertEqual(tokenise("Hello, World! x-ray"), ["hello", "world", "x-ray"])
+
+    def test_search_msgs(self):
+        """Events are indexed as they are sent, and all of the search terms must
+        match (as prefixes of words).
+        """
+        self.helper.send(self.room_id, body="hello world", tok=self.tok)
+        self.helper.send(self.room_id, body="hello there", tok=self.tok)
+        self.helper.send(self.room_id, body="worldly goods", tok=self.tok)
+        self.helper.send(self.other_room_id, body="hello world", tok=self.tok)
+        self.pump()
+
+        result = self._search_msgs(self.backend, "hello")
+        self.assertEqual(result["count"], 2)
+        self.assertCountEqual(self._bodies(result), ["hello world", "hello there"])
+
+        result = self._search_msgs(self.backend, "Hello WORLD")
+        self.assertEqual(self._bodies(result), ["hello world"])
+        self.assertEqual(result["highlights"], {"hello", "world"})
+
+        # "world" is a prefix of "worldly".
+        result = self._search_msgs(self.backend, "world")
+        self.assertCountEqual(self._bodies(result), ["hello world", "worldly goods"])
+
+        # Both rooms can be searched at once.
+        result = self._search_msgs(
+            self.backend, "hello world", [self.room_id, self.other_room_id]
+        )
+        self.assertEqual(result["count"], 2)
+
+        result = self._search_msgs(self.backend, "nothing")
+        self.assertEqual(result["count"], 0)
+        self.assertEqual(result["results"], [])
+
+    def test_rank(self):
+        """Documents where the search terms are more significant rank higher."""
+        self.helper.send(
+            self.room_id, body="cheese and a lot of other words", tok=self.tok
+        )
+        self.helper.send(self.room_id, body="cheese cheese", tok=self.tok)
+        self.pump()
+
+        result = self._search_msgs(self.backend, "cheese")
+        self.assertEqual(
+            self._bodies(result), ["cheese cheese", "cheese and a lot of other words"]
+        )
+        self.assertGreater(result["results"][0]["rank"], result["results"][1]["rank"])
+
+    def test_search_rooms_pagination(self):
+        """Results are returned most recent first, and can be paginated."""
+        for i in range(5):
+            self.helper.send(self.room_id, body="message %d" % (i,), tok=self.tok)
+        self.pump()
+
+        bodies = []
+        pagination_token = None
+        for _ in range(3):
+            result = self.get_success(
+                self.backend.search_rooms(
+                    [self.room_id],
+                    "message",
+                    ["content.body"],
+                    2,
+                    pagination_token=pagination_token,
+                )
+            )
+            self.assertEqual(result["count"], 5)
+            bodies.extend(self._bodies(result))
+            if result["results"]:
+                pagination_token = result["results"][-1]["pagination_token"]
+
+        self.assertEqual(bodies, ["message %d" % (i,) for i in reversed(range(5))])
+
+    def test_flush(self):
+        """Indexed events are written out to disk, where other instances can
+        search them.
+        """
+        self.helper.send(self.room_id, body="hello world", tok=self.tok)
+        self.pump()
+
+        self.get_success(self.backend._flush())
+        self.assertEqual(self.backend._memory_segments, [])
+        self.assertEqual(len(self.backend._index.segments), 1)
+
+        # Another instance reading the same index finds the event.
+        reader = InvertedIndexSearchBackend(
+            self.hs,
+            InvertedIndexSearchBackend.parse_config(
+                {
+                    "index_directory": self.index_directory,
+                    "indexer_instance": "some_other_worker",
+                }
+            ),
+        )
+        result = self._search_msgs(reader, "hello")
+        self.assertEqual(self._bodies(result), ["hello world"])
+
+        # ... and picks up newly written segments.
+        self.helper.send(self.room_id, body="hello again", tok=self.tok)
+        self.pump()
+        self.get_success(self.backend._flush())
+
+        result = self._search_msgs(reader, "hello")
+        self.assertCountEqual(self._bodies(result), ["hello world", "hello again"])
+
+    def test_resume(self):
+        """Indexing resumes from the position recorded on disk."""
+        self.helper.send(self.room_id, body="hello world", tok=self.tok)
+        self.pump()
+        self.get_success(self.backend._flush())
+
+        position = self.backend._position
+        index = _SearchIndex(self.hs, self.index_directory, is_writer=False)
+        self.get_success(index.reload())
+        self.assertEqual(index.manifest["position"], position)
+
+    @patch("synapse.search.inverted_index._MAX_SEGMENTS", 2)
+    @patch("synapse.search.inverted_index._MERGE_FACTOR", 2)
+    def test_merge(self):
+        """Segments are merged together when there are too many of them."""
+        for i in range(3):
+            self.helper.send(self.room_id, body="hello %d" % (i,), tok=self.tok)
+            self.pump()
+            self.get_success(self.backend._flush())
+
+        self.assertEqual(len(self.backend._index.segments), 2)
+
+        result = self._search_msgs(self.backend, "hello")
+        self.assertEqual(result["count"], 3)
+
+        # The merged segments get deleted after a while.
+        self.reactor.advance(120)
+        files = os.listdir(self.index_directory)
+        self.assertEqual(len([f for f in files if f.endswith(".postings")]), 2)
+
+    def _redact(self, event_id):
+        channel = self.make_request(
+            "POST",
+            "/rooms/%s/redact/%s" % (self.room_id, event_id),
+            {},
+            access_token=self.tok,
+        )
+        self.assertEqual(channel.code, 200, channel.json_body)
+        self.pump()
+
+    def _event_ids_on_disk(self):
+        """Get the IDs of the events in the segments listed in the manifest."""
+        event_ids = set()
+        for segment in self.backend._index.segments.values():
+            for _, _, postings in segment.iter_postings():
+                event_ids.update(posting[2] for posting in postings)
+        return event_ids
+
+    @patch("synapse.search.inverted_index._MAX_TOMBSTONES", 1)
+    def test_redaction(self):
+        """Redacted events aren't returned, counted or highlighted, and get
+        removed from the segments on disk.
+        """
+        secret_id = self.helper.send(self.room_id, body="hello secret", tok=self.tok)[
+            "event_id"
+        ]
+        self.helper.send(self.room_id, body="hello there", tok=self.tok)
+        self.pump()
+        self.get_success(self.backend._flush())
+        self.assertIn(secret_id, self._event_ids_on_disk())
+
+        self._redact(secret_id)
+
+        result = self._search_msgs(self.backend, "hello")
+        self.assertEqual(self._bodies(result), ["hello there"])
+        self.assertEqual(result["count"], 1)
+        self.assertEqual(result["highlights"], {"hello"})
+
+        result = self._search_msgs(self.backend, "secret")
+        self.assertEqual(result["count"], 0)
+        self.assertEqual(result["highlights"], set())
+
+        # Flushing writes out the tombstone and then, as there are enough
+        # tombstones, rewrites the segment without the redacted event.
+        self.get_success(self.backend._flush())
+        self.assertNotIn(secret_id, self._event_ids_on_disk())
+        self.assertEqual(len(self.backend._index.tombstones), 0)
+
+        result = self._search_msgs(self.backend, "hello")
+        self.assertEqual(self._bodies(result), ["hello there"])
+
+    @patch("synapse.search.inverted_index._MAX_TOMBSTONES", 1)
+    def test_compact_only_segments_with_many_tombstones(self):
+        """Only segments where a large enough proportion of the documents have
+        been deleted are rewritten, and the tombstones for the events in the
+        other segments are kept.
+        """
+        secret_id = self.helper.send(self.room_id, body="hello secret", tok=self.tok)[
+            "event_id"
+        ]
+        self.pump()
+        self.get_success(self.backend._flush())
+
+        event_ids = []
+        for i in range(10):
+            event_ids.append(
+                self.helper.send(self.room_id, body="hello %d" % (i,), tok=self.tok)[
+                    "event_id"
+                ]
+            )
+        self.pump()
+        self.get_success(self.backend._flush())
+        large_segment = self.backend._index.manifest["segments"][1][0]
+
+        self._redact(secret_id)
+        self._redact(event_ids[0])
+        self.get_success(self.backend._flush())
+
+        # The segment which only contained the secret has gone, while the
+        # larger segment is left alone.
+        self.assertEqual(
+            [name for name, _ in self.backend._index.manifest["segments"]],
+            [large_segment],
+        )
+        self.assertEqual(self._event_ids_on_disk(), set(event_ids))
+        self.assertEqual(self.backend._index.tombstones.events, {event_ids[0]})
+        self.assertIsNone(self.backend._index.tombstones.since)
+
+        result = self._search_msgs(self.backend, "hello")
+        self.assertEqual(result["count"], 9)
+
+        # The segments aren't checked again until there are new tombstones.
+        with patch("synapse.search.inverted_index._find_tombstoned") as find_tombstoned:
+            self.get_success(self.backend._flush())
+        find_tombstoned.assert_not_called()
+
+    def test_highlights_only_from_results(self):
+        """Only the words of events which matched all the terms are
+        highlighted.
+        """
+        self.helper.send(self.room_id, body="hello world", tok=self.tok)
+        self.helper.send(self.room_id, body="help there", tok=self.tok)
+        self.pump()
+
+        # "hel" is a prefix of "hello", but that event doesn't contain "there".
+        result = self._search_msgs(self.backend, "hel there")
+        self.assertEqual(self._bodies(result), ["help there"])
+        self.assertEqual(result["highlights"], {"help", "there"})
+
+    def test_purge_room(self):
+        """Events in purged rooms are no longer returned, and get removed from
+        the segments on disk once they have been tombstoned for long enough.
+        """
+        event_id = self.helper.send(self.room_id, body="hello world", tok=self.tok)[
+            "event_id"
+        ]
+        self.helper.send(self.other_room_id, body="hello world", tok=self.tok)
+        self.pump()
+        self.get_success(self.backend._flush())
+
+        self.get_success(self.hs.get_storage().purge_events.purge_room(self.room_id))
+        self.get_success(self.backend._flush())
+
+        result = self._search_msgs(self.backend, "hello")
+        self.assertEqual(result["count"], 0)
+        self.assertEqual(result["highlights"], set())
+        self.assertIn(event_id, self._event_ids_on_disk())
+
+        # The deletion has been recorded, so the row is removed.
+        self.assertEqual(
+            self.get_success(self.hs.get_datastore().get_search_index_deletions(10)),
+            [],
+        )
+
+        # The segments get rewritten once the tombstones are old enough.
+        self.reactor.advance(24 * 60 * 60)
+        self.get_success(self.backend._flush())
+        self.assertNotIn(event_id, self._event_ids_on_disk())
+
+        result = self._search_msgs(self.backend, "hello", [self.other_room_id])
+        self.assertEqual(self._bodies(result), ["hello world"])
+
+    def test_purge_history(self):
+        """Events removed by purging history are no longer returned."""
+        first = self.helper.send(self.room_id, body="hello first", tok=self.tok)
+        last = self.helper.send(self.room_id, body="hello last", tok=self.tok)
+        self.pump()
+
+        store = self.hs.get_datastore()
+        token = self.get_success(
+            store.get_topological_token_for_event(last["event_id"])
+        )
+        token_str = self.get_success(token.to_string(store))
+        self.get_success(
+            self.hs.get_storage().purge_events.purge_history(
+                self.room_id, token_str, True
+            )
+        )
+        self.get_success(self.backend._flush())
+
+        self.assertIn(first["event_id"], self.backend._index.tombstones.events)
+        result = self._search_msgs(self.backend, "hello")
+        self.assertEqual(self._bodies(result), ["hello last"])
+        self.assertEqual(result["count"], 1)
@@ -14,6 +14,7 @@
 
 import itertools
 from typing import List
+from unittest.mock import Mock
 
 import attr
 
@@ -643,6 +644,31 @@ class SimpleParamStateTestCase(unittest.TestCase):
 
         self.assert_dict(self.expected_combined_state, state)
 
+    def test_events_fetched_in_batches(self):
+        # Test that the events needed for resolution are fetched from the store
+        # in batches, rather than one at a time.
+
+        store = TestStateResolutionStore(self.event_map)
+        get_events = Mock(side_effect=store.get_events)
+        store.get_events = get_events
+
+        state_d = resolve_events_with_store(
+            FakeClock(),
+            ROOM_ID,
+            RoomVersions.V2,
+            [self.state_at_bob, self.state_at_charlie],
+            event_map=None,
+            state_res_store=store,
+        )
+
+        state = self.successResultOf(defer.ensureDeferred(state_d))
+
+        self.assert_dict(self.expected_combined_state, state)
+
+        # None of the calls should have been for a single event.
+        for call in get_events.call_args_list:
+            self.assertNotEqual(len(call[0][0]), 1, call)
+
 
 class AuthChainDifferenceTestCase(unittest.TestCase):
     """We test that `_get_auth_chain_difference` correctly handles unpersisted
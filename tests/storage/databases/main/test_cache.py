@@ -0,0 +1,82 @@
+# Copyright 2021 The Matrix.org Foundation C.I.C.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from synapse.replication.tcp.streams import CachesStream
+from synapse.server import HomeServer
+from synapse.storage.databases.main.cache import (
+    BULK_CACHE_INVALIDATION_NAME,
+    MAX_INVALIDATION_ROW_KEYS_SIZE,
+    _chunk_keys_by_size,
+)
+from synapse.util import json_encoder
+
+from tests import unittest
+
+
+class CacheInvalidationTestCase(unittest.HomeserverTestCase):
+    def prepare(self, reactor, clock, hs: HomeServer):
+        self.store = hs.get_datastore()
+
+    def test_chunk_keys_by_size(self):
+        """Keys are packed into as few chunks as fit in a replication row."""
+        keys = ["@user%d:test" % (i,) for i in range(2000)]
+        chunks = list(_chunk_keys_by_size(keys))
+
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual([k for chunk in chunks for k in chunk], keys)
+        for chunk in chunks:
+            self.assertLessEqual(
+                len(json_encoder.encode(chunk)), MAX_INVALIDATION_ROW_KEYS_SIZE
+            )
+
+    def test_process_bulk_invalidation_row(self):
+        """A bulk invalidation row received over replication invalidates all
+        the given keys.
+        """
+        self.store.is_host_joined.prefill(("!room:test", "a"), True)
+        self.store.is_host_joined.prefill(("!room:test", "b"), True)
+        self.store.is_host_joined.prefill(("!room:test", "c"), True)
+        self.store._get_state_group_for_event.prefill(("$event",), 1)
+
+        rows = [
+            CachesStream.ROW_TYPE(
+                BULK_CACHE_INVALIDATION_NAME,
+                [
+                    "is_host_joined",
+                    json_encoder.encode(["!room:test", "a"]),
+                    json_encoder.encode(["!room:test", "b"]),
+                ],
+                0,
+            ),
+            CachesStream.ROW_TYPE(
+                BULK_CACHE_INVALIDATION_NAME,
+                ["_get_state_group_for_event", json_encoder.encode(["$event"])],
+                0,
+            ),
+            # Caches which don't exist on this worker are ignored.
+            CachesStream.ROW_TYPE(
+                BULK_CACHE_INVALIDATION_NAME,
+                ["not_a_cache", json_encoder.encode(["key"])],
+                0,
+            ),
+        ]
+        self.store.process_replication_rows(CachesStream.NAME, "master", 1, rows)
+
+        cache = self.store.is_host_joined.cache
+        self.assertIsNone(cache.get_immediate(("!room:test", "a"), None))
+        self.assertIsNone(cache.get_immediate(("!room:test", "b"), None))
+        self.assertIsNotNone(cache.get_immediate(("!room:test", "c"), None))
+        self.assertIsNone(
+            self.store._get_state_group_for_event.cache.get_immediate("$event", None)
+        )
@@ -12,6 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 import json
+from unittest.mock import Mock, patch
 
 from synapse.logging.context import LoggingContext
 from synapse.rest import admin
@@ -144,3 +145,28 @@ class EventCacheTestCase(unittest.HomeserverTestCase):
 
             # We should have fetched the event from the DB
             self.assertEqual(ctx.get_resource_usage().evt_db_fetch_count, 1)
+
+    @patch("synapse.storage.databases.main.events_worker.EVENT_QUEUE_BATCH_SIZE", 2)
+    def test_large_fetch_is_split(self):
+        """Test that fetching more events than the batch size splits the fetch
+        into several requests, and that we get all the events back.
+        """
+        event_ids = [self.event_id]
+        for _ in range(4):
+            res = self.helper.send(self.room, tok=self.token)
+            event_ids.append(res["event_id"])
+        self.store._get_event_cache.clear()
+
+        fetch_event_list = Mock(side_effect=self.store._fetch_event_list)
+        self.store._fetch_event_list = fetch_event_list
+
+        events = self.get_success(self.store.get_events(event_ids))
+        self.assertEqual(set(events), set(event_ids))
+        for event_id in event_ids:
+            self.assertEqual(events[event_id].event_id, event_id)
+
+        # Each fetch should only have handled up to two events.
+        self.assertEqual(fetch_event_list.call_count, 3)
+        for call in fetch_event_list.call_args_list:
+            event_list = call[0][1]
+            self.assertLessEqual(sum(len(events) for events, _, _ in event_list), 2)
@@ -15,6 +15,8 @@
 
 import secrets
 
+from twisted.internet import defer
+
 from tests import unittest
 
 
@@ -103,3 +105,95 @@ class UpsertManyTests(unittest.HomeserverTestCase):
             set(self._dump_to_tuple(res)),
             {(1, "user1", "hello"), (2, "user2", "bleb")},
         )
+
+    def test_upsert_buffered(self):
+        """
+        Buffered upserts are coalesced, and written out once the flush interval
+        has passed.
+        """
+        db_pool = self.storage.db_pool
+
+        for value in ("hello", "there", "bleb"):
+            self.get_success(
+                db_pool.simple_upsert_buffered(
+                    self.table_name,
+                    keyvalues={"id": 1, "username": "user1"},
+                    values={"value": value},
+                )
+            )
+        self.get_success(
+            db_pool.simple_upsert_buffered(
+                self.table_name,
+                keyvalues={"id": 2, "username": "user2"},
+                values={"value": "world"},
+            )
+        )
+
+        # Nothing has been written yet.
+        res = self.get_success(
+            db_pool.simple_select_list(self.table_name, None, ["id, username, value"])
+        )
+        self.assertEqual(res, [])
+
+        # Once the flush interval passes, only the latest value for each row is
+        # written.
+        self.reactor.advance(1)
+        res = self.get_success(
+            db_pool.simple_select_list(self.table_name, None, ["id, username, value"])
+        )
+        self.assertEqual(
+            set(self._dump_to_tuple(res)),
+            {(1, "user1", "bleb"), (2, "user2", "world")},
+        )
+
+    def test_upsert_buffered_flushed_on_shutdown(self):
+        """
+        Buffered upserts are written out when the server shuts down.
+        """
+        db_pool = self.storage.db_pool
+
+        self.get_success(
+            db_pool.simple_upsert_buffered(
+                self.table_name,
+                keyvalues={"id": 1, "username": "user1"},
+                values={"value": "hello"},
+            )
+        )
+
+        # Run the shutdown triggers as the reactor would, waiting for any
+        # Deferreds they return.
+        self.get_success(
+            defer.gatherResults(
+                [
+                    defer.maybeDeferred(trigger, *args, **kwargs)
+                    for trigger, args, kwargs in self.reactor.triggers["before"][
+                        "shutdown"
+                    ]
+                ]
+            )
+        )
+
+        res = self.get_success(
+            db_pool.simple_select_list(self.table_name, None, ["id, username, value"])
+        )
+        self.assertEqual(set(self._dump_to_tuple(res)), {(1, "user1", "hello")})
+
+    def test_upsert_buffered_disabled(self):
+        """
+        If the flush interval is zero, buffered upserts are written immediately.
+        """
+        db_pool = self.storage.db_pool
+        db_pool._upsert_flush_interval = 0
+
+        self.get_success(
+            db_pool.simple_upsert_buffered(
+                self.table_name,
+                keyvalues={"id": 1, "username": "user1"},
+                values={"value": "hello"},
+            )
+        )
+
+        res = self.get_success(
+            db_pool.simple_select_list(self.table_name, None, ["id, username, value"])
+        )
+        self.assertEqual(set(self._dump_to_tuple(res)), {(1, "user1", "hello")})
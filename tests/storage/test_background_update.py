@@ -1,5 +1,8 @@
 from unittest.mock import Mock
 
+from twisted.internet import defer
+
+from synapse.logging.context import make_deferred_yieldable
 from synapse.storage.background_updates import BackgroundUpdater
 
 from tests import unittest
@@ -87,3 +90,137 @@ class BackgroundUpdateTestCase(unittest.HomeserverTestCase):
         )
         self.assertTrue(result)
         self.assertFalse(self.update_handler.called)
+
+    def test_concurrent_updates(self):
+        """Independent updates are run concurrently, and updates wait for those
+        they depend on.
+        """
+        store = self.hs.get_datastore()
+        for update_name, depends_on in (
+            ("update_a", None),
+            ("update_b", None),
+            ("update_c", "update_a"),
+        ):
+            self.get_success(
+                store.db_pool.simple_insert(
+                    "background_updates",
+                    values={
+                        "update_name": update_name,
+                        "progress_json": "{}",
+                        "depends_on": depends_on,
+                    },
+                )
+            )
+
+        calls = []
+
+        def make_handler(update_name):
+            async def update(progress, count):
+                calls.append(update_name)
+                await self.updates._end_background_update(update_name)
+                return count
+
+            return update
+
+        for update_name in ("update_a", "update_b", "update_c"):
+            self.updates.register_background_update_handler(
+                update_name, make_handler(update_name)
+            )
+
+        # update_c depends on update_a, so only a and b can run at first.
+        result = self.get_success(self.updates.do_next_background_updates(100, 3))
+        self.assertFalse(result)
+        self.assertCountEqual(calls, ["update_a", "update_b"])
+
+        calls.clear()
+        result = self.get_success(self.updates.do_next_background_updates(100, 3))
+        self.assertFalse(result)
+        self.assertEqual(calls, ["update_c"])
+
+        result = self.get_success(self.updates.do_next_background_updates(100, 3))
+        self.assertTrue(result)
+
+    def test_concurrent_update_fails(self):
+        """If one of several concurrent updates fails, we wait for the others
+        to finish before raising the error.
+        """
+        store = self.hs.get_datastore()
+        for update_name in ("update_a", "update_b"):
+            self.get_success(
+                store.db_pool.simple_insert(
+                    "background_updates",
+                    values={"update_name": update_name, "progress_json": "{}"},
+                )
+            )
+
+        async def update_a(progress, count):
+            raise Exception("bad update")
+
+        update_b_blocker: "defer.Deferred[None]" = defer.Deferred()
+
+        async def update_b(progress, count):
+            await make_deferred_yieldable(update_b_blocker)
+            await self.updates._end_background_update("update_b")
+            return count
+
+        self.updates.register_background_update_handler("update_a", update_a)
+        self.updates.register_background_update_handler("update_b", update_b)
+
+        d = defer.ensureDeferred(self.updates.do_next_background_updates(100, 2))
+        self.pump()
+        self.assertNoResult(d)
+
+        # update_b is still running, so we must not start another batch of it.
+        self.assertIn("update_b", self.updates._current_background_updates)
+
+        update_b_blocker.callback(None)
+        self.get_failure(d, Exception)
+        self.assertNotIn("update_b", self.updates._current_background_updates)
+
+    def test_prioritise_background_update(self):
+        """Prioritising an update moves it to the front of the queue."""
+        store = self.hs.get_datastore()
+        for update_name in ("update_a", "update_b"):
+            self.get_success(
+                store.db_pool.simple_insert(
+                    "background_updates",
+                    values={"update_name": update_name, "progress_json": "{}"},
+                )
+            )
+
+        self.assertTrue(
+            self.get_success(self.updates.prioritise_background_update("update_b"))
+        )
+        self.assertFalse(
+            self.get_success(self.updates.prioritise_background_update("unknown"))
+        )
+
+        pending = self.get_success(self.updates.get_pending_background_updates())
+        self.assertEqual(
+            [upd["update_name"] for upd in pending], ["update_b", "update_a"]
+        )
+
+    def test_eta(self):
+        """An ETA is estimated for updates which track how much is remaining."""
+        store = self.hs.get_datastore()
+        self.get_success(
+            store.db_pool.simple_insert(
+                "background_updates",
+                values={
+                    "update_name": "test_update",
+                    "progress_json": '{"remaining": 1000}',
+                },
+            )
+        )
+
+        async def update(progress, count):
+            await self.clock.sleep(1)
+            return 100
+
+        self.update_handler.side_effect = update
+        self.get_success(self.updates.do_next_background_update(1000), by=0.1)
+
+        stats = self.updates.get_current_update_stats()["test_update"]
+        self.assertEqual(stats["total_item_count"], 100)
+        # 900 items left at roughly 100 items a second
+        self.assertApproximates(stats["eta_seconds"], 9, 1)
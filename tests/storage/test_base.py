@@ -46,6 +46,7 @@ class SQLBaseStoreTestCase(unittest.TestCase):
             return defer.succeed(func(self.mock_conn, *args, **kwargs))
 
         self.db_pool.runWithConnection = runWithConnection
+        self.db_pool.running = True
 
         config = default_config(name="test", parse=True)
         hs = TestHomeServer("test", config=config)
@@ -56,7 +57,16 @@ class SQLBaseStoreTestCase(unittest.TestCase):
         fake_engine.can_native_upsert = False
         fake_engine.in_transaction.return_value = False
 
-        db = DatabasePool(Mock(), Mock(config=sqlite_config), fake_engine)
+        db = DatabasePool(
+            Mock(),
+            Mock(
+                config=sqlite_config,
+                replicas=[],
+                upsert_flush_interval_ms=500,
+                max_concurrent_background_updates=1,
+            ),
+            fake_engine,
+        )
         db._db_pool = self.db_pool
 
         self.datastore = SQLBaseStore(db, None, hs)
@@ -12,7 +12,16 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from synapse.storage.database import make_tuple_comparison_clause
+from unittest.mock import Mock
+
+from twisted.internet import defer
+
+from synapse.logging.context import LoggingContext, run_in_background
+from synapse.storage.database import (
+    TransactionLane,
+    _ReplicaBehindError,
+    make_tuple_comparison_clause,
+)
 from synapse.storage.engines import BaseDatabaseEngine
 
 from tests import unittest
@@ -38,3 +47,258 @@ class TupleComparisonClauseTestCase(unittest.TestCase):
         clause, args = make_tuple_comparison_clause([("a", 1), ("b", 2)])
         self.assertEqual(clause, "(a,b) > (?,?)")
         self.assertEqual(args, [1, 2])
+
+
+class TransactionLaneTestCase(unittest.HomeserverTestCase):
+    def prepare(self, reactor, clock, hs):
+        self.db_pool = hs.get_datastore().db_pool
+
+        # Replace the underlying connection pool with one where we control when
+        # each piece of work finishes.
+        self.started = []
+
+        def runWithConnection(func, *args, **kwargs):
+            d = defer.Deferred()
+            self.started.append((args[0], d))
+            return d
+
+        self.db_pool._db_pool = Mock(spec=["runWithConnection", "running"])
+        self.db_pool._db_pool.runWithConnection = runWithConnection
+        self.db_pool._db_pool.running = True
+
+        self.db_pool._max_connections = 2
+        self.db_pool._max_bulk_connections = 1
+        self.db_pool._bulk_connection_limit = 1
+
+    def _start(self, name, lane=TransactionLane.NORMAL):
+        with LoggingContext(name):
+            with self.db_pool.transaction_lane(lane):
+                return run_in_background(self.db_pool.runWithConnection, None, name)
+
+    def _started_names(self):
+        return [name for name, _ in self.started]
+
+    def _finish(self, name):
+        for started_name, d in self.started:
+            if started_name == name:
+                d.callback(name)
+                return
+        raise AssertionError("%s was not started" % (name,))
+
+    def test_lanes(self):
+        """Bulk work is limited to its share of the connections, and queued work
+        is started in priority order.
+        """
+        d_bulk1 = self._start("bulk1", TransactionLane.BULK)
+        self._start("bulk2", TransactionLane.BULK)
+        self._start("normal1")
+
+        # Only one piece of bulk work may run at once, leaving a connection for
+        # the normal work.
+        self.assertEqual(self._started_names(), ["bulk1", "normal1"])
+
+        self._start("normal2")
+        self._start("critical", TransactionLane.LATENCY_CRITICAL)
+        self.assertEqual(self._started_names(), ["bulk1", "normal1"])
+
+        # When a connection frees up the latency critical work gets it, even
+        # though it was queued after other work.
+        self._finish("bulk1")
+        self.assertEqual(self.successResultOf(d_bulk1), "bulk1")
+        self.assertEqual(self._started_names(), ["bulk1", "normal1", "critical"])
+
+        self._finish("normal1")
+        self.assertEqual(
+            self._started_names(), ["bulk1", "normal1", "critical", "normal2"]
+        )
+
+        # The remaining bulk work waits for the other work to finish.
+        self._finish("critical")
+        self.assertEqual(
+            self._started_names(),
+            ["bulk1", "normal1", "critical", "normal2", "bulk2"],
+        )
+
+    def test_adaptive_bulk_limit(self):
+        """The bulk lane shrinks when other work has to wait, and grows back
+        once it doesn't.
+        """
+        self.db_pool._max_bulk_connections = 4
+        self.db_pool._bulk_connection_limit = 4
+
+        self.db_pool._record_lane_queue_time(TransactionLane.NORMAL, "test", 1.0)
+        self.assertEqual(self.db_pool._bulk_connection_limit, 2)
+
+        self.db_pool._record_lane_queue_time(TransactionLane.NORMAL, "test", 1.0)
+        self.assertEqual(self.db_pool._bulk_connection_limit, 1)
+
+        # Bulk work waiting doesn't affect the limit.
+        self.db_pool._recent_lane_queue_time = 0
+        self.db_pool._record_lane_queue_time(TransactionLane.BULK, "test", 1.0)
+        self.assertEqual(self.db_pool._bulk_connection_limit, 1)
+
+        # Once other work stops waiting the limit grows, but only gradually.
+        self.db_pool._last_bulk_limit_increase = 0
+        self.db_pool._record_lane_queue_time(TransactionLane.NORMAL, "test", 0)
+        self.assertEqual(self.db_pool._bulk_connection_limit, 2)
+        self.db_pool._record_lane_queue_time(TransactionLane.NORMAL, "test", 0)
+        self.assertEqual(self.db_pool._bulk_connection_limit, 2)
+
+
+class ReadReplicaTestCase(unittest.HomeserverTestCase):
+    def prepare(self, reactor, clock, hs):
+        self.db_pool = hs.get_datastore().db_pool
+
+        # Use the primary as the "replica", and fake out the WAL position
+        # queries, which only work on Postgres.
+        self.db_pool._replica_pools = [self.db_pool._db_pool]
+
+        self.wal_position_fetches = 0
+
+        def get_wal_position_txn(txn):
+            self.wal_position_fetches += 1
+            return "0/%d" % (self.wal_position_fetches,)
+
+        self.db_pool._get_wal_position_txn = get_wal_position_txn
+
+        self.replica_caught_up = True
+        self.checked_positions = []
+
+        def check_replica_position_txn(txn, wal_position, func, *args, **kwargs):
+            self.checked_positions.append(wal_position)
+            if not self.replica_caught_up:
+                raise _ReplicaBehindError()
+            return func(txn, *args, **kwargs)
+
+        self.db_pool._check_replica_position_txn = check_replica_position_txn
+
+    def _run_read(self):
+        return self.get_success(
+            self.db_pool.runInteraction(
+                "test_read", lambda txn: "result", db_read_only=True
+            )
+        )
+
+    def test_read_from_replica(self):
+        """Read-only transactions are checked against the primary's WAL
+        position and then run on the replica.
+        """
+        self.assertEqual(self._run_read(), "result")
+        self.assertEqual(self.checked_positions, ["0/1"])
+
+        # Each read needs a fresh position.
+        self._run_read()
+        self.assertEqual(self.checked_positions, ["0/1", "0/2"])
+
+    def test_fallback_to_primary(self):
+        """If the replica is behind, the transaction is run on the primary."""
+        self.replica_caught_up = False
+        self.assertEqual(self._run_read(), "result")
+        self.assertEqual(self.checked_positions, ["0/1"])
+
+    def test_fallback_when_replica_fails(self):
+        """If the replica fails, the transaction is run on the primary and the
+        replica isn't used again until it has had time to recover.
+        """
+        replica_pool = Mock()
+        replica_pool.runWithConnection.side_effect = lambda *args, **kwargs: (
+            defer.fail(self.db_pool.engine.module.OperationalError("gone away"))
+        )
+        self.db_pool._replica_pools = [replica_pool]
+
+        self.assertEqual(self._run_read(), "result")
+        self.assertEqual(replica_pool.runWithConnection.call_count, 1)
+
+        # The replica is skipped while it is backed off.
+        self.assertEqual(self._run_read(), "result")
+        self.assertEqual(replica_pool.runWithConnection.call_count, 1)
+
+        # Once the back off has passed the replica is used again.
+        self.reactor.advance(60)
+        self.db_pool._replica_pools = [self.db_pool._db_pool]
+        self.assertEqual(self._run_read(), "result")
+        self.assertEqual(len(self.checked_positions), 1)
+
+    def test_not_read_only(self):
+        """Transactions which aren't marked read-only never use the replica."""
+        self.get_success(self.db_pool.runInteraction("test", lambda txn: None))
+        self.assertEqual(self.checked_positions, [])
+        self.assertEqual(self.wal_position_fetches, 0)
+
+    def test_wal_position_fetches_are_batched(self):
+        """Concurrent reads share WAL position queries."""
+        with LoggingContext("test"):
+            ds = [
+                run_in_background(self.db_pool._get_primary_wal_position)
+                for _ in range(5)
+            ]
+        self.pump()
+
+        # The first read's query had already started when the others were
+        # made, so they share a second query.
+        self.assertEqual(
+            [self.successResultOf(d) for d in ds],
+            ["0/1", "0/2", "0/2", "0/2", "0/2"],
+        )
+        self.assertEqual(self.wal_position_fetches, 2)
+
+
+class StreamRowsTestCase(unittest.HomeserverTestCase):
+    def prepare(self, reactor, clock, hs):
+        self.db_pool = hs.get_datastore().db_pool
+
+        self.get_success(
+            self.db_pool.runInteraction(
+                "create",
+                lambda txn: txn.execute(
+                    "CREATE TABLE stream_test(id INTEGER, value TEXT)"
+                ),
+            )
+        )
+        self.get_success(
+            self.db_pool.simple_insert_many(
+                "stream_test",
+                [{"id": i, "value": "v%d" % (i,)} for i in range(25)],
+                desc="insert",
+            )
+        )
+
+    def test_stream_rows(self):
+        """All rows are returned, across multiple batches."""
+
+        def _txn(txn):
+            return list(
+                txn.stream_rows(
+                    "SELECT id, value FROM stream_test WHERE id >= ? ORDER BY id",
+                    (5,),
+                    batch_size=7,
+                )
+            )
+
+        rows = self.get_success(self.db_pool.runInteraction("test", _txn))
+        self.assertEqual(
+            [tuple(row) for row in rows], [(i, "v%d" % (i,)) for i in range(5, 25)]
+        )
+
+    def test_stream_rows_interleaved(self):
+        """Other queries can be run on the transaction while rows are being
+        streamed.
+        """
+
+        def _txn(txn):
+            for (row_id,) in txn.stream_rows(
+                "SELECT id FROM stream_test ORDER BY id", batch_size=3
+            ):
+                txn.execute(
+                    "UPDATE stream_test SET value = ? WHERE id = ?",
+                    ("updated", row_id),
+                )
+
+        self.get_success(self.db_pool.runInteraction("test", _txn))
+
+        values = self.get_success(
+            self.db_pool.simple_select_onecol(
+                "stream_test", keyvalues={}, retcol="value", desc="select"
+            )
+        )
+        self.assertEqual(values, ["updated"] * 25)
@@ -591,12 +591,7 @@ class EventChainBackgroundUpdateTestCase(HomeserverTestCase):
         # Test that calculating the auth chain difference using the newly
         # calculated chain cover works.
         self.get_success(
-            self.store.db_pool.runInteraction(
-                "test",
-                self.store._get_auth_chain_difference_using_cover_index_txn,
-                room_id,
-                states,
-            )
+            self.store._get_auth_chain_difference_using_cover_index(room_id, states)
         )
 
     def test_background_update_multiple_rooms(self):
@@ -634,12 +629,7 @@ class EventChainBackgroundUpdateTestCase(HomeserverTestCase):
         # Test that calculating the auth chain difference using the newly
         # calculated chain cover works.
         self.get_success(
-            self.store.db_pool.runInteraction(
-                "test",
-                self.store._get_auth_chain_difference_using_cover_index_txn,
-                room_id1,
-                states1,
-            )
+            self.store._get_auth_chain_difference_using_cover_index(room_id1, states1)
         )
 
     def test_background_update_single_large_room(self):
@@ -687,12 +677,7 @@ class EventChainBackgroundUpdateTestCase(HomeserverTestCase):
         # Test that calculating the auth chain difference using the newly
         # calculated chain cover works.
         self.get_success(
-            self.store.db_pool.runInteraction(
-                "test",
-                self.store._get_auth_chain_difference_using_cover_index_txn,
-                room_id,
-                states,
-            )
+            self.store._get_auth_chain_difference_using_cover_index(room_id, states)
         )
 
     def test_background_update_multiple_large_room(self):
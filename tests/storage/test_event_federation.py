@@ -12,11 +12,15 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from unittest.mock import patch
+
 import attr
 from parameterized import parameterized
 
 from synapse.api.room_versions import RoomVersions
 from synapse.events import _EventInternalMetadata
+from synapse.replication.tcp.streams.events import EventsStreamEventRow, EventsStreamRow
+from synapse.storage.util.auth_chain_index import AuthChainIndex
 from synapse.util import json_encoder
 
 import tests.unittest
@@ -506,6 +510,164 @@ class EventFederationWorkerStoreTestCase(tests.unittest.HomeserverTestCase):
         )
         self.assertSetEqual(difference, set())
 
+    def _add_event_to_auth_chain(self, room_id: str, event_id: str, auth_events):
+        """Adds an event to the auth chain set up by `_setup_auth_chain`."""
+
+        def insert_event(txn):
+            self.store.db_pool.simple_insert_txn(
+                txn,
+                table="events",
+                values={
+                    "event_id": event_id,
+                    "room_id": room_id,
+                    "depth": 8,
+                    "topological_ordering": 8,
+                    "type": "m.test",
+                    "processed": True,
+                    "outlier": False,
+                    "stream_ordering": 100,
+                },
+            )
+
+            self.hs.datastores.persist_events._persist_event_auth_chain_txn(
+                txn, [FakeEvent(event_id, room_id, auth_events)]
+            )
+
+        self.get_success(self.store.db_pool.runInteraction("insert", insert_event))
+
+    def test_auth_chain_index(self):
+        """The chain cover index is kept in memory, and only the new parts of
+        chains are fetched from the database.
+        """
+        room_id = self._setup_auth_chain(True)
+
+        difference = self.get_success(
+            self.store.get_auth_chain_difference(room_id, [{"a"}, {"b"}, {"c"}])
+        )
+        self.assertSetEqual(difference, {"a", "b", "c", "e", "f"})
+
+        auth_chain_ids = self.get_success(self.store.get_auth_chain_ids(room_id, ["c"]))
+        self.assertCountEqual(auth_chain_ids, ["g", "h", "i", "j", "k"])
+
+        # Asking again doesn't need to go to the database.
+        with patch.object(
+            self.store, "_load_auth_chains_txn", wraps=self.store._load_auth_chains_txn
+        ) as load_auth_chains_txn:
+            difference = self.get_success(
+                self.store.get_auth_chain_difference(room_id, [{"a"}, {"b"}, {"c"}])
+            )
+            self.assertSetEqual(difference, {"a", "b", "c", "e", "f"})
+
+            auth_chain_ids = self.get_success(
+                self.store.get_auth_chain_ids(room_id, ["c"])
+            )
+            self.assertCountEqual(auth_chain_ids, ["g", "h", "i", "j", "k"])
+
+            load_auth_chains_txn.assert_not_called()
+
+            # New events get picked up.
+            self._add_event_to_auth_chain(room_id, "l", ["a", "c"])
+
+            auth_chain_ids = self.get_success(
+                self.store.get_auth_chain_ids(room_id, ["l"])
+            )
+            self.assertCountEqual(
+                auth_chain_ids, ["a", "c", "e", "f", "g", "h", "i", "j", "k"]
+            )
+
+            difference = self.get_success(
+                self.store.get_auth_chain_difference(room_id, [{"l"}, {"b"}])
+            )
+            self.assertSetEqual(difference, {"l", "a", "b", "c"})
+
+            # We only needed to load the new parts of the chains.
+            for call in load_auth_chains_txn.call_args_list:
+                from_seqs = call[0][1]
+                self.assertEqual(len(from_seqs), 1)
+
+    def test_auth_chain_index_large_chains(self):
+        """Chains too big for the in memory index aren't cached, and only the
+        parts of them that are needed get loaded.
+        """
+        room_id = self._setup_auth_chain(True)
+
+        # Only allow chains with up to two entries to be cached.
+        self.store._auth_chain_index = AuthChainIndex(20)
+
+        with patch.object(
+            self.store, "_load_auth_chains_txn", wraps=self.store._load_auth_chains_txn
+        ) as load_auth_chains_txn:
+            for _ in range(2):
+                difference = self.get_success(
+                    self.store.get_auth_chain_difference(room_id, [{"a"}, {"b"}, {"c"}])
+                )
+                self.assertSetEqual(difference, {"a", "b", "c", "e", "f"})
+
+                auth_chain_ids = self.get_success(
+                    self.store.get_auth_chain_ids(room_id, ["c"])
+                )
+                self.assertCountEqual(auth_chain_ids, ["g", "h", "i", "j", "k"])
+
+            seq_ranges = [
+                seq_range
+                for call in load_auth_chains_txn.call_args_list
+                for seq_range in call[0][1].values()
+            ]
+
+        # Some of the chains are only needed part way through.
+        self.assertTrue(any(min_seq > 0 for min_seq, _ in seq_ranges))
+
+        nodes = list(self.store._auth_chain_index._chains.cache.values())
+        self.assertTrue(nodes)
+        for node in nodes:
+            chain, size = node.value
+            self.assertLessEqual(size, 2)
+            self.assertEqual(size, len(chain))
+
+    def test_auth_chain_index_replication(self):
+        """New state events in rooms that the index is being used for are loaded
+        into the index as they come down replication.
+        """
+        room_id = self._setup_auth_chain(True)
+
+        self.get_success(self.store.get_auth_chain_difference(room_id, [{"a"}, {"b"}]))
+
+        self._add_event_to_auth_chain(room_id, "l", ["a", "c"])
+
+        # The main process's stream ID generator doesn't expect to be told
+        # about other writers.
+        with patch.object(self.store._stream_id_gen, "advance", create=True):
+            self.store.process_replication_rows(
+                "events",
+                "master",
+                100,
+                [
+                    EventsStreamRow(
+                        EventsStreamEventRow.TypeId,
+                        EventsStreamEventRow(
+                            "l", room_id, "foo", "foo", None, None, None, False
+                        ),
+                    )
+                ],
+            )
+        self.pump()
+
+        with patch.object(
+            self.store, "_load_auth_chains_txn", wraps=self.store._load_auth_chains_txn
+        ) as load_auth_chains_txn:
+            difference = self.get_success(
+                self.store.get_auth_chain_difference(room_id, [{"l"}, {"b"}])
+            )
+            self.assertSetEqual(difference, {"l", "a", "b", "c"})
+
+            # The chains for "c" still have to be loaded, as they weren't
+            # needed before.
+            for call in load_auth_chains_txn.call_args_list:
+                self.assertNotIn(
+                    self.store._auth_chain_index.get_positions(room_id, ["l"])["l"][0],
+                    call[0][1],
+                )
+
     def test_prune_inbound_federation_queue(self):
         "Test that pruning of inbound federation queues work"
 
@@ -144,6 +144,73 @@ class EventPushActionsStoreTestCase(HomeserverTestCase):
         _rotate(10)
         _assert_counts(1, 1)
 
+    def test_rotation_keeps_counts(self):
+        """Rotating push actions which only notify, or are only unread, doesn't
+        reset the other count in the summary.
+        """
+        room_id = "!foo:example.com"
+        user_id = "@user1235:example.com"
+
+        def _assert_counts(notif_count, unread_count):
+            counts = self.get_success(
+                self.store.db_pool.runInteraction(
+                    "", self.store._get_unread_counts_by_pos_txn, room_id, user_id, 0
+                )
+            )
+            self.assertEquals(
+                counts,
+                {
+                    "notify_count": notif_count,
+                    "unread_count": unread_count,
+                    "highlight_count": 0,
+                },
+            )
+
+        def _inject_actions(stream, actions, count_as_unread):
+            event = Mock()
+            event.room_id = room_id
+            event.event_id = "$test%d:example.com" % (stream,)
+            event.internal_metadata.stream_ordering = stream
+            event.depth = stream
+
+            self.get_success(
+                self.store.add_push_actions_to_staging(
+                    event.event_id,
+                    {user_id: actions},
+                    count_as_unread,
+                )
+            )
+            self.get_success(
+                self.store.db_pool.runInteraction(
+                    "",
+                    self.persist_events_store._set_push_actions_for_event_and_users_txn,
+                    [(event, None)],
+                    [(event, None)],
+                )
+            )
+
+        def _rotate(stream):
+            self.get_success(
+                self.store.db_pool.runInteraction(
+                    "", self.store._rotate_notifs_before_txn, stream
+                )
+            )
+
+        _inject_actions(1, PlAIN_NOTIF, False)
+        _inject_actions(2, PlAIN_NOTIF, True)
+        _rotate(3)
+        _assert_counts(2, 1)
+
+        # An event which is unread but doesn't notify.
+        _inject_actions(3, [], True)
+        _rotate(4)
+        _assert_counts(2, 2)
+
+        # An event which notifies but isn't unread.
+        _inject_actions(4, PlAIN_NOTIF, False)
+        _rotate(5)
+        _assert_counts(3, 2)
+
     def test_find_first_stream_ordering_after_ts(self):
         def add_event(so, ts):
             self.get_success(
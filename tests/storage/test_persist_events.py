@@ -0,0 +1,114 @@
+# Copyright 2021 The Matrix.org Foundation C.I.C.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from twisted.internet import defer
+
+from synapse.logging.context import make_deferred_yieldable
+from synapse.storage.persist_events import _EventPeristenceQueue
+
+from tests import unittest
+
+
+class EventPersistenceQueueTestCase(unittest.TestCase):
+    def setUp(self):
+        # The batches of events the queue asked us to persist, and the
+        # deferreds to resolve to finish persisting them.
+        self.batches = []
+        self.deferreds = []
+
+        async def persist(events_and_contexts, backfilled):
+            self.batches.append([ev for ev, _ in events_and_contexts])
+            d = defer.Deferred()
+            self.deferreds.append(d)
+            return await make_deferred_yieldable(d)
+
+        self.queue = _EventPeristenceQueue(persist)
+
+    def _add(self, room_id, event, backfilled=False):
+        return defer.ensureDeferred(
+            self.queue.add_to_queue(room_id, [(event, None)], backfilled=backfilled)
+        )
+
+    def test_rooms_are_independent(self):
+        """A room whose events are slow to persist doesn't hold up other rooms."""
+        d1 = self._add("!room1", "ev1")
+        d2 = self._add("!room2", "ev2")
+        self.assertEqual(self.batches, [["ev1"], ["ev2"]])
+
+        self.deferreds[1].callback("result2")
+        self.assertEqual(self.successResultOf(d2), "result2")
+        self.assertNoResult(d1)
+
+        # room2 can carry on persisting events while room1 is still busy.
+        d3 = self._add("!room2", "ev3")
+        self.assertEqual(self.batches[2], ["ev3"])
+        self.deferreds[2].callback("result3")
+        self.assertEqual(self.successResultOf(d3), "result3")
+
+        self.deferreds[0].callback("result1")
+        self.assertEqual(self.successResultOf(d1), "result1")
+
+    def test_batches_events_in_room(self):
+        """Events queued for a room while it is busy are persisted in a single
+        batch.
+        """
+        d1 = self._add("!room1", "ev1")
+        d2 = self._add("!room1", "ev2")
+        d3 = self._add("!room1", "ev3")
+        self.assertEqual(self.batches, [["ev1"]])
+
+        self.deferreds[0].callback("result1")
+        self.assertEqual(self.successResultOf(d1), "result1")
+        self.assertEqual(self.batches[1], ["ev2", "ev3"])
+
+        self.deferreds[1].callback("result2")
+        self.assertEqual(self.successResultOf(d2), "result2")
+        self.assertEqual(self.successResultOf(d3), "result2")
+
+    def test_backfilled_not_batched_together(self):
+        """Backfilled and non-backfilled events are persisted separately."""
+        self._add("!room1", "ev1")
+        d2 = self._add("!room1", "ev2", backfilled=True)
+        d3 = self._add("!room1", "ev3")
+
+        self.deferreds[0].callback("result1")
+        self.assertEqual(self.batches[1], ["ev2"])
+
+        self.deferreds[1].callback("result2")
+        self.assertEqual(self.successResultOf(d2), "result2")
+        self.assertEqual(self.batches[2], ["ev3"])
+
+        self.deferreds[2].callback("result3")
+        self.assertEqual(self.successResultOf(d3), "result3")
+
+    def test_failure_only_fails_its_batch(self):
+        """If persisting a batch fails, only the requests in that batch fail."""
+        self._add("!room1", "ev1")
+        d2 = self._add("!room1", "ev2")
+        d3 = self._add("!room2", "ev3")
+
+        self.deferreds[0].callback("result1")
+        self.assertEqual(self.batches[2], ["ev2"])
+
+        self.deferreds[2].errback(Exception("ev2 failed"))
+        self.failureResultOf(d2, Exception)
+
+        self.deferreds[1].callback("result3")
+        self.assertEqual(self.successResultOf(d3), "result3")
+
+        # The room's queue carries on after a failure.
+        d4 = self._add("!room1", "ev4")
+        self.assertEqual(self.batches[3], ["ev4"])
+        self.deferreds[3].callback("result4")
+        self.assertEqual(self.successResultOf(d4), "result4")
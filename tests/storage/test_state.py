@@ -13,6 +13,7 @@
 # limitations under the License.
 
 import logging
+import sys
 
 from synapse.api.constants import EventTypes, Membership
 from synapse.api.room_versions import RoomVersions
@@ -102,6 +103,112 @@ class StateStoreTestCase(HomeserverTestCase):
 
         self.assertEqual({ev.event_id for ev in state_list}, {e1.event_id, e2.event_id})
 
+    def test_cached_state_is_interned(self):
+        e1 = self.inject_state_event(self.room, self.u_alice, EventTypes.Create, "", {})
+        e2 = self.inject_state_event(
+            self.room,
+            self.u_alice,
+            EventTypes.Member,
+            self.u_alice.to_string(),
+            {"membership": Membership.JOIN},
+        )
+
+        group_ids = self.get_success(
+            self.storage.state.get_state_groups_ids(self.room, [e2.event_id])
+        )
+        group = list(group_ids.keys())[0]
+
+        # Clear the caches so that the state gets loaded from the database.
+        self.state_datastore._state_group_cache.invalidate(group)
+        self.state_datastore._state_group_members_cache.invalidate(group)
+
+        state = self.get_success(self.state_datastore._get_state_for_groups([group]))
+        self.assertDictEqual(
+            {
+                (e1.type, e1.state_key): e1.event_id,
+                (e2.type, e2.state_key): e2.event_id,
+            },
+            state[group],
+        )
+
+        for cache in (
+            self.state_datastore._state_group_cache,
+            self.state_datastore._state_group_members_cache,
+        ):
+            cache_entry = cache.get(group)
+            self.assertTrue(cache_entry.full)
+            for (typ, state_key), event_id in cache_entry.value.items():
+                self.assertIs(typ, sys.intern(typ))
+                self.assertIs(state_key, sys.intern(state_key))
+                self.assertIs(event_id, sys.intern(event_id))
+
+    def test_compress_state_group_chains(self):
+        self.inject_state_event(self.room, self.u_alice, EventTypes.Create, "", {})
+        self.inject_state_event(
+            self.room,
+            self.u_alice,
+            EventTypes.Member,
+            self.u_alice.to_string(),
+            {"membership": Membership.JOIN},
+        )
+        for i in range(40):
+            self.inject_state_event(
+                self.room, self.u_alice, EventTypes.Name, "", {"name": "room %d" % i}
+            )
+
+        groups = self.get_success(
+            self.state_datastore.db_pool.simple_select_onecol(
+                table="state_groups",
+                keyvalues={"room_id": self.room.to_string()},
+                retcol="id",
+            )
+        )
+        self.assertGreaterEqual(len(groups), 40)
+
+        def get_hops(group):
+            return self.get_success(
+                self.state_datastore.db_pool.runInteraction(
+                    "get_hops",
+                    self.state_datastore._count_state_group_hops_txn,
+                    group,
+                )
+            )
+
+        expected_state = self.get_success(
+            self.state_datastore._get_state_groups_from_groups(
+                groups, StateFilter.all()
+            )
+        )
+        self.assertGreater(max(get_hops(group) for group in groups), 30)
+
+        # Run the background update to compress the state group chains.
+        self.get_success(
+            self.state_datastore.db_pool.simple_insert(
+                table="background_updates",
+                values={
+                    "update_name": "state_group_chain_compression",
+                    "progress_json": "{}",
+                },
+            )
+        )
+        self.state_datastore.db_pool.updates._all_done = False
+        while not self.get_success(
+            self.state_datastore.db_pool.updates.has_completed_background_updates()
+        ):
+            self.get_success(
+                self.state_datastore.db_pool.updates.do_next_background_update(100),
+                by=0.1,
+            )
+
+        # The state of every group is unchanged, but the chains are shorter.
+        state = self.get_success(
+            self.state_datastore._get_state_groups_from_groups(
+                groups, StateFilter.all()
+            )
+        )
+        self.assertEqual(state, expected_state)
+        self.assertLessEqual(max(get_hops(group) for group in groups), 30)
+
     def test_get_state_for_event(self):
 
         # this defaults to a linear DAG as each new injection defaults to whatever
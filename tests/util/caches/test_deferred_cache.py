@@ -152,6 +152,32 @@ class DeferredCacheTestCase(TestCase):
         with self.assertRaises(KeyError):
             cache.get(("foo",))
 
+    def test_invalidate_many(self):
+        cache = DeferredCache("test")
+        cache.prefill(("foo",), 123)
+        cache.prefill(("bar",), 456)
+        cache.prefill(("baz",), 789)
+
+        # add a pending entry, which should also get invalidated
+        callback_record = [False]
+
+        def record_callback():
+            callback_record[0] = True
+
+        d = defer.Deferred()
+        cache.set(("pending",), d, record_callback)
+
+        cache.invalidate_many([("foo",), ("pending",), ("bar",)])
+
+        with self.assertRaises(KeyError):
+            cache.get(("foo",))
+        with self.assertRaises(KeyError):
+            cache.get(("bar",))
+        with self.assertRaises(KeyError):
+            cache.get(("pending",))
+        self.assertTrue(callback_record[0])
+        self.assertEqual(self.successResultOf(cache.get(("baz",))), 789)
+
     def test_invalidate_all(self):
         cache = DeferredCache("testcache")
 
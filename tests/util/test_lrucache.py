@@ -13,7 +13,7 @@
 # limitations under the License.
 
 
-from unittest.mock import Mock
+from unittest.mock import Mock, patch
 
 from synapse.util.caches.lrucache import LruCache, setup_expire_lru_cache_entries
 from synapse.util.caches.treecache import TreeCache
@@ -77,6 +77,20 @@ class LruCacheTestCase(unittest.HomeserverTestCase):
         self.assertEquals(cache.get(("vehicles", "train")), "chuff")
         # Man from del_multi say "Yes".
 
+    def test_del_multi_many(self):
+        cache = LruCache(4, cache_type=TreeCache)
+        cache[("animal", "cat")] = "mew"
+        cache[("animal", "dog")] = "woof"
+        cache[("vehicles", "car")] = "vroom"
+        cache[("vehicles", "train")] = "chuff"
+
+        cache.del_multi_many([("animal",), ("vehicles", "car"), ("plants",)])
+        self.assertEquals(len(cache), 1)
+        self.assertEquals(cache.get(("animal", "cat")), None)
+        self.assertEquals(cache.get(("animal", "dog")), None)
+        self.assertEquals(cache.get(("vehicles", "car")), None)
+        self.assertEquals(cache.get(("vehicles", "train")), "chuff")
+
     def test_clear(self):
         cache = LruCache(1)
         cache["key"] = 1
@@ -184,6 +198,22 @@ class LruCacheCallbacksTestCase(unittest.HomeserverTestCase):
         self.assertEquals(m3.call_count, 0)
         self.assertEquals(m4.call_count, 0)
 
+    def test_del_multi_many(self):
+        m1 = Mock()
+        m2 = Mock()
+        m3 = Mock()
+        cache = LruCache(4, cache_type=TreeCache)
+
+        cache.set(("a", "1"), "value", callbacks=[m1])
+        cache.set(("a", "2"), "value", callbacks=[m2])
+        cache.set(("b", "1"), "value", callbacks=[m3])
+
+        cache.del_multi_many([("a", "1"), ("b",), ("a", "1")])
+
+        self.assertEquals(m1.call_count, 1)
+        self.assertEquals(m2.call_count, 0)
+        self.assertEquals(m3.call_count, 1)
+
     def test_clear(self):
         m1 = Mock()
         m2 = Mock()
@@ -262,6 +292,76 @@ class LruCacheSizedTestCase(unittest.HomeserverTestCase):
         self.assertEquals(cache["key5"], [5, 6])
 
 
+def _fake_get_size_of(val, *, recurse=True):
+    """A stand in for `_get_size_of` which sizes strings by their length and
+    ignores everything else, so that tests don't depend on pympler.
+    """
+    if recurse and isinstance(val, str):
+        return len(val)
+    return 0
+
+
+@patch("synapse.util.caches.lrucache._get_size_of", _fake_get_size_of)
+class LruCacheMemorySizedTestCase(unittest.HomeserverTestCase):
+    def test_evict(self):
+        cache = LruCache(100, max_size_bytes=20)
+        cache["a"] = "x" * 4
+        cache["b"] = "x" * 4
+        cache["c"] = "x" * 9
+
+        # Each entry is sized as key + value, so we're now at 20 bytes.
+        self.assertEquals(len(cache), 3)
+
+        # Adding another entry pushes the oldest entries out, even though the
+        # cache is well under its entry limit.
+        cache["d"] = "x" * 5
+
+        self.assertEquals(len(cache), 2)
+        self.assertEquals(cache.get("a"), None)
+        self.assertEquals(cache.get("b"), None)
+        self.assertEquals(cache["c"], "x" * 9)
+        self.assertEquals(cache["d"], "x" * 5)
+
+    def test_replace_value(self):
+        """Replacing a value with a larger one is accounted for."""
+        cache = LruCache(100, max_size_bytes=20)
+        cache["a"] = "x" * 4
+        cache["b"] = "x" * 4
+
+        cache["b"] = "x" * 15
+
+        self.assertEquals(cache.get("a"), None)
+        self.assertEquals(cache["b"], "x" * 15)
+
+        # Shrinking it again frees up room for another entry.
+        cache["b"] = "x"
+        cache["c"] = "x" * 10
+
+        self.assertEquals(cache["b"], "x")
+        self.assertEquals(cache["c"], "x" * 10)
+
+    def test_pop_and_clear(self):
+        """Removed entries no longer count towards the limit."""
+        cache = LruCache(100, max_size_bytes=20)
+        cache["a"] = "x" * 9
+        cache.pop("a")
+        cache["b"] = "x" * 9
+        cache["c"] = "x" * 9
+        self.assertEquals(len(cache), 2)
+
+        cache.clear()
+        cache["d"] = "x" * 19
+        self.assertEquals(cache["d"], "x" * 19)
+
+    def test_oversized_entry(self):
+        """An entry larger than the whole cache is not kept."""
+        cache = LruCache(100, max_size_bytes=20)
+        cache["a"] = "x" * 4
+        cache["b"] = "x" * 50
+
+        self.assertEquals(len(cache), 0)
+
+
 class TimeEvictionTestCase(unittest.HomeserverTestCase):
     """Test that time based eviction works correctly."""
 